@@ -20,12 +20,14 @@ __all__ = [
     "analyse_data",
     "analyse_model",
     "analyse_intermediate_results",
+    "AsynchronousIntermediateAnalyser",
     "analyse_results",
     "cross_analyse"
 ]
 
 from scvae.analyses.analyses import (
     analyse_data, analyse_model,
-    analyse_intermediate_results, analyse_results
+    analyse_intermediate_results, analyse_results,
+    AsynchronousIntermediateAnalyser
 )
 from scvae.analyses.cross_analysis import cross_analyse
@@ -16,7 +16,9 @@
 #
 # ======================================================================== #
 
+import copy
 import gzip
+import multiprocessing
 import os
 import pickle
 from time import time
@@ -747,6 +749,108 @@ def analyse_intermediate_results(epoch, learning_curves=None, epoch_start=None,
         )
 
 
+class AsynchronousIntermediateAnalyser:
+    """Intermediate analyses in a background worker process.
+
+    Calls are handed to a worker process, so that training can continue
+    while learning curves and latent values are plotted. At most
+    ``queue_size`` analyses are in flight at once. If plotting falls
+    behind, only the most recent of the waiting analyses is kept, since
+    its learning curves supersede those of earlier epochs.
+
+    Arguments:
+        analyser (callable, optional): Function performing the
+            intermediate analyses. Defaults to
+            ``analyse_intermediate_results``.
+        queue_size (int, optional): The number of analyses in flight
+            at once.
+    """
+
+    def __init__(self, analyser=None, queue_size=1):
+
+        if analyser is None:
+            analyser = analyse_intermediate_results
+
+        self.analyser = analyser
+        self.queue_size = queue_size
+        self.number_of_dropped_analyses = 0
+
+        # Spawning avoids forking the threads of the TensorFlow runtime
+        self._pool = multiprocessing.get_context("spawn").Pool(processes=1)
+        self._results = []
+        self._pending_arguments = None
+
+    def __call__(self, **kwargs):
+
+        data_set = kwargs.get("data_set")
+        if data_set is not None:
+            kwargs["data_set"] = _data_set_for_plotting(data_set)
+
+        if self._pending_arguments is not None:
+            self.number_of_dropped_analyses += 1
+        self._pending_arguments = kwargs
+
+        self._submit_pending_arguments()
+
+    def flush(self):
+        """Wait for all outstanding analyses to finish."""
+
+        while self._results or self._pending_arguments is not None:
+            if self._results:
+                # Analyses finish in order on the single worker process
+                self._results[0].wait()
+            self._submit_pending_arguments()
+
+    def close(self):
+        """Finish outstanding analyses and stop the worker process."""
+
+        try:
+            self.flush()
+        finally:
+            self._pool.close()
+            self._pool.join()
+
+        if self.number_of_dropped_analyses > 0:
+            print(
+                "{} intermediate analyses skipped,".format(
+                    self.number_of_dropped_analyses),
+                "since plotting fell behind training."
+            )
+
+    def _submit_pending_arguments(self):
+
+        running_results = []
+
+        for result in self._results:
+            if result.ready():
+                result.get()
+            else:
+                running_results.append(result)
+
+        self._results = running_results
+
+        if (self._pending_arguments is not None
+                and len(self._results) < self.queue_size):
+            self._results.append(self._pool.apply_async(
+                self.analyser, kwds=self._pending_arguments))
+            self._pending_arguments = None
+
+
+def _data_set_for_plotting(data_set):
+    # Only labels and related attributes are used for plotting
+    # intermediate results, so values are left out to limit what is sent
+    # to the worker process, as are the noisy preprocessing functions,
+    # which cannot be pickled
+    data_set = copy.copy(data_set)
+    for attribute in ["values", "preprocessed_values", "binarised_values",
+                      "total_standard_deviations",
+                      "explained_standard_deviations",
+                      "noisy_preprocess", "_noisy_deterministic_preprocess",
+                      "_noisy_values"]:
+        setattr(data_set, attribute, None)
+    return data_set
+
+
 def analyse_results(evaluation_set, reconstructed_evaluation_set,
                     latent_evaluation_sets, model, run_id=None,
                     sample_reconstruction_set=None,
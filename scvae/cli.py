@@ -25,14 +25,22 @@ from scvae.analyses.prediction import (
     PredictionSpecifications, predict_labels
 )
 from scvae.data import DataSet
+from scvae.data.chunked import CHUNKED_DATA_FORMATS, open_chunked_reader
 from scvae.data.utilities import (
     build_directory_path, indices_for_evaluation_subset
 )
 from scvae.defaults import defaults
 from scvae.models import (
     VariationalAutoencoder,
-    GaussianMixtureVariationalAutoencoder
+    GaussianMixtureVariationalAutoencoder,
+    evaluate_ensemble,
+    export_inference_graph,
+    export_inference_parameters,
+    validate_inference_parameters
 )
+from scvae.models.embedding import embed_in_chunks
+from scvae.models.serving import ModelServer, ServedModel
+from scvae.models.sinks import OUTPUT_SINKS
 from scvae.models.utilities import (
     better_model_exists, model_stopped_early,
     parse_model_versions
@@ -45,6 +53,7 @@ from scvae.utilities import (
 
 
 def analyse(data_set_file_or_name, data_format=None, data_directory=None,
+            parsing_chunk_size=None, parsing_workers=None,
             map_features=None, feature_selection=None, example_filter=None,
             preprocessing_methods=None, split_data_set=None,
             splitting_method=None, splitting_fraction=None,
@@ -69,6 +78,8 @@ def analyse(data_set_file_or_name, data_format=None, data_directory=None,
         data_set_file_or_name,
         data_format=data_format,
         directory=data_directory,
+        parsing_chunk_size=parsing_chunk_size,
+        parsing_workers=parsing_workers,
         map_features=map_features,
         feature_selection=feature_selection,
         example_filter=example_filter,
@@ -109,6 +120,7 @@ def analyse(data_set_file_or_name, data_format=None, data_directory=None,
 
 
 def train(data_set_file_or_name, data_format=None, data_directory=None,
+          parsing_chunk_size=None, parsing_workers=None,
           map_features=None, feature_selection=None, example_filter=None,
           noisy_preprocessing_methods=None, preprocessing_methods=None,
           split_data_set=None, splitting_method=None, splitting_fraction=None,
@@ -120,12 +132,19 @@ def train(data_set_file_or_name, data_format=None, data_directory=None,
           prior_probabilities_method=None,
           generative_architecture=None, reconstruction_distribution=None,
           number_of_reconstruction_classes=None, count_sum=None,
+          sparse_input=None, sparse_reconstruction=None,
+          batched_clusters=None,
           proportion_of_free_nats_for_y_kl_divergence=None,
           minibatch_normalisation=None, batch_correction=None,
           dropout_keep_probabilities=None,
           number_of_warm_up_epochs=None, kl_weight=None,
           number_of_epochs=None, minibatch_size=None, learning_rate=None,
           run_id=None, new_run=False, reset_training=None,
+          input_pipeline=None, prefetch_size=None, producer_thread=None,
+          evaluation_budget=None, evaluation_subsample_size=None,
+          asynchronous_checkpoints=None,
+          asynchronous_intermediate_analyses=None,
+          data_parallel_workers=None, data_parallel_reference_steps=None,
           models_directory=None, caches_directory=None,
           analyses_directory=None, **keyword_arguments):
     """Train model on data set."""
@@ -153,6 +172,8 @@ def train(data_set_file_or_name, data_format=None, data_directory=None,
         data_set_file_or_name,
         data_format=data_format,
         directory=data_directory,
+        parsing_chunk_size=parsing_chunk_size,
+        parsing_workers=parsing_workers,
         map_features=map_features,
         feature_selection=feature_selection,
         example_filter=example_filter,
@@ -220,6 +241,9 @@ def train(data_set_file_or_name, data_format=None, data_directory=None,
         reconstruction_distribution=reconstruction_distribution,
         number_of_reconstruction_classes=number_of_reconstruction_classes,
         count_sum=count_sum,
+        sparse_input=sparse_input,
+        sparse_reconstruction=sparse_reconstruction,
+        batched_clusters=batched_clusters,
         proportion_of_free_nats_for_y_kl_divergence=(
             proportion_of_free_nats_for_y_kl_divergence),
         minibatch_normalisation=minibatch_normalisation,
@@ -238,24 +262,43 @@ def train(data_set_file_or_name, data_format=None, data_directory=None,
 
     print(subtitle("Training"))
 
-    if analyses_directory:
+    if asynchronous_intermediate_analyses is None:
+        asynchronous_intermediate_analyses = defaults["analyses"][
+            "asynchronous_intermediate_analyses"]
+
+    if analyses_directory and asynchronous_intermediate_analyses:
+        intermediate_analyser = analyses.AsynchronousIntermediateAnalyser()
+    elif analyses_directory:
         intermediate_analyser = analyses.analyse_intermediate_results
     else:
         intermediate_analyser = None
 
-    model.train(
-        training_set,
-        validation_set,
-        number_of_epochs=number_of_epochs,
-        minibatch_size=minibatch_size,
-        learning_rate=learning_rate,
-        intermediate_analyser=intermediate_analyser,
-        run_id=run_id,
-        new_run=new_run,
-        reset_training=reset_training,
-        analyses_directory=analyses_directory,
-        temporary_log_directory=model_caches_directory
-    )
+    try:
+        model.train(
+            training_set,
+            validation_set,
+            number_of_epochs=number_of_epochs,
+            minibatch_size=minibatch_size,
+            learning_rate=learning_rate,
+            intermediate_analyser=intermediate_analyser,
+            run_id=run_id,
+            new_run=new_run,
+            reset_training=reset_training,
+            input_pipeline=input_pipeline,
+            prefetch_size=prefetch_size,
+            producer_thread=producer_thread,
+            evaluation_budget=evaluation_budget,
+            evaluation_subsample_size=evaluation_subsample_size,
+            asynchronous_checkpoints=asynchronous_checkpoints,
+            data_parallel_workers=data_parallel_workers,
+            data_parallel_reference_steps=data_parallel_reference_steps,
+            analyses_directory=analyses_directory,
+            temporary_log_directory=model_caches_directory
+        )
+    finally:
+        if isinstance(intermediate_analyser,
+                      analyses.AsynchronousIntermediateAnalyser):
+            intermediate_analyser.close()
 
     # Remove temporary directories created and emptied during training
     if model_caches_directory and os.path.exists(caches_directory):
@@ -265,6 +308,7 @@ def train(data_set_file_or_name, data_format=None, data_directory=None,
 
 
 def evaluate(data_set_file_or_name, data_format=None, data_directory=None,
+             parsing_chunk_size=None, parsing_workers=None,
              map_features=None, feature_selection=None, example_filter=None,
              noisy_preprocessing_methods=None, preprocessing_methods=None,
              split_data_set=None, splitting_method=None,
@@ -277,6 +321,8 @@ def evaluate(data_set_file_or_name, data_format=None, data_directory=None,
              prior_probabilities_method=None,
              generative_architecture=None, reconstruction_distribution=None,
              number_of_reconstruction_classes=None, count_sum=None,
+             sparse_input=None, sparse_reconstruction=None,
+             batched_clusters=None,
              proportion_of_free_nats_for_y_kl_divergence=None,
              minibatch_normalisation=None, batch_correction=None,
              dropout_keep_probabilities=None,
@@ -287,7 +333,10 @@ def evaluate(data_set_file_or_name, data_format=None, data_directory=None,
              export_options=None, analyses_directory=None,
              evaluation_set_kind=None, sample_size=None,
              prediction_method=None, prediction_training_set_kind=None,
-             model_versions=None, **keyword_arguments):
+             model_versions=None, parallel_model_versions=False,
+             sample_chunk_size=None, output_sink=None,
+             use_inference_graph=False, draw_counts=False,
+             **keyword_arguments):
     """Evaluate model on data set."""
 
     if split_data_set is None:
@@ -331,6 +380,8 @@ def evaluate(data_set_file_or_name, data_format=None, data_directory=None,
         data_set_file_or_name,
         data_format=data_format,
         directory=data_directory,
+        parsing_chunk_size=parsing_chunk_size,
+        parsing_workers=parsing_workers,
         map_features=map_features,
         feature_selection=feature_selection,
         example_filter=example_filter,
@@ -402,6 +453,9 @@ def evaluate(data_set_file_or_name, data_format=None, data_directory=None,
         reconstruction_distribution=reconstruction_distribution,
         number_of_reconstruction_classes=number_of_reconstruction_classes,
         count_sum=count_sum,
+        sparse_input=sparse_input,
+        sparse_reconstruction=sparse_reconstruction,
+        batched_clusters=batched_clusters,
         proportion_of_free_nats_for_y_kl_divergence=(
             proportion_of_free_nats_for_y_kl_divergence),
         minibatch_normalisation=minibatch_normalisation,
@@ -462,6 +516,44 @@ def evaluate(data_set_file_or_name, data_format=None, data_directory=None,
 
     print()
 
+    if parallel_model_versions and len(model_versions) > 1:
+        print(subtitle("Model versions"))
+        print(heading("Evaluation of model versions"))
+        model_version_evaluations = evaluate_ensemble(
+            model=model,
+            evaluation_set=evaluation_set,
+            model_versions=model_versions,
+            run_ids=[run_id],
+            evaluation_subset_indices=evaluation_subset_indices,
+            minibatch_size=minibatch_size,
+            output_versions="all",
+            sample_chunk_size=sample_chunk_size,
+            output_sink=output_sink,
+            use_inference_graph=use_inference_graph
+        )
+        print()
+
+        if prediction_method:
+            print(heading("Evaluation of model versions for prediction"))
+            model_version_prediction_evaluations = evaluate_ensemble(
+                model=model,
+                evaluation_set=prediction_training_set,
+                model_versions=model_versions,
+                run_ids=[run_id],
+                minibatch_size=minibatch_size,
+                output_versions="latent",
+                log_results=False,
+                sample_chunk_size=sample_chunk_size,
+                output_sink=output_sink,
+                output_name="prediction-{}".format(
+                    prediction_training_set.kind),
+                use_inference_graph=use_inference_graph
+            )
+            print()
+    else:
+        model_version_evaluations = None
+        model_version_prediction_evaluations = None
+
     for model_version in model_versions:
 
         use_best_model = False
@@ -473,95 +565,650 @@ def evaluate(data_set_file_or_name, data_format=None, data_directory=None,
 
         print(subtitle(model_version.replace("_", " ").capitalize()))
 
-        print(heading("{} evaluation".format(
+        if model_version_evaluations:
+            (
+                transformed_evaluation_set,
+                reconstructed_evaluation_set,
+                latent_evaluation_sets
+            ) = model_version_evaluations[run_id, model_version]
+        else:
+            print(heading("{} evaluation".format(
+                model_version.replace("_", "-").capitalize())))
+
+            (
+                transformed_evaluation_set,
+                reconstructed_evaluation_set,
+                latent_evaluation_sets
+            ) = model.evaluate(
+                evaluation_set=evaluation_set,
+                evaluation_subset_indices=evaluation_subset_indices,
+                minibatch_size=minibatch_size,
+                run_id=run_id,
+                use_best_model=use_best_model,
+                use_early_stopping_model=use_early_stopping_model,
+                output_versions="all",
+                sample_chunk_size=sample_chunk_size,
+                output_sink=output_sink,
+                use_inference_graph=use_inference_graph
+            )
+            print()
+
+        if sample_size:
+            print(heading("{} sampling".format(
+                model_version.replace("_", "-").capitalize())))
+
+            sample_reconstruction_set, __ = model.sample(
+                sample_size=sample_size,
+                minibatch_size=minibatch_size,
+                run_id=run_id,
+                use_best_model=use_best_model,
+                use_early_stopping_model=use_early_stopping_model,
+                output_sink=output_sink,
+                draw_counts=draw_counts
+            )
+            print()
+        else:
+            sample_reconstruction_set = None
+
+        if prediction_method:
+            print(heading("{} prediction".format(
+                model_version.replace("_", "-").capitalize())))
+
+            if model_version_prediction_evaluations:
+                latent_prediction_training_sets = (
+                    model_version_prediction_evaluations[
+                        run_id, model_version])
+            else:
+                latent_prediction_training_sets = model.evaluate(
+                    evaluation_set=prediction_training_set,
+                    minibatch_size=minibatch_size,
+                    run_id=run_id,
+                    use_best_model=use_best_model,
+                    use_early_stopping_model=use_early_stopping_model,
+                    output_versions="latent",
+                    log_results=False,
+                    sample_chunk_size=sample_chunk_size,
+                    output_sink=output_sink,
+                    output_name="prediction-{}".format(
+                        prediction_training_set.kind),
+                    use_inference_graph=use_inference_graph
+                )
+                print()
+
+            cluster_ids, predicted_labels, predicted_superset_labels = (
+                predict_labels(
+                    training_set=latent_prediction_training_sets["z"],
+                    evaluation_set=latent_evaluation_sets["z"],
+                    specifications=prediction_specifications
+                )
+            )
+
+            evaluation_set_versions = [
+                transformed_evaluation_set, reconstructed_evaluation_set
+            ] + list(latent_evaluation_sets.values())
+
+            for evaluation_set_version in evaluation_set_versions:
+                evaluation_set_version.update_predictions(
+                    prediction_specifications=prediction_specifications,
+                    predicted_cluster_ids=cluster_ids,
+                    predicted_labels=predicted_labels,
+                    predicted_superset_labels=predicted_superset_labels
+                )
+            print()
+
+        print(heading("{} analysis".format(
             model_version.replace("_", "-").capitalize())))
 
-        (
-            transformed_evaluation_set,
-            reconstructed_evaluation_set,
-            latent_evaluation_sets
-        ) = model.evaluate(
-            evaluation_set=evaluation_set,
+        analyses.analyse_results(
+            evaluation_set=transformed_evaluation_set,
+            reconstructed_evaluation_set=reconstructed_evaluation_set,
+            latent_evaluation_sets=latent_evaluation_sets,
+            model=model,
+            run_id=run_id,
+            sample_reconstruction_set=sample_reconstruction_set,
+            decomposition_methods=decomposition_methods,
             evaluation_subset_indices=evaluation_subset_indices,
-            minibatch_size=minibatch_size,
+            highlight_feature_indices=highlight_feature_indices,
+            best_model=use_best_model,
+            early_stopping=use_early_stopping_model,
+            included_analyses=included_analyses,
+            analysis_level=analysis_level,
+            export_options=export_options,
+            analyses_directory=analyses_directory
+        )
+
+    return 0
+
+
+def export(data_set_file_or_name, data_format=None, data_directory=None,
+           parsing_chunk_size=None, parsing_workers=None,
+           map_features=None, feature_selection=None, example_filter=None,
+           noisy_preprocessing_methods=None, preprocessing_methods=None,
+           split_data_set=None, splitting_method=None,
+           splitting_fraction=None,
+           model_type=None, latent_size=None, hidden_sizes=None,
+           number_of_importance_samples=None,
+           number_of_monte_carlo_samples=None,
+           inference_architecture=None, latent_distribution=None,
+           number_of_classes=None, parameterise_latent_posterior=False,
+           prior_probabilities_method=None,
+           generative_architecture=None, reconstruction_distribution=None,
+           number_of_reconstruction_classes=None, count_sum=None,
+           sparse_input=None, sparse_reconstruction=None,
+           batched_clusters=None,
+           proportion_of_free_nats_for_y_kl_divergence=None,
+           minibatch_normalisation=None, batch_correction=None,
+           dropout_keep_probabilities=None,
+           number_of_warm_up_epochs=None, kl_weight=None,
+           minibatch_size=None, run_id=None, models_directory=None,
+           evaluation_set_kind=None, model_versions=None, validate=False,
+           inference_graph=False, **keyword_arguments):
+    """Export encoders of model for inference without TensorFlow."""
+
+    if split_data_set is None:
+        split_data_set = defaults["data"]["split_data_set"]
+    if splitting_method is None:
+        splitting_method = defaults["data"]["splitting_method"]
+    if splitting_fraction is None:
+        splitting_fraction = defaults["data"]["splitting_fraction"]
+    if models_directory is None:
+        models_directory = defaults["models"]["directory"]
+    if evaluation_set_kind is None:
+        evaluation_set_kind = defaults["evaluation"]["data_set_kind"]
+    if model_versions is None:
+        model_versions = defaults["evaluation"]["model_versions"]
+
+    evaluation_set_kind = normalise_string(evaluation_set_kind)
+    model_versions = parse_model_versions(model_versions)
+
+    print(title("Data"))
+
+    binarise_values = False
+    if reconstruction_distribution == "bernoulli":
+        if noisy_preprocessing_methods:
+            if noisy_preprocessing_methods[-1] != "binarise":
+                noisy_preprocessing_methods.append("binarise")
+        else:
+            binarise_values = True
+
+    data_set = DataSet(
+        data_set_file_or_name,
+        data_format=data_format,
+        directory=data_directory,
+        parsing_chunk_size=parsing_chunk_size,
+        parsing_workers=parsing_workers,
+        map_features=map_features,
+        feature_selection=feature_selection,
+        example_filter=example_filter,
+        preprocessing_methods=preprocessing_methods,
+        binarise_values=binarise_values,
+        noisy_preprocessing_methods=noisy_preprocessing_methods
+    )
+
+    if not split_data_set or evaluation_set_kind == "full":
+        data_set.load()
+
+    if split_data_set:
+        training_set, validation_set, test_set = data_set.split(
+            method=splitting_method, fraction=splitting_fraction)
+        evaluation_set = {
+            "full": data_set,
+            "training": training_set,
+            "validation": validation_set,
+            "test": test_set
+        }[evaluation_set_kind]
+    else:
+        splitting_method = None
+        splitting_fraction = None
+        evaluation_set = data_set
+
+    models_directory = build_directory_path(
+        models_directory,
+        data_set=evaluation_set,
+        splitting_method=splitting_method,
+        splitting_fraction=splitting_fraction
+    )
+
+    print(title("Model"))
+
+    if number_of_classes is None:
+        if evaluation_set.has_labels:
+            number_of_classes = (
+                evaluation_set.number_of_classes
+                - evaluation_set.number_of_excluded_classes)
+
+    model = _setup_model(
+        data_set=evaluation_set,
+        model_type=model_type,
+        latent_size=latent_size,
+        hidden_sizes=hidden_sizes,
+        number_of_importance_samples=number_of_importance_samples,
+        number_of_monte_carlo_samples=number_of_monte_carlo_samples,
+        inference_architecture=inference_architecture,
+        latent_distribution=latent_distribution,
+        number_of_classes=number_of_classes,
+        parameterise_latent_posterior=parameterise_latent_posterior,
+        prior_probabilities_method=prior_probabilities_method,
+        generative_architecture=generative_architecture,
+        reconstruction_distribution=reconstruction_distribution,
+        number_of_reconstruction_classes=number_of_reconstruction_classes,
+        count_sum=count_sum,
+        sparse_input=sparse_input,
+        sparse_reconstruction=sparse_reconstruction,
+        batched_clusters=batched_clusters,
+        proportion_of_free_nats_for_y_kl_divergence=(
+            proportion_of_free_nats_for_y_kl_divergence),
+        minibatch_normalisation=minibatch_normalisation,
+        batch_correction=batch_correction,
+        dropout_keep_probabilities=dropout_keep_probabilities,
+        number_of_warm_up_epochs=number_of_warm_up_epochs,
+        kl_weight=kl_weight,
+        models_directory=models_directory
+    )
+
+    if not model.has_been_trained(run_id=run_id):
+        raise Exception(
+            "Model not found. Either it has not been trained or "
+            "scVAE is looking in the wrong directory. "
+            "The model directory resulting from the model specification is: "
+            "\"{}\"".format(model.log_directory())
+        )
+
+    if ("best_model" in model_versions
+            and not better_model_exists(model, run_id=run_id)):
+        model_versions.remove("best_model")
+
+    if ("early_stopping" in model_versions
+            and not model_stopped_early(model, run_id=run_id)):
+        model_versions.remove("early_stopping")
+
+    print(title("Export"))
+
+    for model_version in model_versions:
+
+        use_best_model = model_version == "best_model"
+        use_early_stopping_model = model_version == "early_stopping"
+
+        export_path = export_inference_parameters(
+            model,
             run_id=run_id,
             use_best_model=use_best_model,
-            use_early_stopping_model=use_early_stopping_model,
-            output_versions="all"
+            use_early_stopping_model=use_early_stopping_model
         )
+        print("Exported {} to \"{}\".".format(
+            model_version.replace("_", " "), export_path))
+
+        if validate:
+            differences = validate_inference_parameters(
+                model,
+                export_path,
+                evaluation_set=evaluation_set,
+                run_id=run_id,
+                use_best_model=use_best_model,
+                use_early_stopping_model=use_early_stopping_model
+            )
+            print("Validated on {} set with maximum differences: {}.".format(
+                evaluation_set.kind,
+                ", ".join("{}: {:.3g}".format(name, difference)
+                          for name, difference in differences.items())
+            ))
+
+        if inference_graph:
+            inference_graph_path = export_inference_graph(
+                model,
+                run_id=run_id,
+                use_best_model=use_best_model,
+                use_early_stopping_model=use_early_stopping_model
+            )
+            print("Exported inference graph for {} to \"{}\".".format(
+                model_version.replace("_", " "), inference_graph_path))
+
         print()
 
-        if sample_size:
-            print(heading("{} sampling".format(
-                model_version.replace("_", "-").capitalize())))
+    return 0
+
+
+def embed(data_set_file_or_name, data_format=None, data_directory=None,
+          parsing_chunk_size=None, parsing_workers=None,
+          map_features=None, feature_selection=None, example_filter=None,
+          noisy_preprocessing_methods=None, preprocessing_methods=None,
+          split_data_set=None, splitting_method=None,
+          splitting_fraction=None,
+          model_type=None, latent_size=None, hidden_sizes=None,
+          number_of_importance_samples=None,
+          number_of_monte_carlo_samples=None,
+          inference_architecture=None, latent_distribution=None,
+          number_of_classes=None, parameterise_latent_posterior=False,
+          prior_probabilities_method=None,
+          generative_architecture=None, reconstruction_distribution=None,
+          number_of_reconstruction_classes=None, count_sum=None,
+          sparse_input=None, sparse_reconstruction=None,
+          batched_clusters=None,
+          proportion_of_free_nats_for_y_kl_divergence=None,
+          minibatch_normalisation=None, batch_correction=None,
+          dropout_keep_probabilities=None,
+          number_of_warm_up_epochs=None, kl_weight=None,
+          minibatch_size=None, run_id=None, models_directory=None,
+          input_path=None, input_format=None, model_versions=None,
+          output_directory=None, output_format=None, chunk_size=None,
+          reconstructions=False, **keyword_arguments):
+    """Embed examples of large data set file in chunks using model."""
+
+    if split_data_set is None:
+        split_data_set = defaults["data"]["split_data_set"]
+    if splitting_method is None:
+        splitting_method = defaults["data"]["splitting_method"]
+    if splitting_fraction is None:
+        splitting_fraction = defaults["data"]["splitting_fraction"]
+    if models_directory is None:
+        models_directory = defaults["models"]["directory"]
+    if model_versions is None:
+        model_versions = defaults["evaluation"]["model_versions"]
+
+    model_versions = parse_model_versions(model_versions)
+
+    print(title("Data"))
+
+    binarise_values = False
+    if reconstruction_distribution == "bernoulli":
+        if noisy_preprocessing_methods:
+            if noisy_preprocessing_methods[-1] != "binarise":
+                noisy_preprocessing_methods.append("binarise")
+        else:
+            binarise_values = True
+
+    data_set = DataSet(
+        data_set_file_or_name,
+        data_format=data_format,
+        directory=data_directory,
+        parsing_chunk_size=parsing_chunk_size,
+        parsing_workers=parsing_workers,
+        map_features=map_features,
+        feature_selection=feature_selection,
+        example_filter=example_filter,
+        preprocessing_methods=preprocessing_methods,
+        binarise_values=binarise_values,
+        noisy_preprocessing_methods=noisy_preprocessing_methods
+    )
+
+    if split_data_set:
+        training_set, __, __ = data_set.split(
+            method=splitting_method, fraction=splitting_fraction)
+    else:
+        data_set.load()
+        splitting_method = None
+        splitting_fraction = None
+        training_set = data_set
+
+    models_directory = build_directory_path(
+        models_directory,
+        data_set=training_set,
+        splitting_method=splitting_method,
+        splitting_fraction=splitting_fraction
+    )
+
+    print(title("Model"))
+
+    if number_of_classes is None:
+        if training_set.has_labels:
+            number_of_classes = (
+                training_set.number_of_classes
+                - training_set.number_of_excluded_classes)
+
+    model = _setup_model(
+        data_set=training_set,
+        model_type=model_type,
+        latent_size=latent_size,
+        hidden_sizes=hidden_sizes,
+        number_of_importance_samples=number_of_importance_samples,
+        number_of_monte_carlo_samples=number_of_monte_carlo_samples,
+        inference_architecture=inference_architecture,
+        latent_distribution=latent_distribution,
+        number_of_classes=number_of_classes,
+        parameterise_latent_posterior=parameterise_latent_posterior,
+        prior_probabilities_method=prior_probabilities_method,
+        generative_architecture=generative_architecture,
+        reconstruction_distribution=reconstruction_distribution,
+        number_of_reconstruction_classes=number_of_reconstruction_classes,
+        count_sum=count_sum,
+        sparse_input=sparse_input,
+        sparse_reconstruction=sparse_reconstruction,
+        batched_clusters=batched_clusters,
+        proportion_of_free_nats_for_y_kl_divergence=(
+            proportion_of_free_nats_for_y_kl_divergence),
+        minibatch_normalisation=minibatch_normalisation,
+        batch_correction=batch_correction,
+        dropout_keep_probabilities=dropout_keep_probabilities,
+        number_of_warm_up_epochs=number_of_warm_up_epochs,
+        kl_weight=kl_weight,
+        models_directory=models_directory
+    )
+
+    if not model.has_been_trained(run_id=run_id):
+        raise Exception(
+            "Model not found. Either it has not been trained or "
+            "scVAE is looking in the wrong directory. "
+            "The model directory resulting from the model specification is: "
+            "\"{}\"".format(model.log_directory())
+        )
+
+    if ("best_model" in model_versions
+            and not better_model_exists(model, run_id=run_id)):
+        model_versions.remove("best_model")
+
+    if ("early_stopping" in model_versions
+            and not model_stopped_early(model, run_id=run_id)):
+        model_versions.remove("early_stopping")
+
+    print(title("Embedding"))
+
+    reader = open_chunked_reader(input_path, data_format=input_format)
+
+    with reader:
+        for model_version in model_versions:
+
+            if output_directory and len(model_versions) > 1:
+                version_output_directory = os.path.join(
+                    output_directory, model_version)
+            else:
+                version_output_directory = output_directory
+
+            print(subtitle(model_version.replace("_", " ").capitalize()))
+
+            output_paths = embed_in_chunks(
+                model,
+                reader,
+                feature_names=training_set.feature_names,
+                output_directory=version_output_directory,
+                output_format=output_format,
+                preprocessing_methods=training_set.preprocessing_methods,
+                chunk_size=chunk_size,
+                minibatch_size=minibatch_size,
+                reconstruct=reconstructions,
+                maximum_count_sum=training_set.count_sum.max(),
+                run_id=run_id,
+                use_best_model=model_version == "best_model",
+                use_early_stopping_model=model_version == "early_stopping"
+            )
+
+            for output_path in output_paths.values():
+                print("Saved \"{}\".".format(output_path))
+
+            print()
+
+    return 0
+
+
+def serve(data_set_file_or_name, data_format=None, data_directory=None,
+          parsing_chunk_size=None, parsing_workers=None,
+          map_features=None, feature_selection=None, example_filter=None,
+          noisy_preprocessing_methods=None, preprocessing_methods=None,
+          split_data_set=None, splitting_method=None,
+          splitting_fraction=None,
+          model_type=None, latent_size=None, hidden_sizes=None,
+          number_of_importance_samples=None,
+          number_of_monte_carlo_samples=None,
+          inference_architecture=None, latent_distribution=None,
+          number_of_classes=None, parameterise_latent_posterior=False,
+          prior_probabilities_method=None,
+          generative_architecture=None, reconstruction_distribution=None,
+          number_of_reconstruction_classes=None, count_sum=None,
+          sparse_input=None, sparse_reconstruction=None,
+          batched_clusters=None,
+          proportion_of_free_nats_for_y_kl_divergence=None,
+          minibatch_normalisation=None, batch_correction=None,
+          dropout_keep_probabilities=None,
+          number_of_warm_up_epochs=None, kl_weight=None,
+          minibatch_size=None, run_id=None, models_directory=None,
+          evaluation_set_kind=None, model_versions=None, host=None,
+          port=None, batching_window=None, maximum_batch_size=None,
+          **keyword_arguments):
+    """Serve model and data set kept in memory for requests."""
+
+    if split_data_set is None:
+        split_data_set = defaults["data"]["split_data_set"]
+    if splitting_method is None:
+        splitting_method = defaults["data"]["splitting_method"]
+    if splitting_fraction is None:
+        splitting_fraction = defaults["data"]["splitting_fraction"]
+    if models_directory is None:
+        models_directory = defaults["models"]["directory"]
+    if evaluation_set_kind is None:
+        evaluation_set_kind = defaults["evaluation"]["data_set_kind"]
+    if model_versions is None:
+        model_versions = defaults["evaluation"]["model_versions"]
+
+    evaluation_set_kind = normalise_string(evaluation_set_kind)
+    model_versions = parse_model_versions(model_versions)
+
+    print(title("Data"))
+
+    binarise_values = False
+    if reconstruction_distribution == "bernoulli":
+        if noisy_preprocessing_methods:
+            if noisy_preprocessing_methods[-1] != "binarise":
+                noisy_preprocessing_methods.append("binarise")
+        else:
+            binarise_values = True
+
+    data_set = DataSet(
+        data_set_file_or_name,
+        data_format=data_format,
+        directory=data_directory,
+        parsing_chunk_size=parsing_chunk_size,
+        parsing_workers=parsing_workers,
+        map_features=map_features,
+        feature_selection=feature_selection,
+        example_filter=example_filter,
+        preprocessing_methods=preprocessing_methods,
+        binarise_values=binarise_values,
+        noisy_preprocessing_methods=noisy_preprocessing_methods
+    )
+
+    if not split_data_set or evaluation_set_kind == "full":
+        data_set.load()
+
+    if split_data_set:
+        training_set, validation_set, test_set = data_set.split(
+            method=splitting_method, fraction=splitting_fraction)
+        evaluation_set = {
+            "full": data_set,
+            "training": training_set,
+            "validation": validation_set,
+            "test": test_set
+        }[evaluation_set_kind]
+    else:
+        splitting_method = None
+        splitting_fraction = None
+        evaluation_set = data_set
+
+    models_directory = build_directory_path(
+        models_directory,
+        data_set=evaluation_set,
+        splitting_method=splitting_method,
+        splitting_fraction=splitting_fraction
+    )
 
-            sample_reconstruction_set, __ = model.sample(
-                sample_size=sample_size,
-                minibatch_size=minibatch_size,
-                run_id=run_id,
-                use_best_model=use_best_model,
-                use_early_stopping_model=use_early_stopping_model
-            )
-            print()
-        else:
-            sample_reconstruction_set = None
+    print(title("Model"))
 
-        if prediction_method:
-            print(heading("{} prediction".format(
-                model_version.replace("_", "-").capitalize())))
+    if number_of_classes is None:
+        if evaluation_set.has_labels:
+            number_of_classes = (
+                evaluation_set.number_of_classes
+                - evaluation_set.number_of_excluded_classes)
 
-            latent_prediction_training_sets = model.evaluate(
-                evaluation_set=prediction_training_set,
-                minibatch_size=minibatch_size,
-                run_id=run_id,
-                use_best_model=use_best_model,
-                use_early_stopping_model=use_early_stopping_model,
-                output_versions="latent",
-                log_results=False
-            )
-            print()
+    model = _setup_model(
+        data_set=evaluation_set,
+        model_type=model_type,
+        latent_size=latent_size,
+        hidden_sizes=hidden_sizes,
+        number_of_importance_samples=number_of_importance_samples,
+        number_of_monte_carlo_samples=number_of_monte_carlo_samples,
+        inference_architecture=inference_architecture,
+        latent_distribution=latent_distribution,
+        number_of_classes=number_of_classes,
+        parameterise_latent_posterior=parameterise_latent_posterior,
+        prior_probabilities_method=prior_probabilities_method,
+        generative_architecture=generative_architecture,
+        reconstruction_distribution=reconstruction_distribution,
+        number_of_reconstruction_classes=number_of_reconstruction_classes,
+        count_sum=count_sum,
+        sparse_input=sparse_input,
+        sparse_reconstruction=sparse_reconstruction,
+        batched_clusters=batched_clusters,
+        proportion_of_free_nats_for_y_kl_divergence=(
+            proportion_of_free_nats_for_y_kl_divergence),
+        minibatch_normalisation=minibatch_normalisation,
+        batch_correction=batch_correction,
+        dropout_keep_probabilities=dropout_keep_probabilities,
+        number_of_warm_up_epochs=number_of_warm_up_epochs,
+        kl_weight=kl_weight,
+        models_directory=models_directory
+    )
 
-            cluster_ids, predicted_labels, predicted_superset_labels = (
-                predict_labels(
-                    training_set=latent_prediction_training_sets["z"],
-                    evaluation_set=latent_evaluation_sets["z"],
-                    specifications=prediction_specifications
-                )
-            )
+    if not model.has_been_trained(run_id=run_id):
+        raise Exception(
+            "Model not found. Either it has not been trained or "
+            "scVAE is looking in the wrong directory. "
+            "The model directory resulting from the model specification is: "
+            "\"{}\"".format(model.log_directory())
+        )
 
-            evaluation_set_versions = [
-                transformed_evaluation_set, reconstructed_evaluation_set
-            ] + list(latent_evaluation_sets.values())
+    if ("best_model" in model_versions
+            and not better_model_exists(model, run_id=run_id)):
+        model_versions.remove("best_model")
 
-            for evaluation_set_version in evaluation_set_versions:
-                evaluation_set_version.update_predictions(
-                    prediction_specifications=prediction_specifications,
-                    predicted_cluster_ids=cluster_ids,
-                    predicted_labels=predicted_labels,
-                    predicted_superset_labels=predicted_superset_labels
-                )
-            print()
+    if ("early_stopping" in model_versions
+            and not model_stopped_early(model, run_id=run_id)):
+        model_versions.remove("early_stopping")
 
-        print(heading("{} analysis".format(
-            model_version.replace("_", "-").capitalize())))
+    print(title("Serving"))
 
-        analyses.analyse_results(
-            evaluation_set=transformed_evaluation_set,
-            reconstructed_evaluation_set=reconstructed_evaluation_set,
-            latent_evaluation_sets=latent_evaluation_sets,
-            model=model,
+    served_models = {}
+
+    for model_version in model_versions:
+        served_models[model_version] = ServedModel(
+            model,
+            data_set=evaluation_set,
             run_id=run_id,
-            sample_reconstruction_set=sample_reconstruction_set,
-            decomposition_methods=decomposition_methods,
-            evaluation_subset_indices=evaluation_subset_indices,
-            highlight_feature_indices=highlight_feature_indices,
-            best_model=use_best_model,
-            early_stopping=use_early_stopping_model,
-            included_analyses=included_analyses,
-            analysis_level=analysis_level,
-            export_options=export_options,
-            analyses_directory=analyses_directory
+            use_best_model=model_version == "best_model",
+            use_early_stopping_model=model_version == "early_stopping",
+            batching_window=batching_window,
+            maximum_batch_size=maximum_batch_size
         )
+        print("Restored {}.".format(model_version.replace("_", " ")))
+
+    with ModelServer(served_models, host=host, port=port) as server:
+        print("Serving {} set of {} examples at {}.".format(
+            evaluation_set.kind, evaluation_set.number_of_examples,
+            server.address))
+        print("Stop serving with Ctrl-C.")
+        print()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print()
+            print("Stopped serving.")
 
     return 0
 
@@ -608,6 +1255,8 @@ def _setup_model(data_set, model_type=None,
                  generative_architecture=None,
                  reconstruction_distribution=None,
                  number_of_reconstruction_classes=None, count_sum=None,
+                 sparse_input=None, sparse_reconstruction=None,
+                 batched_clusters=None,
                  proportion_of_free_nats_for_y_kl_divergence=None,
                  minibatch_normalisation=None, batch_correction=None,
                  dropout_keep_probabilities=None,
@@ -644,6 +1293,8 @@ def _setup_model(data_set, model_type=None,
             number_of_batches=number_of_batches,
             dropout_keep_probabilities=dropout_keep_probabilities,
             count_sum=count_sum,
+            sparse_input=sparse_input,
+            sparse_reconstruction=sparse_reconstruction,
             number_of_warm_up_epochs=number_of_warm_up_epochs,
             kl_weight=kl_weight,
             log_directory=models_directory
@@ -678,6 +1329,9 @@ def _setup_model(data_set, model_type=None,
             number_of_batches=number_of_batches,
             dropout_keep_probabilities=dropout_keep_probabilities,
             count_sum=count_sum,
+            sparse_input=sparse_input,
+            sparse_reconstruction=sparse_reconstruction,
+            batched_clusters=batched_clusters,
             number_of_warm_up_epochs=number_of_warm_up_epochs,
             kl_weight=kl_weight,
             log_directory=models_directory
@@ -740,6 +1394,35 @@ def main():
     evaluation_subparsers.append(parser_evaluate)
     analysis_subparsers.append(parser_evaluate)
 
+    parser_export = subparsers.add_parser(
+        name="export",
+        description=(
+            "Export encoders of model for inference without TensorFlow."),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_export.set_defaults(func=export)
+    data_set_subparsers.append(parser_export)
+    model_subparsers.append(parser_export)
+
+    parser_embed = subparsers.add_parser(
+        name="embed",
+        description=(
+            "Embed examples of large data set file in chunks using model "
+            "trained on data set."),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_embed.set_defaults(func=embed)
+    data_set_subparsers.append(parser_embed)
+    model_subparsers.append(parser_embed)
+
+    parser_serve = subparsers.add_parser(
+        name="serve",
+        description=(
+            "Serve model and data set kept in memory for embedding, "
+            "evaluation, and sampling requests."),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser_serve.set_defaults(func=serve)
+    data_set_subparsers.append(parser_serve)
+    model_subparsers.append(parser_serve)
+
     parser_cross_analyse = subparsers.add_parser(
         name="cross-analyse",
         description="Cross-analyse models and results on withheld data sets.",
@@ -764,6 +1447,20 @@ def main():
             default=_parse_default(defaults["data"]["directory"]),
             help="directory where data are placed or copied"
         )
+        subparser.add_argument(
+            "--parsing-chunk-size",
+            metavar="SIZE",
+            type=int,
+            default=_parse_default(defaults["data"]["parsing_chunk_size"]),
+            help="number of bytes parsed at a time from text-based files"
+        )
+        subparser.add_argument(
+            "--parsing-workers",
+            metavar="NUMBER",
+            type=int,
+            default=_parse_default(defaults["data"]["parsing_workers"]),
+            help="number of processes parsing text-based files"
+        )
         subparser.add_argument(
             "--map-features",
             action="store_true",
@@ -958,6 +1655,15 @@ def main():
                 "minibatch_normalisation"]),
             help="use batch normalisation for minibatches in models"
         )
+        subparser.add_argument(
+            "--no-minibatch-normalisation",
+            dest="minibatch_normalisation",
+            action="store_false",
+            help=(
+                "do not use batch normalisation for minibatches in models "
+                "(required for data-parallel training)"
+            )
+        )
         subparser.add_argument(
             "--batch-correction", "--bc",
             action="store_true",
@@ -984,6 +1690,35 @@ def main():
             default=_parse_default(defaults["models"]["count_sum"]),
             help="use count sum"
         )
+        subparser.add_argument(
+            "--sparse-input",
+            action="store_true",
+            default=_parse_default(defaults["models"]["sparse_input"]),
+            help=(
+                "feed values to models as sparse matrices and use sparse "
+                "matrix multiplication in the first layer"
+            )
+        )
+        subparser.add_argument(
+            "--sparse-reconstruction",
+            action="store_true",
+            default=_parse_default(defaults["models"][
+                "sparse_reconstruction"]),
+            help=(
+                "evaluate the likelihood function using closed-form "
+                "probabilities for zero values and full probabilities for "
+                "nonzero values only"
+            )
+        )
+        subparser.add_argument(
+            "--batched-clusters",
+            action="store_true",
+            default=_parse_default(defaults["models"]["batched_clusters"]),
+            help=(
+                "compute all clusters of Gaussian-mixture models at once by "
+                "folding them into the minibatch"
+            )
+        )
         subparser.add_argument(
             "--minibatch-size", "-B",
             metavar="SIZE",
@@ -1035,6 +1770,92 @@ def main():
             default=_parse_default(defaults["models"]["reset_training"]),
             help="reset already trained model"
         )
+        subparser.add_argument(
+            "--input-pipeline",
+            action="store_true",
+            default=_parse_default(defaults["models"]["input_pipeline"]),
+            help=(
+                "prepare minibatches in the background using a prefetching "
+                "input pipeline"
+            )
+        )
+        subparser.add_argument(
+            "--prefetch-size",
+            metavar="SIZE",
+            type=int,
+            default=_parse_default(defaults["models"]["prefetch_size"]),
+            help=(
+                "number of minibatches to prepare in advance when using the "
+                "input pipeline or the producer thread"
+            )
+        )
+        subparser.add_argument(
+            "--producer-thread",
+            action="store_true",
+            default=_parse_default(defaults["models"]["producer_thread"]),
+            help=(
+                "prepare minibatches in a background thread while training "
+                "on the current minibatch"
+            )
+        )
+        subparser.add_argument(
+            "--evaluation-budget",
+            type=str,
+            choices=["full", "subsample", "running"],
+            default=_parse_default(defaults["models"]["evaluation_budget"]),
+            help=(
+                "how to evaluate the model after each epoch: on all "
+                "examples, on a fixed random subsample of examples, or "
+                "using running averages of the training steps"
+            )
+        )
+        subparser.add_argument(
+            "--evaluation-subsample-size",
+            metavar="SIZE",
+            type=int,
+            default=_parse_default(defaults["models"][
+                "evaluation_subsample_size"]),
+            help="number of examples used for evaluation when subsampling"
+        )
+        subparser.add_argument(
+            "--asynchronous-checkpoints",
+            action="store_true",
+            default=_parse_default(
+                defaults["models"]["asynchronous_checkpoints"]),
+            help="write checkpoints in a background thread during training"
+        )
+        subparser.add_argument(
+            "--data-parallel-workers",
+            metavar="N",
+            type=int,
+            default=_parse_default(defaults["models"][
+                "data_parallel_workers"]),
+            help=(
+                "number of shards each minibatch is split into for computing "
+                "gradients in parallel"
+            )
+        )
+        subparser.add_argument(
+            "--data-parallel-reference-steps",
+            metavar="N",
+            type=int,
+            default=_parse_default(defaults["models"][
+                "data_parallel_reference_steps"]),
+            help=(
+                "number of initial steps also computed without sharding to "
+                "measure the speed-up of data-parallel training"
+            )
+        )
+        subparser.add_argument(
+            "--asynchronous-intermediate-analyses",
+            action="store_true",
+            default=_parse_default(defaults["analyses"][
+                "asynchronous_intermediate_analyses"]),
+            help=(
+                "plot intermediate results in a background process during "
+                "training"
+            )
+        )
         subparser.add_argument(
             "--caches-directory", "-C",
             metavar="DIRECTORY",
@@ -1115,6 +1936,44 @@ def main():
             default=_parse_default(defaults["models"]["sample_size"]),
             help="sample size for sampling model"
         )
+        subparser.add_argument(
+            "--draw-counts",
+            action="store_true",
+            default=_parse_default(defaults["models"]["draw_counts"]),
+            help=(
+                "draw values from reconstruction distribution instead of "
+                "using its means when sampling model"
+            )
+        )
+        subparser.add_argument(
+            "--sample-chunk-size",
+            metavar="SIZE",
+            type=int,
+            default=_parse_default(defaults["models"]["sample_chunk_size"]),
+            help=(
+                "evaluate importance-weighted and Monte Carlo samples in "
+                "chunks of this size, keeping the minibatch size"
+            )
+        )
+        subparser.add_argument(
+            "--output-sink",
+            metavar="SINK",
+            choices=["memory", "npy", "hdf5"],
+            default=_parse_default(defaults["models"]["output_sink"]),
+            help=(
+                "where reconstructions, latent values, and samples are "
+                "written during evaluation: memory, npy, or hdf5"
+            )
+        )
+        subparser.add_argument(
+            "--use-inference-graph",
+            action="store_true",
+            default=_parse_default(defaults["models"]["use_inference_graph"]),
+            help=(
+                "evaluate using inference graphs exported with the export "
+                "command"
+            )
+        )
         subparser.add_argument(
             "--prediction-method", "-P",
             metavar="METHOD",
@@ -1142,7 +2001,155 @@ def main():
                 "early-stopping"
             )
         )
+        subparser.add_argument(
+            "--parallel-model-versions",
+            action="store_true",
+            default=_parse_default(
+                defaults["evaluation"]["parallel_model_versions"]),
+            help=(
+                "evaluate model versions concurrently, preparing each "
+                "minibatch once for all versions"
+            )
+        )
+
+    parser_export.add_argument(
+        "--evaluation-set-kind",
+        metavar="KIND",
+        default=_parse_default(defaults["evaluation"]["data_set_kind"]),
+        help=(
+            "kind of subset used for validation: "
+            "training, validation, test (default), or full"
+        )
+    )
+    parser_export.add_argument(
+        "--model-versions",
+        metavar="VERSION",
+        nargs="+",
+        default=_parse_default(defaults["evaluation"]["model_versions"]),
+        help=(
+            "model versions to export: end-of-training, best-model, "
+            "early-stopping"
+        )
+    )
+    parser_export.add_argument(
+        "--validate",
+        action="store_true",
+        help=(
+            "validate exported encoders against evaluating model on "
+            "evaluation set"
+        )
+    )
+    parser_export.add_argument(
+        "--inference-graph",
+        action="store_true",
+        help=(
+            "also export frozen inference graph with folded minibatch "
+            "normalisation for evaluation"
+        )
+    )
 
+    parser_embed.add_argument(
+        "--input-file", "-i",
+        dest="input_path",
+        metavar="PATH",
+        required=True,
+        help="path to data set file with examples to embed"
+    )
+    parser_embed.add_argument(
+        "--input-format",
+        metavar="FORMAT",
+        choices=CHUNKED_DATA_FORMATS,
+        help=(
+            "format of data set file with examples to embed "
+            "(inferred by default): {}".format(
+                enumerate_strings(CHUNKED_DATA_FORMATS, conjunction="or"))
+        )
+    )
+    parser_embed.add_argument(
+        "--model-versions",
+        metavar="VERSION",
+        nargs="+",
+        default=_parse_default(defaults["evaluation"]["model_versions"]),
+        help=(
+            "model versions to embed examples with: end-of-training, "
+            "best-model, early-stopping"
+        )
+    )
+    parser_embed.add_argument(
+        "--output-directory", "-o",
+        metavar="DIRECTORY",
+        help=(
+            "directory for embeddings (by default, in the log directory "
+            "of the model)"
+        )
+    )
+    parser_embed.add_argument(
+        "--output-format",
+        metavar="FORMAT",
+        choices=[
+            output_sink for output_sink in OUTPUT_SINKS
+            if output_sink != "memory"
+        ],
+        default=_parse_default(defaults["embedding"]["output_format"]),
+        help="format of embedding files: npy or hdf5"
+    )
+    parser_embed.add_argument(
+        "--chunk-size",
+        metavar="SIZE",
+        type=int,
+        default=_parse_default(defaults["embedding"]["chunk_size"]),
+        help="number of examples read from data set file at a time"
+    )
+    parser_embed.add_argument(
+        "--reconstructions",
+        action="store_true",
+        help="also save means of reconstructed values"
+    )
+    parser_serve.add_argument(
+        "--evaluation-set-kind",
+        metavar="KIND",
+        default=_parse_default(defaults["evaluation"]["data_set_kind"]),
+        help=(
+            "kind of subset served: "
+            "training, validation, test (default), or full"
+        )
+    )
+    parser_serve.add_argument(
+        "--model-versions",
+        metavar="VERSION",
+        nargs="+",
+        default=_parse_default(defaults["evaluation"]["model_versions"]),
+        help=(
+            "model versions to serve: end-of-training, best-model, "
+            "early-stopping"
+        )
+    )
+    parser_serve.add_argument(
+        "--host",
+        metavar="HOST",
+        default=_parse_default(defaults["serving"]["host"]),
+        help="host name or address to listen on"
+    )
+    parser_serve.add_argument(
+        "--port",
+        type=int,
+        default=_parse_default(defaults["serving"]["port"]),
+        help="port to listen on"
+    )
+    parser_serve.add_argument(
+        "--batching-window",
+        metavar="SECONDS",
+        type=float,
+        default=_parse_default(defaults["serving"]["batching_window"]),
+        help="number of seconds to wait for embedding requests to batch"
+    )
+    parser_serve.add_argument(
+        "--maximum-batch-size",
+        metavar="SIZE",
+        type=int,
+        default=_parse_default(defaults["serving"]["maximum_batch_size"]),
+        help="maximum number of examples in a batch of embedding requests"
+    )
     parser_cross_analyse.add_argument(
         "analyses_directory",
         metavar="ANALYSES_DIRECTORY",
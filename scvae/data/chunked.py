@@ -0,0 +1,305 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import os
+
+import loompy
+import numpy
+import scipy.sparse
+import tables
+
+from scvae.utilities import normalise_string
+
+CHUNKED_DATA_FORMATS = ["10x", "loom", "internal"]
+
+# Preprocessing methods applied to each example separately, which can
+# therefore be applied to chunks of examples
+CHUNKED_PREPROCESSING_METHODS = ["log", "exp", "binarise"]
+
+
+class ChunkedValuesReader:
+    """Reader of values of a data set in chunks of examples.
+
+    Only the names of examples and features are read when opening the
+    file, and the values are read a chunk of examples at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.example_names = None
+        self.feature_names = None
+
+    @property
+    def number_of_examples(self):
+        return len(self.example_names)
+
+    @property
+    def number_of_features(self):
+        return len(self.feature_names)
+
+    def chunks(self, chunk_size):
+        """Iterate over chunks of examples.
+
+        Arguments:
+            chunk_size (int): Number of examples in each chunk.
+
+        Yields:
+            Pairs of the slice of examples in the chunk and their values
+            as a sparse matrix with examples as rows.
+        """
+        for start in range(0, self.number_of_examples, chunk_size):
+            stop = min(start + chunk_size, self.number_of_examples)
+            yield slice(start, stop), self.read(start, stop)
+
+    def read(self, start, stop):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+
+class CompressedSparseHDF5Reader(ChunkedValuesReader):
+    """Reader of a compressed sparse matrix stored in an HDF5 group.
+
+    Arguments:
+        path (str): Path to HDF5 file.
+        tables_file (tables.File): Open HDF5 file, which is closed
+            together with the reader.
+        group (tables.Group): Group with the arrays ``data``,
+            ``indices``, ``indptr``, and ``shape``.
+        examples_as_rows (bool): If ``True``, the matrix is stored in
+            compressed sparse row format with examples as rows.
+            Otherwise, it is stored in compressed sparse column format
+            with examples as columns.
+    """
+
+    def __init__(self, path, tables_file, group, examples_as_rows):
+        super().__init__(path)
+        self._tables_file = tables_file
+        self._data = group.data
+        self._indices = group.indices
+        self._indptr = group.indptr.read()
+        self._number_of_inner_elements = int(
+            group.shape.read()[1 if examples_as_rows else 0])
+
+    def read(self, start, stop):
+        indptr = self._indptr[start:(stop + 1)]
+        data = self._data[indptr[0]:indptr[-1]]
+        indices = self._indices[indptr[0]:indptr[-1]]
+        return scipy.sparse.csr_matrix(
+            (data, indices, indptr - indptr[0]),
+            shape=(stop - start, self._number_of_inner_elements)
+        )
+
+    def close(self):
+        self._tables_file.close()
+
+
+class TenXHDF5Reader(CompressedSparseHDF5Reader):
+    """Reader of a 10x Genomics HDF5 file with cells as columns."""
+
+    def __init__(self, path):
+
+        tables_file = tables.open_file(path, mode="r")
+        group = _find_sparse_matrix_group(tables_file)
+
+        super().__init__(path, tables_file, group, examples_as_rows=False)
+
+        self.example_names = _decode_names(group.barcodes.read())
+        if "gene_names" in group:
+            self.feature_names = _decode_names(group.gene_names.read())
+        else:
+            self.feature_names = _decode_names(group.features.name.read())
+
+
+class InternalHDF5Reader(CompressedSparseHDF5Reader):
+    """Reader of a data set saved in the internal HDF5 format."""
+
+    def __init__(self, path):
+
+        tables_file = tables.open_file(path, mode="r")
+        root = tables_file.root
+
+        super().__init__(path, tables_file, root.values, examples_as_rows=True)
+
+        self.example_names = _decode_names(root.example_names.read())
+        self.feature_names = _decode_names(root.feature_names.read())
+
+
+class LoomReader(ChunkedValuesReader):
+    """Reader of a Loom file with cells as columns."""
+
+    def __init__(self, path):
+
+        super().__init__(path)
+        self._data_file = loompy.connect(path, mode="r")
+
+        number_of_features, number_of_examples = self._data_file.shape
+
+        if "CellID" in self._data_file.ca:
+            self.example_names = (
+                self._data_file.ca["CellID"].flatten().astype("U"))
+        elif "Cell" in self._data_file.ca:
+            self.example_names = self._data_file.ca["Cell"].flatten()
+        else:
+            self.example_names = numpy.array([
+                "Cell {}".format(j + 1) for j in range(number_of_examples)])
+
+        if "Gene" in self._data_file.ra:
+            self.feature_names = (
+                self._data_file.ra["Gene"].flatten().astype("U"))
+        else:
+            self.feature_names = numpy.array([
+                "Gene {}".format(j + 1) for j in range(number_of_features)])
+
+    def read(self, start, stop):
+        return scipy.sparse.csr_matrix(self._data_file[:, start:stop].T)
+
+    def close(self):
+        self._data_file.close()
+
+
+def open_chunked_reader(path, data_format=None):
+    """Open reader of values of a data set in chunks of examples.
+
+    Arguments:
+        path (str): Path to data set file.
+        data_format (str, optional): Format of the data set file:
+            ``"10x"`` (HDF5 file from 10x Genomics), ``"loom"``, or
+            ``"internal"`` (HDF5 file saved by scVAE). By default, the
+            format is inferred from the file.
+
+    Returns:
+        Chunked values reader.
+    """
+
+    if data_format is None:
+        extension = os.path.splitext(path)[-1]
+        if extension == ".loom":
+            data_format = "loom"
+        elif extension in [".h5", ".hdf5"]:
+            with tables.open_file(path, mode="r") as tables_file:
+                if "/values" in tables_file:
+                    data_format = "internal"
+                else:
+                    data_format = "10x"
+        else:
+            raise ValueError(
+                "Cannot infer format of data set file `{}`.".format(path))
+
+    data_format = normalise_string(data_format)
+
+    if data_format == "10x":
+        return TenXHDF5Reader(path)
+    elif data_format == "loom":
+        return LoomReader(path)
+    elif data_format == "internal":
+        return InternalHDF5Reader(path)
+    else:
+        raise ValueError(
+            "Data format `{}` cannot be read in chunks.".format(data_format))
+
+
+class FeatureAligner:
+    """Align features of values to a list of feature names.
+
+    The index map between the two lists of feature names is computed
+    once and then applied to each chunk of values. Features not found
+    in the values are set to zero, and features not in the list are
+    dropped.
+
+    Arguments:
+        feature_names (array_like): Feature names of the values.
+        target_feature_names (array_like): Feature names to align to.
+    """
+
+    def __init__(self, feature_names, target_feature_names):
+
+        feature_indices = {}
+        for i, feature_name in enumerate(feature_names):
+            feature_indices.setdefault(feature_name, i)
+
+        source_indices = []
+        target_indices = []
+
+        for j, feature_name in enumerate(target_feature_names):
+            i = feature_indices.get(feature_name)
+            if i is not None:
+                source_indices.append(i)
+                target_indices.append(j)
+
+        self.number_of_features = len(feature_names)
+        self.number_of_target_features = len(target_feature_names)
+        self.number_of_matched_features = len(target_indices)
+        self.identity = (
+            self.number_of_features == self.number_of_target_features
+            and self.number_of_matched_features
+            == self.number_of_target_features
+            and source_indices == target_indices
+        )
+
+        # Target column of each feature of the values, or -1 for features
+        # without a target
+        self._column_map = numpy.full(
+            self.number_of_features, -1, dtype=numpy.int64)
+        self._column_map[source_indices] = target_indices
+
+    def align(self, values):
+        """Align features of values.
+
+        Arguments:
+            values (matrix): Sparse matrix with examples as rows.
+
+        Returns:
+            Sparse matrix with the target features as columns.
+        """
+
+        values = scipy.sparse.csr_matrix(values)
+
+        if self.identity:
+            return values
+
+        columns = self._column_map[values.indices]
+        kept = columns >= 0
+        rows = numpy.repeat(
+            numpy.arange(values.shape[0]), numpy.diff(values.indptr))
+
+        return scipy.sparse.csr_matrix(
+            (values.data[kept], (rows[kept], columns[kept])),
+            shape=(values.shape[0], self.number_of_target_features)
+        )
+
+
+def _find_sparse_matrix_group(tables_file):
+    for group in tables_file.walk_groups("/"):
+        if "indptr" in group:
+            return group
+    raise ValueError(
+        "No sparse matrix found in `{}`.".format(tables_file.filename))
+
+
+def _decode_names(names):
+    if names.dtype.char == "S":
+        names = numpy.char.decode(names, "UTF-8")
+    return names.astype("U")
@@ -16,6 +16,7 @@
 #
 # ======================================================================== #
 
+import functools
 import os
 import re
 import shutil
@@ -243,6 +244,7 @@ class DataSet:
         self.normalised_count_sum = None
         self.preprocessed_values = None
         self.binarised_values = None
+        self._noisy_values = None
         self.labels = None
         self.example_names = None
         self.feature_names = None
@@ -302,6 +304,16 @@ class DataSet:
         if self.features_mapped:
             self.terms = _update_tag_for_mapped_features(self.terms)
 
+        # Parsing of original text-based data sets
+        parsing_chunk_size = kwargs.get("parsing_chunk_size")
+        if parsing_chunk_size is None:
+            parsing_chunk_size = defaults["data"]["parsing_chunk_size"]
+        self.parsing_chunk_size = parsing_chunk_size
+        parsing_workers = kwargs.get("parsing_workers")
+        if parsing_workers is None:
+            parsing_workers = defaults["data"]["parsing_workers"]
+        self.parsing_workers = parsing_workers
+
         # Feature selection
         if feature_selection is None:
             feature_selection = defaults["data"]["feature_selection"]
@@ -366,13 +378,22 @@ class DataSet:
             noisy_preprocessing_methods = []
         self.noisy_preprocessing_methods = noisy_preprocessing_methods
 
+        # Deterministic noisy preprocessing is applied once to the values,
+        # while the random remainder is applied to each minibatch
+        self._noisy_deterministic_preprocess = None
+        self.noisy_preprocess = None
+
         if self.noisy_preprocessing_methods:
+            deterministic_methods, random_methods = (
+                processing.split_noisy_preprocessing_methods(
+                    self.noisy_preprocessing_methods))
+            if deterministic_methods:
+                self._noisy_deterministic_preprocess = (
+                    processing.build_preprocessor(deterministic_methods))
             self.noisy_preprocess = processing.build_preprocessor(
-                self.noisy_preprocessing_methods,
+                random_methods,
                 noisy=True
             )
-        else:
-            self.noisy_preprocess = None
 
         if self.kind == "full" and self.values is None:
 
@@ -453,6 +474,20 @@ class DataSet:
 
         return class_probabilities
 
+    @property
+    def noisy_values(self):
+        """Values with deterministic noisy preprocessing applied.
+
+        The random part of the noisy preprocessing, `noisy_preprocess`,
+        is applied to minibatches of these values.
+        """
+        if self._noisy_deterministic_preprocess is None:
+            return self.values
+        if self._noisy_values is None and self.values is not None:
+            self._noisy_values = self._noisy_deterministic_preprocess(
+                self.values)
+        return self._noisy_values
+
     @property
     def has_values(self):
         return self.values is not None
@@ -530,6 +565,7 @@ class DataSet:
         if values is not None:
 
             self.values = values
+            self._noisy_values = None
 
             self.count_sum = self.values.sum(axis=1).reshape(-1, 1)
             if isinstance(self.count_sum, numpy.matrix):
@@ -767,7 +803,9 @@ class DataSet:
             loading_time_start = time()
             data_dictionary = loading.load_original_data_set(
                 paths=original_paths,
-                data_format=self.data_format
+                data_format=self.data_format,
+                parsing_chunk_size=self.parsing_chunk_size,
+                parsing_workers=self.parsing_workers
             )
             loading_duration = time() - loading_time_start
 
@@ -1248,6 +1286,7 @@ class DataSet:
         self.normalised_count_sum = None
         self.preprocessed_values = None
         self.binarised_values = None
+        self._noisy_values = None
         self.labels = None
         self.example_names = None
         self.feature_names = None
@@ -1396,29 +1435,33 @@ def _create_label_sorter(sorted_class_names=None):
     if not sorted_class_names:
         sorted_class_names = []
 
-    def sort_key_for_label(label):
+    # Partial application of a module-level function keeps the label sorter
+    # picklable, so that data sets can be sent to other processes
+    return functools.partial(
+        _sort_key_for_label, sorted_class_names=sorted_class_names)
 
-        label = str(label)
 
-        if label.isdigit():
-            number = int(label)
-        elif label.isdecimal():
-            number = float(label)
-        else:
-            number = numpy.nan
+def _sort_key_for_label(label, sorted_class_names):
 
-        n_sorted = len(sorted_class_names)
-        n_generic = len(GENERIC_CLASS_NAMES)
+    label = str(label)
 
-        if label in sorted_class_names:
-            index = sorted_class_names.index(label)
-        elif label in GENERIC_CLASS_NAMES:
-            index = n_sorted + GENERIC_CLASS_NAMES.index(label)
-        else:
-            index = n_sorted + n_generic
+    if label.isdigit():
+        number = int(label)
+    elif label.isdecimal():
+        number = float(label)
+    else:
+        number = numpy.nan
+
+    n_sorted = len(sorted_class_names)
+    n_generic = len(GENERIC_CLASS_NAMES)
 
-        sort_key = [number, index, label]
+    if label in sorted_class_names:
+        index = sorted_class_names.index(label)
+    elif label in GENERIC_CLASS_NAMES:
+        index = n_sorted + GENERIC_CLASS_NAMES.index(label)
+    else:
+        index = n_sorted + n_generic
 
-        return sort_key
+    sort_key = [number, index, label]
 
-    return sort_key_for_label
+    return sort_key
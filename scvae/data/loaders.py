@@ -16,7 +16,13 @@
 #
 # ======================================================================== #
 
+import collections
+import concurrent.futures
+import csv
+import functools
 import gzip
+import io
+import multiprocessing
 import os
 import pickle
 import struct
@@ -28,6 +34,7 @@ import pandas
 import scipy
 import tables
 
+from scvae.defaults import defaults
 from scvae.utilities import normalise_string
 
 # List name strings are normalised, so no need to check for
@@ -55,12 +62,15 @@ def _register_loader(name):
 
 
 @_register_loader("macosko")
-def _load_macokso_data_set(paths):
+def _load_macokso_data_set(paths, **kwargs):
 
     values, column_headers, row_indices = _load_tab_separated_matrix(
-        paths["values"]["full"], numpy.float32)
+        paths["values"]["full"], numpy.float32,
+        chunk_size=kwargs.get("parsing_chunk_size"),
+        number_of_workers=kwargs.get("parsing_workers")
+    )
 
-    values = values.T
+    values = values.T.tocsr()
     example_names = numpy.array(column_headers)
 
     feature_column = 0
@@ -90,9 +100,10 @@ def _load_macokso_data_set(paths):
 
 
 @_register_loader("10x")
-def _load_10x_data_set(paths):
+def _load_10x_data_set(paths, **kwargs):
 
-    data_dictionary = _load_values_from_10x_data_set(paths["values"]["full"])
+    data_dictionary = _load_values_from_10x_data_set(
+        paths["values"]["full"], **kwargs)
     values = data_dictionary["values"]
     example_names = data_dictionary["example names"]
     feature_names = data_dictionary["feature names"]
@@ -120,7 +131,7 @@ def _load_10x_data_set(paths):
 
 
 @_register_loader("h5")
-def _load_h5_data_set(paths):
+def _load_h5_data_set(paths, **kwargs):
 
     data_dictionary = _load_sparse_matrix_in_hdf5_format(
         paths["values"]["full"])
@@ -149,7 +160,7 @@ def _load_h5_data_set(paths):
 
 
 @_register_loader("10x_combine")
-def _load_and_combine_10x_data_sets(paths):
+def _load_and_combine_10x_data_sets(paths, **kwargs):
 
     # Initialisation
 
@@ -161,7 +172,7 @@ def _load_and_combine_10x_data_sets(paths):
     # Loading values from separate data sets
 
     for class_name, path in paths["all"].items():
-        data_dictionary = _load_values_from_10x_data_set(path)
+        data_dictionary = _load_values_from_10x_data_set(path, **kwargs)
         value_sets[class_name] = data_dictionary["values"]
         example_name_sets[class_name] = data_dictionary["example names"]
         feature_name_sets[class_name] = data_dictionary["feature names"]
@@ -220,16 +231,19 @@ def _load_and_combine_10x_data_sets(paths):
 
 
 @_register_loader("tcga")
-def _load_tcga_data_set(paths):
+def _load_tcga_data_set(paths, **kwargs):
 
     # Values, example names, and feature names
 
     values, column_headers, row_indices = _load_tab_separated_matrix(
-        paths["values"]["full"], numpy.float32)
+        paths["values"]["full"], numpy.float32,
+        chunk_size=kwargs.get("parsing_chunk_size"),
+        number_of_workers=kwargs.get("parsing_workers")
+    )
 
-    values = values.T
-    values = numpy.power(2, values) - 1
-    values = numpy.round(values)
+    values = values.T.tocsr()
+    values.data = numpy.round(numpy.power(2, values.data) - 1)
+    values.eliminate_zeros()
 
     example_names = numpy.array(column_headers)
 
@@ -282,14 +296,17 @@ def _load_tcga_data_set(paths):
 
 
 @_register_loader("gtex")
-def _load_gtex_data_set(paths):
+def _load_gtex_data_set(paths, **kwargs):
 
     # Values, example names and feature names
 
     values, column_headers, row_indices = _load_tab_separated_matrix(
-        paths["values"]["full"], numpy.float32)
+        paths["values"]["full"], numpy.float32,
+        chunk_size=kwargs.get("parsing_chunk_size"),
+        number_of_workers=kwargs.get("parsing_workers")
+    )
 
-    values = values.T
+    values = values.T.tocsr()
 
     example_names = numpy.array(column_headers)
 
@@ -336,14 +353,24 @@ def _load_gtex_data_set(paths):
 
 
 @_register_loader("loom")
-def _load_loom_data_set(paths):
+def _load_loom_data_set(paths, **kwargs):
 
     values = labels = example_names = feature_names = batch_indices = None
 
+    chunk_size = defaults["data"]["loom_chunk_size"]
+
     with loompy.connect(paths["all"]["full"]) as data_file:
 
-        values = data_file[:, :].T
-        n_examples, n_features = values.shape
+        n_features, n_examples = data_file.shape
+
+        # Read cells a chunk at a time, so only one chunk of the main
+        # matrix is stored densely at a time
+        value_chunks = []
+        for start in range(0, n_examples, chunk_size):
+            stop = min(start + chunk_size, n_examples)
+            value_chunks.append(
+                scipy.sparse.csr_matrix(data_file[:, start:stop].T))
+        values = scipy.sparse.vstack(value_chunks, format="csr")
 
         if "ClusterName" in data_file.ca:
             labels = data_file.ca["ClusterName"].flatten()
@@ -387,23 +414,25 @@ def _load_loom_data_set(paths):
 
 
 @_register_loader("matrix_fbe")
-def _load_fbe_matrix_as_data_set(paths):
+def _load_fbe_matrix_as_data_set(paths, **kwargs):
     return _load_values_and_labels_from_matrix(
         paths=paths,
-        orientation="fbe"
+        orientation="fbe",
+        **kwargs
     )
 
 
 @_register_loader("matrix_ebf")
-def _load_ebf_matrix_as_data_set(paths):
+def _load_ebf_matrix_as_data_set(paths, **kwargs):
     return _load_values_and_labels_from_matrix(
         paths=paths,
-        orientation="ebf"
+        orientation="ebf",
+        **kwargs
     )
 
 
 @_register_loader("mnist_original")
-def _load_original_mnist_data_set(paths):
+def _load_original_mnist_data_set(paths, **kwargs):
 
     values = {}
 
@@ -453,7 +482,7 @@ def _load_original_mnist_data_set(paths):
 
 
 @_register_loader("mnist_normalised")
-def _load_normalised_mnist_data_set(paths):
+def _load_normalised_mnist_data_set(paths, **kwargs):
 
     with gzip.open(paths["all"]["full"], mode="r") as data_file:
         ((values_training, labels_training),
@@ -498,7 +527,7 @@ def _load_normalised_mnist_data_set(paths):
 
 
 @_register_loader("mnist_binarised")
-def _load_binarised_mnist_data_set(paths):
+def _load_binarised_mnist_data_set(paths, **kwargs):
 
     values = {}
 
@@ -547,15 +576,19 @@ def _load_development_data_set(**kwargs):
     )
 
 
-def _load_values_and_labels_from_matrix(paths, orientation=None):
+def _load_values_and_labels_from_matrix(paths, orientation=None,
+                                        **kwargs):
 
     # Values
 
     values, column_headers, row_indices = _load_tab_separated_matrix(
-        paths["values"]["full"], numpy.float32)
+        paths["values"]["full"], numpy.float32,
+        chunk_size=kwargs.get("parsing_chunk_size"),
+        number_of_workers=kwargs.get("parsing_workers")
+    )
 
     if orientation == "fbe":
-        values = values.T
+        values = values.T.tocsr()
         example_names = column_headers
         feature_names = row_indices
     elif orientation == "ebf":
@@ -603,7 +636,7 @@ def _load_values_and_labels_from_matrix(paths, orientation=None):
     return data_dictionary
 
 
-def _load_values_from_10x_data_set(path):
+def _load_values_from_10x_data_set(path, **kwargs):
 
     parent_paths = set()
 
@@ -627,35 +660,51 @@ def _load_values_from_10x_data_set(path):
             values = scipy.sparse.csc_matrix(
                 (table["data"], table["indices"], table["indptr"]),
                 shape=table["shape"]
-            )
+            ).T
 
             example_names = table["barcodes"]
             feature_names = table["gene_names"]
 
-    elif path.endswith(".tar.gz"):
-        with tarfile.open(path, mode="r:gz") as tarball:
-            for member in sorted(tarball, key=lambda member: member.name):
-                if member.isfile():
-
-                    parent_path, filename = os.path.split(member.name)
-                    parent_paths.add(parent_path)
+    elif path.endswith(".tar.gz") or os.path.isdir(path):
+        for data_path, data_file in _10x_data_files(path):
 
-                    if len(parent_paths) > 1:
-                        raise multiple_directories_error
+            parent_path, filename = os.path.split(data_path)
+            parent_paths.add(parent_path)
 
-                    name, extension = os.path.splitext(filename)
+            if len(parent_paths) > 1:
+                raise multiple_directories_error
+
+            # Cell Ranger 3 compresses each file and renames `genes.tsv`
+            # to `features.tsv`
+            compressed = filename.endswith(".gz")
+            if compressed:
+                filename = filename[:-len(".gz")]
+                data_file = gzip.open(data_file)
+
+            name, extension = os.path.splitext(filename)
+
+            if filename == "matrix.mtx":
+                values = _load_matrix_market_by_columns(
+                    data_file,
+                    chunk_size=kwargs.get("parsing_chunk_size"),
+                    number_of_workers=kwargs.get("parsing_workers")
+                )
+            elif extension == ".tsv":
+                names = numpy.array(data_file.read().splitlines())
+                if name == "barcodes":
+                    example_names = names
+                elif name == "genes":
+                    feature_names = names
+                elif name == "features":
+                    # Keep feature ID and name like in `genes.tsv`, but
+                    # not feature type
+                    feature_names = numpy.array([
+                        b"\t".join(row.split(b"\t")[:2]) for row in names
+                    ])
+
+            if compressed:
+                data_file.close()
 
-                    with tarball.extractfile(member) as data_file:
-                        if filename == "matrix.mtx":
-                            values = scipy.io.mmread(data_file)
-                        elif extension == ".tsv":
-                            names = numpy.array(data_file.read().splitlines())
-                            if name == "barcodes":
-                                example_names = names
-                            elif name == "genes":
-                                feature_names = names
-
-    values = values.T
     example_names = example_names.astype("U")
     feature_names = feature_names.astype("U")
 
@@ -676,6 +725,161 @@ def _load_values_from_10x_data_set(path):
     return data_dictionary
 
 
+def _10x_data_files(path):
+
+    # Files are read either from a gzip-compressed tarball of a matrix
+    # directory or from an extracted matrix directory
+    if os.path.isdir(path):
+        path = os.path.normpath(path)
+        for filename in sorted(os.listdir(path)):
+            data_path = os.path.join(path, filename)
+            if os.path.isfile(data_path):
+                with open(data_path, mode="rb") as data_file:
+                    yield data_path, data_file
+    else:
+        with tarfile.open(path, mode="r:gz") as tarball:
+            for member in sorted(tarball, key=lambda member: member.name):
+                if member.isfile():
+                    with tarball.extractfile(member) as data_file:
+                        yield member.name, data_file
+
+
+def _load_matrix_market_by_columns(mtx_file, chunk_size=None,
+                                   number_of_workers=None):
+
+    if chunk_size is None:
+        chunk_size = defaults["data"]["parsing_chunk_size"]
+    if number_of_workers is None:
+        number_of_workers = defaults["data"]["parsing_workers"]
+
+    banner = mtx_file.readline().decode().split()
+
+    if (len(banner) != 5 or banner[0] != "%%MatrixMarket"
+            or banner[2] != "coordinate"):
+        raise ValueError("Not a coordinate Matrix Market file.")
+
+    field, symmetry = banner[3:]
+
+    if symmetry != "general":
+        raise NotImplementedError(
+            "Loading {} Matrix Market files not implemented.".format(
+                symmetry)
+        )
+
+    if field == "integer":
+        data_type = numpy.int64
+    elif field in ["real", "pattern"]:
+        data_type = numpy.float64
+    else:
+        raise NotImplementedError(
+            "Loading {} Matrix Market files not implemented.".format(field))
+
+    line = mtx_file.readline()
+    while line.startswith(b"%"):
+        line = mtx_file.readline()
+
+    n_rows, n_columns, n_entries = map(int, line.split())
+
+    # Entries are read a chunk of bytes at a time extended to the end of
+    # the last entry, while earlier chunks are parsed at once on separate
+    # threads
+    parse_chunk = functools.partial(
+        _parse_matrix_market_entries,
+        data_type=None if field == "pattern" else data_type
+    )
+
+    entry_chunks = []
+    pending_chunks = collections.deque()
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=number_of_workers) as executor:
+        while True:
+            chunk = mtx_file.read(chunk_size)
+            if not chunk:
+                break
+            if not chunk.endswith(b"\n"):
+                chunk += mtx_file.readline()
+            pending_chunks.append(executor.submit(parse_chunk, chunk))
+            if len(pending_chunks) > 2 * number_of_workers:
+                entry_chunks.append(pending_chunks.popleft().result())
+        while pending_chunks:
+            entry_chunks.append(pending_chunks.popleft().result())
+
+    row_indices = numpy.concatenate(
+        [numpy.empty(0, numpy.int64)]
+        + [row_indices for row_indices, _, _ in entry_chunks]
+    )
+    column_indices = numpy.concatenate(
+        [numpy.empty(0, numpy.int64)]
+        + [column_indices for _, column_indices, _ in entry_chunks]
+    )
+
+    if field == "pattern":
+        data = numpy.ones(len(row_indices), data_type)
+    else:
+        data = numpy.concatenate(
+            [numpy.empty(0, data_type)]
+            + [data for _, _, data in entry_chunks]
+        )
+
+    if len(data) != n_entries:
+        raise ValueError(
+            "Expected {} entries in Matrix Market file, but found {}."
+            .format(n_entries, len(data))
+        )
+
+    # Group entries by column directly into compressed sparse rows of the
+    # transposed matrix; Cell Ranger already writes entries by column
+    if numpy.any(numpy.diff(column_indices) < 0):
+        order = numpy.argsort(column_indices, kind="stable")
+        row_indices = row_indices[order]
+        column_indices = column_indices[order]
+        data = data[order]
+
+    index_pointers = numpy.zeros(n_columns + 1, numpy.int64)
+    numpy.cumsum(
+        numpy.bincount(column_indices, minlength=n_columns),
+        out=index_pointers[1:]
+    )
+
+    values = scipy.sparse.csr_matrix(
+        (data, row_indices, index_pointers),
+        shape=(n_columns, n_rows)
+    )
+
+    # Duplicate entries are summed as for other Matrix Market readers
+    values.sum_duplicates()
+
+    return values
+
+
+def _parse_matrix_market_entries(chunk, data_type=None):
+
+    column_types = {0: numpy.int64, 1: numpy.int64}
+    if data_type is not None:
+        column_types[2] = data_type
+
+    entries = pandas.read_csv(
+        io.BytesIO(chunk),
+        sep=r"\s+",
+        header=None,
+        dtype=column_types,
+        quoting=csv.QUOTE_NONE,
+        na_filter=False
+    )
+
+    # Matrix Market indices are one-based
+    row_indices = entries[0].to_numpy() - 1
+    column_indices = entries[1].to_numpy() - 1
+
+    if data_type is None:
+        data = None
+    else:
+        data = entries[2].to_numpy()
+
+    return row_indices, column_indices, data
+
+
 def _load_sparse_matrix_in_hdf5_format(path, example_names_key=None,
                                        feature_names_key=None):
 
@@ -753,7 +957,15 @@ def _load_sparse_matrix_in_hdf5_format(path, example_names_key=None,
     return data_dictionary
 
 
-def _load_tab_separated_matrix(tsv_path, data_type=None):
+def _load_tab_separated_matrix(tsv_path, data_type=None, chunk_size=None,
+                               number_of_workers=None):
+
+    if data_type is None:
+        data_type = numpy.float64
+    if chunk_size is None:
+        chunk_size = defaults["data"]["parsing_chunk_size"]
+    if number_of_workers is None:
+        number_of_workers = defaults["data"]["parsing_workers"]
 
     tsv_extension = tsv_path.split(os.extsep, 1)[-1]
 
@@ -767,9 +979,8 @@ def _load_tab_separated_matrix(tsv_path, data_type=None):
                 tsv_extension)
         )
 
-    values = []
-    row_indices = []
     column_headers = None
+    n_header_rows = 0
 
     with open_file(tsv_path, mode="rt") as tsv_file:
 
@@ -779,53 +990,148 @@ def _load_tab_separated_matrix(tsv_path, data_type=None):
 
             # Skip, if row could not be split into elements
             if len(row_elements) <= 1:
+                n_header_rows += 1
                 continue
 
             # Skip, if row only contains two integers before header
             # (assumed to be the shape of the matrix)
             elif (len(row_elements) == 2
                     and all([element.isdigit() for element in row_elements])):
+                n_header_rows += 1
                 continue
 
             elif all(_is_float(element) for element in row_elements):
                 break
 
             column_headers = row_elements
+            n_header_rows += 1
 
         if column_headers:
             row_elements = next(tsv_file).split()
 
-        for i, element in enumerate(row_elements):
-            if _is_float(element):
-                column_offset = i
-                break
+    for i, element in enumerate(row_elements):
+        if _is_float(element):
+            column_offset = i
+            break
 
-        if column_headers:
-            column_header_offset = column_offset - (
-                len(row_elements) - len(column_headers)
+    if column_headers:
+        column_header_offset = column_offset - (
+            len(row_elements) - len(column_headers)
+        )
+        column_headers = column_headers[column_header_offset:]
+
+    parsing_arguments = {
+        "column_offset": column_offset,
+        "n_columns": len(row_elements),
+        "data_type": data_type,
+        "chunk_size": chunk_size
+    }
+
+    # Uncompressed files are split into byte ranges of whole rows, which
+    # are parsed in separate processes
+    if open_file is open and number_of_workers > 1:
+
+        with open(tsv_path, mode="rb") as tsv_file:
+            for _ in range(n_header_rows):
+                tsv_file.readline()
+            start = tsv_file.tell()
+            stop = os.fstat(tsv_file.fileno()).st_size
+            byte_range_limits = [start]
+            for i in range(1, number_of_workers):
+                tsv_file.seek(max(
+                    start + i * (stop - start) // number_of_workers,
+                    byte_range_limits[-1]
+                ))
+                tsv_file.readline()
+                byte_range_limits.append(tsv_file.tell())
+            byte_range_limits.append(stop)
+
+        with multiprocessing.get_context("spawn").Pool(
+                number_of_workers) as pool:
+            parsed_byte_ranges = pool.starmap(
+                functools.partial(
+                    _parse_tab_separated_byte_range,
+                    tsv_path, **parsing_arguments),
+                zip(byte_range_limits[:-1], byte_range_limits[1:])
             )
-            column_headers = column_headers[column_header_offset:]
 
-        def parse_row_elements(row_elements):
-            row_index = row_elements[:column_offset]
-            if row_index:
-                row_indices.append(row_index)
-            row_values = list(map(float, row_elements[column_offset:]))
-            values.append(row_values)
+    else:
+        with open_file(tsv_path, mode="rb") as tsv_file:
+            for _ in range(n_header_rows):
+                tsv_file.readline()
+            parsed_byte_ranges = [_parse_tab_separated_rows(
+                tsv_file, **parsing_arguments)]
 
-        parse_row_elements(row_elements)
+    value_chunks = []
+    row_index_chunks = []
 
-        for row in tsv_file:
-            parse_row_elements(row.split())
+    for range_value_chunks, range_row_index_chunks in parsed_byte_ranges:
+        value_chunks.extend(range_value_chunks)
+        row_index_chunks.extend(range_row_index_chunks)
 
-    values = numpy.array(values, data_type)
+    values = scipy.sparse.vstack(value_chunks, format="csr")
 
-    if not row_indices:
+    if column_offset > 0:
+        row_indices = numpy.concatenate(row_index_chunks).tolist()
+    else:
         row_indices = None
 
     return values, column_headers, row_indices
 
 
+def _parse_tab_separated_byte_range(tsv_path, start, stop, **kwargs):
+    with open(tsv_path, mode="rb") as tsv_file:
+        tsv_file.seek(start)
+        return _parse_tab_separated_rows(tsv_file, stop=stop, **kwargs)
+
+
+def _parse_tab_separated_rows(tsv_file, column_offset, n_columns, data_type,
+                              chunk_size, stop=None):
+
+    # Rows are read a chunk of bytes at a time extended to the end of the
+    # last row, and each chunk is parsed at once and kept sparse, so only
+    # one chunk is stored densely at a time
+    column_types = {
+        j: str if j < column_offset else data_type for j in range(n_columns)
+    }
+
+    value_chunks = []
+    row_index_chunks = []
+
+    while True:
+
+        if stop is None:
+            chunk = tsv_file.read(chunk_size)
+        else:
+            chunk = tsv_file.read(min(chunk_size, stop - tsv_file.tell()))
+
+        if not chunk:
+            break
+
+        if not chunk.endswith(b"\n"):
+            chunk += tsv_file.readline()
+
+        # Skip chunks of blank lines, which cannot be parsed
+        if not chunk.strip():
+            continue
+
+        rows = pandas.read_csv(
+            io.BytesIO(chunk),
+            sep=r"\s+",
+            header=None,
+            dtype=column_types,
+            quoting=csv.QUOTE_NONE,
+            na_filter=False
+        )
+
+        value_chunks.append(scipy.sparse.csr_matrix(
+            rows.iloc[:, column_offset:].to_numpy(data_type)))
+        row_index_chunks.append(
+            rows.iloc[:, :column_offset].to_numpy().astype("U"))
+
+    return value_chunks, row_index_chunks
+
+
 def _load_labels_from_delimiter_separeted_values(
         path, label_column=1, example_column=0,
         example_names=None, delimiter=None,
@@ -843,8 +1149,8 @@ def _load_labels_from_delimiter_separeted_values(
         open_file = open
 
     with open_file(path, mode="rt") as labels_file:
-        first_row_elements = next(labels_file).split()
-        second_row_elements = next(labels_file).split()
+        first_row_elements = next(labels_file, "").split()
+        second_row_elements = next(labels_file, "").split()
 
     if len(first_row_elements) == 1 and len(second_row_elements) == 1:
         label_column = 0
@@ -874,13 +1180,32 @@ def _load_labels_from_delimiter_separeted_values(
 
     if example_names is not None:
 
-        labels = numpy.zeros(example_names.shape, unordered_labels.dtype)
+        if default_label is None:
+            default_label = 0
 
-        for example_name, label in unordered_labels.items():
-            labels[example_names == example_name] = label
+        # Join labels onto example names using the hashed index of the
+        # labels table, keeping the last label of duplicated examples
+        unordered_labels = unordered_labels[
+            ~unordered_labels.index.duplicated(keep="last")]
+        label_indices = unordered_labels.index.get_indexer(example_names)
 
-        if default_label:
-            labels[labels == 0] = default_label
+        if len(unordered_labels) > 0:
+            labels = unordered_labels.to_numpy()[label_indices]
+        else:
+            labels = numpy.empty(
+                len(example_names), dtype=unordered_labels.dtype)
+
+        unmatched = label_indices == -1
+        n_unmatched = unmatched.sum()
+
+        if n_unmatched > 0:
+            labels[unmatched] = default_label
+            print(
+                "{0} example{1} cannot be labelled -- using default label "
+                "\"{2}\".".format(
+                    n_unmatched, "s" if n_unmatched > 1 else "",
+                    default_label)
+            )
 
     else:
         labels = unordered_labels.values
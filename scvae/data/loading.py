@@ -54,18 +54,20 @@ def acquire_data_set(title, urls, directory):
 
             filename = "-".join(
                 map(normalise_string, [title, values_or_labels, kind]))
-            path = os.path.join(directory, filename) + file_extension
+            path = os.path.join(directory, filename)
+            if file_extension:
+                path += file_extension
 
             paths[values_or_labels][kind] = path
 
-            if not os.path.isfile(path):
+            if not os.path.exists(path):
 
                 if url.startswith("."):
                     raise Exception(
                         "Data set file have to be manually placed in "
                         "correct folder."
                     )
-                if os.path.isfile(url):
+                if os.path.isfile(url) or os.path.isdir(url):
 
                     print("Copying {} for {} set.".format(
                         values_or_labels, kind, title))
@@ -94,7 +96,7 @@ def acquire_data_set(title, urls, directory):
     return paths
 
 
-def load_original_data_set(paths, data_format):
+def load_original_data_set(paths, data_format, **kwargs):
 
     print("Loading original data set.")
     loading_time_start = time()
@@ -110,7 +112,7 @@ def load_original_data_set(paths, data_format):
         raise ValueError("Data format `{}` not recognised.".format(
             data_format))
 
-    data_dictionary = load(paths=paths)
+    data_dictionary = load(paths=paths, **kwargs)
 
     loading_duration = time() - loading_time_start
     print("Original data set loaded ({}).".format(format_duration(
@@ -61,6 +61,14 @@ def parse_input(input_file_or_name):
             "values": file_path,
             "format": data_format
         }
+    elif os.path.isdir(input_file_or_name):
+        # Extracted matrix directory from Cell Ranger
+        directory_path = os.path.normpath(input_file_or_name)
+        name = _base_name(directory_path)
+        data_set_dictionary = {
+            "values": directory_path,
+            "format": "10x"
+        }
     else:
         name = input_file_or_name
         name = normalise_string(name)
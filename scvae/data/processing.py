@@ -20,6 +20,7 @@ from functools import reduce
 from time import time
 
 import numpy
+import pandas
 import scipy
 import sklearn.preprocessing
 
@@ -28,25 +29,34 @@ from scvae.defaults import defaults
 from scvae.utilities import normalise_string, format_duration
 
 PREPROCESSERS = {}
+RANDOM_PREPROCESSERS = set()
+EXAMPLEWISE_PREPROCESSERS = set()
 
 
 def map_features(values, feature_ids, feature_mapping):
 
-    values = scipy.sparse.csc_matrix(values)
+    values = scipy.sparse.csr_matrix(values)
 
     n_examples, n_ids = values.shape
-    n_features = len(feature_mapping)
 
     feature_name_from_id = {
         v: k for k, vs in feature_mapping.items() for v in vs
     }
 
-    n_unknown_ids = 0
+    feature_ids = numpy.asarray(feature_ids)
 
-    for feature_id in feature_ids:
-        if feature_id not in feature_name_from_id:
-            feature_name_from_id[feature_id] = feature_id
-            n_unknown_ids += 1
+    if n_ids == 0:
+        return (
+            SparseRowMatrix((n_examples, 0), dtype=values.dtype),
+            feature_ids
+        )
+
+    known_ids = numpy.fromiter(
+        (feature_id in feature_name_from_id for feature_id in feature_ids),
+        dtype=bool,
+        count=n_ids
+    )
+    n_unknown_ids = numpy.unique(feature_ids[~known_ids]).size
 
     if n_unknown_ids > 0:
         print(
@@ -54,29 +64,31 @@ def map_features(values, feature_ids, feature_mapping):
             .format(n_unknown_ids, "s" if n_unknown_ids > 1 else "")
         )
 
-    n_features += n_unknown_ids
+    id_feature_names = feature_ids.astype(object)
+    id_feature_names[known_ids] = [
+        feature_name_from_id[feature_id]
+        for feature_id in feature_ids[known_ids]
+    ]
 
-    aggregated_values = numpy.zeros((n_examples, n_features), values.dtype)
-    feature_names_with_index = dict()
+    # Number features by the order in which they are first seen
+    feature_indices, feature_names = pandas.factorize(id_feature_names)
+    n_features = len(feature_names)
 
-    for i, feature_id in enumerate(feature_ids):
+    # Indicator matrix mapping each original feature ID onto its feature,
+    # so aggregation is a single sparse matrix product
+    feature_indicators = scipy.sparse.csr_matrix(
+        (
+            numpy.ones(n_ids, dtype=values.dtype),
+            (numpy.arange(n_ids), feature_indices)
+        ),
+        shape=(n_ids, n_features)
+    )
 
-        feature_name = feature_name_from_id[feature_id]
-
-        if feature_name in feature_names_with_index:
-            index = feature_names_with_index[feature_name]
-        else:
-            index = len(feature_names_with_index)
-            feature_names_with_index[feature_name] = index
+    aggregated_values = SparseRowMatrix(values @ feature_indicators)
+    feature_names = numpy.array(feature_names.tolist())
 
-        aggregated_values[:, index] += values[:, i].A.flatten()
-
-    feature_names = list(feature_names_with_index.keys())
-
-    feature_names_not_found = set(feature_mapping.keys()) - set(feature_names)
-    n_feature_names_not_found = len(feature_names_not_found)
-    n_features -= n_feature_names_not_found
-    aggregated_values = aggregated_values[:, :n_features]
+    n_feature_names_not_found = numpy.isin(
+        list(feature_mapping.keys()), feature_names, invert=True).sum()
 
     if n_feature_names_not_found > 0:
         print(
@@ -86,9 +98,6 @@ def map_features(values, feature_ids, feature_mapping):
             )
         )
 
-    aggregated_values = SparseRowMatrix(aggregated_values)
-    feature_names = numpy.array(feature_names)
-
     return aggregated_values, feature_names
 
 
@@ -304,28 +313,20 @@ def filter_examples(values_dictionary, example_names,
 
 def build_preprocessor(preprocessing_methods, noisy=False):
 
-    preprocessers = []
-
-    for preprocessing_method in preprocessing_methods:
-
-        if noisy and preprocessing_method == "binarise":
-            preprocessing_method = "bernoulli_sample"
-
-        preprocesser = PREPROCESSERS.get(preprocessing_method)
-
-        if preprocesser is None:
-            raise ValueError(
-                "Preprocessing method `{}` not found."
-                .format(preprocessing_method))
-
-        preprocessers.append(preprocesser)
+    preprocessers = [
+        _find_preprocesser(preprocessing_method, noisy=noisy)
+        for preprocessing_method in preprocessing_methods
+    ]
 
     if not preprocessing_methods:
         preprocessers.append(lambda x: x)
 
-    def preprocess(values):
+    def preprocess(values, random_state=None):
         return reduce(
-            lambda v, p: p(v),
+            lambda v, p: (
+                p(v, random_state=random_state)
+                if p in RANDOM_PREPROCESSERS else p(v)
+            ),
             preprocessers,
             values
         )
@@ -333,6 +334,35 @@ def build_preprocessor(preprocessing_methods, noisy=False):
     return preprocess
 
 
+def split_noisy_preprocessing_methods(preprocessing_methods):
+
+    # Methods before the first random method are deterministic and are
+    # applied once to all values, whereas the remaining methods are
+    # applied to each minibatch as it is drawn, so these have to treat
+    # each example separately
+    number_of_deterministic_methods = len(preprocessing_methods)
+
+    for i, preprocessing_method in enumerate(preprocessing_methods):
+        preprocesser = _find_preprocesser(preprocessing_method, noisy=True)
+        if preprocesser in RANDOM_PREPROCESSERS:
+            number_of_deterministic_methods = i
+            break
+
+    deterministic_methods = preprocessing_methods[
+        :number_of_deterministic_methods]
+    random_methods = preprocessing_methods[number_of_deterministic_methods:]
+
+    for preprocessing_method in random_methods:
+        preprocesser = _find_preprocesser(preprocessing_method, noisy=True)
+        if preprocesser not in EXAMPLEWISE_PREPROCESSERS:
+            raise ValueError(
+                "Noisy preprocessing method `{}` cannot follow a random "
+                "method, since it does not preprocess each example "
+                "separately.".format(preprocessing_method))
+
+    return deterministic_methods, random_methods
+
+
 def split_data_set(data_dictionary, method=None, fraction=None):
 
     if method is None:
@@ -486,19 +516,38 @@ def split_data_set(data_dictionary, method=None, fraction=None):
     return split_data_dictionary
 
 
-def _register_preprocessor(name):
+def _register_preprocessor(name, random=False, examplewise=False):
     def decorator(function):
         PREPROCESSERS[name] = function
+        if random:
+            RANDOM_PREPROCESSERS.add(function)
+        if examplewise:
+            EXAMPLEWISE_PREPROCESSERS.add(function)
         return function
     return decorator
 
 
-@_register_preprocessor("log")
+def _find_preprocesser(preprocessing_method, noisy=False):
+
+    if noisy and preprocessing_method == "binarise":
+        preprocessing_method = "bernoulli_sample"
+
+    preprocesser = PREPROCESSERS.get(preprocessing_method)
+
+    if preprocesser is None:
+        raise ValueError(
+            "Preprocessing method `{}` not found."
+            .format(preprocessing_method))
+
+    return preprocesser
+
+
+@_register_preprocessor("log", examplewise=True)
 def _log(values):
     return values.log1p()
 
 
-@_register_preprocessor("exp")
+@_register_preprocessor("exp", examplewise=True)
 def _exp(values):
     return values.expm1()
 
@@ -508,11 +557,14 @@ def _normalise(values):
     return sklearn.preprocessing.normalize(values, norm="l2", axis=0)
 
 
-@_register_preprocessor("binarise")
+@_register_preprocessor("binarise", examplewise=True)
 def _binarise(values):
     return sklearn.preprocessing.binarize(values, threshold=0.5)
 
 
-@_register_preprocessor("bernoulli_sample")
-def _bernoulli_sample(values):
-    return numpy.random.binomial(1, values)
+@_register_preprocessor(
+    "bernoulli_sample", random=True, examplewise=True)
+def _bernoulli_sample(values, random_state=None):
+    if random_state is None:
+        random_state = numpy.random
+    return random_state.binomial(1, values)
@@ -23,7 +23,8 @@ from scvae.distributions.lomax import Lomax
 from scvae.distributions.zero_inflated import ZeroInflated
 from scvae.distributions.utilities import (
     DISTRIBUTIONS, LATENT_DISTRIBUTIONS, GAUSSIAN_MIXTURE_DISTRIBUTIONS,
-    parse_distribution)
+    COUNT_DISTRIBUTIONS, SPARSE_LOG_PROB_DISTRIBUTIONS, parse_distribution,
+    sparse_log_prob)
 
 __all__ = [
     "Categorised",
@@ -33,5 +34,8 @@ __all__ = [
     "DISTRIBUTIONS",
     "LATENT_DISTRIBUTIONS",
     "GAUSSIAN_MIXTURE_DISTRIBUTIONS",
-    "parse_distribution"
+    "COUNT_DISTRIBUTIONS",
+    "SPARSE_LOG_PROB_DISTRIBUTIONS",
+    "parse_distribution",
+    "sparse_log_prob"
 ]
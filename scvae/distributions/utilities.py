@@ -347,6 +347,103 @@ GAUSSIAN_MIXTURE_DISTRIBUTIONS = {
 }
 
 
+# Reconstruction distributions of counts, which samples are integers
+COUNT_DISTRIBUTIONS = [
+    "bernoulli",
+    "poisson",
+    "constrained poisson",
+    "zero-inflated poisson",
+    "negative binomial",
+    "zero-inflated negative binomial"
+]
+
+SPARSE_LOG_PROB_DISTRIBUTIONS = [
+    "bernoulli",
+    "poisson",
+    "constrained poisson",
+    "zero-inflated poisson",
+    "negative binomial",
+    "zero-inflated negative binomial"
+]
+
+
+def sparse_log_prob(distribution, values):
+    """Sum of log-probabilities of sparse values over the last axis.
+
+    The log-probabilities of zero are evaluated for all values in closed
+    form, and the full log-probabilities are only evaluated for the
+    nonzero values, which are then used to correct the sum.
+
+    Arguments:
+        distribution (Distribution): Distribution of values with batch
+            shape (N, D).
+        values (SparseTensor): Values with dense shape (N, D).
+
+    Returns:
+        Tensor with shape (N) of the log-probabilities summed over the
+        last axis.
+    """
+
+    log_prob_of_zeros = _log_prob_of_zeros(distribution)
+    log_prob = tf.reduce_sum(log_prob_of_zeros, axis=-1)
+
+    nonzero_distribution = _gather_distribution(distribution, values.indices)
+    nonzero_log_prob = (
+        nonzero_distribution.log_prob(values.values)
+        - tf.gather_nd(log_prob_of_zeros, values.indices)
+    )
+
+    log_prob += tf.math.unsorted_segment_sum(
+        nonzero_log_prob,
+        segment_ids=values.indices[:, 0],
+        num_segments=tf.shape(log_prob, out_type=tf.int64)[0]
+    )
+
+    return log_prob
+
+
+def _log_prob_of_zeros(distribution):
+    if isinstance(distribution, ZeroInflated):
+        return distribution.log_prob_of_zeros(
+            _log_prob_of_zeros(distribution.dist))
+    elif isinstance(distribution, tfp.distributions.Poisson):
+        return - distribution.rate
+    elif isinstance(distribution, tfp.distributions.NegativeBinomial):
+        return distribution.total_count * tf.math.log_sigmoid(
+            - distribution.logits)
+    elif isinstance(distribution, tfp.distributions.Bernoulli):
+        return tf.math.log_sigmoid(- distribution.logits)
+    else:
+        raise NotImplementedError(
+            "Log-probability of zeros not implemented for the {} "
+            "distribution.".format(type(distribution).__name__)
+        )
+
+
+def _gather_distribution(distribution, indices):
+    if isinstance(distribution, ZeroInflated):
+        return ZeroInflated(
+            dist=_gather_distribution(distribution.dist, indices),
+            pi=tf.gather_nd(distribution.pi, indices)
+        )
+    elif isinstance(distribution, tfp.distributions.Poisson):
+        return tfp.distributions.Poisson(
+            rate=tf.gather_nd(distribution.rate, indices))
+    elif isinstance(distribution, tfp.distributions.NegativeBinomial):
+        return tfp.distributions.NegativeBinomial(
+            total_count=tf.gather_nd(distribution.total_count, indices),
+            logits=tf.gather_nd(distribution.logits, indices)
+        )
+    elif isinstance(distribution, tfp.distributions.Bernoulli):
+        return tfp.distributions.Bernoulli(
+            logits=tf.gather_nd(distribution.logits, indices))
+    else:
+        raise NotImplementedError(
+            "Gathering parameters not implemented for the {} "
+            "distribution.".format(type(distribution).__name__)
+        )
+
+
 def parse_distribution(distribution, model_type=None):
 
     distribution = normalise_string(distribution)
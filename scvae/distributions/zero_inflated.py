@@ -42,7 +42,9 @@ from tensorflow.python.framework import ops
 from tensorflow.python.ops import array_ops
 from tensorflow.python.ops import check_ops
 from tensorflow.python.ops import math_ops
+from tensorflow.python.ops import random_ops
 from tensorflow_probability.python.distributions import distribution
+from tensorflow_probability.python.distributions import seed_stream
 from tensorflow_probability.python.internal import reparameterization
 
 
@@ -191,12 +193,49 @@ class ZeroInflated(distribution.Distribution):
                                     + math_ops.square(self._dist.mean()))
                     - math_ops.square(self._mean()))
 
+    def _sample_n(self, n, seed=None):
+        with ops.control_dependencies(self._assertions):
+            stream = seed_stream.SeedStream(seed, salt="zero_inflated")
+            dist_samples = self._dist.sample(n, seed=stream())
+            uniform_samples = random_ops.random_uniform(
+                array_ops.shape(dist_samples),
+                dtype=dist_samples.dtype,
+                seed=stream()
+            )
+            # Each sample is a zero with probability pi
+            return where(
+                uniform_samples < self._pi * array_ops.ones_like(
+                    dist_samples),
+                array_ops.zeros_like(dist_samples),
+                dist_samples
+            )
+
     def _log_prob(self, x):
         with ops.control_dependencies(self._assertions):
             x = ops.convert_to_tensor(x, name="x")
-            y_0 = math_ops.log(self.pi + (1 - self.pi) * self._dist.prob(x))
-            y_1 = math_ops.log(1 - self.pi) + self._dist.log_prob(x)
+            dist_log_prob = self._dist.log_prob(x)
+            y_0 = self.log_prob_of_zeros(dist_log_prob)
+            y_1 = math_ops.log(1 - self.pi) + dist_log_prob
             return where(x > 0, y_1, y_0)
 
+    def log_prob_of_zeros(self, dist_log_prob_of_zeros=None):
+        """Log-probability of zero for all batch members.
+
+        Args:
+            dist_log_prob_of_zeros: Log-probability of zero for `dist`
+                (optional). If not given, it is evaluated using
+                `dist.log_prob`.
+
+        Returns:
+            A `Tensor` with the log-probability of zero for each batch
+            member.
+        """
+        with ops.control_dependencies(self._assertions):
+            if dist_log_prob_of_zeros is None:
+                dist_log_prob_of_zeros = self._dist.log_prob(
+                    array_ops.zeros_like(self.pi))
+            return math_ops.log(
+                self.pi + (1 - self.pi) * math_ops.exp(dist_log_prob_of_zeros))
+
     def _prob(self, x):
         return math_ops.exp(self._log_prob(x))
@@ -0,0 +1,212 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+import scipy.sparse
+import scipy.special
+
+from scvae.defaults import defaults
+
+BATCH_NORMALISATION_EPSILON = 0.001
+
+
+class InferenceModel:
+    """Inference of latent representations using NumPy.
+
+    The encoders of a trained model are evaluated with parameters
+    exported from a checkpoint of the model (see
+    `scvae.models.export_inference_parameters`), so TensorFlow is not
+    needed. Dropout is not used, and minibatch normalisation uses the
+    moving statistics from training, as when evaluating the model.
+
+    Arguments:
+        parameters (dict): Exported parameters as arrays keyed by name.
+    """
+
+    def __init__(self, parameters):
+
+        self.model_type = str(parameters["model_type"])
+        self.feature_size = int(parameters["feature_size"])
+        self.latent_size = int(parameters["latent_size"])
+        self.number_of_clusters = int(parameters["number_of_clusters"])
+        self.epoch = int(parameters["epoch"])
+
+        if self.model_type == "VAE":
+            self._y_encoder = None
+            self._y_logits = None
+        elif self.model_type == "GMVAE":
+            self._y_encoder = _layers_from_parameters(
+                parameters, "y_encoder")
+            self._y_logits = _layer_from_parameters(parameters, "y_logits")
+        else:
+            raise ValueError(
+                "Model type `{}` not found.".format(self.model_type))
+
+        self._z_encoder = _layers_from_parameters(parameters, "z_encoder")
+        self._z_mean = _layer_from_parameters(parameters, "z_mean")
+
+    @classmethod
+    def load(cls, path):
+        """Load inference model from parameters exported to a file.
+
+        Arguments:
+            path (str): Path to NumPy archive with exported parameters.
+
+        Returns:
+            Inference model.
+        """
+        with numpy.load(path, allow_pickle=False) as parameters:
+            return cls(dict(parameters))
+
+    def transform(self, values, minibatch_size=None):
+        """Infer latent representations of examples.
+
+        Arguments:
+            values (matrix): Values of examples as a sparse (CSR) or
+                dense matrix with the same features and preprocessing
+                as the data set used to train the model.
+            minibatch_size (int, optional): Number of examples
+                transformed at a time.
+
+        Returns:
+            Dictionary of the latent means, ``"z"``, and for GMVAE
+            models also the cluster probabilities, ``"y"``.
+        """
+
+        if minibatch_size is None:
+            minibatch_size = defaults["models"]["minibatch_size"]
+
+        if scipy.sparse.issparse(values):
+            values = values.tocsr()
+        else:
+            values = numpy.asarray(values)
+
+        number_of_examples, number_of_features = values.shape
+
+        if number_of_features != self.feature_size:
+            raise ValueError(
+                "The number of features ({}) is not the same as for the "
+                "model ({}).".format(number_of_features, self.feature_size)
+            )
+
+        latent_values = {
+            "z": numpy.empty(
+                (number_of_examples, self.latent_size), dtype=numpy.float32)
+        }
+
+        if self.model_type == "GMVAE":
+            latent_values["y"] = numpy.empty(
+                (number_of_examples, self.number_of_clusters),
+                dtype=numpy.float32
+            )
+
+        for i in range(0, number_of_examples, minibatch_size):
+            minibatch = slice(i, min(i + minibatch_size, number_of_examples))
+            for name, minibatch_values in self._transform_minibatch(
+                    values[minibatch]).items():
+                latent_values[name][minibatch] = minibatch_values
+
+        return latent_values
+
+    def _transform_minibatch(self, x):
+
+        if not scipy.sparse.issparse(x):
+            x = x.astype(numpy.float32)
+
+        if self.model_type == "VAE":
+            encoder = _dense_layers(x, self._z_encoder)
+            return {"z": _linear(encoder, self._z_mean)}
+
+        # q(y|x) = Cat(pi(x)), (B, K)
+        y_encoder = _dense_layers(x, self._y_encoder)
+        y_logits = _linear(y_encoder, self._y_logits)
+        y = scipy.special.softmax(y_logits, axis=-1)
+
+        # The first layer of q(z|x,y) is evaluated for all clusters at
+        # once by adding the weights for each one-hot cluster vector to
+        # the transformed features, (B, H) --> (K, B, H)
+        if self._z_encoder:
+            first_layer, *remaining_layers = self._z_encoder
+            z_encoder = _linear(x, first_layer, number_of_inputs=(
+                self.feature_size))
+            z_encoder = (
+                z_encoder[numpy.newaxis]
+                + first_layer["weights"][self.feature_size:, numpy.newaxis]
+            )
+            z_encoder = _normalise_and_activate(z_encoder, first_layer)
+            z_encoder = _dense_layers(z_encoder, remaining_layers)
+            # (K, B, L)
+            z_means = _linear(z_encoder, self._z_mean)
+        else:
+            z_means = (
+                _linear(x, self._z_mean, number_of_inputs=self.feature_size)
+                [numpy.newaxis]
+                + self._z_mean["weights"][self.feature_size:, numpy.newaxis]
+            )
+
+        # (B, K), (K, B, L) --> (B, L)
+        z = numpy.einsum("bk,kbl->bl", y, z_means)
+
+        return {"z": z, "y": y}
+
+
+def _layer_from_parameters(parameters, name):
+    layer = {}
+    prefix = name + "/"
+    for key, value in parameters.items():
+        if key.startswith(prefix):
+            layer[key[len(prefix):]] = numpy.asarray(value)
+    if "weights" not in layer:
+        raise ValueError("Parameters for layer `{}` not found.".format(name))
+    return layer
+
+
+def _layers_from_parameters(parameters, name):
+    number_of_layers = int(parameters[name + "/number_of_layers"])
+    return [
+        _layer_from_parameters(parameters, "{}/{}".format(name, i + 1))
+        for i in range(number_of_layers)
+    ]
+
+
+def _linear(inputs, layer, number_of_inputs=None):
+    weights = layer["weights"]
+    if number_of_inputs is not None:
+        weights = weights[:number_of_inputs]
+    outputs = inputs @ weights
+    if scipy.sparse.issparse(outputs):
+        outputs = outputs.toarray()
+    return numpy.asarray(outputs) + layer["biases"]
+
+
+def _normalise_and_activate(outputs, layer):
+    if "moving_mean" in layer:
+        outputs = (outputs - layer["moving_mean"]) / numpy.sqrt(
+            layer["moving_variance"] + BATCH_NORMALISATION_EPSILON)
+        if "gamma" in layer:
+            outputs = outputs * layer["gamma"]
+        if "beta" in layer:
+            outputs = outputs + layer["beta"]
+    return numpy.maximum(outputs, 0)
+
+
+def _dense_layers(inputs, layers):
+    outputs = inputs
+    for layer in layers:
+        outputs = _normalise_and_activate(_linear(outputs, layer), layer)
+    return outputs
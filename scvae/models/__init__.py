@@ -18,7 +18,12 @@
 
 __all__ = [
     "VariationalAutoencoder",
-    "GaussianMixtureVariationalAutoencoder"
+    "GaussianMixtureVariationalAutoencoder",
+    "StepHook",
+    "evaluate_ensemble",
+    "export_inference_graph",
+    "export_inference_parameters",
+    "validate_inference_parameters"
 ]
 
 import importlib
@@ -34,6 +39,11 @@ from scvae.models.variational_autoencoder import (
     VariationalAutoencoder)  # noqa: E402
 from scvae.models.gaussian_mixture_variational_autoencoder import (
     GaussianMixtureVariationalAutoencoder)  # noqa: E402
+from scvae.models.hooks import StepHook  # noqa: E402
+from scvae.models.ensembles import evaluate_ensemble  # noqa: E402
+from scvae.models.exports import (
+    export_inference_graph, export_inference_parameters,
+    validate_inference_parameters)  # noqa: E402
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "1"
 tensorflow.compat.v1.logging.set_verbosity(tensorflow.compat.v1.logging.ERROR)
@@ -0,0 +1,134 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import threading
+
+import tensorflow as tf
+
+
+class CheckpointManager:
+    """Checkpointing of model variables in a background thread.
+
+    Variable values are snapshotted into copies in the model graph,
+    which are then written to disk from a background thread, so that
+    training can continue while the checkpoint is being written.
+    Checkpoints are written using the original variable names, so they
+    can be restored by any saver for the model graph.
+
+    Create the checkpoint manager in the graph of the model after all
+    variables of the model have been created.
+
+    Arguments:
+        variables (list, optional): Variables to save. Defaults to all
+            global variables.
+        max_to_keep (int, optional): The number of recent checkpoints
+            to keep.
+    """
+
+    def __init__(self, variables=None, max_to_keep=1):
+
+        if variables is None:
+            variables = tf.global_variables()
+
+        snapshots = {}
+        snapshot_assignments = []
+
+        with tf.name_scope("CHECKPOINT"):
+            for variable in variables:
+                snapshot = tf.Variable(
+                    initial_value=tf.zeros(
+                        shape=variable.shape,
+                        dtype=variable.dtype.base_dtype
+                    ),
+                    trainable=False,
+                    collections=[],
+                    name=variable.op.name.replace("/", "_")
+                )
+                snapshots[variable.op.name] = snapshot
+                snapshot_assignments.append(
+                    tf.assign(snapshot, variable).op)
+
+            self._snapshot = tf.group(*snapshot_assignments, name="SNAPSHOT")
+
+        self.saver = tf.train.Saver(
+            var_list=snapshots,
+            max_to_keep=max_to_keep
+        )
+
+        self._thread = None
+        self._exception = None
+
+    def save(self, session, checkpoint_path, global_step=None,
+             asynchronous=True, callback=None):
+        """Snapshot variables and write them to a checkpoint.
+
+        Any checkpoint still being written is finished first.
+
+        Arguments:
+            session (Session): TensorFlow session with the variables.
+            checkpoint_path (str): Path prefix for checkpoint files.
+            global_step (int, optional): Step number appended to the
+                path prefix.
+            asynchronous (bool, optional): If ``True``, write the
+                checkpoint from a background thread and return as soon
+                as the variables have been snapshotted.
+            callback (callable, optional): Function called without
+                arguments after the checkpoint has been written, for
+                instance, to record the checkpoint as another model
+                version.
+        """
+
+        self.wait()
+        session.run(self._snapshot)
+
+        if asynchronous:
+            self._thread = threading.Thread(
+                target=self._write,
+                args=(session, checkpoint_path, global_step, callback)
+            )
+            self._thread.start()
+        else:
+            self._write(session, checkpoint_path, global_step, callback)
+            self._raise_exception()
+
+    def wait(self):
+        """Wait until any checkpoint being written has been written."""
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self._raise_exception()
+
+    def _write(self, session, checkpoint_path, global_step, callback):
+        try:
+            self.saver.save(
+                session,
+                checkpoint_path,
+                global_step=global_step
+            )
+            if callback:
+                callback()
+        except Exception as exception:
+            self._exception = exception
+
+    def _raise_exception(self):
+        if self._exception is not None:
+            exception = self._exception
+            self._exception = None
+            raise exception
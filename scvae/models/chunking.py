@@ -0,0 +1,236 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+
+
+class SampleChunk:
+    """Chunk of importance-weighted and Monte Carlo samples.
+
+    Arguments:
+        iw_start (int): Index of first importance-weighted sample.
+        number_of_iw_samples (int): Number of importance-weighted
+            samples in chunk.
+        mc_start (int): Index of first Monte Carlo sample.
+        number_of_mc_samples (int): Number of Monte Carlo samples in
+            chunk.
+    """
+
+    def __init__(self, iw_start, number_of_iw_samples, mc_start,
+                 number_of_mc_samples):
+        self.iw_start = iw_start
+        self.number_of_iw_samples = number_of_iw_samples
+        self.mc_start = mc_start
+        self.number_of_mc_samples = number_of_mc_samples
+
+    @property
+    def number_of_samples(self):
+        return self.number_of_iw_samples * self.number_of_mc_samples
+
+    @property
+    def mc_slice(self):
+        return slice(self.mc_start, self.mc_start + self.number_of_mc_samples)
+
+
+def sample_chunks(number_of_iw_samples, number_of_mc_samples, chunk_size):
+    """Split importance-weighted and Monte Carlo samples into chunks.
+
+    Importance-weighted samples are split into chunks keeping all Monte
+    Carlo samples for each, unless there are more Monte Carlo samples
+    than the chunk size, in which case every importance-weighted sample
+    gets its own chunks of Monte Carlo samples.
+
+    Arguments:
+        number_of_iw_samples (int): Total number of importance-weighted
+            samples.
+        number_of_mc_samples (int): Total number of Monte Carlo
+            samples.
+        chunk_size (int): Maximum number of samples in each chunk.
+
+    Returns:
+        List of sample chunks.
+    """
+
+    if chunk_size < 1:
+        raise ValueError("The sample chunk size should be positive.")
+
+    if number_of_mc_samples <= chunk_size:
+        iw_chunk_size = chunk_size // number_of_mc_samples
+        mc_chunk_size = number_of_mc_samples
+    else:
+        iw_chunk_size = 1
+        mc_chunk_size = chunk_size
+
+    chunks = []
+
+    for iw_start in range(0, number_of_iw_samples, iw_chunk_size):
+        for mc_start in range(0, number_of_mc_samples, mc_chunk_size):
+            chunks.append(SampleChunk(
+                iw_start=iw_start,
+                number_of_iw_samples=min(
+                    iw_chunk_size, number_of_iw_samples - iw_start),
+                mc_start=mc_start,
+                number_of_mc_samples=min(
+                    mc_chunk_size, number_of_mc_samples - mc_start)
+            ))
+
+    return chunks
+
+
+def run_in_sample_chunks(session, fetches, feed_dict, sample_placeholders,
+                         number_of_iw_samples, number_of_mc_samples,
+                         chunk_size):
+    """Run tensors for a minibatch in chunks of samples.
+
+    The tensors are run for each chunk of samples and their results
+    combined into the results for all samples, so that memory use is
+    bounded by the chunk size instead of the total number of samples.
+
+    Tensors are given together with how their results are combined:
+
+    * ``"mean"``: Means over samples weighted by chunk size.
+    * ``"log_mean_exp"``: Log-mean-exp over importance-weighted
+      samples of estimates with shape (L, B) for L Monte Carlo samples
+      and B examples, as evaluated for each chunk. The log-sum-exp is
+      accumulated across chunks in a numerically stable way.
+    * ``("stddev", name)``: Standard deviations over samples around the
+      mean given by the ``"mean"`` tensor ``name``.
+    * ``"constant"``: Results that do not depend on the samples, which
+      are only run for the first chunk.
+
+    Arguments:
+        session (Session): TensorFlow session in which tensors are run.
+        fetches (dict): Pairs of tensor and combination method keyed by
+            name.
+        feed_dict (dict): Values fed for every chunk.
+        sample_placeholders (tuple): Placeholders for the numbers of
+            importance-weighted and Monte Carlo samples.
+        number_of_iw_samples (int): Total number of importance-weighted
+            samples.
+        number_of_mc_samples (int): Total number of Monte Carlo
+            samples.
+        chunk_size (int): Maximum number of samples in each chunk.
+
+    Returns:
+        Dictionary of combined results keyed by name.
+    """
+
+    iw_placeholder, mc_placeholder = sample_placeholders
+    number_of_samples = number_of_iw_samples * number_of_mc_samples
+
+    results = {}
+    second_moments = {}
+    log_sum_exps = {}
+
+    for chunk_index, chunk in enumerate(sample_chunks(
+            number_of_iw_samples, number_of_mc_samples, chunk_size)):
+
+        chunk_fetches = {
+            name: tensor for name, (tensor, combination) in fetches.items()
+            if combination != "constant" or chunk_index == 0
+        }
+
+        chunk_feed_dict = dict(feed_dict)
+        chunk_feed_dict[iw_placeholder] = chunk.number_of_iw_samples
+        chunk_feed_dict[mc_placeholder] = chunk.number_of_mc_samples
+
+        chunk_results = session.run(chunk_fetches, feed_dict=chunk_feed_dict)
+        chunk_weight = chunk.number_of_samples / number_of_samples
+
+        for name, chunk_result in chunk_results.items():
+
+            __, combination = fetches[name]
+            chunk_result = numpy.asarray(chunk_result, dtype=numpy.float64)
+
+            if combination == "constant":
+                results[name] = chunk_result
+
+            elif combination == "mean":
+                results[name] = (
+                    results.get(name, 0.) + chunk_weight * chunk_result)
+
+            elif combination == "log_mean_exp":
+                chunk_result = chunk_result.reshape(
+                    chunk.number_of_mc_samples, -1)
+                if name not in log_sum_exps:
+                    log_sum_exps[name] = numpy.full(
+                        (number_of_mc_samples, chunk_result.shape[-1]),
+                        -numpy.inf
+                    )
+                log_sum_exps[name][chunk.mc_slice] = numpy.logaddexp(
+                    log_sum_exps[name][chunk.mc_slice],
+                    chunk_result + numpy.log(chunk.number_of_iw_samples)
+                )
+
+            elif combination[0] == "stddev":
+                mean_name = combination[1]
+                mean_result = numpy.asarray(
+                    chunk_results[mean_name], dtype=numpy.float64)
+                second_moments[name] = (
+                    second_moments.get(name, 0.) + chunk_weight * (
+                        numpy.square(chunk_result)
+                        + numpy.square(mean_result)
+                    )
+                )
+
+            else:
+                raise ValueError(
+                    "Combination `{}` not found.".format(combination))
+
+    for name, log_sum_exp in log_sum_exps.items():
+        results[name] = log_sum_exp - numpy.log(number_of_iw_samples)
+
+    for name, second_moment in second_moments.items():
+        __, (__, mean_name) = fetches[name]
+        results[name] = numpy.sqrt(numpy.maximum(
+            second_moment - numpy.square(results[mean_name]), 0.))
+
+    return results
+
+
+def plan_fetches(fetches, names):
+    """Select the fetches needed to compute certain results.
+
+    Fetches that the combination of a selected fetch depends on, such as
+    the mean for a standard deviation, are included as well.
+
+    Arguments:
+        fetches (dict): Pairs of tensor and combination method keyed by
+            name.
+        names (iterable): Names of required results.
+
+    Returns:
+        Dictionary of the selected pairs of tensor and combination
+        method keyed by name.
+    """
+
+    planned_fetches = {}
+    pending_names = list(names)
+
+    while pending_names:
+        name = pending_names.pop()
+        if name in planned_fetches:
+            continue
+        if name not in fetches:
+            raise ValueError("Fetch `{}` not found.".format(name))
+        planned_fetches[name] = fetches[name]
+        __, combination = fetches[name]
+        if isinstance(combination, tuple):
+            pending_names.append(combination[1])
+
+    return planned_fetches
@@ -0,0 +1,245 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import os
+from time import time
+
+import numpy
+
+from scvae.data.chunked import CHUNKED_PREPROCESSING_METHODS, FeatureAligner
+from scvae.data.processing import build_preprocessor
+from scvae.defaults import defaults
+from scvae.models.inputs import minibatch_values, split_indices
+from scvae.models.sinks import build_output_sink
+from scvae.models.utilities import check_run_id, restored_session
+from scvae.utilities import format_duration
+
+# Latent means inferred by the encoders of each model type
+LATENT_OUTPUTS = {
+    "VAE": {"z": "q_z_mean"},
+    "GMVAE": {"z": "z_mean", "y": "y_mean"}
+}
+
+
+def embed_in_chunks(model, reader, feature_names, output_directory=None,
+                    output_format=None, preprocessing_methods=None,
+                    chunk_size=None, minibatch_size=None, reconstruct=False,
+                    maximum_count_sum=None, run_id=None,
+                    use_early_stopping_model=False, use_best_model=False):
+    """Embed examples read in chunks using a trained model.
+
+    Chunks of examples are read from the data set file, aligned to the
+    features of the model, preprocessed, and encoded, and the latent
+    means are written to output files, so only a chunk of examples is
+    kept in memory at a time.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Trained model.
+        reader (ChunkedValuesReader): Reader of the examples to embed.
+        feature_names (array_like): Names of the features of the data
+            set the model was trained on.
+        output_directory (str, optional): Directory for output files.
+            Defaults to the ``embeddings`` subdirectory of the log
+            directory of the model.
+        output_format (str, optional): Format of output files:
+            ``"npy"`` or ``"hdf5"``.
+        preprocessing_methods (list, optional): Preprocessing methods
+            applied to the examples like for the training data set. Only
+            methods applied to each example separately are supported.
+        chunk_size (int, optional): Number of examples read at a time.
+        minibatch_size (int, optional): Number of examples encoded at a
+            time.
+        reconstruct (bool, optional): If ``True``, also write the means
+            of the reconstructed values.
+        maximum_count_sum (float, optional): Maximum count sum of the
+            training data set used to normalise count sums, when these
+            are used as an additional latent feature.
+        run_id (str, optional): ID used to identify a certain run
+            of the model.
+        use_early_stopping_model (bool, optional): If ``True``, use
+            model parameters, when early stopping triggered during
+            training. Defaults to ``False``.
+        use_best_model (bool, optional): If ``True``, use model
+            parameters, which resulted in the best performance on
+            validation set during training. Defaults to ``False``.
+
+    Returns:
+        Dictionary of paths to the output files.
+    """
+
+    if output_format is None:
+        output_format = defaults["embedding"]["output_format"]
+    if preprocessing_methods is None:
+        preprocessing_methods = []
+    if chunk_size is None:
+        chunk_size = defaults["embedding"]["chunk_size"]
+    if minibatch_size is None:
+        minibatch_size = defaults["models"]["minibatch_size"]
+
+    if run_id is None:
+        run_id = defaults["models"]["run_id"]
+    if run_id:
+        run_id = check_run_id(run_id)
+        model_string = "model for run {}".format(run_id)
+    else:
+        model_string = "model"
+
+    if output_format == "memory":
+        raise ValueError("Embeddings can only be written to files.")
+
+    for preprocessing_method in preprocessing_methods:
+        if preprocessing_method not in CHUNKED_PREPROCESSING_METHODS:
+            raise ValueError(
+                "Preprocessing method `{}` cannot be applied to chunks of "
+                "examples.".format(preprocessing_method))
+
+    if reconstruct:
+        if model.batch_correction:
+            raise NotImplementedError(
+                "Reconstructing embedded examples with batch correction.")
+        if model.use_count_sum_as_feature and maximum_count_sum is None:
+            raise ValueError(
+                "Maximum count sum of training data set required for "
+                "reconstructing with count sum as additional latent "
+                "feature.")
+
+    log_directory = model.log_directory(
+        run_id=run_id,
+        early_stopping=use_early_stopping_model,
+        best_model=use_best_model
+    )
+
+    if output_directory is None:
+        output_directory = os.path.join(log_directory, "embeddings")
+
+    aligner = FeatureAligner(reader.feature_names, feature_names)
+    print(
+        "Aligning {} features of data set to {} features of model "
+        "({} found).".format(
+            aligner.number_of_features, aligner.number_of_target_features,
+            aligner.number_of_matched_features)
+    )
+
+    if preprocessing_methods:
+        preprocess = build_preprocessor(preprocessing_methods)
+    else:
+        preprocess = None
+
+    number_of_examples = reader.number_of_examples
+    name = os.path.basename(reader.path).split(os.extsep, 1)[0]
+
+    output_tensors = dict(LATENT_OUTPUTS[model.type])
+    output_sizes = {"z": model.latent_size}
+    if model.type == "GMVAE":
+        output_sizes["y"] = model.n_clusters
+    if reconstruct:
+        output_tensors["x"] = "p_x_mean"
+        output_sizes["x"] = model.feature_size
+
+    outputs = {}
+    for output_name in output_tensors:
+        if output_name == "x":
+            output_title = "reconstructed"
+        elif model.type == "GMVAE":
+            output_title = "latent-{}".format(output_name)
+        else:
+            output_title = "latent"
+        outputs[output_name] = build_output_sink(
+            output_format,
+            shape=(number_of_examples, output_sizes[output_name]),
+            name="{}-{}-values".format(name, output_title),
+            directory=output_directory
+        )
+
+    example_names_path = os.path.join(
+        output_directory, "{}-example-names.txt".format(name))
+    with open(example_names_path, "w") as example_names_file:
+        for example_name in reader.example_names:
+            example_names_file.write("{}\n".format(example_name))
+
+    if model.type == "VAE":
+        sample_placeholders = (
+            model.number_of_iw_samples, model.number_of_mc_samples)
+    else:
+        sample_placeholders = (model.n_iw_samples, model.n_mc_samples)
+
+    fetches = {
+        output_name: getattr(model, tensor_name)
+        for output_name, tensor_name in output_tensors.items()
+    }
+
+    with restored_session(model, log_directory, model_string) as session:
+
+        print("Embedding {} examples from \"{}\" using {}.".format(
+            number_of_examples, reader.path, model_string))
+        embedding_time_start = time()
+
+        for chunk_slice, chunk_values in reader.chunks(chunk_size):
+
+            values = aligner.align(chunk_values)
+
+            if reconstruct and (model.use_count_sum_as_parameter
+                                or model.use_count_sum_as_feature):
+                count_sum = values.sum(axis=1).A
+
+            if preprocess:
+                values = preprocess(values)
+
+            chunk_indices = numpy.arange(chunk_slice.start, chunk_slice.stop)
+
+            for indices in split_indices(chunk_indices, minibatch_size):
+
+                local_indices = indices - chunk_slice.start
+
+                feed_dict = {
+                    model.x: minibatch_values(
+                        values, local_indices, sparse=model.sparse_input),
+                    model.is_training: False,
+                    sample_placeholders[0]: 1,
+                    sample_placeholders[1]: 1
+                }
+
+                if model.type == "VAE":
+                    feed_dict[model.use_deterministic_z] = True
+
+                if reconstruct and model.use_count_sum_as_parameter:
+                    feed_dict[model.count_sum_parameter] = (
+                        count_sum[local_indices])
+
+                if reconstruct and model.use_count_sum_as_feature:
+                    feed_dict[model.count_sum_feature] = (
+                        count_sum[local_indices] / maximum_count_sum)
+
+                results = session.run(fetches, feed_dict=feed_dict)
+
+                for output_name, output in outputs.items():
+                    output.write(indices, results[output_name])
+
+            print("    {} of {} examples embedded.".format(
+                chunk_slice.stop, number_of_examples))
+
+        embedding_duration = time() - embedding_time_start
+        print("Examples embedded ({}).".format(
+            format_duration(embedding_duration)))
+
+    paths = {"example_names": example_names_path}
+    for output_name, output in outputs.items():
+        output.close()
+        paths[output_name] = output.path
+
+    return paths
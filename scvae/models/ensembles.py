@@ -0,0 +1,206 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import concurrent.futures
+import threading
+
+from scvae.defaults import defaults
+
+
+class SharedMinibatches:
+    """Minibatches prepared once and shared by several readers.
+
+    Each minibatch is prepared by the first reader requesting it and
+    kept until every reader has read it. At most a certain number of
+    minibatches are kept at once, so readers running ahead wait for the
+    slower ones.
+
+    Arguments:
+        maximum_number_of_minibatches (int, optional): Maximum number
+            of prepared minibatches kept at once.
+    """
+
+    def __init__(self, maximum_number_of_minibatches=4):
+        self.maximum_number_of_minibatches = max(
+            maximum_number_of_minibatches, 1)
+        self.number_of_preparations = 0
+        self.number_of_reads = 0
+        self._condition = threading.Condition()
+        self._entries = {}
+        self._readers = set()
+        self._next_reader_id = 0
+
+    def reader(self):
+        """Add a reader of the minibatches.
+
+        Returns:
+            Reader with a ``get(key, prepare)`` method returning the
+            minibatch for ``key``, prepared using the callable
+            ``prepare`` if needed, and a ``close()`` method, which
+            should be called when the reader is done.
+        """
+        with self._condition:
+            reader_id = self._next_reader_id
+            self._next_reader_id += 1
+            self._readers.add(reader_id)
+        return _MinibatchReader(self, reader_id)
+
+    def _get(self, reader_id, key, prepare):
+
+        with self._condition:
+            entry = self._entries.get(key)
+            preparing = entry is None
+            if preparing:
+                while (len(self._entries)
+                        >= self.maximum_number_of_minibatches):
+                    self._condition.wait()
+                entry = self._entries.get(key)
+                preparing = entry is None
+            if preparing:
+                entry = _SharedMinibatch(self._readers)
+                self._entries[key] = entry
+
+        if preparing:
+            try:
+                entry.value = prepare()
+            except BaseException as exception:
+                entry.exception = exception
+                raise
+            finally:
+                with self._condition:
+                    self.number_of_preparations += 1
+                entry.ready.set()
+        else:
+            entry.ready.wait()
+            if entry.exception is not None:
+                raise entry.exception
+
+        with self._condition:
+            self.number_of_reads += 1
+            entry.pending_readers.discard(reader_id)
+            if not entry.pending_readers:
+                self._entries.pop(key, None)
+                self._condition.notify_all()
+
+        return entry.value
+
+    def _close(self, reader_id):
+        with self._condition:
+            self._readers.discard(reader_id)
+            for key, entry in list(self._entries.items()):
+                entry.pending_readers.discard(reader_id)
+                if not entry.pending_readers and entry.ready.is_set():
+                    del self._entries[key]
+            self._condition.notify_all()
+
+
+class _SharedMinibatch:
+    def __init__(self, readers):
+        self.pending_readers = set(readers)
+        self.ready = threading.Event()
+        self.value = None
+        self.exception = None
+
+
+class _MinibatchReader:
+    def __init__(self, shared_minibatches, reader_id):
+        self._shared_minibatches = shared_minibatches
+        self._reader_id = reader_id
+
+    def get(self, key, prepare):
+        return self._shared_minibatches._get(self._reader_id, key, prepare)
+
+    def close(self):
+        self._shared_minibatches._close(self._reader_id)
+
+
+def evaluate_ensemble(model, evaluation_set, model_versions=None,
+                      run_ids=None, **kwargs):
+    """Evaluate several versions and runs of a model together.
+
+    Each model version and run is restored into its own session, and
+    these are evaluated concurrently on separate threads. Every
+    minibatch of the evaluation set is prepared once and fed to all
+    sessions.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Model to
+            evaluate.
+        evaluation_set (DataSet): Data set used to evaluate model.
+        model_versions (list(str), optional): Model versions to
+            evaluate: ``"end_of_training"``, ``"best_model"``, and/or
+            ``"early_stopping"``. Defaults to the model version at the
+            end of training.
+        run_ids (list(str), optional): IDs of runs of the model to
+            evaluate. Defaults to the default run.
+        **kwargs: Remaining arguments are passed on to the ``evaluate``
+            method of the model.
+
+    Returns:
+        Dictionary of the outputs of ``evaluate`` for each model version
+        and run keyed by pairs of run ID and model version.
+    """
+
+    if model_versions is None:
+        model_versions = ["end_of_training"]
+    if run_ids is None:
+        run_ids = [defaults["models"]["run_id"]]
+
+    members = []
+
+    for run_id in run_ids:
+        for model_version in model_versions:
+            if model_version not in [
+                    "end_of_training", "best_model", "early_stopping"]:
+                raise ValueError(
+                    "Model version `{}` not found.".format(model_version))
+            members.append((run_id, model_version))
+
+    shared_minibatches = SharedMinibatches(
+        maximum_number_of_minibatches=2 * len(members))
+    readers = {member: shared_minibatches.reader() for member in members}
+
+    def evaluate_member(member):
+        run_id, model_version = member
+        try:
+            return model.evaluate(
+                evaluation_set=evaluation_set,
+                run_id=run_id,
+                use_best_model=(model_version == "best_model"),
+                use_early_stopping_model=(
+                    model_version == "early_stopping"),
+                shared_minibatches=readers[member],
+                **kwargs
+            )
+        finally:
+            readers[member].close()
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(members)) as executor:
+        futures = {
+            member: executor.submit(evaluate_member, member)
+            for member in members
+        }
+        evaluations = {
+            member: future.result() for member, future in futures.items()
+        }
+
+    print("Prepared {} minibatches for {} model versions.".format(
+        shared_minibatches.number_of_preparations, len(members)))
+
+    return evaluations
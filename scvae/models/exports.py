@@ -0,0 +1,635 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import json
+import os
+
+import numpy
+import tensorflow as tf
+from tensorflow.python.grappler import tf_optimizer
+
+from scvae.inference import InferenceModel
+from scvae.models.utilities import correct_model_checkpoint_path
+from scvae.utilities import normalise_string
+
+INFERENCE_GRAPH_FILENAME = "inference_graph.pb"
+INFERENCE_GRAPH_METADATA_FILENAME = "inference_graph.json"
+BATCH_NORMALISATION_EPSILON = 0.001
+
+# Inputs fed to inference graphs
+INFERENCE_GRAPH_INPUTS = [
+    "x", "t", "batch_indices", "count_sum_feature", "count_sum_parameter"
+]
+
+# Outputs run when evaluating models
+INFERENCE_GRAPH_OUTPUTS = {
+    "VAE": [
+        "lower_bound_estimates", "kl_divergence", "reconstruction_error",
+        "p_x_mean", "p_x_stddev", "stddev_of_p_x_given_z_mean", "q_z_mean",
+        "kl_divergence_neurons", "p_z_probabilities", "p_z_means",
+        "p_z_variances"
+    ],
+    "GMVAE": [
+        "lower_bound", "reconstruction_error", "kl_divergence_z",
+        "kl_divergence_y", "q_y_probabilities", "q_z_means",
+        "q_z_variances", "p_y_probabilities", "p_z_means", "p_z_variances",
+        "q_z_covariances", "p_z_covariances", "q_y_logits", "p_x_mean",
+        "p_x_stddev", "stddev_of_p_x_given_z_mean", "y_mean", "z_mean",
+        "kl_divergence_z_neurons"
+    ]
+}
+
+# Parameters of the latent posterior distributions of z giving their means
+Z_MEAN_PARAMETERS = {
+    "gaussian": "mu",
+    "softplus gaussian": "mean",
+    "modified gaussian": "mean",
+    "multivariate gaussian": "locations"
+}
+
+
+def export_inference_parameters(model, path=None, run_id=None,
+                                use_early_stopping_model=False,
+                                use_best_model=False):
+    """Export parameters of the encoders of a trained model.
+
+    The weights, minibatch-normalisation statistics, and latent mean
+    layers of the encoders are read from a checkpoint of the model and
+    saved to a compressed NumPy archive, which can be loaded by
+    `scvae.inference.InferenceModel` to infer latent representations
+    without TensorFlow.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Trained model.
+        path (str, optional): Path to NumPy archive. Defaults to
+            ``inference.npz`` in the log directory of the model.
+        run_id (str, optional): ID used to identify a certain run
+            of the model.
+        use_early_stopping_model (bool, optional): If ``True``, use
+            model parameters, when early stopping triggered during
+            training. Defaults to ``False``.
+        use_best_model (bool, optional): If ``True``, use model
+            parameters, which resulted in the best performance on
+            validation set during training. Defaults to ``False``.
+
+    Returns:
+        Path to NumPy archive.
+    """
+
+    log_directory = model.log_directory(
+        run_id=run_id,
+        early_stopping=use_early_stopping_model,
+        best_model=use_best_model
+    )
+
+    checkpoint = tf.train.get_checkpoint_state(log_directory)
+
+    if not checkpoint:
+        raise Exception(
+            "Cannot export model when it has not been trained.")
+
+    model_checkpoint_path = correct_model_checkpoint_path(
+        checkpoint.model_checkpoint_path, log_directory)
+    epoch = int(os.path.split(model_checkpoint_path)[-1].split("-")[-1])
+    checkpoint_reader = tf.train.load_checkpoint(model_checkpoint_path)
+
+    parameters = {
+        "model_type": numpy.array(model.type),
+        "feature_size": numpy.array(model.feature_size),
+        "latent_size": numpy.array(model.latent_size),
+        "epoch": numpy.array(epoch)
+    }
+
+    if model.type == "VAE":
+        parameters["number_of_clusters"] = numpy.array(1)
+
+        if model.inference_architecture == "MLP":
+            parameters.update(_layers_parameters(
+                checkpoint_reader, "ENCODER", "",
+                number_of_layers=len(model.hidden_sizes),
+                name="z_encoder"
+            ))
+        else:
+            parameters["z_encoder/number_of_layers"] = numpy.array(0)
+
+        parameters.update(_layer_parameters(
+            checkpoint_reader,
+            "POSTERIOR/" + Z_MEAN_PARAMETERS["gaussian"].upper(),
+            name="z_mean"
+        ))
+
+    elif model.type == "GMVAE":
+        parameters["number_of_clusters"] = numpy.array(model.n_clusters)
+
+        parameters.update(_layers_parameters(
+            checkpoint_reader, "Y/CATEGORICAL/ENCODER", "LAYER_",
+            number_of_layers=len(model.hidden_sizes),
+            name="y_encoder"
+        ))
+        parameters.update(_layer_parameters(
+            checkpoint_reader, "Y/CATEGORICAL/LOGITS", name="y_logits"))
+
+        parameters.update(_layers_parameters(
+            checkpoint_reader, "Z/Q/ENCODER", "LAYER_",
+            number_of_layers=len(model.hidden_sizes),
+            name="z_encoder"
+        ))
+
+        z_posterior_name = model.latent_distribution["z posterior"]
+        parameters.update(_layer_parameters(
+            checkpoint_reader,
+            "Z/Q/{}/{}".format(
+                normalise_string(z_posterior_name).upper(),
+                Z_MEAN_PARAMETERS[z_posterior_name].upper()
+            ),
+            name="z_mean"
+        ))
+
+    else:
+        raise ValueError("Model type `{}` not found.".format(model.type))
+
+    if path is None:
+        path = os.path.join(log_directory, "inference.npz")
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    numpy.savez_compressed(path, **parameters)
+
+    return path
+
+
+def validate_inference_parameters(model, path, evaluation_set, run_id=None,
+                                  use_early_stopping_model=False,
+                                  use_best_model=False,
+                                  relative_tolerance=1e-3,
+                                  absolute_tolerance=1e-4):
+    """Validate exported parameters against evaluating the model.
+
+    Latent representations of the evaluation set inferred using NumPy
+    are compared with those found by evaluating the model.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Trained model.
+        path (str): Path to NumPy archive with exported parameters.
+        evaluation_set (DataSet): Data set used for validation.
+        run_id (str, optional): ID used to identify a certain run
+            of the model.
+        use_early_stopping_model (bool, optional): If ``True``, use
+            model parameters, when early stopping triggered during
+            training. Defaults to ``False``.
+        use_best_model (bool, optional): If ``True``, use model
+            parameters, which resulted in the best performance on
+            validation set during training. Defaults to ``False``.
+        relative_tolerance (float, optional): Relative tolerance for
+            the latent values.
+        absolute_tolerance (float, optional): Absolute tolerance for
+            the latent values.
+
+    Returns:
+        Dictionary of maximum absolute differences keyed by latent
+        variable.
+    """
+
+    if evaluation_set.noisy_preprocess:
+        raise ValueError(
+            "Cannot validate exported parameters using a data set with "
+            "noisy preprocessing.")
+
+    if evaluation_set.has_preprocessed_values:
+        values = evaluation_set.preprocessed_values
+    else:
+        values = evaluation_set.values
+
+    inferred_latent_values = InferenceModel.load(path).transform(values)
+
+    latent_evaluation_sets = model.evaluate(
+        evaluation_set=evaluation_set,
+        run_id=run_id,
+        use_early_stopping_model=use_early_stopping_model,
+        use_best_model=use_best_model,
+        output_versions="latent",
+        log_results=False
+    )
+
+    differences = {}
+
+    for name, inferred_values in inferred_latent_values.items():
+        evaluated_values = numpy.asarray(latent_evaluation_sets[name].values)
+        differences[name] = float(numpy.max(
+            numpy.abs(inferred_values - evaluated_values)))
+        if not numpy.allclose(
+                inferred_values, evaluated_values,
+                rtol=relative_tolerance, atol=absolute_tolerance):
+            raise ValueError(
+                "Latent values for {} inferred using exported parameters "
+                "differ from evaluated ones by up to {:.3g}.".format(
+                    name, differences[name])
+            )
+
+    return differences
+
+
+def export_inference_graph(model, run_id=None, use_early_stopping_model=False,
+                           use_best_model=False, use_deterministic_z=False):
+    """Export an inference-only graph of a trained model.
+
+    The model graph is frozen at a checkpoint with the evaluation
+    outputs as the only outputs. Minibatch normalisation is folded into
+    the weights and biases of the preceding dense layers, and the
+    placeholders for training mode, warm-up weight, and numbers of
+    samples are replaced by the constants used for evaluation, so that
+    dropout, training branches, and the folded minibatch normalisation
+    are removed when the graph is optimised. The graph and its metadata
+    are saved in the log directory of the model and can be used by
+    ``evaluate`` with ``use_inference_graph``.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Trained model.
+        run_id (str, optional): ID used to identify a certain run
+            of the model.
+        use_early_stopping_model (bool, optional): If ``True``, use
+            model parameters, when early stopping triggered during
+            training. Defaults to ``False``.
+        use_best_model (bool, optional): If ``True``, use model
+            parameters, which resulted in the best performance on
+            validation set during training. Defaults to ``False``.
+        use_deterministic_z (bool, optional): If ``True``, use the
+            latent means instead of samples (only for VAE models).
+
+    Returns:
+        Path to the saved graph.
+    """
+
+    log_directory = model.log_directory(
+        run_id=run_id,
+        early_stopping=use_early_stopping_model,
+        best_model=use_best_model
+    )
+
+    checkpoint = tf.train.get_checkpoint_state(log_directory)
+
+    if not checkpoint:
+        raise Exception(
+            "Cannot export model when it has not been trained.")
+
+    model_checkpoint_path = correct_model_checkpoint_path(
+        checkpoint.model_checkpoint_path, log_directory)
+    epoch = int(os.path.split(model_checkpoint_path)[-1].split("-")[-1])
+
+    if model.type == "VAE":
+        sample_placeholders = (
+            model.number_of_iw_samples, model.number_of_mc_samples)
+    elif model.type == "GMVAE":
+        sample_placeholders = (model.n_iw_samples, model.n_mc_samples)
+    else:
+        raise ValueError("Model type `{}` not found.".format(model.type))
+
+    if use_deterministic_z:
+        if model.type != "VAE":
+            raise ValueError(
+                "Deterministic latent values are only used for VAE models.")
+        number_of_samples = (1, 1)
+    else:
+        number_of_samples = (
+            model.number_of_importance_samples["evaluation"],
+            model.number_of_monte_carlo_samples["evaluation"]
+        )
+
+    constants = {
+        model.is_training: False,
+        model.warm_up_weight: 1.0,
+        sample_placeholders[0]: number_of_samples[0],
+        sample_placeholders[1]: number_of_samples[1]
+    }
+
+    if model.type == "VAE":
+        constants[model.use_deterministic_z] = use_deterministic_z
+
+    input_tensors = []
+    for input_name in INFERENCE_GRAPH_INPUTS:
+        input_tensor = getattr(model, input_name, None)
+        if isinstance(input_tensor, tf.SparseTensor):
+            input_tensors.extend([
+                input_tensor.indices,
+                input_tensor.values,
+                input_tensor.dense_shape
+            ])
+        elif input_tensor is not None:
+            input_tensors.append(input_tensor)
+
+    outputs = {
+        output_name: [
+            tensor.name for tensor
+            in tf.nest.flatten(getattr(model, output_name))
+        ]
+        for output_name in INFERENCE_GRAPH_OUTPUTS[model.type]
+    }
+    output_tensor_names = [
+        tensor_name
+        for tensor_names in outputs.values()
+        for tensor_name in tensor_names
+    ]
+    output_node_names = sorted(set(
+        tensor_name.split(":")[0] for tensor_name in output_tensor_names))
+
+    with tf.Session(graph=model.graph) as session:
+        model.saver.restore(session, model_checkpoint_path)
+        _fold_batch_normalisation(session, model.graph)
+        graph_def = tf.graph_util.convert_variables_to_constants(
+            session,
+            model.graph.as_graph_def(),
+            output_node_names
+        )
+
+    input_node_names = set(tensor.op.name for tensor in input_tensors)
+    constant_values = {
+        placeholder.op.name: value for placeholder, value in constants.items()
+    }
+
+    for node in graph_def.node:
+        if node.name in constant_values:
+            dtype = tf.as_dtype(node.attr["dtype"].type)
+            node.op = "Const"
+            del node.input[:]
+            for attribute_name in list(node.attr.keys()):
+                if attribute_name != "dtype":
+                    del node.attr[attribute_name]
+            node.attr["value"].tensor.CopyFrom(tf.make_tensor_proto(
+                constant_values[node.name], dtype=dtype))
+        elif (node.name in input_node_names
+                and node.op == "PlaceholderWithDefault"):
+            # Inputs are always fed, so their defaults from the input
+            # pipeline are removed
+            node.op = "Placeholder"
+            del node.input[:]
+
+    graph_def = _optimise_graph_def(graph_def, output_tensor_names)
+
+    graph_path = os.path.join(log_directory, INFERENCE_GRAPH_FILENAME)
+    tf.io.write_graph(
+        graph_def, log_directory, INFERENCE_GRAPH_FILENAME, as_text=False)
+
+    metadata = {
+        "model_type": model.type,
+        "epoch": epoch,
+        "constants": {
+            node_name: (value if not isinstance(value, numpy.generic)
+                        else value.item())
+            for node_name, value in constant_values.items()
+        },
+        "outputs": outputs
+    }
+
+    with open(os.path.join(
+            log_directory, INFERENCE_GRAPH_METADATA_FILENAME), "w") as file:
+        json.dump(metadata, file, indent=4)
+
+    return graph_path
+
+
+class InferenceGraph:
+    """Inference-only graph exported from a trained model.
+
+    Arguments:
+        graph_def (GraphDef): Frozen graph definition.
+        metadata (dict): Model type, epoch, folded constants, and
+            outputs of the graph.
+    """
+
+    def __init__(self, graph_def, metadata):
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name="")
+        self.model_type = metadata["model_type"]
+        self.epoch = metadata["epoch"]
+        self.constants = metadata["constants"]
+        self.outputs = metadata["outputs"]
+
+    @classmethod
+    def load(cls, directory):
+        """Load inference graph saved in a model log directory."""
+
+        graph_path = os.path.join(directory, INFERENCE_GRAPH_FILENAME)
+        metadata_path = os.path.join(
+            directory, INFERENCE_GRAPH_METADATA_FILENAME)
+
+        if not (os.path.exists(graph_path) and os.path.exists(metadata_path)):
+            raise ValueError(
+                "Inference graph not found in \"{}\". It can be exported "
+                "using the `export` command.".format(directory))
+
+        graph_def = tf.GraphDef()
+        with open(graph_path, "rb") as file:
+            graph_def.ParseFromString(file.read())
+
+        with open(metadata_path, "r") as file:
+            metadata = json.load(file)
+
+        return cls(graph_def, metadata)
+
+    def session(self):
+        """Return session running tensors of the original model graph
+        using the inference graph."""
+        return InferenceGraphSession(self)
+
+
+class InferenceGraphSession:
+    """Session running an inference graph.
+
+    Fetches and feeds refer to tensors of the original model graph and
+    are mapped to the tensors with the same names in the inference
+    graph. Feeds for folded placeholders are checked against the
+    constants used when exporting the graph.
+
+    Arguments:
+        inference_graph (InferenceGraph): Inference graph.
+    """
+
+    def __init__(self, inference_graph):
+        self.inference_graph = inference_graph
+        self.graph = inference_graph.graph
+        self._session = tf.Session(graph=self.graph)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def run(self, fetches, feed_dict=None):
+
+        mapped_fetches = tf.nest.map_structure(
+            self._inference_graph_tensor, fetches)
+
+        mapped_feed_dict = {}
+
+        for tensor, value in (feed_dict or {}).items():
+            if isinstance(tensor, tf.SparseTensor):
+                components = [
+                    (tensor.indices, value.indices),
+                    (tensor.values, value.values),
+                    (tensor.dense_shape, value.dense_shape)
+                ]
+            else:
+                components = [(tensor, value)]
+
+            for component_tensor, component_value in components:
+                node_name = component_tensor.op.name
+                if node_name in self.inference_graph.constants:
+                    constant = self.inference_graph.constants[node_name]
+                    if numpy.any(component_value != constant):
+                        raise ValueError(
+                            "The inference graph was exported with `{}` "
+                            "set to {}, but {} was requested.".format(
+                                node_name, constant, component_value)
+                        )
+                    continue
+                try:
+                    mapped_tensor = self.graph.get_tensor_by_name(
+                        component_tensor.name)
+                except KeyError:
+                    # Inputs not used by any output are pruned
+                    continue
+                mapped_feed_dict[mapped_tensor] = component_value
+
+        return self._session.run(mapped_fetches, feed_dict=mapped_feed_dict)
+
+    def _inference_graph_tensor(self, tensor):
+        try:
+            return self.graph.get_tensor_by_name(tensor.name)
+        except KeyError:
+            raise ValueError(
+                "Tensor `{}` is not an output of the inference graph."
+                .format(tensor.name))
+
+
+def _fold_batch_normalisation(session, graph):
+    # Fold minibatch normalisation with moving statistics into the weights
+    # and biases of the preceding dense layers, and replace the
+    # normalisation statistics with ones leaving values unchanged
+
+    variables = {
+        variable.op.name: variable
+        for variable in graph.get_collection(tf.GraphKeys.GLOBAL_VARIABLES)
+    }
+
+    for name in variables:
+
+        if not name.endswith("BATCH_NORM/moving_mean"):
+            continue
+
+        scope = name[:-len("BATCH_NORM/moving_mean")]
+        weights = variables.get(scope + "DENSE/weights")
+        biases = variables.get(scope + "DENSE/biases")
+
+        if weights is None or biases is None:
+            continue
+
+        moving_mean = variables[name]
+        moving_variance = variables[scope + "BATCH_NORM/moving_variance"]
+        beta = variables.get(scope + "BATCH_NORM/beta")
+        gamma = variables.get(scope + "BATCH_NORM/gamma")
+
+        values = session.run({
+            "weights": weights,
+            "biases": biases,
+            "moving_mean": moving_mean,
+            "moving_variance": moving_variance
+        })
+
+        scale = 1 / numpy.sqrt(
+            values["moving_variance"] + BATCH_NORMALISATION_EPSILON)
+        if gamma is not None:
+            scale *= session.run(gamma)
+            gamma.load(numpy.ones_like(scale), session)
+
+        shift = -values["moving_mean"] * scale
+        if beta is not None:
+            shift += session.run(beta)
+            beta.load(numpy.zeros_like(shift), session)
+
+        weights.load(values["weights"] * scale, session)
+        biases.load(values["biases"] * scale + shift, session)
+        moving_mean.load(numpy.zeros_like(shift), session)
+        moving_variance.load(
+            numpy.full_like(scale, 1 - BATCH_NORMALISATION_EPSILON), session)
+
+
+def _optimise_graph_def(graph_def, output_tensor_names):
+    # Optimise graph using Grappler, which folds constants, removes
+    # branches of conditionals with constant predicates, and simplifies
+    # arithmetic with the folded minibatch normalisation
+
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name="")
+        meta_graph = tf.train.export_meta_graph(graph=graph)
+
+    fetch_collection = meta_graph.collection_def["train_op"]
+    fetch_collection.node_list.value.extend(output_tensor_names)
+
+    config = tf.ConfigProto()
+    rewrite_options = config.graph_options.rewrite_options
+    rewrite_options.optimizers.extend(
+        ["constfold", "arithmetic", "dependency", "loop"])
+    rewrite_options.meta_optimizer_iterations = rewrite_options.TWO
+
+    return tf_optimizer.OptimizeGraph(config, meta_graph)
+
+
+def _layer_parameters(checkpoint_reader, scope, name):
+
+    parameters = {}
+
+    for variable_name, parameter_name in [
+            ("DENSE/weights", "weights"),
+            ("DENSE/biases", "biases"),
+            ("BATCH_NORM/beta", "beta"),
+            ("BATCH_NORM/gamma", "gamma"),
+            ("BATCH_NORM/moving_mean", "moving_mean"),
+            ("BATCH_NORM/moving_variance", "moving_variance")]:
+        full_variable_name = scope + "/" + variable_name
+        if checkpoint_reader.has_tensor(full_variable_name):
+            parameters[name + "/" + parameter_name] = (
+                checkpoint_reader.get_tensor(full_variable_name))
+
+    if name + "/weights" not in parameters:
+        raise ValueError(
+            "Weights for layer `{}` not found in checkpoint.".format(scope))
+
+    return parameters
+
+
+def _layers_parameters(checkpoint_reader, scope, layer_name,
+                       number_of_layers, name):
+
+    parameters = {name + "/number_of_layers": numpy.array(number_of_layers)}
+
+    for i in range(number_of_layers):
+        parameters.update(_layer_parameters(
+            checkpoint_reader,
+            "{}/{}{:d}".format(scope, layer_name, i + 1),
+            name="{}/{:d}".format(name, i + 1)
+        ))
+
+    return parameters
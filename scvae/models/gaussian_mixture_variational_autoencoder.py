@@ -17,12 +17,12 @@
 # ======================================================================== #
 
 import copy
+import functools
 import os
 import shutil
 from time import time
 
 import numpy
-import scipy.sparse
 import tensorflow as tf
 import tensorflow_probability as tfp
 
@@ -32,17 +32,31 @@ from scvae.data.data_set import DataSet
 from scvae.defaults import defaults
 from scvae.distributions import (
     DISTRIBUTIONS, GAUSSIAN_MIXTURE_DISTRIBUTIONS, parse_distribution,
-    Categorised)
+    Categorised, sparse_log_prob)
 from scvae.analyses.prediction import PredictionSpecifications
+from scvae.models.checkpoints import CheckpointManager
+from scvae.models.chunking import plan_fetches, run_in_sample_chunks
+from scvae.models.exports import InferenceGraph
+from scvae.models.hooks import ProgressPrinter, RunningEvaluation
+from scvae.models.inputs import (
+    EVALUATION_BUDGETS, InputPipeline, MinibatchProducer,
+    generate_minibatches, minibatch_values,
+    minibatch_values_and_targets, run_minibatches,
+    sparse_placeholder_with_default, split_indices,
+    stack_minibatch_values, subsample_indices)
+from scvae.models.parallel import DataParallelSteps
+from scvae.models.sinks import SparseSubsetBuffer, build_output_sink
 from scvae.models.utilities import (
-    dense_layer, dense_layers,
+    dense_layer, dense_layers, concatenate_sparse_and_dense,
+    sparse_from_dense, tile_sparse_rows,
     build_training_string, build_data_string,
     load_learning_curves, early_stopping_status,
     generate_unique_run_id_for_model, check_run_id,
     correct_model_checkpoint_path, remove_old_checkpoints,
-    copy_model_directory, clear_log_directory,
+    save_model_version, clear_log_directory,
     parse_numbers_of_samples, validate_model_parameters,
-    batch_indices_for_subset)
+    batch_indices_for_subset, restored_session, reconstruction_output,
+    sampled_values_data_type, numbered_names, noise_random_state)
 from scvae.utilities import (
     format_duration, format_time,
     normalise_string, capitalise_string)
@@ -302,6 +316,28 @@ class GaussianMixtureVariationalAutoencoder:
             if dropout_keep_probabilities and dropout_keep_probabilities != 1:
                 self.dropout_parts.append(str(dropout_keep_probabilities))
 
+        sparse_input = kwargs.get("sparse_input")
+        if sparse_input is None:
+            sparse_input = defaults["models"]["sparse_input"]
+        self.sparse_input = sparse_input
+
+        sparse_reconstruction = kwargs.get("sparse_reconstruction")
+        if sparse_reconstruction is None:
+            sparse_reconstruction = defaults["models"][
+                "sparse_reconstruction"]
+        self.sparse_reconstruction = sparse_reconstruction
+
+        batched_clusters = kwargs.get("batched_clusters")
+        if batched_clusters is None:
+            batched_clusters = defaults["models"]["batched_clusters"]
+        if (batched_clusters
+                and "full-covariance" in self.latent_distribution_name):
+            raise NotImplementedError(
+                "Computing all clusters at once for full-covariance "
+                "Gaussian-mixture latent distributions not implemented."
+            )
+        self.batched_clusters = batched_clusters
+
         count_sum = kwargs.get("count_sum")
         if count_sum is None:
             count_sum = defaults["models"]["count_sum"]
@@ -335,21 +371,43 @@ class GaussianMixtureVariationalAutoencoder:
 
         validate_model_parameters(
             reconstruction_distribution=self.reconstruction_distribution_name,
-            number_of_reconstruction_classes=self.k_max
+            number_of_reconstruction_classes=self.k_max,
+            sparse_reconstruction=self.sparse_reconstruction
         )
 
         with self.graph.as_default():
 
-            self.x = tf.placeholder(
-                dtype=tf.float32,
-                shape=[None, self.feature_size],
-                name="X"
-            )
-            self.t = tf.placeholder(
-                dtype=tf.float32,
-                shape=[None, self.feature_size],
-                name="T"
+            self.input_pipeline = InputPipeline(
+                feature_size=self.feature_size,
+                sparse_values=self.sparse_input,
+                batch_correction=self.batch_correction,
+                count_sum_feature=self.use_count_sum_as_feature,
+                count_sum_parameter=self.use_count_sum_as_parameter
             )
+            pipeline_inputs = self.input_pipeline.inputs
+
+            if self.sparse_input:
+                self.x = sparse_placeholder_with_default(
+                    pipeline_inputs["x"],
+                    feature_size=self.feature_size,
+                    name="X"
+                )
+                self.t = sparse_placeholder_with_default(
+                    pipeline_inputs["t"],
+                    feature_size=self.feature_size,
+                    name="T"
+                )
+            else:
+                self.x = tf.placeholder_with_default(
+                    pipeline_inputs["x"],
+                    shape=[None, self.feature_size],
+                    name="X"
+                )
+                self.t = tf.placeholder_with_default(
+                    pipeline_inputs["t"],
+                    shape=[None, self.feature_size],
+                    name="T"
+                )
 
             self.learning_rate = tf.placeholder(
                 dtype=tf.float32,
@@ -403,21 +461,21 @@ class GaussianMixtureVariationalAutoencoder:
             )
 
             if self.batch_correction:
-                self.batch_indices = tf.placeholder(
-                    dtype=tf.int32,
+                self.batch_indices = tf.placeholder_with_default(
+                    pipeline_inputs["batch_indices"],
                     shape=[None, 1],
                     name="batch_indices"
                 )
 
             if self.use_count_sum_as_feature:
-                self.count_sum_feature = tf.placeholder(
-                    dtype=tf.float32,
+                self.count_sum_feature = tf.placeholder_with_default(
+                    pipeline_inputs["count_sum_feature"],
                     shape=[None, 1],
                     name="count_sum_feature"
                 )
             if self.use_count_sum_as_parameter:
-                self.count_sum_parameter = tf.placeholder(
-                    dtype=tf.float32,
+                self.count_sum_parameter = tf.placeholder_with_default(
+                    pipeline_inputs["count_sum_parameter"],
                     shape=[None, 1],
                     name="count_sum"
                 )
@@ -437,6 +495,10 @@ class GaussianMixtureVariationalAutoencoder:
             self._setup_optimiser()
 
             self.saver = tf.train.Saver(max_to_keep=1)
+            self.checkpoint_manager = CheckpointManager(max_to_keep=1)
+
+        # Tensors for sampling added to the graph, when first needed
+        self.reconstruction_outputs = {}
 
     @property
     def name(self):
@@ -581,6 +643,16 @@ class GaussianMixtureVariationalAutoencoder:
         if self.use_count_sum_as_feature:
             description_parts.append("using count sums")
 
+        if self.sparse_input:
+            description_parts.append("using sparse inputs")
+
+        if self.sparse_reconstruction:
+            description_parts.append(
+                "using sparse evaluation of reconstruction likelihood")
+
+        if self.batched_clusters:
+            description_parts.append("computing all clusters at once")
+
         if self.early_stopping_rounds:
             description_parts.append(
                 "early stopping: after {} epoch with no improvements"
@@ -702,6 +774,38 @@ class GaussianMixtureVariationalAutoencoder:
                 as a separate run with an automatically generated ID.
             reset_training (bool, optional): If ``True``, reset model
                 by removing saved parameters for the model.
+            input_pipeline (bool, optional): If ``True``, prepare
+                minibatches in the background using a prefetching input
+                pipeline instead of feeding them at each step.
+            prefetch_size (int, optional): The number of minibatches
+                prepared in advance by the input pipeline or the
+                producer thread.
+            producer_thread (bool, optional): If ``True``, and if the
+                input pipeline is not used, prepare minibatches in a
+                background thread while the model is run for the
+                current minibatch.
+            hooks (list(StepHook), optional): Hooks called at each step
+                of training in addition to printing progress.
+            evaluation_budget (str, optional): How the model is
+                evaluated on the training and validation sets after
+                each epoch: ``"full"`` evaluation of all examples,
+                ``"subsample"`` evaluation of a fixed random subsample
+                of examples, or ``"running"`` averages of the training
+                steps during the epoch (the validation set is then
+                evaluated using a subsample).
+            evaluation_subsample_size (int, optional): The number of
+                examples in the subsample used for evaluation.
+            asynchronous_checkpoints (bool, optional): If ``True``,
+                write checkpoints in a background thread while training
+                continues.
+            data_parallel_workers (int, optional): If larger than one,
+                split each minibatch into this number of shards, compute
+                the gradients for the shards in parallel, and apply
+                their average. Not possible with minibatch
+                normalisation.
+            data_parallel_reference_steps (int, optional): The number
+                of initial steps also computed without sharding to
+                measure the speed-up of data-parallel training.
         """
 
         if number_of_epochs is None:
@@ -721,6 +825,68 @@ class GaussianMixtureVariationalAutoencoder:
         if analyses_directory is None:
             analyses_directory = defaults["analyses"]["directory"]
 
+        input_pipeline = kwargs.get("input_pipeline")
+        if input_pipeline is None:
+            input_pipeline = defaults["models"]["input_pipeline"]
+
+        prefetch_size = kwargs.get("prefetch_size")
+        if prefetch_size is None:
+            prefetch_size = defaults["models"]["prefetch_size"]
+
+        producer_thread = kwargs.get("producer_thread")
+        if producer_thread is None:
+            producer_thread = defaults["models"]["producer_thread"]
+
+        evaluation_budget = kwargs.get("evaluation_budget")
+        if evaluation_budget is None:
+            evaluation_budget = defaults["models"]["evaluation_budget"]
+        if evaluation_budget not in EVALUATION_BUDGETS:
+            raise ValueError(
+                "Evaluation budget `{}` not found.".format(evaluation_budget))
+
+        evaluation_subsample_size = kwargs.get("evaluation_subsample_size")
+        if evaluation_subsample_size is None:
+            evaluation_subsample_size = defaults["models"][
+                "evaluation_subsample_size"]
+
+        asynchronous_checkpoints = kwargs.get("asynchronous_checkpoints")
+        if asynchronous_checkpoints is None:
+            asynchronous_checkpoints = defaults["models"][
+                "asynchronous_checkpoints"]
+
+        data_parallel_workers = kwargs.get("data_parallel_workers")
+        if data_parallel_workers is None:
+            data_parallel_workers = defaults["models"][
+                "data_parallel_workers"]
+        data_parallel_reference_steps = kwargs.get(
+            "data_parallel_reference_steps")
+        if data_parallel_reference_steps is None:
+            data_parallel_reference_steps = defaults["models"][
+                "data_parallel_reference_steps"]
+        if data_parallel_workers > 1 and input_pipeline:
+            raise ValueError(
+                "Data-parallel training cannot be used together with the "
+                "input pipeline."
+            )
+        if data_parallel_workers > 1 and evaluation_budget == "running":
+            raise ValueError(
+                "Data-parallel training cannot be used together with the "
+                "running evaluation budget."
+            )
+        if data_parallel_workers > 1 and self.minibatch_normalisation:
+            raise ValueError(
+                "Data-parallel training cannot be used together with "
+                "minibatch normalisation, since each shard would be "
+                "normalised separately."
+            )
+        if (data_parallel_workers > 1
+                and self.proportion_of_free_nats_for_y_kl_divergence):
+            raise ValueError(
+                "Data-parallel training cannot be used together with free "
+                "nats for the KL divergence of y, since these depend on "
+                "the whole minibatch."
+            )
+
         start_time = time()
 
         if run_id is None:
@@ -852,18 +1018,24 @@ class GaussianMixtureVariationalAutoencoder:
         preparing_data_time_start = time()
 
         # Batch indices for batch correction
+        batch_indices_train = None
+        batch_indices_valid = None
         if self.batch_correction:
             batch_indices_train = batch_indices_for_subset(training_set)
             if validation_set:
                 batch_indices_valid = batch_indices_for_subset(validation_set)
 
         # Count sum for distributions
+        count_sum_parameter_train = None
+        count_sum_parameter_valid = None
         if self.use_count_sum_as_parameter:
             count_sum_parameter_train = training_set.count_sum
             if validation_set:
                 count_sum_parameter_valid = validation_set.count_sum
 
         # Normalised count sum as a feature to the decoder
+        count_sum_feature_train = None
+        count_sum_feature_valid = None
         if self.use_count_sum_as_feature:
             count_sum_feature_train = training_set.normalised_count_sum
             if validation_set:
@@ -874,7 +1046,7 @@ class GaussianMixtureVariationalAutoencoder:
         if validation_set:
             n_examples_valid = validation_set.number_of_examples
 
-        # Preprocessing function at every epoch
+        # Noisy preprocessing function applied to every minibatch
         noisy_preprocess = training_set.noisy_preprocess
 
         # Input and output
@@ -898,6 +1070,14 @@ class GaussianMixtureVariationalAutoencoder:
                 if validation_set:
                     t_valid = validation_set.values
 
+        else:
+            # Deterministic noisy preprocessing is applied once, and the
+            # random part to each minibatch as it is drawn using a random
+            # stream seeded by the run and the epoch
+            x_train = t_train = training_set.noisy_values
+            if validation_set:
+                x_valid = t_valid = validation_set.noisy_values
+
         # Use label IDs instead of labels
         if training_set.has_labels:
 
@@ -946,9 +1126,66 @@ class GaussianMixtureVariationalAutoencoder:
             preparing_data_duration)))
         print()
 
-        # Display intervals during every epoch
+        # Hooks called at every step including printing of progress at
+        # intervals during every epoch
         steps_per_epoch = numpy.ceil(n_examples_train / minibatch_size)
-        output_at_step = numpy.round(numpy.linspace(0, steps_per_epoch, 11))
+        hooks = [ProgressPrinter(steps_per_epoch)]
+        hooks.extend(kwargs.get("hooks") or [])
+
+        # Tensors and examples used for evaluation after every epoch
+        minibatch_inputs = {"x": self.x, "t": self.t}
+        if self.batch_correction:
+            minibatch_inputs["batch_indices"] = self.batch_indices
+        if self.use_count_sum_as_parameter:
+            minibatch_inputs["count_sum_parameter"] = (
+                self.count_sum_parameter)
+        if self.use_count_sum_as_feature:
+            minibatch_inputs["count_sum_feature"] = self.count_sum_feature
+
+        evaluation_feed_dict = {
+            self.is_training: False,
+            self.warm_up_weight: 1.0,
+            self.n_iw_samples: self.number_of_importance_samples["training"],
+            self.n_mc_samples: self.number_of_monte_carlo_samples["training"]
+        }
+
+        training_evaluation_fetches = [
+            self.lower_bound, self.reconstruction_error,
+            self.kl_divergence_z, self.kl_divergence_y,
+            self.kl_divergence_neurons, self.q_y_probabilities,
+            self.q_z_means, self.q_z_variances,
+            self.p_y_probabilities, self.p_z_means,
+            self.p_z_variances, self.q_z_covariances,
+            self.p_z_covariances, self.q_y_logits, self.z_mean
+        ]
+        validation_evaluation_fetches = [
+            fetch for fetch in training_evaluation_fetches
+            if fetch is not self.kl_divergence_neurons
+        ]
+
+        evaluation_indices_train = numpy.arange(n_examples_train)
+        if validation_set:
+            evaluation_indices_valid = numpy.arange(n_examples_valid)
+
+        if evaluation_budget == "running":
+            running_evaluation = RunningEvaluation(
+                training_evaluation_fetches)
+            hooks.append(running_evaluation)
+        elif evaluation_budget == "subsample":
+            evaluation_indices_train = subsample_indices(
+                n_examples_train, evaluation_subsample_size)
+
+        if evaluation_budget != "full" and validation_set:
+            evaluation_indices_valid = subsample_indices(
+                n_examples_valid, evaluation_subsample_size)
+
+        if data_parallel_workers > 1:
+            data_parallel_steps = DataParallelSteps(
+                self, data_parallel_workers,
+                number_of_reference_steps=data_parallel_reference_steps
+            )
+        else:
+            data_parallel_steps = None
 
         # Initialising lists for learning curves
         learning_curves = {
@@ -1038,25 +1275,10 @@ class GaussianMixtureVariationalAutoencoder:
             print()
             training_time_start = time()
 
-            for epoch in range(epoch_start, number_of_epochs):
-
-                if noisy_preprocess:
-                    print("Noisily preprocess values.")
-                    noisy_time_start = time()
-
-                    x_train = noisy_preprocess(
-                        training_set.values)
-                    t_train = x_train
+            for hook in hooks:
+                hook.begin(self, session)
 
-                    if validation_set:
-                        x_valid = noisy_preprocess(
-                            validation_set.values)
-                        t_valid = x_valid
-
-                    noisy_duration = time() - noisy_time_start
-                    print("Values noisily preprocessed ({}).".format(
-                        format_duration(noisy_duration)))
-                    print()
+            for epoch in range(epoch_start, number_of_epochs):
 
                 epoch_time_start = time()
 
@@ -1068,22 +1290,53 @@ class GaussianMixtureVariationalAutoencoder:
 
                 shuffled_indices = numpy.random.permutation(n_examples_train)
 
+                # Track steps locally instead of at every step
+                step = int(session.run(self.global_step))
+
+                for hook in hooks:
+                    hook.before_epoch(epoch)
+                minibatch_producer = None
+
+                if input_pipeline:
+                    self.input_pipeline.initialise(
+                        session,
+                        values=x_train,
+                        targets=t_train,
+                        indices=shuffled_indices,
+                        minibatch_size=minibatch_size,
+                        batch_indices=batch_indices_train,
+                        count_sum_feature=count_sum_feature_train,
+                        count_sum_parameter=count_sum_parameter_train,
+                        prefetch_size=prefetch_size,
+                        preprocess=noisy_preprocess,
+                        random_state=noise_random_state(
+                            self, epoch, "training", run_id=run_id)
+                    )
+                else:
+                    minibatches = generate_minibatches(
+                        values=x_train,
+                        targets=t_train,
+                        indices=shuffled_indices,
+                        minibatch_size=minibatch_size,
+                        sparse=self.sparse_input,
+                        batch_indices=batch_indices_train,
+                        count_sum_feature=count_sum_feature_train,
+                        count_sum_parameter=count_sum_parameter_train,
+                        preprocess=noisy_preprocess,
+                        random_state=noise_random_state(
+                            self, epoch, "training", run_id=run_id)
+                    )
+                    if producer_thread:
+                        minibatch_producer = MinibatchProducer(
+                            minibatches, queue_size=prefetch_size)
+                        minibatches = minibatch_producer
+
                 for i in range(0, n_examples_train, minibatch_size):
 
                     # Internal setup
                     step_time_start = time()
-                    step = session.run(self.global_step)
-
-                    # Prepare minibatch
-                    minibatch_indices = shuffled_indices[
-                        i:(i + minibatch_size)]
-
-                    x_batch = x_train[minibatch_indices].toarray()
-                    t_batch = t_train[minibatch_indices].toarray()
 
                     feed_dict_batch = {
-                        self.x: x_batch,
-                        self.t: t_batch,
                         self.is_training: True,
                         self.learning_rate: learning_rate,
                         self.warm_up_weight: warm_up_weight,
@@ -1093,38 +1346,55 @@ class GaussianMixtureVariationalAutoencoder:
                             self.number_of_monte_carlo_samples["training"]
                     }
 
-                    if self.batch_correction:
-                        feed_dict_batch[self.batch_indices] = (
-                            batch_indices_train[minibatch_indices])
+                    # Prepare minibatch, unless the input pipeline does
+                    if not input_pipeline:
+
+                        minibatch = next(minibatches)
 
-                    if self.use_count_sum_as_parameter:
-                        feed_dict_batch[self.count_sum_parameter] = (
-                            count_sum_parameter_train[minibatch_indices])
+                        feed_dict_batch[self.x] = minibatch["x"]
+                        feed_dict_batch[self.t] = minibatch["t"]
+
+                        if self.batch_correction:
+                            feed_dict_batch[self.batch_indices] = (
+                                minibatch["batch_indices"])
+
+                        if self.use_count_sum_as_parameter:
+                            feed_dict_batch[self.count_sum_parameter] = (
+                                minibatch["count_sum_parameter"])
 
-                    if self.use_count_sum_as_feature:
-                        feed_dict_batch[self.count_sum_feature] = (
-                            count_sum_feature_train[minibatch_indices])
+                        if self.use_count_sum_as_feature:
+                            feed_dict_batch[self.count_sum_feature] = (
+                                minibatch["count_sum_feature"])
 
                     # Run the stochastic minibatch training operation
-                    _, minibatch_loss = session.run(
-                        [self.optimiser, self.lower_bound],
-                        feed_dict=feed_dict_batch
-                    )
+                    # together with tensors requested by hooks
+                    hook_fetches = [
+                        hook.before_step(step) or {} for hook in hooks]
+                    if data_parallel_steps:
+                        minibatch_loss, hook_results = (
+                            data_parallel_steps.run(
+                                session,
+                                feed_dict=feed_dict_batch,
+                                minibatch=minibatch,
+                                inputs=minibatch_inputs,
+                                fetches=hook_fetches
+                            )
+                        )
+                    else:
+                        _, minibatch_loss, hook_results = session.run(
+                            [self.optimiser, self.lower_bound, hook_fetches],
+                            feed_dict=feed_dict_batch
+                        )
+                    step += 1
 
                     # Compute step duration
                     step_duration = time() - step_time_start
 
-                    # Print evaluation and output summaries
-                    if (step + 1 - steps_per_epoch * epoch) in output_at_step:
-
-                        print("Step {:d} ({}): {:.5g}.".format(
-                            int(step + 1), format_duration(step_duration),
-                            minibatch_loss))
-
-                        if numpy.isnan(minibatch_loss):
-                            raise ArithmeticError(
-                                "Aborting. The ELBO for the last batch became "
-                                "indefinite.")
+                    for hook, results in zip(hooks, hook_results):
+                        hook.after_step(
+                            step, epoch, minibatch_loss, step_duration,
+                            results=results
+                        )
 
                 print()
 
@@ -1133,6 +1403,26 @@ class GaussianMixtureVariationalAutoencoder:
                 print("Epoch {} ({}):".format(
                     epoch + 1, format_duration(epoch_duration)))
 
+                for hook in hooks:
+                    hook.after_epoch(epoch, epoch_duration)
+
+                # Time spent waiting for minibatches from producer thread
+                if minibatch_producer:
+                    minibatch_producer.close()
+                    print("    Input stall time: {}.".format(
+                        format_duration(minibatch_producer.stall_duration)))
+
+                if (data_parallel_steps
+                        and not numpy.isnan(data_parallel_steps.speed_up)):
+                    print(
+                        "    Data-parallel speed-up:",
+                        "{:.2f} with {} workers.".format(
+                            data_parallel_steps.speed_up,
+                            data_parallel_steps.number_of_workers
+                        )
+                    )
+                    data_parallel_steps.reset()
+
                 # With warmup or not
                 if warm_up_weight < 1:
                     print("    Warm-up weight: {:.2g}".format(warm_up_weight))
@@ -1190,33 +1480,31 @@ class GaussianMixtureVariationalAutoencoder:
                 else:
                     kl_divergence_neurons = numpy.zeros(self.latent_size)
 
-                for i in range(0, n_examples_train, minibatch_size):
-                    subset = slice(
-                        i, min(i + minibatch_size, n_examples_train))
-                    x_batch = x_train[subset].toarray()
-                    t_batch = t_train[subset].toarray()
-                    feed_dict_batch = {
-                        self.x: x_batch,
-                        self.t: t_batch,
-                        self.is_training: False,
-                        self.warm_up_weight: 1.0,
-                        self.n_iw_samples:
-                            self.number_of_importance_samples["training"],
-                        self.n_mc_samples:
-                            self.number_of_monte_carlo_samples["training"]
-                    }
-
-                    if self.batch_correction:
-                        feed_dict_batch[self.batch_indices] = (
-                            batch_indices_train[subset])
-
-                    if self.use_count_sum_as_parameter:
-                        feed_dict_batch[self.count_sum_parameter] = (
-                            count_sum_parameter_train[subset])
+                if evaluation_budget == "running":
+                    training_evaluations = zip(
+                        split_indices(shuffled_indices, minibatch_size),
+                        running_evaluation.results
+                    )
+                else:
+                    training_evaluations = run_minibatches(
+                        session,
+                        training_evaluation_fetches,
+                        inputs=minibatch_inputs,
+                        values=x_train,
+                        targets=t_train,
+                        indices=evaluation_indices_train,
+                        minibatch_size=minibatch_size,
+                        sparse=self.sparse_input,
+                        feed_dict=evaluation_feed_dict,
+                        batch_indices=batch_indices_train,
+                        count_sum_feature=count_sum_feature_train,
+                        count_sum_parameter=count_sum_parameter_train,
+                        preprocess=noisy_preprocess,
+                        random_state=noise_random_state(
+                            self, epoch, "evaluation", run_id=run_id)
+                    )
 
-                    if self.use_count_sum_as_feature:
-                        feed_dict_batch[self.count_sum_feature] = (
-                            count_sum_feature_train[subset])
+                for subset, evaluation_results in training_evaluations:
 
                     (
                         lower_bound_i, reconstruction_error_i,
@@ -1226,18 +1514,7 @@ class GaussianMixtureVariationalAutoencoder:
                         p_y_probabilities_i, p_z_means_i, p_z_variances_i,
                         q_z_covariances_i, p_z_covariances_i,
                         q_y_logits_train_i, z_mean_i
-                    ) = session.run(
-                        [
-                            self.lower_bound, self.reconstruction_error,
-                            self.kl_divergence_z, self.kl_divergence_y,
-                            self.kl_divergence_neurons, self.q_y_probabilities,
-                            self.q_z_means, self.q_z_variances,
-                            self.p_y_probabilities, self.p_z_means,
-                            self.p_z_variances, self.q_z_covariances,
-                            self.p_z_covariances, self.q_y_logits, self.z_mean
-                        ],
-                        feed_dict=feed_dict_batch
-                    )
+                    ) = evaluation_results
 
                     lower_bound_train += lower_bound_i
                     kl_divergence_z_train += kl_divergence_z_i
@@ -1261,24 +1538,27 @@ class GaussianMixtureVariationalAutoencoder:
                     q_y_logits_train[subset] = q_y_logits_train_i
                     z_mean_train[subset] = z_mean_i
 
-                lower_bound_train /= n_examples_train / minibatch_size
-                kl_divergence_z_train /= n_examples_train / minibatch_size
-                kl_divergence_y_train /= n_examples_train / minibatch_size
-                reconstruction_error_train /= n_examples_train / minibatch_size
+                n_evaluated_train = evaluation_indices_train.size
+
+                lower_bound_train /= n_evaluated_train / minibatch_size
+                kl_divergence_z_train /= n_evaluated_train / minibatch_size
+                kl_divergence_y_train /= n_evaluated_train / minibatch_size
+                reconstruction_error_train /= (
+                    n_evaluated_train / minibatch_size)
 
-                kl_divergence_neurons /= n_examples_train / minibatch_size
+                kl_divergence_neurons /= n_evaluated_train / minibatch_size
 
-                q_y_probabilities /= n_examples_train / minibatch_size
-                q_z_means /= n_examples_train / minibatch_size
-                q_z_variances /= n_examples_train / minibatch_size
+                q_y_probabilities /= n_evaluated_train / minibatch_size
+                q_z_means /= n_evaluated_train / minibatch_size
+                q_z_variances /= n_evaluated_train / minibatch_size
 
-                p_y_probabilities /= n_examples_train / minibatch_size
-                p_z_means /= n_examples_train / minibatch_size
-                p_z_variances /= n_examples_train / minibatch_size
+                p_y_probabilities /= n_evaluated_train / minibatch_size
+                p_z_means /= n_evaluated_train / minibatch_size
+                p_z_variances /= n_evaluated_train / minibatch_size
 
                 if "full-covariance" in self.latent_distribution_name:
-                    q_z_covariances /= n_examples_train / minibatch_size
-                    p_z_covariances /= n_examples_train / minibatch_size
+                    q_z_covariances /= n_evaluated_train / minibatch_size
+                    p_z_covariances /= n_evaluated_train / minibatch_size
 
                 if numpy.isnan(lower_bound_train):
                     raise ArithmeticError(
@@ -1296,18 +1576,19 @@ class GaussianMixtureVariationalAutoencoder:
 
                 # Training accuracies
 
-                training_cluster_ids = q_y_logits_train.argmax(axis=1)
+                training_cluster_ids = q_y_logits_train[
+                    evaluation_indices_train].argmax(axis=1)
 
                 if training_set.has_labels:
                     predicted_training_label_ids = (
                         map_cluster_ids_to_label_ids(
-                            training_label_ids,
+                            training_label_ids[evaluation_indices_train],
                             training_cluster_ids,
                             excluded_class_ids
                         )
                     )
                     accuracy_train = accuracy(
-                        training_label_ids,
+                        training_label_ids[evaluation_indices_train],
                         predicted_training_label_ids,
                         excluded_class_ids
                     )
@@ -1317,13 +1598,14 @@ class GaussianMixtureVariationalAutoencoder:
                 if training_set.label_superset:
                     predicted_training_superset_label_ids = (
                         map_cluster_ids_to_label_ids(
-                            training_superset_label_ids,
+                            training_superset_label_ids[
+                                evaluation_indices_train],
                             training_cluster_ids,
                             excluded_superset_class_ids
                         )
                     )
                     accuracy_superset_train = accuracy(
-                        training_superset_label_ids,
+                        training_superset_label_ids[evaluation_indices_train],
                         predicted_training_superset_label_ids,
                         excluded_superset_class_ids
                     )
@@ -1481,33 +1763,25 @@ class GaussianMixtureVariationalAutoencoder:
                         dtype=numpy.float32
                     )
 
-                    for i in range(0, n_examples_valid, minibatch_size):
-                        subset = slice(
-                            i, min(i + minibatch_size, n_examples_valid))
-                        x_batch = x_valid[subset].toarray()
-                        t_batch = t_valid[subset].toarray()
-                        feed_dict_batch = {
-                            self.x: x_batch,
-                            self.t: t_batch,
-                            self.is_training: False,
-                            self.warm_up_weight: 1.0,
-                            self.n_iw_samples:
-                                self.number_of_importance_samples["training"],
-                            self.n_mc_samples:
-                                self.number_of_monte_carlo_samples["training"]
-                        }
-
-                        if self.batch_correction:
-                            feed_dict_batch[self.batch_indices] = (
-                                batch_indices_valid[subset])
+                    validation_evaluations = run_minibatches(
+                        session,
+                        validation_evaluation_fetches,
+                        inputs=minibatch_inputs,
+                        values=x_valid,
+                        targets=t_valid,
+                        indices=evaluation_indices_valid,
+                        minibatch_size=minibatch_size,
+                        sparse=self.sparse_input,
+                        feed_dict=evaluation_feed_dict,
+                        batch_indices=batch_indices_valid,
+                        count_sum_feature=count_sum_feature_valid,
+                        count_sum_parameter=count_sum_parameter_valid,
+                        preprocess=noisy_preprocess,
+                        random_state=noise_random_state(
+                            self, epoch, "evaluation", run_id=run_id)
+                    )
 
-                        if self.use_count_sum_as_parameter:
-                            feed_dict_batch[self.count_sum_parameter] = (
-                                count_sum_parameter_valid[subset])
-
-                        if self.use_count_sum_as_feature:
-                            feed_dict_batch[self.count_sum_feature] = (
-                                count_sum_feature_valid[subset])
+                    for subset, evaluation_results in validation_evaluations:
 
                         (
                             lower_bound_i, reconstruction_error_i,
@@ -1516,18 +1790,7 @@ class GaussianMixtureVariationalAutoencoder:
                             p_y_probabilities_i, p_z_means_i, p_z_variances_i,
                             q_z_covariances_i, p_z_covariances_i,
                             q_y_logits_i, z_mean_i
-                        ) = session.run(
-                            [
-                                self.lower_bound, self.reconstruction_error,
-                                self.kl_divergence_z, self.kl_divergence_y,
-                                self.q_y_probabilities, self.q_z_means,
-                                self.q_z_variances, self.p_y_probabilities,
-                                self.p_z_means, self.p_z_variances,
-                                self.q_z_covariances, self.p_z_covariances,
-                                self.q_y_logits, self.z_mean
-                            ],
-                            feed_dict=feed_dict_batch
-                        )
+                        ) = evaluation_results
 
                         lower_bound_valid += lower_bound_i
                         kl_divergence_z_valid += kl_divergence_z_i
@@ -1549,23 +1812,25 @@ class GaussianMixtureVariationalAutoencoder:
                         q_y_logits_valid[subset] = q_y_logits_i
                         z_mean_valid[subset] = z_mean_i
 
-                    lower_bound_valid /= n_examples_valid / minibatch_size
-                    kl_divergence_z_valid /= n_examples_valid / minibatch_size
-                    kl_divergence_y_valid /= n_examples_valid / minibatch_size
+                    n_evaluated_valid = evaluation_indices_valid.size
+
+                    lower_bound_valid /= n_evaluated_valid / minibatch_size
+                    kl_divergence_z_valid /= n_evaluated_valid / minibatch_size
+                    kl_divergence_y_valid /= n_evaluated_valid / minibatch_size
                     reconstruction_error_valid /= (
-                        n_examples_valid / minibatch_size)
+                        n_evaluated_valid / minibatch_size)
 
-                    q_y_probabilities /= n_examples_valid / minibatch_size
-                    q_z_means /= n_examples_valid / minibatch_size
-                    q_z_variances /= n_examples_valid / minibatch_size
+                    q_y_probabilities /= n_evaluated_valid / minibatch_size
+                    q_z_means /= n_evaluated_valid / minibatch_size
+                    q_z_variances /= n_evaluated_valid / minibatch_size
 
-                    p_y_probabilities /= n_examples_valid / minibatch_size
-                    p_z_means /= n_examples_valid / minibatch_size
-                    p_z_variances /= n_examples_valid / minibatch_size
+                    p_y_probabilities /= n_evaluated_valid / minibatch_size
+                    p_z_means /= n_evaluated_valid / minibatch_size
+                    p_z_variances /= n_evaluated_valid / minibatch_size
 
                     if "full-covariance" in self.latent_distribution_name:
-                        q_z_covariances /= n_examples_valid / minibatch_size
-                        p_z_covariances /= n_examples_valid / minibatch_size
+                        q_z_covariances /= n_evaluated_valid / minibatch_size
+                        p_z_covariances /= n_evaluated_valid / minibatch_size
 
                     if numpy.isnan(lower_bound_valid):
                         raise ArithmeticError(
@@ -1583,18 +1848,19 @@ class GaussianMixtureVariationalAutoencoder:
                         kl_divergence_y_valid)
 
                     # Validation accuracies
-                    validation_cluster_ids = q_y_logits_valid.argmax(axis=1)
+                    validation_cluster_ids = q_y_logits_valid[
+                        evaluation_indices_valid].argmax(axis=1)
 
                     if validation_set.has_labels:
                         predicted_validation_label_ids = (
                             map_cluster_ids_to_label_ids(
-                                validation_label_ids,
+                                validation_label_ids[evaluation_indices_valid],
                                 validation_cluster_ids,
                                 excluded_class_ids
                             )
                         )
                         accuracy_valid = accuracy(
-                            validation_label_ids,
+                            validation_label_ids[evaluation_indices_valid],
                             predicted_validation_label_ids,
                             excluded_class_ids
                         )
@@ -1604,13 +1870,15 @@ class GaussianMixtureVariationalAutoencoder:
                     if validation_set.label_superset:
                         predicted_validation_superset_label_ids = (
                             map_cluster_ids_to_label_ids(
-                                validation_superset_label_ids,
+                                validation_superset_label_ids[
+                                    evaluation_indices_valid],
                                 validation_cluster_ids,
                                 excluded_superset_class_ids
                             )
                         )
                         accuracy_superset_valid = accuracy(
-                            validation_superset_label_ids,
+                            validation_superset_label_ids[
+                                evaluation_indices_valid],
                             predicted_validation_superset_label_ids,
                             excluded_superset_class_ids
                         )
@@ -1738,13 +2006,11 @@ class GaussianMixtureVariationalAutoencoder:
                             saving_time_start = time()
                             lower_bound_valid_early_stopping = (
                                 lower_bound_valid)
-                            current_checkpoint = tf.train.get_checkpoint_state(
-                                log_directory)
-                            if current_checkpoint:
-                                copy_model_directory(
-                                    current_checkpoint,
-                                    early_stopping_log_directory
-                                )
+                            self.checkpoint_manager.wait()
+                            save_model_version(
+                                log_directory,
+                                early_stopping_log_directory
+                            )
                             saving_duration = time() - saving_time_start
                             print(
                                 "        "
@@ -1780,34 +2046,43 @@ class GaussianMixtureVariationalAutoencoder:
                         self.stopped_early = True
                         epochs_with_no_improvement = numpy.nan
 
-                # Saving model parameters (update checkpoint)
-                print("    Saving model parameters.")
-                saving_time_start = time()
-                self.saver.save(
-                    session, checkpoint_file, global_step=epoch + 1)
-                saving_duration = time() - saving_time_start
-                print("    Model parameters saved ({}).".format(
-                    format_duration(saving_duration)))
-
-                # Saving best model parameters yet
-                if (validation_set
-                        and lower_bound_valid > lower_bound_valid_maximum):
+                # Saving model parameters (update checkpoint) and, if
+                # best yet, recording them as best model parameters
+                best_model_yet = (
+                    validation_set
+                    and lower_bound_valid > lower_bound_valid_maximum
+                )
+                if best_model_yet:
                     print(
                         "    Best validation lower_bound yet.",
                         "Saving model parameters as best model parameters."
                     )
-                    saving_time_start = time()
                     lower_bound_valid_maximum = lower_bound_valid
-                    current_checkpoint = (
-                        tf.train.get_checkpoint_state(log_directory))
-                    if current_checkpoint:
-                        copy_model_directory(
-                            current_checkpoint,
-                            best_model_log_directory
-                        )
-                    remove_old_checkpoints(best_model_log_directory)
-                    saving_duration = time() - saving_time_start
-                    print("    Best model parameters saved ({}).".format(
+                    saving_callback = functools.partial(
+                        save_model_version,
+                        log_directory,
+                        best_model_log_directory
+                    )
+                else:
+                    print("    Saving model parameters.")
+                    saving_callback = None
+                saving_time_start = time()
+                self.checkpoint_manager.save(
+                    session,
+                    checkpoint_file,
+                    global_step=epoch + 1,
+                    asynchronous=asynchronous_checkpoints,
+                    callback=saving_callback
+                )
+                saving_duration = time() - saving_time_start
+                if asynchronous_checkpoints:
+                    print(
+                        "    Model parameters snapshotted ({});".format(
+                            format_duration(saving_duration)),
+                        "saving in background."
+                    )
+                else:
+                    print("    Model parameters saved ({}).".format(
                         format_duration(saving_duration)))
 
                 print()
@@ -1862,12 +2137,19 @@ class GaussianMixtureVariationalAutoencoder:
                         else:
                             centroids = None
 
-                        if validation_set:
+                        # Latent values are only available for whole data
+                        # sets, when these are fully evaluated
+                        if (validation_set and evaluation_indices_valid.size
+                                == n_examples_valid):
                             intermediate_latent_values = z_mean_valid
                             intermediate_data_set = validation_set
-                        else:
+                        elif (evaluation_indices_train.size
+                                == n_examples_train):
                             intermediate_latent_values = z_mean_train
                             intermediate_data_set = training_set
+                        else:
+                            intermediate_latent_values = None
+                            intermediate_data_set = None
 
                         intermediate_analyser(
                             epoch=epoch,
@@ -1894,6 +2176,14 @@ class GaussianMixtureVariationalAutoencoder:
                         )
                         print()
 
+            for hook in hooks:
+                hook.end()
+
+            if data_parallel_steps:
+                data_parallel_steps.close()
+
+            self.checkpoint_manager.wait()
+
             training_duration = time() - training_time_start
 
             print("{} trained for {} epochs ({}).".format(
@@ -1947,7 +2237,8 @@ class GaussianMixtureVariationalAutoencoder:
             return 0
 
     def sample(self, sample_size=None, minibatch_size=None, run_id=None,
-               use_early_stopping_model=False, use_best_model=False):
+               use_early_stopping_model=False, use_best_model=False,
+               session=None, **kwargs):
         """Sample from trained model.
 
         Arguments:
@@ -1963,6 +2254,21 @@ class GaussianMixtureVariationalAutoencoder:
             use_best_model (bool, optional): If ``True``, use model
                 parameters, which resulted in the best performance on
                 validation set during training. Defaults to ``False``.
+            session (tf.Session, optional): Open session, in which the
+                model parameters have already been restored, for
+                example, by a model server. By default, a new session
+                is opened and the parameters are restored.
+            output_sink (str, optional): Where samples are written
+                while sampling: ``"memory"`` (in-memory arrays),
+                ``"npy"`` (memory-mapped NumPy files), or ``"hdf5"``
+                (chunked HDF5 files).
+            output_directory (str, optional): Directory for files
+                written by file-based output sinks. Defaults to a
+                subdirectory of the log directory of the model.
+            draw_counts (bool, optional): If ``True``, draw values from
+                the reconstruction distribution, which are integer
+                counts for count distributions, instead of using its
+                means.
 
         Returns:
             A data set of generated examples/cells as well as a
@@ -1975,6 +2281,14 @@ class GaussianMixtureVariationalAutoencoder:
         if minibatch_size is None:
             minibatch_size = defaults["models"]["minibatch_size"]
 
+        output_sink = kwargs.get("output_sink")
+        if output_sink is None:
+            output_sink = defaults["models"]["output_sink"]
+
+        draw_counts = kwargs.get("draw_counts")
+        if draw_counts is None:
+            draw_counts = defaults["models"]["draw_counts"]
+
         if run_id is None:
             run_id = defaults["models"]["run_id"]
         if run_id:
@@ -2002,82 +2316,128 @@ class GaussianMixtureVariationalAutoencoder:
             best_model=use_best_model
         )
 
-        checkpoint = tf.train.get_checkpoint_state(log_directory)
+        output_directory = kwargs.get("output_directory")
+        if output_directory is None:
+            output_directory = os.path.join(log_directory, "samples")
 
-        with tf.Session(graph=self.graph) as session:
+        if draw_counts:
+            x_version = "drawn"
+        else:
+            x_version = "reconstructed"
 
-            if checkpoint:
-                model_checkpoint_path = correct_model_checkpoint_path(
-                    checkpoint.model_checkpoint_path,
-                    log_directory
-                )
-                self.saver.restore(session, model_checkpoint_path)
-            else:
-                raise Exception(
-                    "Cannot evaluate {} when it has not been trained.".format(
-                        model_string)
-                )
+        if self.batched_clusters:
+            x_samples_output = reconstruction_output(
+                self, self.p_x_given_z, draw_counts=draw_counts)
+        else:
+            x_samples_outputs = [
+                reconstruction_output(
+                    self, self.p_x_given_z[k], draw_counts=draw_counts)
+                for k in range(self.n_clusters)
+            ]
+
+        with restored_session(self, log_directory, model_string,
+                              session=session) as session:
 
             print("Sampling {} examples from {}.".format(
                 sample_size, model_string))
             sampling_time_start = time()
 
-            y_samples = numpy.empty(
+            y_samples = build_output_sink(
+                output_sink,
                 shape=(sample_size, self.n_clusters),
+                name="sample-latent-y-values",
+                directory=output_directory,
                 dtype=numpy.int32
             )
-            z_mean_samples = numpy.empty(
+            z_samples = build_output_sink(
+                output_sink,
                 shape=(sample_size, self.latent_size),
-                dtype=numpy.float32
+                name="sample-latent-z-values",
+                directory=output_directory
             )
-            x_mean = numpy.empty(
+            x_samples = build_output_sink(
+                output_sink,
                 shape=(sample_size, self.feature_size),
-                dtype=numpy.float32
+                name="sample-{}-values".format(x_version),
+                directory=output_directory,
+                dtype=sampled_values_data_type(self, draw_counts)
             )
 
+            p_y_probabilities = session.run(
+                self.p_y_probabilities).astype(numpy.float64)
+            p_y_probabilities /= p_y_probabilities.sum()
+
             for i in range(0, sample_size, minibatch_size):
 
                 indices = numpy.arange(
                     i, min(i + minibatch_size, sample_size))
                 minibatch_sample_size = len(indices)
 
-                (y_samples_i, z_mean_samples_i, z_samples_i) = session.run(
-                    [
-                        self.p_y_samples, self.p_z_mean_samples,
-                        self.p_z_samples
-                    ],
-                    feed_dict={self.sample_size: minibatch_sample_size}
+                # Clusters are drawn first, so that latent values are
+                # only decoded for the drawn cluster of each sample
+                clusters_i = numpy.random.choice(
+                    self.n_clusters,
+                    size=minibatch_sample_size,
+                    p=p_y_probabilities
                 )
-                y_samples[indices] = y_samples_i
-                z_mean_samples[indices] = z_mean_samples_i
 
                 feed_dict_batch = {
-                    self.y: y_samples_i,
                     self.is_training: False,
                     self.n_iw_samples: 1,
                     self.n_mc_samples: 1
                 }
-                feed_dict_batch.update({
-                    self.z[k]: z_samples_i[k] for k in range(self.n_clusters)
-                })
 
-                # if self.batch_correction:
-                #     feed_dict_batch[self.batch_indices] = (
-                #         batch_indices_samples[indices])
+                if self.batched_clusters:
+                    # Shape: (K, S, L)
+                    z_samples_i = session.run(
+                        self.p_z_samples,
+                        feed_dict={self.sample_size: minibatch_sample_size}
+                    )
+                    z_samples_i = z_samples_i[
+                        clusters_i, numpy.arange(minibatch_sample_size)]
+                    # The batched decoder arranges latent values in
+                    # groups for each cluster, so their number is padded
+                    # to a multiple of the number of clusters
+                    n_padding = -minibatch_sample_size % self.n_clusters
+                    feed_dict_batch[self.z] = numpy.pad(
+                        z_samples_i, [(0, n_padding), (0, 0)])
+                    x_samples_i = session.run(
+                        x_samples_output,
+                        feed_dict=feed_dict_batch
+                    )[:minibatch_sample_size]
 
-                # if self.use_count_sum_as_parameter:
-                #     feed_dict_batch[self.count_sum_parameter] = (
-                #         count_sum_parameter_samples[indices])
+                else:
+                    z_samples_i = numpy.empty(
+                        shape=(minibatch_sample_size, self.latent_size),
+                        dtype=numpy.float32
+                    )
+                    x_samples_i = numpy.empty(
+                        shape=(minibatch_sample_size, self.feature_size),
+                        dtype=x_samples.dtype
+                    )
+                    for k in numpy.unique(clusters_i):
+                        cluster_indices = numpy.flatnonzero(clusters_i == k)
+                        z_samples_k = session.run(
+                            self.p_z_samples[k],
+                            feed_dict={self.sample_size: len(cluster_indices)}
+                        ).reshape(-1, self.latent_size)
+                        feed_dict_batch[self.z[k]] = z_samples_k
+                        z_samples_i[cluster_indices] = z_samples_k
+                        x_samples_i[cluster_indices] = session.run(
+                            x_samples_outputs[k],
+                            feed_dict=feed_dict_batch
+                        )
+                        del feed_dict_batch[self.z[k]]
 
-                # if self.use_count_sum_as_feature:
-                #     feed_dict_batch[self.count_sum_feature] = (
-                #         count_sum_feature_samples[indices])
+                y_samples.write(
+                    indices, numpy.eye(
+                        self.n_clusters, dtype=numpy.int32)[clusters_i])
+                z_samples.write(indices, z_samples_i)
+                x_samples.write(indices, x_samples_i)
 
-                x_mean_i = session.run(
-                    self.p_x_mean,
-                    feed_dict=feed_dict_batch
-                )
-                x_mean[indices] = x_mean_i
+            y_samples.close()
+            z_samples.close()
+            x_samples.close()
 
             sampling_duration = time() - sampling_time_start
 
@@ -2090,16 +2450,14 @@ class GaussianMixtureVariationalAutoencoder:
             title = "Sampled data set"
             name = normalise_string(title)
             specifications = dict()
-            sample_names = numpy.array([
-                "sample {}".format(i + 1) for i in range(sample_size)])
-            feature_names = numpy.array([
-                "feature {}".format(i + 1) for i in range(self.feature_size)])
+            sample_names = numbered_names("sample", sample_size)
+            feature_names = numbered_names("feature", self.feature_size)
 
             sample_reconstruction_set = DataSet(
                 name,
                 title=title,
                 specifications=specifications,
-                values=x_mean,
+                values=x_samples.values,
                 preprocessed_values=None,
                 labels=None,
                 example_names=sample_names,
@@ -2109,21 +2467,18 @@ class GaussianMixtureVariationalAutoencoder:
                 example_filter=None,
                 preprocessing_methods=None,
                 kind="sample",
-                version="reconstructed"
+                version=x_version
             )
 
             sample_z_set = DataSet(
                 name,
                 title=title,
                 specifications=specifications,
-                values=z_mean_samples,
+                values=z_samples.values,
                 preprocessed_values=None,
                 labels=None,
                 example_names=sample_names,
-                feature_names=numpy.array([
-                    "z variable {}".format(i + 1)
-                    for i in range(self.latent_size)
-                ]),
+                feature_names=numbered_names("z variable", self.latent_size),
                 batch_indices=batch_indices_samples,
                 feature_selection=None,
                 example_filter=None,
@@ -2136,14 +2491,11 @@ class GaussianMixtureVariationalAutoencoder:
                 name,
                 title=title,
                 specifications=specifications,
-                values=y_samples,
+                values=y_samples.values,
                 preprocessed_values=None,
                 labels=None,
                 example_names=sample_names,
-                feature_names=numpy.array([
-                    "y variable {}".format(i + 1)
-                    for i in range(self.n_clusters)
-                ]),
+                feature_names=numbered_names("y variable", self.n_clusters),
                 batch_indices=batch_indices_samples,
                 feature_selection=None,
                 example_filter=None,
@@ -2176,6 +2528,29 @@ class GaussianMixtureVariationalAutoencoder:
             use_best_model (bool, optional): If ``True``, use model
                 parameters, which resulted in the best performance on
                 validation set during training. Defaults to ``False``.
+            sample_chunk_size (int, optional): If given, evaluate the
+                importance-weighted and Monte Carlo samples for each
+                minibatch in chunks of at most this number of samples.
+            output_sink (str, optional): Where reconstructions and
+                latent means are written during evaluation:
+                ``"memory"`` (in-memory arrays), ``"npy"``
+                (memory-mapped NumPy files), or ``"hdf5"`` (chunked HDF5
+                files).
+            output_directory (str, optional): Directory for files
+                written by file-based output sinks. Defaults to a
+                subdirectory of the log directory of the model.
+            output_name (str, optional): Name used as prefix for files
+                written by file-based output sinks, which should differ
+                between evaluations of the same model whose outputs are
+                used at the same time. Defaults to the kind of the
+                evaluation set.
+            shared_minibatches (optional): Reader of minibatches shared
+                with evaluations of other model versions, as used by
+                `evaluate_ensemble`. Not used with noisy preprocessing.
+            use_inference_graph (bool, optional): If ``True``, evaluate
+                using the inference graph exported for the model
+                version (see `export_inference_graph`) instead of the
+                model graph.
 
         Returns:
             A data set of reconstructed examples/cells as well as a
@@ -2217,6 +2592,20 @@ class GaussianMixtureVariationalAutoencoder:
         if evaluation_subset_indices is None:
             evaluation_subset_indices = set()
 
+        sample_chunk_size = kwargs.get("sample_chunk_size")
+        if sample_chunk_size is None:
+            sample_chunk_size = defaults["models"]["sample_chunk_size"]
+
+        output_sink = kwargs.get("output_sink")
+        if output_sink is None:
+            output_sink = defaults["models"]["output_sink"]
+
+        shared_minibatches = kwargs.get("shared_minibatches")
+
+        use_inference_graph = kwargs.get("use_inference_graph")
+        if use_inference_graph is None:
+            use_inference_graph = defaults["models"]["use_inference_graph"]
+
         evaluation_set_transformed = False
 
         if self.batch_correction:
@@ -2247,15 +2636,11 @@ class GaussianMixtureVariationalAutoencoder:
                 t_eval = evaluation_set.values
 
         else:
-            print("Noisily preprocess values.")
-            noisy_time_start = time()
-            x_eval = noisy_preprocess(evaluation_set.values)
-            t_eval = x_eval
+            # Random noisy preprocessing is applied to each minibatch, and
+            # these are only kept for the transformed data set
+            x_eval = evaluation_set.noisy_values
+            t_eval = None
             evaluation_set_transformed = True
-            noisy_duration = time() - noisy_time_start
-            print("Values noisily preprocessed ({}).".format(
-                format_duration(noisy_duration)))
-            print()
 
         # Use label IDs instead of labels
         if evaluation_set.has_labels:
@@ -2311,13 +2696,33 @@ class GaussianMixtureVariationalAutoencoder:
 
         checkpoint = tf.train.get_checkpoint_state(log_directory)
 
+        output_directory = kwargs.get("output_directory")
+        if output_directory is None:
+            output_directory = os.path.join(log_directory, "outputs")
+
+        output_name = kwargs.get("output_name")
+        if output_name is None:
+            output_name = evaluation_set.kind
+
+        if use_inference_graph:
+            if sample_chunk_size:
+                raise ValueError(
+                    "Cannot evaluate samples in chunks using an inference "
+                    "graph, since its numbers of samples are fixed."
+                )
+            inference_graph = InferenceGraph.load(log_directory)
+            evaluation_session = inference_graph.session()
+        else:
+            inference_graph = None
+            evaluation_session = tf.Session(graph=self.graph)
+
         log_results = kwargs.get("log_results", True)
         if log_results:
             eval_summary_directory = os.path.join(log_directory, "evaluation")
             if os.path.exists(eval_summary_directory):
                 shutil.rmtree(eval_summary_directory)
 
-        with tf.Session(graph=self.graph) as session:
+        with evaluation_session as session:
 
             if log_results:
                 eval_summary_writer = tf.summary.FileWriter(
@@ -2328,9 +2733,17 @@ class GaussianMixtureVariationalAutoencoder:
                     checkpoint.model_checkpoint_path,
                     log_directory
                 )
-                self.saver.restore(session, model_checkpoint_path)
                 epoch = int(
                     os.path.split(model_checkpoint_path)[-1].split("-")[-1])
+                if inference_graph is None:
+                    self.saver.restore(session, model_checkpoint_path)
+                elif inference_graph.epoch != epoch:
+                    raise ValueError(
+                        "The inference graph was exported at epoch {}, but "
+                        "the {} has been trained for {} epochs. Export the "
+                        "inference graph again.".format(
+                            inference_graph.epoch, model_string, epoch)
+                    )
             else:
                 raise Exception(
                     "Cannot evaluate {} when it has not been trained.".format(
@@ -2372,29 +2785,101 @@ class GaussianMixtureVariationalAutoencoder:
                 shape=(n_examples_eval, self.n_clusters))
 
             if "reconstructed" in output_versions:
-                p_x_mean_eval = numpy.zeros(
+                p_x_mean_eval = build_output_sink(
+                    output_sink,
                     shape=(n_examples_eval, n_feature_eval),
-                    dtype=numpy.float32
+                    name="{}-reconstructed-values".format(output_name),
+                    directory=output_directory
                 )
-                p_x_stddev_eval = scipy.sparse.lil_matrix(
+                p_x_stddev_eval = SparseSubsetBuffer(
                     (n_examples_eval, n_feature_eval),
-                    dtype=numpy.float32
+                    evaluation_subset_indices
                 )
-                stddev_of_p_x_given_z_mean_eval = scipy.sparse.lil_matrix(
+                stddev_of_p_x_given_z_mean_eval = SparseSubsetBuffer(
                     (n_examples_eval, n_feature_eval),
-                    dtype=numpy.float32
+                    evaluation_subset_indices
                 )
 
             if "latent" in output_versions:
-                z_mean_eval = numpy.zeros(
+                z_mean_eval = build_output_sink(
+                    output_sink,
                     shape=(n_examples_eval, self.latent_size),
-                    dtype=numpy.float32
+                    name="{}-latent-z-values".format(output_name),
+                    directory=output_directory
                 )
-                y_mean_eval = numpy.zeros(
+                y_mean_eval = build_output_sink(
+                    output_sink,
                     shape=(n_examples_eval, self.n_clusters),
-                    dtype=numpy.float32
+                    name="{}-latent-y-values".format(output_name),
+                    directory=output_directory
                 )
 
+            # Tensors evaluated for each minibatch together with how
+            # their results are combined when evaluating chunks of samples
+            evaluation_fetches = {
+                "lower_bound": (self.lower_bound, "mean"),
+                "reconstruction_error": (self.reconstruction_error, "mean"),
+                "kl_divergence_z": (self.kl_divergence_z, "mean"),
+                "kl_divergence_y": (self.kl_divergence_y, "constant"),
+                "q_y_probabilities": (self.q_y_probabilities, "constant"),
+                "q_z_means": (self.q_z_means, "constant"),
+                "q_z_variances": (self.q_z_variances, "constant"),
+                "p_y_probabilities": (self.p_y_probabilities, "constant"),
+                "p_z_means": (self.p_z_means, "constant"),
+                "p_z_variances": (self.p_z_variances, "constant"),
+                "q_z_covariances": (self.q_z_covariances, "constant"),
+                "p_z_covariances": (self.p_z_covariances, "constant"),
+                "q_y_logits": (self.q_y_logits, "constant"),
+                "p_x_mean": (self.p_x_mean, "mean"),
+                "p_x_stddev": (self.p_x_stddev, ("stddev", "p_x_mean")),
+                "stddev_of_p_x_given_z_mean": (
+                    self.stddev_of_p_x_given_z_mean, ("stddev", "p_x_mean")),
+                "y_mean": (self.y_mean, "constant"),
+                "z_mean": (self.z_mean, "constant"),
+                "kl_divergence_z_neurons": (
+                    self.kl_divergence_z_neurons, "mean")
+            }
+
+            # Only tensors required for the requested outputs are run,
+            # and standard deviations of reconstructions only for
+            # minibatches with examples in the evaluation subset
+            required_fetch_names = [
+                "lower_bound", "reconstruction_error",
+                "kl_divergence_z", "kl_divergence_y", "q_y_logits"
+            ]
+            if log_results:
+                required_fetch_names.extend([
+                    "q_y_probabilities", "q_z_means", "q_z_variances",
+                    "p_y_probabilities", "p_z_means", "p_z_variances",
+                    "kl_divergence_z_neurons"
+                ])
+                if "full-covariance" in self.latent_distribution_name:
+                    required_fetch_names.extend(
+                        ["q_z_covariances", "p_z_covariances"])
+            if "reconstructed" in output_versions:
+                required_fetch_names.append("p_x_mean")
+                subset_fetch_names = [
+                    "p_x_stddev", "stddev_of_p_x_given_z_mean"]
+            else:
+                subset_fetch_names = []
+            if "latent" in output_versions:
+                required_fetch_names.extend(["y_mean", "z_mean"])
+
+            minibatch_fetches = plan_fetches(
+                evaluation_fetches, required_fetch_names)
+            subset_minibatch_fetches = plan_fetches(
+                evaluation_fetches, required_fetch_names + subset_fetch_names)
+
+            # Random stream for noisy preprocessing seeded by the run and
+            # the number of epochs trained, and noisy values kept for the
+            # transformed data set
+            noisy_random_state = noise_random_state(
+                self, epoch, "evaluation", run_id=run_id)
+            if noisy_preprocess and "transformed" in output_versions:
+                noisy_minibatches_eval = []
+            else:
+                noisy_minibatches_eval = None
+
             for i in range(0, n_examples_eval, minibatch_size):
 
                 indices = numpy.arange(
@@ -2403,9 +2888,34 @@ class GaussianMixtureVariationalAutoencoder:
                 subset_indices = numpy.array(list(
                     evaluation_subset_indices.intersection(indices)))
 
+                if shared_minibatches is not None and not noisy_preprocess:
+                    x_eval_i, t_eval_i = shared_minibatches.get(
+                        i,
+                        functools.partial(
+                            minibatch_values_and_targets,
+                            x_eval, t_eval, indices,
+                            sparse=self.sparse_input
+                        )
+                    )
+                else:
+                    x_eval_i = minibatch_values(
+                        x_eval, indices,
+                        sparse=self.sparse_input,
+                        preprocess=noisy_preprocess,
+                        random_state=noisy_random_state
+                    )
+
+                    if noisy_preprocess:
+                        t_eval_i = x_eval_i
+                        if noisy_minibatches_eval is not None:
+                            noisy_minibatches_eval.append(x_eval_i)
+                    else:
+                        t_eval_i = minibatch_values(
+                            t_eval, indices, sparse=self.sparse_input)
+
                 feed_dict_batch = {
-                    self.x: x_eval[indices].toarray(),
-                    self.t: t_eval[indices].toarray(),
+                    self.x: x_eval_i,
+                    self.t: t_eval_i,
                     self.is_training: False,
                     self.warm_up_weight: 1.0,
                     self.n_iw_samples:
@@ -2426,6 +2936,33 @@ class GaussianMixtureVariationalAutoencoder:
                     feed_dict_batch[self.count_sum_feature] = (
                         count_sum_feature_eval[indices])
 
+                if subset_indices.size > 0:
+                    fetches_i = subset_minibatch_fetches
+                else:
+                    fetches_i = minibatch_fetches
+
+                if sample_chunk_size:
+                    results_i = run_in_sample_chunks(
+                        session,
+                        fetches_i,
+                        feed_dict=feed_dict_batch,
+                        sample_placeholders=(
+                            self.n_iw_samples, self.n_mc_samples),
+                        number_of_iw_samples=(
+                            self.number_of_importance_samples["evaluation"]),
+                        number_of_mc_samples=(
+                            self.number_of_monte_carlo_samples["evaluation"]),
+                        chunk_size=sample_chunk_size
+                    )
+                else:
+                    results_i = session.run(
+                        {
+                            name: tensor for name, (tensor, __)
+                            in fetches_i.items()
+                        },
+                        feed_dict=feed_dict_batch
+                    )
+
                 (
                     lower_bound_i, reconstruction_error_i,
                     kl_divergence_z_i, kl_divergence_y_i,
@@ -2435,21 +2972,7 @@ class GaussianMixtureVariationalAutoencoder:
                     q_y_logits_i, p_x_mean_i,
                     p_x_stddev_i, stddev_of_p_x_given_z_mean_i,
                     y_mean_i, z_mean_i, kl_divergence_z_neurons_i
-                ) = session.run(
-                        [
-                            self.lower_bound, self.reconstruction_error,
-                            self.kl_divergence_z, self.kl_divergence_y,
-                            self.q_y_probabilities, self.q_z_means,
-                            self.q_z_variances, self.p_y_probabilities,
-                            self.p_z_means, self.p_z_variances,
-                            self.q_z_covariances, self.p_z_covariances,
-                            self.q_y_logits, self.p_x_mean,
-                            self.p_x_stddev, self.stddev_of_p_x_given_z_mean,
-                            self.y_mean, self.z_mean,
-                            self.kl_divergence_z_neurons
-                        ],
-                        feed_dict=feed_dict_batch
-                    )
+                ) = [results_i.get(name) for name in evaluation_fetches]
 
                 lower_bound_eval += lower_bound_i
                 kl_divergence_z_eval += kl_divergence_z_i
@@ -2472,17 +2995,29 @@ class GaussianMixtureVariationalAutoencoder:
                 q_y_logits[indices] = q_y_logits_i
 
                 if "reconstructed" in output_versions:
-                    p_x_mean_eval[indices] = p_x_mean_i
+                    p_x_mean_eval.write(indices, p_x_mean_i)
 
                     if subset_indices.size > 0:
-                        p_x_stddev_eval[subset_indices] = (
-                            p_x_stddev_i[subset_indices - i])
-                        stddev_of_p_x_given_z_mean_eval[subset_indices] = (
-                            stddev_of_p_x_given_z_mean_i[subset_indices - i])
+                        p_x_stddev_eval.write(
+                            subset_indices, p_x_stddev_i[subset_indices - i])
+                        stddev_of_p_x_given_z_mean_eval.write(
+                            subset_indices,
+                            stddev_of_p_x_given_z_mean_i[subset_indices - i]
+                        )
 
                 if "latent" in output_versions:
-                    y_mean_eval[indices] = y_mean_i
-                    z_mean_eval[indices] = z_mean_i
+                    y_mean_eval.write(indices, y_mean_i)
+                    z_mean_eval.write(indices, z_mean_i)
+
+            if "reconstructed" in output_versions:
+                p_x_mean_eval.close()
+                p_x_stddev_eval = p_x_stddev_eval.to_sparse()
+                stddev_of_p_x_given_z_mean_eval = (
+                    stddev_of_p_x_given_z_mean_eval.to_sparse())
+
+            if "latent" in output_versions:
+                y_mean_eval.close()
+                z_mean_eval.close()
 
             lower_bound_eval /= n_examples_eval / minibatch_size
             kl_divergence_z_eval /= n_examples_eval / minibatch_size
@@ -2637,6 +3172,9 @@ class GaussianMixtureVariationalAutoencoder:
 
             print(evaluation_string)
 
+            if noisy_minibatches_eval is not None:
+                t_eval = stack_minibatch_values(noisy_minibatches_eval)
+
             # Data sets
             output_sets = [None] * len(output_versions)
 
@@ -2672,7 +3210,7 @@ class GaussianMixtureVariationalAutoencoder:
                     evaluation_set.name,
                     title=evaluation_set.title,
                     specifications=evaluation_set.specifications,
-                    values=p_x_mean_eval,
+                    values=p_x_mean_eval.values,
                     total_standard_deviations=p_x_stddev_eval,
                     explained_standard_deviations=(
                         stddev_of_p_x_given_z_mean_eval),
@@ -2697,7 +3235,7 @@ class GaussianMixtureVariationalAutoencoder:
                     evaluation_set.name,
                     title=evaluation_set.title,
                     specifications=evaluation_set.specifications,
-                    values=z_mean_eval,
+                    values=z_mean_eval.values,
                     preprocessed_values=None,
                     labels=evaluation_set.labels,
                     example_names=evaluation_set.example_names,
@@ -2719,7 +3257,7 @@ class GaussianMixtureVariationalAutoencoder:
                     evaluation_set.name,
                     title=evaluation_set.title,
                     specifications=evaluation_set.specifications,
-                    values=y_mean_eval,
+                    values=y_mean_eval.values,
                     preprocessed_values=None,
                     labels=evaluation_set.labels,
                     example_names=evaluation_set.example_names,
@@ -2842,6 +3380,27 @@ class GaussianMixtureVariationalAutoencoder:
             self.q_y_logits = self.q_y_given_x.logits
             self.q_y_probabilities = tf.reduce_mean(self.q_y_given_x.probs, 0)
 
+        if self.batched_clusters:
+            self._setup_batched_graph_for_clusters()
+        else:
+            self._setup_graph_for_clusters(y)
+
+        # (B, K)
+        self.y_mean = self.y
+        # (R, L, Bs, K)
+        self.q_y_logits = tf.reshape(
+            self.q_y_given_x.logits, shape=[1, -1, self.n_clusters])
+
+        # Add histogram summaries for the trainable parameters
+        for parameter in tf.trainable_variables():
+            parameter_summary = tf.summary.histogram(parameter.name, parameter)
+            self.parameter_summary_list.append(parameter_summary)
+        self.parameter_summary = tf.summary.merge(self.parameter_summary_list)
+
+    def _setup_graph_for_clusters(self, y):
+        # Latent and decoder graphs built for each cluster in turn with
+        # shared weights
+
         # z latent space
         with tf.variable_scope("Z"):
             self.q_z_given_x_y = [None]*self.n_clusters
@@ -2921,26 +3480,121 @@ class GaussianMixtureVariationalAutoencoder:
                 self.p_x_given_z[k] = self._build_graph_for_p_x_given_z(
                     self.z[k], reuse=reuse_weights)
 
-        # (B, K)
-        self.y_mean = self.y
-        # (R, L, Bs, K)
-        self.q_y_logits = tf.reshape(
-            self.q_y_given_x.logits, shape=[1, -1, self.n_clusters])
+    def _setup_batched_graph_for_clusters(self):
+        # Latent and decoder graphs built for all clusters at once by
+        # replicating the minibatch for each cluster, so that the cluster
+        # dimension is folded into the minibatch dimension as K * B. The
+        # same variables as for `_setup_graph_for_clusters` are used.
 
-        # Add histogram summaries for the trainable parameters
-        for parameter in tf.trainable_variables():
-            parameter_summary = tf.summary.histogram(parameter.name, parameter)
-            self.parameter_summary_list.append(parameter_summary)
-        self.parameter_summary = tf.summary.merge(self.parameter_summary_list)
+        # (K, K)
+        y_identity = tf.eye(self.n_clusters, dtype=tf.float32)
+
+        # (B, F) --> (K * B, F)
+        if isinstance(self.x, tf.SparseTensor):
+            n_examples = tf.cast(self.x.dense_shape[0], tf.int32)
+            x_replicated = tile_sparse_rows(self.x, self.n_clusters)
+        else:
+            n_examples = tf.shape(self.x)[0]
+            x_replicated = tf.tile(self.x, multiples=[self.n_clusters, 1])
+
+        # (K, K) --> (K, B, K) --> (K * B, K)
+        y_replicated = tf.reshape(
+            tf.tile(
+                tf.expand_dims(y_identity, axis=1),
+                multiples=[1, n_examples, 1]
+            ),
+            shape=[-1, self.n_clusters]
+        )
+
+        q_z_shape = [self.n_clusters, -1, self.latent_size]
+        p_z_shape = [self.n_clusters, self.latent_size]
+
+        # z latent space
+        with tf.variable_scope("Z"):
+            # Shape: (1, 1, K * B, L)
+            self.q_z_given_x_y, z_mean, self.z = (
+                self._build_graph_for_q_z_given_x_y(
+                    x_replicated, y_replicated,
+                    distribution_name=self.latent_distribution[
+                        "z posterior"],
+                    number_of_clusters=self.n_clusters))
+            # Shape: (1, 1, K, L)
+            self.p_z_given_y, self.p_z_mean = (
+                self._build_graph_for_p_z_given_y(
+                    y_identity,
+                    distribution_name=self.latent_distribution["z prior"]))
+
+            # (1, 1, K * B, L) --> (K, B, L) --> (K, L)
+            self.q_z_means = tf.reduce_mean(
+                tf.reshape(self.q_z_given_x_y.mean(), shape=q_z_shape),
+                axis=1
+            )
+            self.q_z_variances = tf.reduce_mean(
+                tf.reshape(
+                    tf.square(self.q_z_given_x_y.stddev()),
+                    shape=q_z_shape
+                ),
+                axis=1
+            )
+
+            # (1, 1, K, L) --> (K, L)
+            self.p_z_means = tf.reshape(
+                self.p_z_given_y.mean(), shape=p_z_shape)
+            self.p_z_variances = tf.square(tf.reshape(
+                self.p_z_given_y.stddev(), shape=p_z_shape))
+
+            # Full-covariance latent distributions are not supported
+            self.q_z_covariances = []
+            self.p_z_covariances = []
+
+            self.y = self.q_y_given_x.probs
+
+            # (1, 1, K * B, L) --> (K, B, L) --> (B, L)
+            self.z_mean = tf.einsum(
+                "bk,kbl->bl",
+                self.y,
+                tf.reshape(z_mean, shape=q_z_shape)
+            )
+
+            # (S, 1, 1, K, L) --> (S, K, L) --> (K, S, L)
+            self.p_z_samples = tf.transpose(
+                tf.reshape(
+                    self.p_z_given_y.sample(sample_shape=(self.sample_size)),
+                    shape=[-1, self.n_clusters, self.latent_size]
+                ),
+                perm=[1, 0, 2]
+            )
+            self.p_z_mean_samples = tf.einsum(
+                "sk,ksl->sl", self.p_y_samples, self.p_z_samples)
+
+        # Decoder for x
+        with tf.variable_scope("X"):
+            # Shape: (R * L * K * B, F)
+            self.p_x_given_z = self._build_graph_for_p_x_given_z(
+                self.z, number_of_clusters=self.n_clusters)
 
     def _build_graph_for_q_z_given_x_y(
-            self, x, y, distribution_name="softplus gaussian", reuse=False):
+            self, x, y, distribution_name="softplus gaussian",
+            number_of_clusters=1, reuse=False):
+
+        # Examples of each cluster are normalised separately, when the
+        # encoder is built for all clusters at once
+        if number_of_clusters > 1:
+            minibatch_normalisation_groups = (1, number_of_clusters)
+        else:
+            minibatch_normalisation_groups = None
 
         # Encoder for q(z|x,y_i=1) = N(mu(x,y_i=1), sigma^2(x,y_i=1))
         with tf.variable_scope("Q"):
             distribution = DISTRIBUTIONS[distribution_name]
-            y = tf.broadcast_to(y, shape=(tf.shape(self.x)[0], tf.shape(y)[1]))
-            xy = tf.concat((self.x, y), axis=-1)
+            if isinstance(x, tf.SparseTensor):
+                y = tf.broadcast_to(y, shape=(
+                    tf.cast(x.dense_shape[0], tf.int32), tf.shape(y)[1]))
+                xy = concatenate_sparse_and_dense(x, y)
+            else:
+                y = tf.broadcast_to(
+                    y, shape=(tf.shape(x)[0], tf.shape(y)[1]))
+                xy = tf.concat((x, y), axis=-1)
             encoder = dense_layers(
                 inputs=xy,
                 num_outputs=self.hidden_sizes,
@@ -2952,7 +3606,8 @@ class GaussianMixtureVariationalAutoencoder:
                     self.dropout_keep_probability_h),
                 scope="ENCODER",
                 layer_name="LAYER",
-                reuse=reuse
+                reuse=reuse,
+                minibatch_normalisation_groups=minibatch_normalisation_groups
             )
 
             with tf.variable_scope(normalise_string(
@@ -3091,9 +3746,24 @@ class GaussianMixtureVariationalAutoencoder:
 
         return q_y_given_x
 
-    def _build_graph_for_p_x_given_z(self, z, reuse=False):
+    def _build_graph_for_p_x_given_z(self, z, number_of_clusters=1,
+                                     reuse=False):
         # Decoder - Generative model, p(x|z)
 
+        # Number of replications of each example in the minibatch, where
+        # `number_of_clusters` is larger than one, when the decoder is
+        # built for all clusters at once
+        n_replicates = (
+            self.n_iw_samples * self.n_mc_samples * number_of_clusters)
+
+        # Latent values of each cluster are normalised separately, when
+        # the decoder is built for all clusters at once
+        if number_of_clusters > 1:
+            minibatch_normalisation_groups = (
+                self.n_iw_samples * self.n_mc_samples, number_of_clusters)
+        else:
+            minibatch_normalisation_groups = None
+
         decoder_inputs = [z]
 
         # Make sure we use a replication per sample of the feature sum,
@@ -3108,7 +3778,7 @@ class GaussianMixtureVariationalAutoencoder:
             )
             replicated_batch_indices = tf.tile(
                 batch_indices_one_hot,
-                multiples=[self.n_iw_samples * self.n_mc_samples, 1],
+                multiples=[n_replicates, 1],
                 name="BATCH_INDICES"
             )
             decoder_inputs.append(replicated_batch_indices)
@@ -3118,7 +3788,7 @@ class GaussianMixtureVariationalAutoencoder:
         if self.use_count_sum_as_feature:
             replicated_count_sum_feature = tf.tile(
                 self.count_sum_feature,
-                multiples=[self.n_iw_samples * self.n_mc_samples, 1],
+                multiples=[n_replicates, 1],
                 name="COUNT_SUM"
             )
             decoder_inputs.append(replicated_count_sum_feature)
@@ -3142,13 +3812,24 @@ class GaussianMixtureVariationalAutoencoder:
             hidden_dropout_keep_probability=self.dropout_keep_probability_h,
             scope="DECODER",
             layer_name="LAYER",
-            reuse=reuse
+            reuse=reuse,
+            minibatch_normalisation_groups=minibatch_normalisation_groups
         )
 
         # Reconstruction distribution parameterisation
 
         with tf.variable_scope("DISTRIBUTION"):
 
+            if self.use_count_sum_as_parameter:
+                if number_of_clusters > 1:
+                    replicated_count_sum_parameter = tf.tile(
+                        self.count_sum_parameter,
+                        multiples=[n_replicates, 1]
+                    )
+                else:
+                    replicated_count_sum_parameter = (
+                        self.replicated_count_sum_parameter)
+
             x_theta = {}
 
             for parameter in self.reconstruction_distribution["parameters"]:
@@ -3177,12 +3858,12 @@ class GaussianMixtureVariationalAutoencoder:
                     or "multinomial" in self.reconstruction_distribution_name):
                 p_x_given_z = self.reconstruction_distribution["class"](
                     x_theta,
-                    self.replicated_count_sum_parameter
+                    replicated_count_sum_parameter
                 )
             elif "multinomial" in self.reconstruction_distribution_name:
                 p_x_given_z = self.reconstruction_distribution["class"](
                     x_theta,
-                    self.replicated_count_sum_parameter
+                    replicated_count_sum_parameter
                 )
             else:
                 p_x_given_z = self.reconstruction_distribution["class"](
@@ -3221,23 +3902,14 @@ class GaussianMixtureVariationalAutoencoder:
             return p_x_given_z
 
     def _setup_loss_function(self):
-        # Prepare replicated and reshaped arrays
-        # Replicate out minibatches in tiles per sample into shape
-        # (R * L * B, N_x)
-        t_tiled = tf.tile(self.t, [self.n_iw_samples*self.n_mc_samples, 1])
-        # Reshape samples back to shape (R, L, B, N_z)
-        z_reshaped = [
-            tf.reshape(
-                self.z[k],
-                shape=[
-                    self.n_iw_samples,
-                    self.n_mc_samples,
-                    -1,
-                    self.latent_size
-                ]
-            )
-            for k in range(self.n_clusters)
-        ]
+        # Use sparse targets for evaluating the reconstruction distribution
+        # sparsely, and dense targets otherwise
+        t = self.t
+        if self.sparse_reconstruction:
+            if not isinstance(t, tf.SparseTensor):
+                t = sparse_from_dense(t)
+        elif isinstance(t, tf.SparseTensor):
+            t = tf.sparse.to_dense(t, validate_indices=False)
 
         if self.prior_probabilities_method == "uniform":
             # H[q(y|x)] = -E_{q(y|x)}[ log(q(y|x)) ]
@@ -3260,6 +3932,82 @@ class GaussianMixtureVariationalAutoencoder:
         kl_divergence_y_threshhold = (
             self.proportion_of_free_nats_for_y_kl_divergence * p_y_entropy)
 
+        if self.batched_clusters:
+            (
+                kl_divergence_z_mean, log_p_x_given_z_mean,
+                self.p_x_mean, self.mean_of_p_x_given_z_variance,
+                self.variance_of_p_x_given_z_mean,
+                kl_divergence_z_neurons_mean
+            ) = self._build_batched_graph_for_cluster_terms(t)
+        else:
+            (
+                kl_divergence_z_mean, log_p_x_given_z_mean,
+                self.p_x_mean, self.mean_of_p_x_given_z_variance,
+                self.variance_of_p_x_given_z_mean,
+                kl_divergence_z_neurons_mean
+            ) = self._build_graph_for_cluster_terms(t)
+
+        self.p_x_stddev = tf.sqrt(
+            self.mean_of_p_x_given_z_variance
+            + self.variance_of_p_x_given_z_mean
+        )
+        self.stddev_of_p_x_given_z_mean = tf.sqrt(
+            self.variance_of_p_x_given_z_mean
+        )
+
+        # (B) --> ()
+        self.kl_divergence_z = tf.reduce_mean(kl_divergence_z_mean)
+        self.kl_divergence_y = tf.reduce_mean(kl_divergence_y)
+        if self.proportion_of_free_nats_for_y_kl_divergence:
+            kl_divergence_y_modified = tf.where(
+                self.kl_divergence_y > kl_divergence_y_threshhold,
+                self.kl_divergence_y,
+                kl_divergence_y_threshhold
+            )
+        else:
+            kl_divergence_y_modified = self.kl_divergence_y
+
+        self.kl_divergence = self.kl_divergence_z + self.kl_divergence_y
+        self.kl_divergence_neurons = tf.expand_dims(self.kl_divergence, -1)
+        self.reconstruction_error = tf.reduce_mean(log_p_x_given_z_mean)
+        self.lower_bound = self.reconstruction_error - self.kl_divergence
+        self.lower_bound_weighted = (
+            self.reconstruction_error
+            - self.warm_up_weight * self.kl_weight * (
+                self.kl_divergence_z + kl_divergence_y_modified
+            )
+        )
+
+        # (B, L) --> (L)
+        self.kl_divergence_z_neurons = tf.reduce_mean(
+            kl_divergence_z_neurons_mean,
+            axis=0)
+
+    def _build_graph_for_cluster_terms(self, t):
+        # Terms of the lower bound for each cluster marginalised over q(y|x)
+
+        # Prepare replicated and reshaped arrays
+        # Replicate out minibatches in tiles per sample into shape
+        # (R * L * B, N_x)
+        if self.sparse_reconstruction:
+            t_tiled = tile_sparse_rows(
+                t, self.n_iw_samples*self.n_mc_samples)
+        else:
+            t_tiled = tf.tile(t, [self.n_iw_samples*self.n_mc_samples, 1])
+        # Reshape samples back to shape (R, L, B, N_z)
+        z_reshaped = [
+            tf.reshape(
+                self.z[k],
+                shape=[
+                    self.n_iw_samples,
+                    self.n_mc_samples,
+                    -1,
+                    self.latent_size
+                ]
+            )
+            for k in range(self.n_clusters)
+        ]
+
         kl_divergence_z = [None] * self.n_clusters
         kl_divergence_z_mean = [None] * self.n_clusters
         log_p_x_given_z_mean = [None] * self.n_clusters
@@ -3291,15 +4039,22 @@ class GaussianMixtureVariationalAutoencoder:
                 axis=(0, 1)
             ) * self.y[:, k]
 
-            # (R, L, B, F)
-            p_x_given_z_log_prob = self.p_x_given_z[k].log_prob(t_tiled)
-
-            # (R, L, B, F) --> (R, L, B)
-            log_p_x_given_z = tf.reshape(
-                tf.reduce_sum(
+            if self.sparse_reconstruction:
+                # (R * L * B)
+                p_x_given_z_log_prob_sum = sparse_log_prob(
+                    self.p_x_given_z[k], t_tiled)
+            else:
+                # (R, L, B, F)
+                p_x_given_z_log_prob = self.p_x_given_z[k].log_prob(t_tiled)
+                # (R, L, B, F) --> (R * L * B)
+                p_x_given_z_log_prob_sum = tf.reduce_sum(
                     p_x_given_z_log_prob,
                     axis=-1
-                ),
+                )
+
+            # (R * L * B) --> (R, L, B)
+            log_p_x_given_z = tf.reshape(
+                p_x_given_z_log_prob_sum,
                 shape=[self.n_iw_samples, self.n_mc_samples, -1]
             )
             # (R, L, B) --> (B)
@@ -3367,48 +4122,6 @@ class GaussianMixtureVariationalAutoencoder:
                 axis=0
             ) * tf.expand_dims(self.y[:, k], -1)
 
-        # Marginalise y out in list by add_n and reshape from
-        # K * [(B, F)] --> (B, F)
-        self.variance_of_p_x_given_z_mean = tf.add_n(
-            variance_of_p_x_given_z_means
-        )
-        self.mean_of_p_x_given_z_variance = tf.add_n(
-            mean_of_p_x_given_z_variances
-        )
-        self.p_x_stddev = tf.sqrt(
-            self.mean_of_p_x_given_z_variance
-            + self.variance_of_p_x_given_z_mean
-        )
-        self.stddev_of_p_x_given_z_mean = tf.sqrt(
-            self.variance_of_p_x_given_z_mean
-        )
-
-        self.p_x_mean = tf.add_n(p_x_means)
-
-        # (B) --> ()
-        self.kl_divergence_z = tf.reduce_mean(tf.add_n(kl_divergence_z_mean))
-        self.kl_divergence_y = tf.reduce_mean(kl_divergence_y)
-        if self.proportion_of_free_nats_for_y_kl_divergence:
-            kl_divergence_y_modified = tf.where(
-                self.kl_divergence_y > kl_divergence_y_threshhold,
-                self.kl_divergence_y,
-                kl_divergence_y_threshhold
-            )
-        else:
-            kl_divergence_y_modified = self.kl_divergence_y
-
-        self.kl_divergence = self.kl_divergence_z + self.kl_divergence_y
-        self.kl_divergence_neurons = tf.expand_dims(self.kl_divergence, -1)
-        self.reconstruction_error = tf.reduce_mean(tf.add_n(
-            log_p_x_given_z_mean))
-        self.lower_bound = self.reconstruction_error - self.kl_divergence
-        self.lower_bound_weighted = (
-            self.reconstruction_error
-            - self.warm_up_weight * self.kl_weight * (
-                self.kl_divergence_z + kl_divergence_y_modified
-            )
-        )
-
         kl_divergence_z_neurons = [None] * self.n_clusters
         kl_divergence_z_neurons_mean = [None] * self.n_clusters
 
@@ -3429,9 +4142,170 @@ class GaussianMixtureVariationalAutoencoder:
             ) * tf.expand_dims(self.y[:, k], -1)
             # ) * tf.tile(self.y[:, k], [self.latent_size])
 
-        self.kl_divergence_z_neurons = tf.reduce_mean(
-            tf.add_n(kl_divergence_z_neurons_mean),
-            axis=0)
+        # Marginalise y out in list by add_n and reshape from
+        # K * [(B, F)] --> (B, F)
+        return (
+            tf.add_n(kl_divergence_z_mean),
+            tf.add_n(log_p_x_given_z_mean),
+            tf.add_n(p_x_means),
+            tf.add_n(mean_of_p_x_given_z_variances),
+            tf.add_n(variance_of_p_x_given_z_means),
+            tf.add_n(kl_divergence_z_neurons_mean)
+        )
+
+    def _build_batched_graph_for_cluster_terms(self, t):
+        # Terms of the lower bound for all clusters at once marginalised
+        # over q(y|x), where clusters are folded into the minibatch
+        # dimension as K * B
+
+        # Replicate out minibatches in tiles per sample and cluster into
+        # shape (R * L * K * B, N_x)
+        n_replicates = self.n_iw_samples * self.n_mc_samples * self.n_clusters
+        if self.sparse_reconstruction:
+            t_tiled = tile_sparse_rows(t, n_replicates)
+        else:
+            t_tiled = tf.tile(t, [n_replicates, 1])
+
+        # (R * L * K * B, N_z) --> (R, L, K * B, N_z)
+        z_for_posterior = tf.reshape(
+            self.z,
+            shape=[
+                self.n_iw_samples,
+                self.n_mc_samples,
+                -1,
+                self.latent_size
+            ]
+        )
+        # (R * L * K * B, N_z) --> (R, L, K, B, N_z) --> (R, L, B, K, N_z),
+        # so that the (1, 1, K) prior parameters are broadcast
+        z_for_prior = tf.transpose(
+            tf.reshape(
+                self.z,
+                shape=[
+                    self.n_iw_samples,
+                    self.n_mc_samples,
+                    self.n_clusters,
+                    -1,
+                    self.latent_size
+                ]
+            ),
+            perm=[0, 1, 3, 2, 4]
+        )
+
+        def cluster_last(tensor):
+            # (R, L, K * B, ...) --> (R, L, K, B, ...) --> (R, L, B, K, ...)
+            rank = len(tensor.shape) + 1
+            tensor = tf.reshape(
+                tensor,
+                shape=tf.concat([
+                    [self.n_iw_samples, self.n_mc_samples, self.n_clusters,
+                     -1],
+                    tf.shape(tensor)[3:]
+                ], axis=0)
+            )
+            return tf.transpose(tensor, perm=[0, 1, 3, 2] + list(
+                range(4, rank)))
+
+        # (R, L, B, K, L)
+        kl_divergence_z_neurons = (
+            cluster_last(self.q_z_given_x_y.log_prob(z_for_posterior))
+            - self.p_z_given_y.log_prob(z_for_prior)
+        )
+
+        # (R, L, B, K, L) --> (B, K, L) --> (B, L)
+        kl_divergence_z_neurons_mean = tf.reduce_sum(
+            tf.reduce_mean(kl_divergence_z_neurons, axis=(0, 1))
+            * tf.expand_dims(self.y, -1),
+            axis=1
+        )
+
+        # (R, L, B, K, L) --> (R, L, B, K) --> (B, K) --> (B)
+        kl_divergence_z_mean = tf.reduce_sum(
+            tf.reduce_mean(
+                tf.reduce_sum(kl_divergence_z_neurons, axis=-1),
+                axis=(0, 1)
+            ) * self.y,
+            axis=1
+        )
+
+        if self.sparse_reconstruction:
+            # (R * L * K * B)
+            p_x_given_z_log_prob_sum = sparse_log_prob(
+                self.p_x_given_z, t_tiled)
+        else:
+            # (R * L * K * B, F) --> (R * L * K * B)
+            p_x_given_z_log_prob_sum = tf.reduce_sum(
+                self.p_x_given_z.log_prob(t_tiled),
+                axis=-1
+            )
+
+        # (R * L * K * B) --> (R, L, K, B) --> (K, B) --> (B)
+        log_p_x_given_z_mean = tf.reduce_sum(
+            tf.transpose(tf.reduce_mean(
+                tf.reshape(
+                    p_x_given_z_log_prob_sum,
+                    shape=[
+                        self.n_iw_samples,
+                        self.n_mc_samples,
+                        self.n_clusters,
+                        -1
+                    ]
+                ),
+                axis=(0, 1)
+            )) * self.y,
+            axis=1
+        )
+
+        p_x_given_z_shape = [
+            self.n_iw_samples,
+            self.n_mc_samples,
+            self.n_clusters,
+            -1,
+            self.feature_size
+        ]
+
+        # (R * L * K * B, F) --> (R, L, K, B, F)
+        p_x_given_z_mean = tf.reshape(
+            self.p_x_given_z.mean(), shape=p_x_given_z_shape)
+
+        # (R, L, K, B, F) --> (K, B, F)
+        p_x_means = tf.reduce_mean(p_x_given_z_mean, axis=(0, 1)) * (
+            tf.expand_dims(tf.transpose(self.y), -1))
+
+        # Ê[V[x|z]]
+        # (R * L * K * B, F) --> (R, L, K, B, F) --> (K, B, F) --> (B, F)
+        mean_of_p_x_given_z_variance = tf.einsum(
+            "bk,kbf->bf",
+            self.y,
+            tf.reduce_mean(
+                tf.reshape(
+                    self.p_x_given_z.variance(), shape=p_x_given_z_shape),
+                axis=(0, 1)
+            )
+        )
+
+        # ^V[E[x|z]] = ( E[x|z_l] - Ê[x] )^2
+        # (R, L, K, B, F) --> (K, B, F) --> (B, F)
+        variance_of_p_x_given_z_mean = tf.einsum(
+            "bk,kbf->bf",
+            self.y,
+            tf.reduce_mean(
+                tf.square(p_x_given_z_mean - p_x_means),
+                axis=(0, 1)
+            )
+        )
+
+        # (K, B, F) --> (B, F)
+        p_x_mean = tf.reduce_sum(p_x_means, axis=0)
+
+        return (
+            kl_divergence_z_mean,
+            log_p_x_given_z_mean,
+            p_x_mean,
+            mean_of_p_x_given_z_variance,
+            variance_of_p_x_given_z_mean,
+            kl_divergence_z_neurons_mean
+        )
 
     def _setup_optimiser(self):
 
@@ -3458,6 +4332,8 @@ class GaussianMixtureVariationalAutoencoder:
                 global_step=self.global_step
             )
 
+            return optimiser, gradients
+
         # Make sure that the updates of the moving_averages in minibatch_norm
         # layers are performed before the train_step.
         update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
@@ -3465,6 +4341,35 @@ class GaussianMixtureVariationalAutoencoder:
         if update_ops:
             updates = tf.group(*update_ops)
             with tf.control_dependencies([updates]):
-                _optimiser()
+                optimiser, gradients = _optimiser()
         else:
-            _optimiser()
+            optimiser, gradients = _optimiser()
+
+        # Gradients and their application for data-parallel training,
+        # where gradients are computed for shards of a minibatch and
+        # averaged before being applied using the same optimiser. The
+        # gradients are computed without depending on the updates of
+        # the moving averages in minibatch_norm layers.
+        self.gradients = [
+            tf.convert_to_tensor(gradient)
+            for gradient in tf.gradients(
+                -self.lower_bound_weighted,
+                [variable for _, variable in gradients]
+            )
+        ]
+        self.gradient_placeholders = [
+            tf.placeholder(
+                dtype=variable.dtype.base_dtype,
+                shape=variable.shape,
+                name="averaged_gradient"
+            )
+            for _, variable in gradients
+        ]
+        self.apply_averaged_gradients = optimiser.apply_gradients(
+            [
+                (tf.clip_by_value(placeholder, -1., 1.), variable)
+                for placeholder, (_, variable) in zip(
+                    self.gradient_placeholders, gradients)
+            ],
+            global_step=self.global_step
+        )
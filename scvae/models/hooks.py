@@ -0,0 +1,141 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+
+from scvae.utilities import format_duration
+
+
+class StepHook:
+    """Base class for hooks called at each step of training models.
+
+    Hooks are called from the training loop of a model. Tensors
+    requested in `before_step` are run together with the training
+    operation, so hooks do not require additional runs of the model
+    graph. Subclasses override the methods they need.
+    """
+
+    def begin(self, model, session):
+        """Called once before training starts.
+
+        Arguments:
+            model: Model being trained.
+            session (Session): TensorFlow session used for training.
+        """
+
+    def before_epoch(self, epoch):
+        """Called before the first step of each epoch.
+
+        Arguments:
+            epoch (int): Index of epoch, starting from zero.
+        """
+
+    def before_step(self, step):
+        """Called before each step.
+
+        Arguments:
+            step (int): Number of steps taken before this step.
+
+        Returns:
+            Dictionary of tensors to run together with the training
+            operation, or ``None``.
+        """
+
+    def after_step(self, step, epoch, lower_bound, step_duration,
+                   results=None):
+        """Called after each step.
+
+        Arguments:
+            step (int): Number of steps taken including this step.
+            epoch (int): Index of epoch, starting from zero.
+            lower_bound (float): Lower bound for the minibatch.
+            step_duration (float): Duration of the step in seconds.
+            results (dict, optional): Values of the tensors requested
+                in `before_step`.
+        """
+
+    def after_epoch(self, epoch, epoch_duration):
+        """Called after the last step of each epoch.
+
+        Arguments:
+            epoch (int): Index of epoch, starting from zero.
+            epoch_duration (float): Duration of the epoch in seconds.
+        """
+
+    def end(self):
+        """Called once after training has stopped."""
+
+
+class ProgressPrinter(StepHook):
+    """Hook printing the lower bound at regular steps during each epoch.
+
+    Training is aborted, if the printed lower bound is not a number.
+
+    Arguments:
+        steps_per_epoch (int): The number of steps in each epoch.
+        number_of_outputs (int, optional): The number of times to print
+            progress in each epoch.
+    """
+
+    def __init__(self, steps_per_epoch, number_of_outputs=10):
+        self.steps_per_epoch = steps_per_epoch
+        self.output_at_step = numpy.round(numpy.linspace(
+            0, steps_per_epoch, number_of_outputs + 1))
+
+    def after_step(self, step, epoch, lower_bound, step_duration,
+                   results=None):
+
+        if (step - self.steps_per_epoch * epoch) in self.output_at_step:
+
+            print("Step {:d} ({}): {:.5g}.".format(
+                int(step), format_duration(step_duration), lower_bound))
+
+            if numpy.isnan(lower_bound):
+                raise ArithmeticError(
+                    "Aborting. The ELBO for the last batch became "
+                    "indefinite.")
+
+
+class RunningEvaluation(StepHook):
+    """Hook collecting evaluations of each training step in an epoch.
+
+    The evaluation tensors are run together with the training
+    operation, so that losses for the training set can be computed as
+    running averages without a separate pass over the training set.
+
+    Arguments:
+        fetches (list): Tensors to evaluate at each step.
+
+    Attributes:
+        results: Values of the evaluated tensors for each step of the
+            current epoch.
+    """
+
+    def __init__(self, fetches):
+        self.fetches = fetches
+        self.results = []
+
+    def before_epoch(self, epoch):
+        self.results = []
+
+    def before_step(self, step):
+        return {"evaluation": self.fetches}
+
+    def after_step(self, step, epoch, lower_bound, step_duration,
+                   results=None):
+        self.results.append(results["evaluation"])
@@ -0,0 +1,589 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import queue
+import threading
+from time import time
+
+import numpy
+import scipy.sparse
+import tensorflow as tf
+
+EVALUATION_BUDGETS = ["full", "subsample", "running"]
+
+
+class InputPipeline:
+    """Prefetching input pipeline for model graphs.
+
+    Minibatches are sliced from the data, densified (unless sparse
+    values are requested), and prefetched in the background using a
+    TensorFlow data set, so that the model graph can be run without
+    feeding the data inputs.
+
+    Arguments:
+        feature_size (int): The number of features/genes in the data.
+        sparse_values (bool, optional): If ``True``, provide values and
+            targets as sparse tensors instead of densifying them.
+        batch_correction (bool, optional): If ``True``, also provide
+            batch indices.
+        count_sum_feature (bool, optional): If ``True``, also provide
+            normalised count sums used as a feature.
+        count_sum_parameter (bool, optional): If ``True``, also provide
+            count sums used as a parameter.
+
+    Attributes:
+        inputs: Dictionary of input tensors from the pipeline keyed by
+            input name (``"x"``, ``"t"``, ``"batch_indices"``,
+            ``"count_sum_feature"``, and ``"count_sum_parameter"``).
+        prefetch_size: Placeholder for the number of minibatches to
+            prefetch, which is fed when initialising the pipeline.
+        initialiser: Operation initialising the pipeline for a new pass
+            over the data.
+    """
+
+    def __init__(self, feature_size, sparse_values=False,
+                 batch_correction=False, count_sum_feature=False,
+                 count_sum_parameter=False):
+
+        self.feature_size = feature_size
+        self.sparse_values = sparse_values
+        self._source = None
+
+        output_types = {}
+        output_shapes = {}
+
+        for value_name in ["x", "t"]:
+            if sparse_values:
+                output_types.update({
+                    value_name + "_indices": tf.int64,
+                    value_name + "_values": tf.float32,
+                    value_name + "_dense_shape": tf.int64
+                })
+                output_shapes.update({
+                    value_name + "_indices": tf.TensorShape([None, 2]),
+                    value_name + "_values": tf.TensorShape([None]),
+                    value_name + "_dense_shape": tf.TensorShape([2])
+                })
+            else:
+                output_types[value_name] = tf.float32
+                output_shapes[value_name] = tf.TensorShape(
+                    [None, feature_size])
+
+        if batch_correction:
+            output_types["batch_indices"] = tf.int32
+            output_shapes["batch_indices"] = tf.TensorShape([None, 1])
+
+        if count_sum_feature:
+            output_types["count_sum_feature"] = tf.float32
+            output_shapes["count_sum_feature"] = tf.TensorShape([None, 1])
+
+        if count_sum_parameter:
+            output_types["count_sum_parameter"] = tf.float32
+            output_shapes["count_sum_parameter"] = tf.TensorShape([None, 1])
+
+        self.input_names = list(output_types.keys())
+
+        with tf.name_scope("INPUT_PIPELINE"):
+
+            self.prefetch_size = tf.placeholder(
+                dtype=tf.int64,
+                shape=[],
+                name="prefetch_size"
+            )
+
+            data_set = tf.data.Dataset.from_generator(
+                self._generate_minibatches,
+                output_types=output_types,
+                output_shapes=output_shapes
+            )
+            data_set = data_set.prefetch(self.prefetch_size)
+
+            iterator = tf.data.make_initializable_iterator(data_set)
+
+            self.initialiser = iterator.initializer
+            self.inputs = iterator.get_next()
+
+            if sparse_values:
+                for value_name in ["x", "t"]:
+                    self.inputs[value_name] = tf.SparseTensor(
+                        indices=self.inputs.pop(value_name + "_indices"),
+                        values=self.inputs.pop(value_name + "_values"),
+                        dense_shape=self.inputs.pop(
+                            value_name + "_dense_shape")
+                    )
+
+    def initialise(self, session, values, targets, indices, minibatch_size,
+                   batch_indices=None, count_sum_feature=None,
+                   count_sum_parameter=None, prefetch_size=1,
+                   preprocess=None, random_state=None):
+        """Initialise pipeline for a pass over the data.
+
+        Arguments:
+            session (Session): TensorFlow session in which the pipeline
+                is run.
+            values (matrix): Input values.
+            targets (matrix): Target values for reconstruction.
+            indices (array): Example indices in the order in which they
+                are passed through the pipeline.
+            minibatch_size (int): Number of examples per minibatch.
+            batch_indices (array, optional): Batch indices for each
+                example.
+            count_sum_feature (array, optional): Normalised count sums
+                for each example.
+            count_sum_parameter (array, optional): Count sums for each
+                example.
+            prefetch_size (int, optional): Number of minibatches to
+                prepare in advance.
+            preprocess (callable, optional): Noisy preprocessing applied
+                to the values of each minibatch as in
+                `generate_minibatches`.
+            random_state (RandomState, optional): Random state used for
+                the noisy preprocessing.
+        """
+
+        arrays = {
+            "batch_indices": batch_indices,
+            "count_sum_feature": count_sum_feature,
+            "count_sum_parameter": count_sum_parameter
+        }
+
+        for input_name in self.input_names:
+            if input_name in arrays and arrays[input_name] is None:
+                raise ValueError(
+                    "Input `{}` is required by the input pipeline."
+                    .format(input_name)
+                )
+
+        self._source = {
+            "values": values,
+            "targets": targets,
+            "indices": numpy.asarray(indices),
+            "minibatch_size": int(minibatch_size),
+            "preprocess": preprocess,
+            "random_state": random_state,
+            "arrays": {
+                input_name: array for input_name, array in arrays.items()
+                if input_name in self.input_names
+            }
+        }
+
+        session.run(
+            self.initialiser,
+            feed_dict={self.prefetch_size: max(int(prefetch_size), 1)}
+        )
+
+    def _generate_minibatches(self):
+
+        source = self._source
+
+        if source is None:
+            raise RuntimeError("Input pipeline has not been initialised.")
+
+        minibatches = generate_minibatches(
+            values=source["values"],
+            targets=source["targets"],
+            indices=source["indices"],
+            minibatch_size=source["minibatch_size"],
+            sparse=self.sparse_values,
+            preprocess=source["preprocess"],
+            random_state=source["random_state"],
+            **source["arrays"]
+        )
+
+        for minibatch in minibatches:
+            if self.sparse_values:
+                for value_name in ["x", "t"]:
+                    value_batch = minibatch.pop(value_name)
+                    minibatch.update({
+                        value_name + "_indices": value_batch.indices,
+                        value_name + "_values": value_batch.values,
+                        value_name + "_dense_shape": value_batch.dense_shape
+                    })
+            yield minibatch
+
+
+class MinibatchProducer:
+    """Background thread preparing minibatches ahead of training steps.
+
+    Minibatches are taken from an iterable in a separate thread and
+    kept in a queue of limited size, so that the next minibatches are
+    prepared while the model graph is run for the current one. The
+    producer is itself iterated over to get the prepared minibatches.
+
+    Arguments:
+        minibatches (iterable): Minibatches to prepare, for instance,
+            from `generate_minibatches`.
+        queue_size (int, optional): The number of minibatches prepared
+            in advance.
+
+    Attributes:
+        stall_duration: The time spent waiting for minibatches to be
+            prepared.
+    """
+
+    _END = object()
+
+    def __init__(self, minibatches, queue_size=2):
+
+        self.stall_duration = 0
+
+        self._queue = queue.Queue(maxsize=max(int(queue_size), 1))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._produce,
+            args=(minibatches,),
+            daemon=True
+        )
+        self._thread.start()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+
+        waiting_time_start = time()
+        minibatch = self._queue.get()
+        self.stall_duration += time() - waiting_time_start
+
+        if minibatch is self._END:
+            raise StopIteration
+        elif isinstance(minibatch, Exception):
+            raise minibatch
+
+        return minibatch
+
+    def close(self):
+        """Stop preparing minibatches and wait for thread to finish."""
+
+        self._stopped.set()
+
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    def _produce(self, minibatches):
+        try:
+            for minibatch in minibatches:
+                if not self._put(minibatch):
+                    return
+        except Exception as exception:
+            self._put(exception)
+        else:
+            self._put(self._END)
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+def generate_minibatches(values, targets, indices, minibatch_size,
+                         sparse=False, batch_indices=None,
+                         count_sum_feature=None, count_sum_parameter=None,
+                         preprocess=None, random_state=None):
+    """Generate minibatches for feeding to a model graph.
+
+    Arguments:
+        values (matrix): Input values.
+        targets (matrix): Target values for reconstruction.
+        indices (array): Example indices in the order in which they
+            are put in minibatches.
+        minibatch_size (int): Number of examples per minibatch.
+        sparse (bool, optional): If ``True``, provide values and
+            targets as sparse tensor values.
+        batch_indices (array, optional): Batch indices for each
+            example.
+        count_sum_feature (array, optional): Normalised count sums
+            for each example.
+        count_sum_parameter (array, optional): Count sums for each
+            example.
+        preprocess (callable, optional): Noisy preprocessing applied to
+            the values of each minibatch as it is drawn. This should
+            preprocess each example separately, such as the random part
+            of the noisy preprocessing of a data set. The noisily
+            preprocessed values are used as both input values and
+            targets, and ``targets`` is then ignored.
+        random_state (RandomState, optional): Random state used for the
+            noisy preprocessing.
+
+    Yields:
+        Dictionary of minibatch arrays keyed by input name (``"x"``,
+        ``"t"``, and, if given, ``"batch_indices"``,
+        ``"count_sum_feature"``, and ``"count_sum_parameter"``).
+    """
+
+    arrays = {
+        "batch_indices": batch_indices,
+        "count_sum_feature": count_sum_feature,
+        "count_sum_parameter": count_sum_parameter
+    }
+
+    for minibatch_indices in split_indices(indices, minibatch_size):
+
+        minibatch = {"x": minibatch_values(
+            values, minibatch_indices, sparse=sparse,
+            preprocess=preprocess, random_state=random_state
+        )}
+
+        if preprocess:
+            minibatch["t"] = minibatch["x"]
+        else:
+            minibatch["t"] = minibatch_values(
+                targets, minibatch_indices, sparse=sparse)
+
+        for input_name, array in arrays.items():
+            if array is not None:
+                minibatch[input_name] = array[minibatch_indices]
+
+        yield minibatch
+
+
+def minibatch_values(values, indices, sparse=False, preprocess=None,
+                     random_state=None):
+    """Slice minibatch of values for feeding to a model graph.
+
+    Arguments:
+        values (matrix): Values as a sparse or dense matrix.
+        indices (array or slice): Indices of examples in minibatch.
+        sparse (bool, optional): If ``True``, return the minibatch as a
+            sparse tensor value instead of a dense array.
+        preprocess (callable, optional): Noisy preprocessing applied to
+            the sliced values, which should preprocess each example
+            separately.
+        random_state (RandomState, optional): Random state used for the
+            noisy preprocessing.
+
+    Returns:
+        Dense array or sparse tensor value with the minibatch values.
+    """
+
+    minibatch = values[indices]
+
+    if preprocess:
+        minibatch = preprocess(minibatch, random_state=random_state)
+
+    if sparse:
+        minibatch = scipy.sparse.coo_matrix(minibatch)
+        minibatch = tf.SparseTensorValue(
+            indices=numpy.column_stack(
+                (minibatch.row, minibatch.col)).astype(numpy.int64),
+            values=minibatch.data.astype(numpy.float32),
+            dense_shape=numpy.array(minibatch.shape, dtype=numpy.int64)
+        )
+    else:
+        if scipy.sparse.issparse(minibatch):
+            minibatch = minibatch.toarray()
+        minibatch = numpy.asarray(minibatch, dtype=numpy.float32)
+
+    return minibatch
+
+
+def minibatch_values_and_targets(values, targets, indices, sparse=False):
+    """Slice minibatch of values and targets for feeding to a model graph.
+
+    Arguments:
+        values (matrix): Values as a sparse or dense matrix.
+        targets (matrix): Target values as a sparse or dense matrix.
+        indices (array or slice): Indices of examples in minibatch.
+        sparse (bool, optional): If ``True``, return the minibatches as
+            sparse tensor values instead of dense arrays.
+
+    Returns:
+        Pair of the minibatch values and targets. If the targets are
+        the values themselves, these are only sliced once.
+    """
+
+    minibatch = minibatch_values(values, indices, sparse=sparse)
+
+    if targets is values:
+        target_minibatch = minibatch
+    else:
+        target_minibatch = minibatch_values(targets, indices, sparse=sparse)
+
+    return minibatch, target_minibatch
+
+
+def stack_minibatch_values(minibatches):
+    """Stack minibatch values back into a matrix of values.
+
+    Arguments:
+        minibatches (list): Dense arrays or sparse tensor values as
+            returned by `minibatch_values`.
+
+    Returns:
+        Dense array, or sparse matrix for sparse tensor values.
+    """
+
+    if minibatches and isinstance(minibatches[0], tf.SparseTensorValue):
+        return scipy.sparse.vstack([
+            scipy.sparse.coo_matrix(
+                (minibatch.values, (
+                    minibatch.indices[:, 0], minibatch.indices[:, 1])),
+                shape=minibatch.dense_shape
+            )
+            for minibatch in minibatches
+        ]).tocsr()
+
+    return numpy.concatenate(minibatches)
+
+
+def sparse_placeholder_with_default(default, feature_size, name=None):
+    """Sparse placeholder passing through a default sparse tensor.
+
+    The number of features is set statically, so that the shape of the
+    sparse tensor is known when building layers on top of it.
+
+    Arguments:
+        default (SparseTensor): Sparse tensor used when the placeholder
+            is not fed.
+        feature_size (int): The number of features/genes.
+        name (str, optional): Name scope for the placeholder.
+
+    Returns:
+        Sparse tensor, which can be fed using a sparse tensor value.
+    """
+
+    with tf.name_scope(name, "sparse_placeholder_with_default"):
+        indices = tf.placeholder_with_default(
+            default.indices,
+            shape=[None, 2],
+            name="indices"
+        )
+        values = tf.placeholder_with_default(
+            default.values,
+            shape=[None],
+            name="values"
+        )
+        number_of_examples = tf.placeholder_with_default(
+            default.dense_shape[0],
+            shape=[],
+            name="number_of_examples"
+        )
+        dense_shape = tf.stack(
+            [number_of_examples, tf.constant(feature_size, dtype=tf.int64)],
+            name="dense_shape"
+        )
+
+    return tf.SparseTensor(
+        indices=indices,
+        values=values,
+        dense_shape=dense_shape
+    )
+
+
+def run_minibatches(session, fetches, inputs, values, targets, indices,
+                    minibatch_size, sparse=False, feed_dict=None,
+                    preprocess=None, random_state=None, **arrays):
+    """Run tensors for examples in minibatches.
+
+    Arguments:
+        session (Session): TensorFlow session in which the tensors are
+            run.
+        fetches: Tensors to run for each minibatch.
+        inputs (dict): Placeholders keyed by input name as used by
+            `generate_minibatches`. Only these inputs are fed.
+        values (matrix): Input values.
+        targets (matrix): Target values for reconstruction.
+        indices (array): Indices of examples to run.
+        minibatch_size (int): Number of examples per minibatch.
+        sparse (bool, optional): If ``True``, feed values and targets
+            as sparse tensor values.
+        feed_dict (dict, optional): Additional values fed for every
+            minibatch.
+        preprocess (callable, optional): Noisy preprocessing applied to
+            the values of each minibatch as for `generate_minibatches`.
+        random_state (RandomState, optional): Random state used for the
+            noisy preprocessing.
+        **arrays: Batch indices and count sums for each example as
+            for `generate_minibatches`.
+
+    Yields:
+        Tuple of the indices of the examples in each minibatch and the
+        values of the tensors for the minibatch.
+    """
+
+    minibatches = generate_minibatches(
+        values=values,
+        targets=targets,
+        indices=indices,
+        minibatch_size=minibatch_size,
+        sparse=sparse,
+        preprocess=preprocess,
+        random_state=random_state,
+        **{
+            input_name: array for input_name, array in arrays.items()
+            if input_name in inputs
+        }
+    )
+
+    for minibatch_indices, minibatch in zip(
+            split_indices(indices, minibatch_size), minibatches):
+
+        feed_dict_batch = dict(feed_dict or {})
+
+        for input_name, input_values in minibatch.items():
+            if input_name in inputs:
+                feed_dict_batch[inputs[input_name]] = input_values
+
+        yield minibatch_indices, session.run(
+            fetches, feed_dict=feed_dict_batch)
+
+
+def split_indices(indices, minibatch_size):
+    """Split example indices into minibatches of indices.
+
+    Arguments:
+        indices (array): Example indices.
+        minibatch_size (int): Number of examples per minibatch.
+
+    Returns:
+        List of arrays with the example indices of each minibatch.
+    """
+
+    indices = numpy.asarray(indices)
+
+    return [
+        indices[i:(i + minibatch_size)]
+        for i in range(0, indices.size, minibatch_size)
+    ]
+
+
+def subsample_indices(number_of_examples, subsample_size):
+    """Draw sorted random subsample of example indices.
+
+    Arguments:
+        number_of_examples (int): The number of examples to draw from.
+        subsample_size (int): The number of examples in the subsample.
+            If this is not smaller than ``number_of_examples``, all
+            examples are used.
+
+    Returns:
+        Sorted array of example indices.
+    """
+
+    if subsample_size is None or subsample_size >= number_of_examples:
+        return numpy.arange(number_of_examples)
+
+    return numpy.sort(numpy.random.choice(
+        number_of_examples, size=subsample_size, replace=False))
@@ -0,0 +1,261 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import concurrent.futures
+from time import time
+
+import numpy
+import tensorflow as tf
+
+
+class DataParallelSteps:
+    """Synchronous data-parallel training steps.
+
+    Each minibatch is split into shards, one for each worker, and the
+    gradients for the shards are computed concurrently in the same
+    session. The TensorFlow runtime releases the global interpreter lock
+    while running, so the shards can be computed in parallel on separate
+    cores. The gradients are then averaged over the shards, weighted by
+    the number of examples in each shard, and applied to the model in
+    a single update. Since the training objective is a mean over the
+    examples in the minibatch, the averaged gradients equal the
+    gradients for the whole minibatch apart from the random samples
+    drawn. This does not hold with minibatch normalisation, which
+    normalises each shard separately, so the two cannot be combined.
+
+    Since TensorFlow already spreads the operations of a single step
+    over several cores, computing the shards on threads in the same
+    session is not guaranteed to be faster than computing the whole
+    minibatch at once, especially for small models. The speed-up can
+    therefore be measured: for the first ``number_of_reference_steps``
+    steps, the gradients for the whole minibatch are also computed
+    without being applied, and the time spent doing this is compared
+    to the time spent computing the shards of the same steps.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Model to train.
+        number_of_workers (int): The number of shards each minibatch is
+            split into.
+        number_of_reference_steps (int, optional): The number of
+            initial steps also computed with a single worker for
+            measuring the speed-up. If zero, the speed-up is not
+            measured.
+    """
+
+    def __init__(self, model, number_of_workers,
+                 number_of_reference_steps=0):
+
+        if number_of_workers < 1:
+            raise ValueError("The number of workers should be positive.")
+
+        if model.minibatch_normalisation and number_of_workers > 1:
+            raise ValueError(
+                "Data-parallel training cannot be used together with "
+                "minibatch normalisation, since each shard would be "
+                "normalised separately."
+            )
+
+        self.model = model
+        self.number_of_workers = number_of_workers
+        self.number_of_reference_steps = number_of_reference_steps
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=number_of_workers)
+
+        self.number_of_steps = 0
+        self.reset()
+
+    @property
+    def speed_up(self):
+        """Speed-up of computing gradients since last reset.
+
+        Computed as the time spent computing the gradients for whole
+        minibatches with a single worker divided by the time spent
+        computing them in shards for the same minibatches. This is NaN,
+        if no reference steps were run since the last reset.
+        """
+        if self.parallel_duration <= 0:
+            return numpy.nan
+        return self.reference_duration / self.parallel_duration
+
+    def reset(self):
+        """Reset the durations used for the speed-up."""
+        self.reference_duration = 0.
+        self.parallel_duration = 0.
+
+    def average_gradients(self, session, feed_dict, minibatch, inputs,
+                          fetches=None):
+        """Compute gradients averaged over the shards of a minibatch.
+
+        Arguments:
+            session (Session): TensorFlow session for the model.
+            feed_dict (dict): Feed dictionary shared by all shards,
+                for instance, with the learning rate.
+            minibatch (dict): Minibatch arrays as generated by
+                ``generate_minibatches``.
+            inputs (dict): Placeholders for the minibatch arrays keyed
+                by the same names.
+            fetches (optional): Additional tensors to evaluate. These
+                are evaluated for the first shard only.
+
+        Returns:
+            Tuple of the averaged gradients, the lower bound for the
+            minibatch, and the results of ``fetches`` for the first
+            shard.
+        """
+
+        shards = shard_minibatch(minibatch, self.number_of_workers)
+
+        def compute_shard(shard_index, shard):
+            shard_feed_dict = dict(feed_dict)
+            for name, values in shard.items():
+                shard_feed_dict[inputs[name]] = values
+            shard_fetches = [self.model.gradients, self.model.lower_bound]
+            if shard_index == 0:
+                shard_fetches.append(fetches or {})
+            return session.run(shard_fetches, feed_dict=shard_feed_dict)
+
+        shard_results = list(self._executor.map(
+            compute_shard, range(len(shards)), shards))
+
+        shard_sizes = numpy.array(
+            [_number_of_rows(shard["x"]) for shard in shards],
+            dtype=numpy.float64
+        )
+        shard_weights = shard_sizes / shard_sizes.sum()
+
+        averaged_gradients = []
+        lower_bound = 0.
+
+        for shard_weight, results in zip(shard_weights, shard_results):
+            gradients, shard_lower_bound = results[:2]
+            if not averaged_gradients:
+                averaged_gradients = [
+                    shard_weight * gradient for gradient in gradients]
+            else:
+                for averaged_gradient, gradient in zip(
+                        averaged_gradients, gradients):
+                    averaged_gradient += shard_weight * gradient
+            lower_bound += shard_weight * shard_lower_bound
+
+        return averaged_gradients, lower_bound, shard_results[0][2]
+
+    def run(self, session, feed_dict, minibatch, inputs, fetches=None):
+        """Run one training step on a minibatch.
+
+        Arguments:
+            session (Session): TensorFlow session for the model.
+            feed_dict (dict): Feed dictionary shared by all shards,
+                for instance, with the learning rate. It should also
+                include the whole minibatch, which is used for the
+                single-worker reference steps.
+            minibatch (dict): Minibatch arrays as generated by
+                ``generate_minibatches``.
+            inputs (dict): Placeholders for the minibatch arrays keyed
+                by the same names.
+            fetches (optional): Additional tensors to evaluate. These
+                are evaluated for the first shard only.
+
+        Returns:
+            Tuple of the lower bound for the minibatch and the results
+            of ``fetches`` for the first shard.
+        """
+
+        reference_step = (
+            self.number_of_steps < self.number_of_reference_steps)
+        self.number_of_steps += 1
+
+        if reference_step:
+            reference_feed_dict = dict(feed_dict)
+            for name, values in minibatch.items():
+                reference_feed_dict[inputs[name]] = values
+            reference_time_start = time()
+            session.run(self.model.gradients, feed_dict=reference_feed_dict)
+            self.reference_duration += time() - reference_time_start
+
+        parallel_time_start = time()
+        averaged_gradients, lower_bound, results = self.average_gradients(
+            session, feed_dict, minibatch, inputs, fetches=fetches)
+        if reference_step:
+            self.parallel_duration += time() - parallel_time_start
+
+        apply_feed_dict = dict(feed_dict)
+        for placeholder, gradient in zip(
+                self.model.gradient_placeholders, averaged_gradients):
+            apply_feed_dict[placeholder] = gradient
+        session.run(
+            self.model.apply_averaged_gradients,
+            feed_dict=apply_feed_dict
+        )
+
+        return lower_bound, results
+
+    def close(self):
+        """Stop the worker threads."""
+        self._executor.shutdown()
+
+
+def shard_minibatch(minibatch, number_of_shards):
+    """Split a minibatch into shards of consecutive examples.
+
+    Arguments:
+        minibatch (dict): Minibatch arrays or sparse tensor values as
+            generated by ``generate_minibatches``.
+        number_of_shards (int): The maximum number of shards. Fewer
+            shards are returned, if the minibatch has fewer examples.
+
+    Returns:
+        List of minibatch dictionaries, one for each shard.
+    """
+
+    number_of_examples = _number_of_rows(minibatch["x"])
+    boundaries = numpy.linspace(
+        0, number_of_examples, min(number_of_shards, number_of_examples) + 1)
+    boundaries = boundaries.round().astype(int)
+
+    shards = []
+
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+        shard = {}
+        for name, values in minibatch.items():
+            if isinstance(values, tf.SparseTensorValue):
+                shard[name] = _sparse_rows(values, start, stop)
+            else:
+                shard[name] = values[start:stop]
+        shards.append(shard)
+
+    return shards
+
+
+def _number_of_rows(values):
+    if isinstance(values, tf.SparseTensorValue):
+        return int(values.dense_shape[0])
+    return values.shape[0]
+
+
+def _sparse_rows(values, start, stop):
+    rows = values.indices[:, 0]
+    included = (rows >= start) & (rows < stop)
+    indices = values.indices[included]
+    indices[:, 0] -= start
+    dense_shape = numpy.array(values.dense_shape, dtype=numpy.int64)
+    dense_shape[0] = stop - start
+    return tf.SparseTensorValue(
+        indices=indices,
+        values=values.values[included],
+        dense_shape=dense_shape
+    )
@@ -0,0 +1,632 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import contextlib
+import json
+import queue
+import socketserver
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from time import time
+
+import numpy
+import scipy.sparse
+
+from scvae.defaults import defaults
+from scvae.models.embedding import LATENT_OUTPUTS
+from scvae.models.inputs import minibatch_values
+from scvae.models.utilities import (
+    check_run_id, restored_session, reconstruction_output)
+from scvae.utilities import format_duration
+
+SERVING_REQUESTS = ["embed", "evaluate", "sample"]
+
+# Tensors run for each kind of request
+SERVING_OUTPUTS = {
+    "VAE": {
+        "embed": LATENT_OUTPUTS["VAE"],
+        "evaluate": ["lower_bound", "reconstruction_error", "kl_divergence"]
+    },
+    "GMVAE": {
+        "embed": LATENT_OUTPUTS["GMVAE"],
+        "evaluate": [
+            "lower_bound", "reconstruction_error", "kl_divergence_z",
+            "kl_divergence_y"
+        ]
+    }
+}
+
+
+class ServedModel:
+    """Trained model kept restored in an open session for serving.
+
+    Embedding requests arriving at about the same time are batched
+    together and run as one, while evaluation and sampling requests are
+    run as they arrive.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Trained model.
+        data_set (DataSet, optional): Loaded data set, which examples
+            can be referred to by index in requests.
+        run_id (str, optional): ID used to identify a certain run
+            of the model.
+        use_early_stopping_model (bool, optional): If ``True``, use
+            model parameters, when early stopping triggered during
+            training. Defaults to ``False``.
+        use_best_model (bool, optional): If ``True``, use model
+            parameters, which resulted in the best performance on
+            validation set during training. Defaults to ``False``.
+        batching_window (float, optional): Number of seconds to wait
+            for more embedding requests to batch together.
+        maximum_batch_size (int, optional): Maximum number of examples
+            in a batch of embedding requests.
+        draw_counts (bool, optional): If ``True``, draw values from the
+            reconstruction distribution when sampling instead of using
+            its mean.
+    """
+
+    def __init__(self, model, data_set=None, run_id=None,
+                 use_early_stopping_model=False, use_best_model=False,
+                 batching_window=None, maximum_batch_size=None,
+                 draw_counts=None):
+
+        if model.type not in SERVING_OUTPUTS:
+            raise ValueError("Model type `{}` not found.".format(model.type))
+
+        if run_id is None:
+            run_id = defaults["models"]["run_id"]
+        if run_id:
+            run_id = check_run_id(run_id)
+        if draw_counts is None:
+            draw_counts = defaults["models"]["draw_counts"]
+
+        self.model = model
+        self.data_set = data_set
+        self.run_id = run_id
+        self.use_early_stopping_model = use_early_stopping_model
+        self.use_best_model = use_best_model
+        self.draw_counts = draw_counts
+
+        # Reconstruction outputs for sampling are added to the model graph
+        # now, since requests run sessions on the graph concurrently
+        if model.type == "GMVAE" and not model.batched_clusters:
+            reconstruction_distributions = model.p_x_given_z
+        else:
+            reconstruction_distributions = [model.p_x_given_z]
+        for distribution in reconstruction_distributions:
+            reconstruction_output(model, distribution, draw_counts=draw_counts)
+
+        if model.type == "VAE":
+            self._sample_placeholders = (
+                model.number_of_iw_samples, model.number_of_mc_samples)
+        else:
+            self._sample_placeholders = (
+                model.n_iw_samples, model.n_mc_samples)
+
+        self._input_values = None
+        self._target_values = None
+        self._noisy_preprocess = None
+
+        if data_set is not None:
+            self._noisy_preprocess = data_set.noisy_preprocess
+            if self._noisy_preprocess:
+                self._input_values = data_set.noisy_values
+            elif data_set.has_preprocessed_values:
+                self._input_values = data_set.preprocessed_values
+            else:
+                self._input_values = data_set.values
+            if model.reconstruction_distribution_name == "bernoulli":
+                self._target_values = data_set.binarised_values
+            else:
+                self._target_values = data_set.values
+        self._random_state = numpy.random.RandomState()
+
+        log_directory = model.log_directory(
+            run_id=run_id,
+            early_stopping=use_early_stopping_model,
+            best_model=use_best_model
+        )
+
+        self._exit_stack = contextlib.ExitStack()
+        self.session = self._exit_stack.enter_context(
+            restored_session(model, log_directory))
+
+        self._batcher = RequestBatcher(
+            self._embed_batch,
+            batching_window=batching_window,
+            maximum_batch_size=maximum_batch_size
+        )
+
+    def embed(self, values=None, indices=None):
+        """Infer latent means for examples.
+
+        Arguments:
+            values (matrix, optional): Values for examples as fed to the
+                model (that is, preprocessed like the data set).
+            indices (array_like, optional): Indices of examples in the
+                served data set. Used instead of `values`.
+
+        Returns:
+            Future, which result is a dictionary of the latent means,
+            ``z``, and, for GMVAE models, the cluster probabilities,
+            ``y``.
+        """
+        if indices is not None:
+            values = self._input_minibatch(indices, sparse=False)
+        elif values is None:
+            raise ValueError("Either values or indices should be given.")
+        elif not scipy.sparse.issparse(values):
+            values = numpy.asarray(values, dtype=numpy.float32)
+        if values.ndim != 2 or values.shape[1] != self.model.feature_size:
+            raise ValueError(
+                "Values should have shape (number of examples, {}).".format(
+                    self.model.feature_size))
+        return self._batcher.submit(values)
+
+    def evaluate(self, indices):
+        """Evaluate model on examples of the served data set.
+
+        Arguments:
+            indices (array_like): Indices of examples in the served data
+                set.
+
+        Returns:
+            Dictionary of the lower bound and its terms averaged over the
+            examples.
+        """
+        model = self.model
+        indices = self._check_indices(indices)
+
+        x = self._input_minibatch(indices, sparse=model.sparse_input)
+        if self._noisy_preprocess:
+            t = x
+        else:
+            t = minibatch_values(
+                self._target_values, indices, sparse=model.sparse_input)
+
+        feed_dict = {
+            model.x: x,
+            model.t: t,
+            model.is_training: False,
+            model.warm_up_weight: 1.0,
+            self._sample_placeholders[0]:
+                model.number_of_importance_samples["evaluation"],
+            self._sample_placeholders[1]:
+                model.number_of_monte_carlo_samples["evaluation"]
+        }
+
+        if model.type == "VAE":
+            feed_dict[model.use_deterministic_z] = False
+
+        if model.batch_correction:
+            if self.data_set.batch_indices is None:
+                raise TypeError(
+                    "No batch indices found in {} set.".format(
+                        self.data_set.kind))
+            feed_dict[model.batch_indices] = (
+                self.data_set.batch_indices[indices])
+
+        if model.use_count_sum_as_parameter:
+            feed_dict[model.count_sum_parameter] = (
+                self.data_set.count_sum[indices])
+
+        if model.use_count_sum_as_feature:
+            feed_dict[model.count_sum_feature] = (
+                self.data_set.normalised_count_sum[indices])
+
+        results = self.session.run(
+            {
+                name: getattr(model, name)
+                for name in SERVING_OUTPUTS[model.type]["evaluate"]
+            },
+            feed_dict=feed_dict
+        )
+
+        return {name: float(value) for name, value in results.items()}
+
+    def sample(self, sample_size):
+        """Sample examples from model.
+
+        Arguments:
+            sample_size (int): The number of samples to draw from the
+                model.
+
+        Returns:
+            Dictionary of the reconstructed values, ``x``, and of the
+            samples of the latent variables.
+        """
+        reconstruction_set, latent_sets = self.model.sample(
+            sample_size=sample_size,
+            run_id=self.run_id,
+            use_early_stopping_model=self.use_early_stopping_model,
+            use_best_model=self.use_best_model,
+            session=self.session,
+            draw_counts=self.draw_counts
+        )
+        samples = {"x": reconstruction_set.values}
+        for latent_variable, latent_set in latent_sets.items():
+            samples[latent_variable] = latent_set.values
+        return samples
+
+    @property
+    def number_of_batches(self):
+        return self._batcher.number_of_batches
+
+    def close(self):
+        self._batcher.close()
+        self._exit_stack.close()
+
+    def _check_indices(self, indices):
+        if self.data_set is None:
+            raise ValueError("No data set served to refer to by index.")
+        indices = numpy.asarray(indices, dtype=numpy.int64)
+        if indices.ndim != 1 or indices.size == 0:
+            raise ValueError("Indices should be a non-empty list.")
+        number_of_examples = self.data_set.number_of_examples
+        if indices.min() < 0 or indices.max() >= number_of_examples:
+            raise ValueError(
+                "Indices should be between 0 and {}.".format(
+                    number_of_examples - 1))
+        return indices
+
+    def _input_minibatch(self, indices, sparse):
+        indices = self._check_indices(indices)
+        return minibatch_values(
+            self._input_values, indices,
+            sparse=sparse,
+            preprocess=self._noisy_preprocess,
+            random_state=self._random_state
+        )
+
+    def _embed_batch(self, values):
+        model = self.model
+        feed_dict = {
+            model.x: minibatch_values(
+                values, slice(None), sparse=model.sparse_input),
+            model.is_training: False,
+            self._sample_placeholders[0]: 1,
+            self._sample_placeholders[1]: 1
+        }
+        if model.type == "VAE":
+            feed_dict[model.use_deterministic_z] = True
+        return self.session.run(
+            {
+                name: getattr(model, tensor_name)
+                for name, tensor_name
+                in SERVING_OUTPUTS[model.type]["embed"].items()
+            },
+            feed_dict=feed_dict
+        )
+
+
+class RequestBatcher:
+    """Batch requests submitted at about the same time.
+
+    Values of requests are stacked and passed to a function in one
+    call, and the rows of its outputs are split back among requests.
+
+    Arguments:
+        function (callable): Function taking a matrix of values and
+            returning a dictionary of arrays with a row for each example.
+        batching_window (float, optional): Number of seconds to wait
+            for more requests after the first one in a batch.
+        maximum_batch_size (int, optional): Maximum number of examples
+            in a batch.
+    """
+
+    def __init__(self, function, batching_window=None,
+                 maximum_batch_size=None):
+
+        if batching_window is None:
+            batching_window = defaults["serving"]["batching_window"]
+        if maximum_batch_size is None:
+            maximum_batch_size = defaults["serving"]["maximum_batch_size"]
+
+        self.function = function
+        self.batching_window = batching_window
+        self.maximum_batch_size = maximum_batch_size
+        self.number_of_batches = 0
+
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, values):
+        future = Future()
+        self._requests.put((values, future))
+        return future
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self):
+
+        closed = False
+
+        while not closed:
+
+            request = self._requests.get()
+
+            if request is None:
+                break
+
+            batch = [request]
+            batch_size = request[0].shape[0]
+            deadline = time() + self.batching_window
+
+            while batch_size < self.maximum_batch_size:
+                timeout = deadline - time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    closed = True
+                    break
+                batch.append(request)
+                batch_size += request[0].shape[0]
+
+            self._run_batch(batch)
+
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request[1].set_exception(
+                    RuntimeError("Request batcher has been closed."))
+
+    def _run_batch(self, batch):
+
+        values = [values for values, __ in batch]
+        if any(scipy.sparse.issparse(v) for v in values):
+            values = scipy.sparse.vstack(values).tocsr()
+        else:
+            values = numpy.concatenate(values)
+
+        try:
+            outputs = self.function(values)
+        except Exception as exception:
+            for __, future in batch:
+                future.set_exception(exception)
+            return
+
+        self.number_of_batches += 1
+
+        start = 0
+        for request_values, future in batch:
+            stop = start + request_values.shape[0]
+            future.set_result({
+                name: output[start:stop]
+                for name, output in outputs.items()
+            })
+            start = stop
+
+
+class ModelServer(socketserver.ThreadingMixIn, HTTPServer):
+    """HTTP server for requests to models kept restored in memory.
+
+    Requests are posted as JSON objects to ``/embed``, ``/evaluate``,
+    or ``/sample`` and can name one of the served model versions. The
+    served model versions are listed at ``/models``. Each response
+    includes the latency of its request in seconds.
+
+    Arguments:
+        served_models (dict): Served models keyed by model version.
+        host (str, optional): Host name or address to listen on.
+        port (int, optional): Port to listen on. Use 0 for any free
+            port.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, served_models, host=None, port=None):
+
+        if not served_models:
+            raise ValueError("No models to serve.")
+
+        if host is None:
+            host = defaults["serving"]["host"]
+        if port is None:
+            port = defaults["serving"]["port"]
+
+        self.served_models = served_models
+        self.default_model_version = next(iter(served_models))
+        self._serving_thread = None
+
+        super().__init__((host, port), _ModelRequestHandler)
+
+    @property
+    def address(self):
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._serving_thread = threading.Thread(
+            target=self.serve_forever, daemon=True)
+        self._serving_thread.start()
+
+    def stop(self):
+        """Stop serving requests and close the served models."""
+        if self._serving_thread is not None:
+            self.shutdown()
+            self._serving_thread.join()
+            self._serving_thread = None
+        self.server_close()
+        for served_model in self.served_models.values():
+            served_model.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.stop()
+
+    def handle_request_content(self, request_kind, content):
+
+        model_version = content.get(
+            "model_version", self.default_model_version)
+        model_version = model_version.replace("-", "_")
+        if model_version not in self.served_models:
+            raise ValueError(
+                "Model version `{}` is not served.".format(model_version))
+        served_model = self.served_models[model_version]
+
+        if request_kind == "embed":
+            future = served_model.embed(
+                values=content.get("values"),
+                indices=content.get("indices")
+            )
+            outputs = future.result()
+        elif request_kind == "evaluate":
+            outputs = served_model.evaluate(content["indices"])
+        elif request_kind == "sample":
+            outputs = served_model.sample(int(content["sample_size"]))
+        else:
+            raise ValueError(
+                "Request `{}` not found.".format(request_kind))
+
+        response = {"model_version": model_version}
+        for name, output in outputs.items():
+            if isinstance(output, numpy.ndarray):
+                output = output.tolist()
+            response[name] = output
+
+        return response
+
+
+class ServingClient:
+    """Client for a model server.
+
+    Arguments:
+        address (str): Address of the model server, for example,
+            ``http://127.0.0.1:8765``.
+        model_version (str, optional): Model version used for requests.
+            Defaults to the first model version served.
+    """
+
+    def __init__(self, address, model_version=None):
+        self.address = address.rstrip("/")
+        self.model_version = model_version
+
+    def models(self):
+        return self._request("models")
+
+    def embed(self, values=None, indices=None):
+        content = {}
+        if values is not None:
+            if scipy.sparse.issparse(values):
+                values = values.toarray()
+            content["values"] = numpy.asarray(values).tolist()
+        if indices is not None:
+            content["indices"] = numpy.asarray(indices).tolist()
+        return self._arrays(self._request("embed", content))
+
+    def evaluate(self, indices):
+        return self._request(
+            "evaluate", {"indices": numpy.asarray(indices).tolist()})
+
+    def sample(self, sample_size):
+        return self._arrays(
+            self._request("sample", {"sample_size": sample_size}))
+
+    def _request(self, request_kind, content=None):
+        url = "{}/{}".format(self.address, request_kind)
+        if content is None:
+            request = urllib.request.Request(url)
+        else:
+            if self.model_version:
+                content["model_version"] = self.model_version
+            request = urllib.request.Request(
+                url,
+                data=json.dumps(content).encode("utf-8"),
+                headers={"Content-Type": "application/json"}
+            )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as error:
+            message = json.loads(error.read().decode("utf-8"))["error"]
+            raise ValueError(message) from None
+
+    @staticmethod
+    def _arrays(response):
+        return {
+            name: numpy.array(value) if isinstance(value, list) else value
+            for name, value in response.items()
+        }
+
+
+class _ModelRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.strip("/") != "models":
+            self._respond(404, {"error": "Not found."})
+            return
+        self._respond(200, {
+            "model_versions": list(self.server.served_models),
+            "requests": SERVING_REQUESTS
+        })
+
+    def do_POST(self):
+
+        request_time_start = time()
+        request_kind = self.path.strip("/")
+
+        if request_kind not in SERVING_REQUESTS:
+            self._respond(404, {"error": "Not found."})
+            return
+
+        try:
+            content_length = int(self.headers.get("Content-Length", 0))
+            content = json.loads(
+                self.rfile.read(content_length).decode("utf-8") or "{}")
+            response = self.server.handle_request_content(
+                request_kind, content)
+        except (ValueError, TypeError, KeyError) as exception:
+            self._respond(400, {"error": str(exception)})
+            return
+        except Exception as exception:
+            self._respond(500, {"error": str(exception)})
+            return
+
+        latency = time() - request_time_start
+        response["latency"] = latency
+        self._respond(200, response)
+
+        print("Served {} request ({}).".format(
+            request_kind, format_duration(latency)))
+
+    def _respond(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *arguments):
+        pass
@@ -0,0 +1,416 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import contextlib
+import operator
+import os
+
+import numpy
+import scipy.sparse
+import tables
+
+OUTPUT_SINKS = ["memory", "npy", "hdf5"]
+
+
+class OutputSink:
+    """Sink for evaluation outputs written one minibatch at a time.
+
+    Arguments:
+        shape (tuple): Shape of the full output array.
+        dtype (dtype, optional): Data type of the output array.
+    """
+
+    def __init__(self, shape, dtype=numpy.float32):
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+
+    def write(self, indices, values):
+        """Write values for examples at indices."""
+        raise NotImplementedError
+
+    @property
+    def values(self):
+        """Array-like of written values, read lazily when possible."""
+        raise NotImplementedError
+
+    def close(self):
+        """Finish writing values."""
+
+
+class MemorySink(OutputSink):
+    """Output sink keeping values in a dense in-memory array."""
+
+    def __init__(self, shape, dtype=numpy.float32):
+        super().__init__(shape, dtype=dtype)
+        self._values = numpy.empty(shape=self.shape, dtype=self.dtype)
+
+    def write(self, indices, values):
+        self._values[_as_slice(indices)] = values
+
+    @property
+    def values(self):
+        return self._values
+
+
+class NPYSink(OutputSink):
+    """Output sink writing values to a memory-mapped NumPy file.
+
+    Arguments:
+        path (str): Path to NumPy file.
+        shape (tuple): Shape of the full output array.
+        dtype (dtype, optional): Data type of the output array.
+    """
+
+    def __init__(self, path, shape, dtype=numpy.float32):
+        super().__init__(shape, dtype=dtype)
+        self.path = path
+        self._values = numpy.lib.format.open_memmap(
+            path, mode="w+", dtype=self.dtype, shape=self.shape)
+
+    def write(self, indices, values):
+        self._values[_as_slice(indices)] = values
+
+    @property
+    def values(self):
+        return self._values
+
+    def close(self):
+        self._values.flush()
+
+
+class HDF5Sink(OutputSink):
+    """Output sink writing values to a chunked, compressed HDF5 file.
+
+    The file is closed when writing is finished, and the returned values
+    wrap the HDF5 array, which is only read when indexed or converted to
+    a NumPy array.
+
+    Arguments:
+        path (str): Path to HDF5 file.
+        shape (tuple): Shape of the full output array.
+        dtype (dtype, optional): Data type of the output array.
+        chunk_size (int, optional): Number of examples in each chunk.
+    """
+
+    def __init__(self, path, shape, dtype=numpy.float32, chunk_size=100):
+        super().__init__(shape, dtype=dtype)
+        self.path = path
+        self._file = tables.open_file(path, mode="w")
+        self._values = self._file.create_carray(
+            self._file.root,
+            name="values",
+            atom=tables.Atom.from_dtype(self.dtype),
+            shape=self.shape,
+            chunkshape=(min(chunk_size, max(self.shape[0], 1)),)
+            + self.shape[1:],
+            filters=tables.Filters(complevel=1, complib="zlib")
+        )
+
+    def write(self, indices, values):
+        indices = _as_slice(indices)
+        if isinstance(indices, slice):
+            self._values[indices] = values
+        else:
+            for index, row in zip(indices, values):
+                self._values[index] = row
+
+    @property
+    def values(self):
+        return HDF5Array(
+            self.path, name="values", chunk_size=self._values.chunkshape[0])
+
+    def close(self):
+        if self._file.isopen:
+            self._file.close()
+
+
+class HDF5Array:
+    """Array-like view of an HDF5 array read lazily in chunks.
+
+    Examples are read when indexed, and sums, means, variances, standard
+    deviations, maxima, and minima are computed a chunk of examples at a
+    time. Other array methods and arithmetic read the whole array.
+
+    The HDF5 file is only opened while reading.
+
+    Arguments:
+        path (str): Path to HDF5 file.
+        name (str, optional): Name of HDF5 array in the root of the file.
+        chunk_size (int, optional): Number of examples read at a time
+            when reducing the array.
+    """
+
+    def __init__(self, path, name="values", chunk_size=100):
+        self.path = path
+        self.name = name
+        self.chunk_size = max(int(chunk_size), 1)
+        with self._open_node() as node:
+            self.shape = tuple(node.shape)
+            self.dtype = node.dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(numpy.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+
+        if isinstance(key, tuple):
+            row_key, other_keys = key[0], key[1:]
+        else:
+            row_key, other_keys = key, ()
+
+        if not isinstance(row_key, (list, numpy.ndarray)):
+            with self._open_node() as node:
+                return node[key]
+
+        row_key = numpy.asarray(row_key)
+
+        if row_key.dtype == bool:
+            row_key = numpy.nonzero(row_key)[0]
+        else:
+            row_key = numpy.where(
+                row_key < 0, row_key + self.shape[0], row_key)
+
+        # Lists of indices are read as point coordinates by PyTables
+        # unless followed by an ellipsis, and then these have to be
+        # sorted and unique
+        unique_row_key, inverse_row_key = numpy.unique(
+            row_key, return_inverse=True)
+
+        if unique_row_key.size > 0:
+            with self._open_node() as node:
+                values = node[unique_row_key, ...][inverse_row_key]
+        else:
+            values = numpy.empty(
+                shape=(0,) + self.shape[1:], dtype=self.dtype)
+
+        if other_keys:
+            values = values[(slice(None),) + other_keys]
+
+        return values
+
+    def __array__(self, dtype=None, copy=None):
+        with self._open_node() as node:
+            values = node[:]
+        if dtype is not None:
+            values = values.astype(dtype)
+        return values
+
+    def __getattr__(self, name):
+        # Other array attributes and methods, such as `reshape` and
+        # `copy`, are taken from the whole array
+        if name.startswith("_") or name in [
+                "path", "name", "chunk_size", "shape", "dtype"]:
+            raise AttributeError(name)
+        return getattr(numpy.asarray(self), name)
+
+    def sum(self, axis=None, dtype=None, out=None):
+        """Sum values in chunks of examples."""
+        return self._reduce(numpy.sum, axis=axis)
+
+    def max(self, axis=None, out=None):
+        """Find maximum values in chunks of examples."""
+        return self._reduce(numpy.max, axis=axis)
+
+    def min(self, axis=None, out=None):
+        """Find minimum values in chunks of examples."""
+        return self._reduce(numpy.min, axis=axis)
+
+    def mean(self, axis=None, dtype=None, out=None):
+        """Average values in chunks of examples."""
+        if self._is_examplewise(axis):
+            return self._reduce(numpy.mean, axis=axis)
+        return self.sum(axis=axis) / self._number_of_reduced_values(axis)
+
+    def var(self, axis=None, dtype=None, out=None, ddof=0):
+        """Compute variances in chunks of examples around the mean."""
+
+        if self._is_examplewise(axis):
+            return numpy.concatenate([
+                chunk.var(axis=axis, ddof=ddof) for chunk in self._chunks()
+            ])
+
+        mean = self.mean(axis=axis)
+        squared_deviations = sum(
+            numpy.square(chunk - mean).sum(axis=axis)
+            for chunk in self._chunks()
+        )
+
+        return squared_deviations / (
+            self._number_of_reduced_values(axis) - ddof)
+
+    def std(self, axis=None, dtype=None, out=None, ddof=0):
+        """Compute standard deviations in chunks of examples."""
+        return numpy.sqrt(self.var(axis=axis, ddof=ddof))
+
+    @contextlib.contextmanager
+    def _open_node(self):
+        with tables.open_file(self.path, mode="r") as hdf5_file:
+            yield hdf5_file.get_node(hdf5_file.root, self.name)
+
+    def _chunks(self):
+        with self._open_node() as node:
+            for i in range(0, self.shape[0], self.chunk_size):
+                yield node[i:i + self.chunk_size]
+
+    def _is_examplewise(self, axis):
+        return axis is not None and axis % self.ndim != 0
+
+    def _number_of_reduced_values(self, axis):
+        if axis is None:
+            return self.size
+        return self.shape[axis]
+
+    def _reduce(self, reduction, axis=None):
+
+        if self._is_examplewise(axis):
+            return numpy.concatenate([
+                reduction(chunk, axis=axis) for chunk in self._chunks()])
+
+        chunk_reductions = numpy.stack([
+            reduction(chunk, axis=0) for chunk in self._chunks()])
+        total = reduction(chunk_reductions, axis=0)
+
+        if axis is None:
+            total = reduction(total)
+
+        return total
+
+
+def _add_array_operator(name):
+    # Arithmetic and comparisons read the whole array, as for the other
+    # array methods
+    function = getattr(operator, name)
+
+    def array_operator(self, other):
+        return function(numpy.asarray(self), other)
+
+    def reflected_array_operator(self, other):
+        return function(other, numpy.asarray(self))
+
+    setattr(HDF5Array, "__{}__".format(name), array_operator)
+    if name not in ["eq", "ne", "lt", "le", "gt", "ge"]:
+        setattr(
+            HDF5Array, "__r{}__".format(name), reflected_array_operator)
+
+
+for _operator_name in ["add", "sub", "mul", "truediv", "floordiv", "pow",
+                       "eq", "ne", "lt", "le", "gt", "ge"]:
+    _add_array_operator(_operator_name)
+
+
+def build_output_sink(kind, shape, name=None, directory=None,
+                      dtype=numpy.float32):
+    """Build output sink of a certain kind.
+
+    Arguments:
+        kind (str): Kind of output sink: ``"memory"``, ``"npy"``, or
+            ``"hdf5"``.
+        shape (tuple): Shape of the full output array.
+        name (str, optional): Name of output used for the file name of
+            file-based sinks.
+        directory (str, optional): Directory for file-based sinks.
+        dtype (dtype, optional): Data type of the output array.
+
+    Returns:
+        Output sink.
+    """
+
+    if kind == "memory":
+        return MemorySink(shape, dtype=dtype)
+
+    if kind not in OUTPUT_SINKS:
+        raise ValueError("Output sink `{}` not found.".format(kind))
+
+    if name is None or directory is None:
+        raise ValueError(
+            "Output sink `{}` requires a name and a directory.".format(kind))
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    if kind == "npy":
+        return NPYSink(
+            os.path.join(directory, name + ".npy"), shape, dtype=dtype)
+    elif kind == "hdf5":
+        return HDF5Sink(
+            os.path.join(directory, name + ".h5"), shape, dtype=dtype)
+
+
+class SparseSubsetBuffer:
+    """Buffer of values for a subset of examples.
+
+    Values are only kept for the examples in the subset, and these are
+    returned as a sparse matrix with the full number of examples.
+
+    Arguments:
+        shape (tuple): Shape of the full output matrix.
+        subset_indices (iterable): Indices of examples in the subset.
+        dtype (dtype, optional): Data type of the values.
+    """
+
+    def __init__(self, shape, subset_indices, dtype=numpy.float32):
+        self.shape = tuple(shape)
+        self.subset_indices = numpy.array(
+            sorted(subset_indices), dtype=numpy.int64)
+        self._values = numpy.zeros(
+            shape=(self.subset_indices.size,) + self.shape[1:],
+            dtype=dtype
+        )
+
+    def write(self, indices, values):
+        """Write values for the examples at indices in the subset."""
+
+        if self.subset_indices.size == 0:
+            return
+
+        indices = numpy.asarray(indices)
+        positions = numpy.searchsorted(self.subset_indices, indices)
+        positions = numpy.minimum(positions, self.subset_indices.size - 1)
+
+        included = self.subset_indices[positions] == indices
+        self._values[positions[included]] = numpy.asarray(values)[included]
+
+    def to_sparse(self):
+        """Return the values as a sparse matrix of the full shape."""
+
+        subset_values = scipy.sparse.coo_matrix(self._values)
+
+        return scipy.sparse.csr_matrix(
+            (
+                subset_values.data,
+                (self.subset_indices[subset_values.row], subset_values.col)
+            ),
+            shape=self.shape
+        )
+
+
+def _as_slice(indices):
+    # Contiguous indices are written as a slice, which is faster for
+    # file-based arrays
+    indices = numpy.asarray(indices)
+    if indices.size > 0 and numpy.all(numpy.diff(indices) == 1):
+        return slice(int(indices[0]), int(indices[-1]) + 1)
+    return indices
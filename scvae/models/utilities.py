@@ -21,45 +21,85 @@ import random
 import re
 import shutil
 import time
+import zlib
 from collections import namedtuple
+from contextlib import contextmanager
 from datetime import datetime
 from string import ascii_uppercase
 
 import numpy
 import tensorflow as tf
-from tensorflow.contrib.layers import fully_connected, batch_norm, dropout
+from tensorflow.contrib.framework import model_variable
+from tensorflow.contrib.layers import (
+    fully_connected, batch_norm, dropout, xavier_initializer)
 
+from scvae.defaults import defaults
+from scvae.distributions import (
+    COUNT_DISTRIBUTIONS, SPARSE_LOG_PROB_DISTRIBUTIONS)
 from scvae.utilities import (
     capitalise_string, enumerate_strings, normalise_string)
 
+NOISE_STREAMS = ["training", "evaluation"]
+
 
 # Wrapper layer for inserting batch normalisation in between linear and
 # nonlinear activation layers
 def dense_layer(inputs, num_outputs, is_training=True, scope="layer",
                 activation_fn=None, minibatch_normalisation=False, decay=0.999,
                 center=True, scale=False, reuse=False,
-                dropout_keep_probability=False):
+                dropout_keep_probability=False,
+                minibatch_normalisation_groups=None):
 
     with tf.variable_scope(scope):
         # Dropout input connections with rate = (1- dropout_keep_probability)
         if dropout_keep_probability and dropout_keep_probability != 1:
-            inputs = dropout(
-                inputs=inputs,
-                keep_prob=dropout_keep_probability,
-                is_training=is_training
-            )
+            if isinstance(inputs, tf.SparseTensor):
+                # Zero-valued inputs are unaffected by dropout
+                inputs = tf.SparseTensor(
+                    indices=inputs.indices,
+                    values=dropout(
+                        inputs=inputs.values,
+                        keep_prob=dropout_keep_probability,
+                        is_training=is_training
+                    ),
+                    dense_shape=inputs.dense_shape
+                )
+            else:
+                inputs = dropout(
+                    inputs=inputs,
+                    keep_prob=dropout_keep_probability,
+                    is_training=is_training
+                )
 
         # Set up weights for and transform inputs through neural network
-        outputs = fully_connected(
-            inputs=inputs,
-            num_outputs=num_outputs,
-            activation_fn=None,
-            scope="DENSE",
-            reuse=reuse
-        )
+        if isinstance(inputs, tf.SparseTensor):
+            outputs = sparse_fully_connected(
+                inputs=inputs,
+                num_outputs=num_outputs,
+                scope="DENSE",
+                reuse=reuse
+            )
+        else:
+            outputs = fully_connected(
+                inputs=inputs,
+                num_outputs=num_outputs,
+                activation_fn=None,
+                scope="DENSE",
+                reuse=reuse
+            )
 
         # Set up normalisation across examples with learned center and scale
-        if minibatch_normalisation:
+        if minibatch_normalisation and minibatch_normalisation_groups:
+            outputs = _batch_norm_in_groups(
+                inputs=outputs,
+                groups=minibatch_normalisation_groups,
+                center=center,
+                scale=scale,
+                is_training=is_training,
+                scope="BATCH_NORM",
+                reuse=reuse
+            )
+        elif minibatch_normalisation:
             outputs = batch_norm(
                 inputs=outputs,
                 center=center,
@@ -76,6 +116,135 @@ def dense_layer(inputs, num_outputs, is_training=True, scope="layer",
     return outputs
 
 
+# Normalisation of each group of examples separately using the same
+# variables, where the rows of the inputs are arranged as replicates by
+# groups by examples, so that a layer applied to several groups at once
+# gives the same outputs as applying it to each group in turn
+def _batch_norm_in_groups(inputs, groups, center=True, scale=False,
+                          is_training=True, scope="BATCH_NORM", reuse=False):
+
+    number_of_replicates, number_of_groups = groups
+    num_outputs = tf.compat.dimension_value(inputs.get_shape()[-1])
+
+    # (R * G * B, H) --> (R, G, B, H)
+    grouped_inputs = tf.reshape(
+        inputs,
+        shape=[number_of_replicates, number_of_groups, -1, num_outputs]
+    )
+
+    grouped_outputs = []
+
+    for g in range(number_of_groups):
+        # (R, B, H) --> (R * B, H)
+        group_outputs = batch_norm(
+            inputs=tf.reshape(grouped_inputs[:, g], shape=[-1, num_outputs]),
+            center=center,
+            scale=scale,
+            is_training=is_training,
+            scope=scope,
+            reuse=reuse or g > 0
+        )
+        # (R * B, H) --> (R, B, H)
+        grouped_outputs.append(tf.reshape(
+            group_outputs, shape=[number_of_replicates, -1, num_outputs]))
+
+    # G * [(R, B, H)] --> (R, G, B, H) --> (R * G * B, H)
+    return tf.reshape(
+        tf.stack(grouped_outputs, axis=1), shape=[-1, num_outputs])
+
+
+# Linear layer for sparse inputs using a sparse-dense matrix multiplication
+# with the same variables as `fully_connected`, so that models can be
+# restored with either sparse or dense inputs
+def sparse_fully_connected(inputs, num_outputs, scope="DENSE", reuse=False):
+
+    num_inputs = tf.compat.dimension_value(inputs.get_shape()[-1])
+
+    if num_inputs is None:
+        raise ValueError(
+            "The number of features of sparse inputs has to be known.")
+
+    with tf.variable_scope(scope, reuse=reuse):
+        weights = model_variable(
+            name="weights",
+            shape=[num_inputs, num_outputs],
+            dtype=tf.float32,
+            initializer=xavier_initializer()
+        )
+        biases = model_variable(
+            name="biases",
+            shape=[num_outputs],
+            dtype=tf.float32,
+            initializer=tf.zeros_initializer()
+        )
+        outputs = tf.sparse.sparse_dense_matmul(inputs, weights)
+        outputs = tf.nn.bias_add(outputs, biases)
+        outputs.set_shape([None, num_outputs])
+
+    return outputs
+
+
+# Concatenate sparse and dense features into sparse features keeping the
+# number of features known
+def concatenate_sparse_and_dense(sparse_inputs, dense_inputs):
+
+    num_sparse_features = tf.compat.dimension_value(
+        sparse_inputs.get_shape()[-1])
+    num_dense_features = tf.compat.dimension_value(
+        dense_inputs.get_shape()[-1])
+
+    dense_inputs = sparse_from_dense(dense_inputs)
+    dense_indices = dense_inputs.indices + tf.constant(
+        [0, num_sparse_features], dtype=tf.int64)
+
+    return tf.SparseTensor(
+        indices=tf.concat([sparse_inputs.indices, dense_indices], axis=0),
+        values=tf.concat([sparse_inputs.values, dense_inputs.values], axis=0),
+        dense_shape=tf.stack([
+            sparse_inputs.dense_shape[0],
+            tf.constant(
+                num_sparse_features + num_dense_features, dtype=tf.int64)
+        ])
+    )
+
+
+# Sparse tensor of the nonzero values of a dense matrix
+def sparse_from_dense(inputs):
+    indices = tf.where(tf.not_equal(inputs, 0))
+    return tf.SparseTensor(
+        indices=indices,
+        values=tf.gather_nd(inputs, indices),
+        dense_shape=tf.shape(inputs, out_type=tf.int64)
+    )
+
+
+# Replicate rows of sparse matrix in tiles like `tf.tile` along the first axis
+def tile_sparse_rows(inputs, multiples):
+
+    multiples = tf.cast(multiples, tf.int64)
+    number_of_rows = inputs.dense_shape[0]
+    number_of_columns = tf.compat.dimension_value(inputs.get_shape()[-1])
+    if number_of_columns is None:
+        number_of_columns = inputs.dense_shape[1]
+    else:
+        number_of_columns = tf.constant(number_of_columns, dtype=tf.int64)
+
+    row_offsets = tf.range(multiples) * number_of_rows
+    row_indices = tf.reshape(
+        tf.expand_dims(inputs.indices[:, 0], axis=0)
+        + tf.expand_dims(row_offsets, axis=-1),
+        shape=[-1]
+    )
+    column_indices = tf.tile(inputs.indices[:, 1], multiples=[multiples])
+
+    return tf.SparseTensor(
+        indices=tf.stack([row_indices, column_indices], axis=-1),
+        values=tf.tile(inputs.values, multiples=[multiples]),
+        dense_shape=tf.stack([
+            multiples * number_of_rows, number_of_columns])
+    )
+
+
 # Wrapper layer for inserting batch normalisation in between several linear
 # and non-linear activation layers in given or reverse order
 def dense_layers(inputs, num_outputs, reverse_order=False, is_training=True,
@@ -83,7 +252,8 @@ def dense_layers(inputs, num_outputs, reverse_order=False, is_training=True,
                  minibatch_normalisation=False, decay=0.999, center=True,
                  scale=False, reuse=False,
                  input_dropout_keep_probability=False,
-                 hidden_dropout_keep_probability=False):
+                 hidden_dropout_keep_probability=False,
+                 minibatch_normalisation_groups=None):
 
     if not isinstance(num_outputs, (list, tuple)):
         num_outputs = [num_outputs]
@@ -120,7 +290,8 @@ def dense_layers(inputs, num_outputs, reverse_order=False, is_training=True,
                 center=center,
                 scale=scale,
                 reuse=reuse,
-                dropout_keep_probability=dropout_keep_probability
+                dropout_keep_probability=dropout_keep_probability,
+                minibatch_normalisation_groups=minibatch_normalisation_groups
             )
 
     return outputs
@@ -657,6 +828,20 @@ def check_run_id(run_id):
     return run_id
 
 
+def noise_random_state(model, epoch, stream, run_id=None):
+    # Random stream for noisy preprocessing seeded by the model and run,
+    # the epoch, and whether the noise is used for training or
+    # evaluation, so that noise is reproducible for a run but differs
+    # between runs and between training and evaluation
+    if stream not in NOISE_STREAMS:
+        raise ValueError("Noise stream `{}` not found.".format(stream))
+    if run_id is None:
+        run_id = defaults["models"]["run_id"]
+    run_seed = zlib.crc32("{}/{}".format(model.name, run_id).encode())
+    return numpy.random.RandomState(
+        [run_seed, epoch, NOISE_STREAMS.index(stream)])
+
+
 def clear_log_directory(log_directory):
     remove_log_directory = True
     if os.path.exists(log_directory):
@@ -681,7 +866,97 @@ def correct_model_checkpoint_path(model_checkpoint_path, parent_directory):
     return correct_model_checkpoint_path
 
 
-def copy_model_directory(model_checkpoint, main_destination_directory):
+@contextmanager
+def restored_session(model, log_directory, model_string="model",
+                     session=None):
+    """Open session with model parameters restored from log directory.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Trained model.
+        log_directory (str): Directory with the model checkpoint.
+        model_string (str, optional): Description of the model used in
+            error messages.
+        session (tf.Session, optional): Open session, in which the model
+            parameters have already been restored. If given, this
+            session is used as is and is not closed afterwards.
+
+    Yields:
+        Session with the restored model parameters.
+    """
+
+    if session is not None:
+        yield session
+        return
+
+    checkpoint = tf.train.get_checkpoint_state(log_directory)
+
+    with tf.Session(graph=model.graph) as session:
+
+        if checkpoint:
+            model_checkpoint_path = correct_model_checkpoint_path(
+                checkpoint.model_checkpoint_path,
+                log_directory
+            )
+            model.saver.restore(session, model_checkpoint_path)
+        else:
+            raise Exception(
+                "Cannot evaluate {} when it has not been trained.".format(
+                    model_string)
+            )
+
+        yield session
+
+
+def reconstruction_output(model, distribution, draw_counts=False):
+    """Tensor of means or draws of a reconstruction distribution.
+
+    The tensor is added to the model graph, when first needed, and then
+    reused.
+
+    Arguments:
+        model ((GaussianMixture)VariationalAutoencoder): Model.
+        distribution (Distribution): Reconstruction distribution p(x|z)
+            in the model graph.
+        draw_counts (bool, optional): If ``True``, draw values from the
+            distribution instead of using its mean.
+
+    Returns:
+        Tensor of values with the shape of the batch of the distribution.
+    """
+
+    key = (id(distribution), draw_counts)
+
+    if key not in model.reconstruction_outputs:
+        with model.graph.as_default():
+            if draw_counts:
+                try:
+                    output = distribution.sample()
+                except NotImplementedError:
+                    raise NotImplementedError(
+                        "Drawing values from {} distribution.".format(
+                            model.reconstruction_distribution_name))
+            else:
+                output = distribution.mean()
+        model.reconstruction_outputs[key] = output
+
+    return model.reconstruction_outputs[key]
+
+
+def sampled_values_data_type(model, draw_counts=False):
+    if (draw_counts and model.reconstruction_distribution_name
+            in COUNT_DISTRIBUTIONS):
+        return numpy.int32
+    return numpy.float32
+
+
+def numbered_names(kind, number):
+    """Numbered names, such as ``"sample 1"``, built as a NumPy array."""
+    return numpy.char.add(
+        "{} ".format(kind), numpy.arange(1, number + 1).astype("U"))
+
+
+def copy_model_directory(model_checkpoint, main_destination_directory,
+                         link_checkpoint_files=False):
 
     checkpoint_path_prefix = model_checkpoint.model_checkpoint_path
     checkpoint_directory, checkpoint_filename_prefix = (
@@ -720,7 +995,13 @@ def copy_model_directory(model_checkpoint, main_destination_directory):
     for f in os.listdir(checkpoint_directory):
         source_path = os.path.join(checkpoint_directory, f)
 
-        if checkpoint_filename_prefix in f or "events" in f:
+        if checkpoint_filename_prefix in f and link_checkpoint_files:
+            _link_or_copy_file(source_path, main_destination_directory)
+
+        elif "events" in f and link_checkpoint_files:
+            _append_new_file_content(source_path, main_destination_directory)
+
+        elif checkpoint_filename_prefix in f or "events" in f:
             destination_directory = main_destination_directory
             shutil.copy(source_path, destination_directory)
 
@@ -733,7 +1014,71 @@ def copy_model_directory(model_checkpoint, main_destination_directory):
                 os.makedirs(destination_directory)
             for sub_f in os.listdir(sub_checkpoint_directory):
                 sub_source_path = os.path.join(sub_checkpoint_directory, sub_f)
-                shutil.copy(sub_source_path, destination_directory)
+                if "events" in sub_f and link_checkpoint_files:
+                    _append_new_file_content(
+                        sub_source_path, destination_directory)
+                else:
+                    shutil.copy(sub_source_path, destination_directory)
+
+
+def save_model_version(log_directory, version_log_directory):
+    """Record the current checkpoint as another model version.
+
+    Checkpoint files are hard-linked into the version log directory
+    instead of being copied, when the file system allows it. Summary
+    files keep being appended to during training, so they cannot be
+    linked. Instead, only the content added since the model version was
+    last recorded is appended to the copies.
+    """
+
+    current_checkpoint = tf.train.get_checkpoint_state(log_directory)
+
+    if current_checkpoint:
+        copy_model_directory(
+            current_checkpoint,
+            version_log_directory,
+            link_checkpoint_files=True
+        )
+
+    remove_old_checkpoints(version_log_directory)
+
+
+def _link_or_copy_file(source_path, destination_directory):
+
+    destination_path = os.path.join(
+        destination_directory, os.path.basename(source_path))
+
+    if os.path.lexists(destination_path):
+        os.remove(destination_path)
+
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        shutil.copy(source_path, destination_path)
+
+
+def _append_new_file_content(source_path, destination_directory):
+
+    destination_path = os.path.join(
+        destination_directory, os.path.basename(source_path))
+
+    # Files written to by appending only share the content of earlier
+    # copies, so only the content added since is copied
+    if (not os.path.isfile(destination_path)
+            or os.path.samefile(source_path, destination_path)
+            or os.path.getsize(destination_path)
+            > os.path.getsize(source_path)):
+        if os.path.lexists(destination_path):
+            os.remove(destination_path)
+        shutil.copy(source_path, destination_path)
+        return
+
+    destination_size = os.path.getsize(destination_path)
+
+    with open(source_path, "rb") as source_file:
+        source_file.seek(destination_size)
+        with open(destination_path, "ab") as destination_file:
+            shutil.copyfileobj(source_file, destination_file)
 
 
 def remove_old_checkpoints(directory):
@@ -850,7 +1195,8 @@ def parse_numbers_of_samples(proposed_numbers_of_samples):
 def validate_model_parameters(reconstruction_distribution=None,
                               number_of_reconstruction_classes=None,
                               model_type=None, latent_distribution=None,
-                              parameterise_latent_posterior=None):
+                              parameterise_latent_posterior=None,
+                              sparse_reconstruction=None):
 
     # Validate piecewise categorical likelihood
     if reconstruction_distribution and number_of_reconstruction_classes:
@@ -896,6 +1242,19 @@ def validate_model_parameters(reconstruction_distribution=None,
                 )
                 raise ValueError(parameterise_error)
 
+    # Validate sparse evaluation of reconstruction likelihood
+    if reconstruction_distribution and sparse_reconstruction:
+        if reconstruction_distribution not in SPARSE_LOG_PROB_DISTRIBUTIONS:
+            raise ValueError(
+                "Cannot evaluate the likelihood sparsely for the {} "
+                "distribution.".format(reconstruction_distribution)
+            )
+        if number_of_reconstruction_classes:
+            raise ValueError(
+                "Cannot evaluate piecewise categorical likelihoods "
+                "sparsely."
+            )
+
 
 def batch_indices_for_subset(subset):
     batch_indices = subset.batch_indices
@@ -17,28 +17,43 @@
 # ======================================================================== #
 
 import copy
+import functools
 import os
 import shutil
 from time import time
 
 import numpy
-import scipy.sparse
 import tensorflow as tf
 import tensorflow_probability as tfp
 
 from scvae.data.data_set import DataSet
 from scvae.defaults import defaults
 from scvae.distributions import (
-    DISTRIBUTIONS, LATENT_DISTRIBUTIONS, parse_distribution, Categorised)
+    DISTRIBUTIONS, LATENT_DISTRIBUTIONS, parse_distribution, Categorised,
+    sparse_log_prob)
+from scvae.models.checkpoints import CheckpointManager
+from scvae.models.chunking import plan_fetches, run_in_sample_chunks
+from scvae.models.exports import InferenceGraph
+from scvae.models.hooks import ProgressPrinter, RunningEvaluation
+from scvae.models.inputs import (
+    EVALUATION_BUDGETS, InputPipeline, MinibatchProducer,
+    generate_minibatches, minibatch_values,
+    minibatch_values_and_targets, run_minibatches,
+    sparse_placeholder_with_default, split_indices,
+    stack_minibatch_values, subsample_indices)
+from scvae.models.parallel import DataParallelSteps
+from scvae.models.sinks import SparseSubsetBuffer, build_output_sink
 from scvae.models.utilities import (
     dense_layer, dense_layers, log_reduce_exp,
+    sparse_from_dense, tile_sparse_rows,
     build_training_string, build_data_string,
     early_stopping_status, load_learning_curves,
     generate_unique_run_id_for_model, check_run_id,
     correct_model_checkpoint_path, remove_old_checkpoints,
-    copy_model_directory, clear_log_directory,
+    save_model_version, clear_log_directory,
     parse_numbers_of_samples, validate_model_parameters,
-    batch_indices_for_subset)
+    batch_indices_for_subset, restored_session, reconstruction_output,
+    sampled_values_data_type, numbered_names, noise_random_state)
 from scvae.utilities import (
     format_duration, format_time,
     normalise_string, capitalise_string)
@@ -268,6 +283,17 @@ class VariationalAutoencoder:
             if dropout_keep_probabilities and dropout_keep_probabilities != 1:
                 self.dropout_parts.append(str(dropout_keep_probabilities))
 
+        sparse_input = kwargs.get("sparse_input")
+        if sparse_input is None:
+            sparse_input = defaults["models"]["sparse_input"]
+        self.sparse_input = sparse_input
+
+        sparse_reconstruction = kwargs.get("sparse_reconstruction")
+        if sparse_reconstruction is None:
+            sparse_reconstruction = defaults["models"][
+                "sparse_reconstruction"]
+        self.sparse_reconstruction = sparse_reconstruction
+
         count_sum = kwargs.get("count_sum")
         if count_sum is None:
             count_sum = defaults["models"]["count_sum"]
@@ -304,39 +330,61 @@ class VariationalAutoencoder:
             number_of_reconstruction_classes=self.k_max,
             model_type=self.type,
             latent_distribution=self.latent_distribution_name,
-            parameterise_latent_posterior=self.parameterise_latent_posterior
+            parameterise_latent_posterior=self.parameterise_latent_posterior,
+            sparse_reconstruction=self.sparse_reconstruction
         )
 
         with self.graph.as_default():
 
-            self.x = tf.placeholder(
-                dtype=tf.float32,
-                shape=[None, self.feature_size],
-                name="X"
-            )
-            self.t = tf.placeholder(
-                dtype=tf.float32,
-                shape=[None, self.feature_size],
-                name="T"
+            self.input_pipeline = InputPipeline(
+                feature_size=self.feature_size,
+                sparse_values=self.sparse_input,
+                batch_correction=self.batch_correction,
+                count_sum_feature=self.use_count_sum_as_feature,
+                count_sum_parameter=self.use_count_sum_as_parameter
             )
+            pipeline_inputs = self.input_pipeline.inputs
+
+            if self.sparse_input:
+                self.x = sparse_placeholder_with_default(
+                    pipeline_inputs["x"],
+                    feature_size=self.feature_size,
+                    name="X"
+                )
+                self.t = sparse_placeholder_with_default(
+                    pipeline_inputs["t"],
+                    feature_size=self.feature_size,
+                    name="T"
+                )
+            else:
+                self.x = tf.placeholder_with_default(
+                    pipeline_inputs["x"],
+                    shape=[None, self.feature_size],
+                    name="X"
+                )
+                self.t = tf.placeholder_with_default(
+                    pipeline_inputs["t"],
+                    shape=[None, self.feature_size],
+                    name="T"
+                )
 
             if self.batch_correction:
-                self.batch_indices = tf.placeholder(
-                    dtype=tf.int32,
+                self.batch_indices = tf.placeholder_with_default(
+                    pipeline_inputs["batch_indices"],
                     shape=[None, 1],
                     name="batch_indices"
                 )
 
             if self.use_count_sum_as_feature:
-                self.count_sum_feature = tf.placeholder(
-                    dtype=tf.float32,
+                self.count_sum_feature = tf.placeholder_with_default(
+                    pipeline_inputs["count_sum_feature"],
                     shape=[None, 1],
                     name="count_sum_feature"
                 )
 
             if self.use_count_sum_as_parameter:
-                self.count_sum_parameter = tf.placeholder(
-                    dtype=tf.float32,
+                self.count_sum_parameter = tf.placeholder_with_default(
+                    pipeline_inputs["count_sum_parameter"],
                     shape=[None, 1],
                     name="count_sum"
                 )
@@ -408,6 +456,10 @@ class VariationalAutoencoder:
             self._setup_optimiser()
 
             self.saver = tf.train.Saver(max_to_keep=1)
+            self.checkpoint_manager = CheckpointManager(max_to_keep=1)
+
+        # Tensors for sampling added to the graph, when first needed
+        self.reconstruction_outputs = {}
 
     @property
     def name(self):
@@ -543,6 +595,13 @@ class VariationalAutoencoder:
         if self.use_count_sum_as_feature:
             description_parts.append("using count sums")
 
+        if self.sparse_input:
+            description_parts.append("using sparse inputs")
+
+        if self.sparse_reconstruction:
+            description_parts.append(
+                "using sparse evaluation of reconstruction likelihood")
+
         if self.early_stopping_rounds:
             description_parts.append(
                 "early stopping: after {} epoch with no improvements"
@@ -658,6 +717,38 @@ class VariationalAutoencoder:
                 as a separate run with an automatically generated ID.
             reset_training (bool, optional): If ``True``, reset model
                 by removing saved parameters for the model.
+            input_pipeline (bool, optional): If ``True``, prepare
+                minibatches in the background using a prefetching input
+                pipeline instead of feeding them at each step.
+            prefetch_size (int, optional): The number of minibatches
+                prepared in advance by the input pipeline or the
+                producer thread.
+            producer_thread (bool, optional): If ``True``, and if the
+                input pipeline is not used, prepare minibatches in a
+                background thread while the model is run for the
+                current minibatch.
+            hooks (list(StepHook), optional): Hooks called at each step
+                of training in addition to printing progress.
+            evaluation_budget (str, optional): How the model is
+                evaluated on the training and validation sets after
+                each epoch: ``"full"`` evaluation of all examples,
+                ``"subsample"`` evaluation of a fixed random subsample
+                of examples, or ``"running"`` averages of the training
+                steps during the epoch (the validation set is then
+                evaluated using a subsample).
+            evaluation_subsample_size (int, optional): The number of
+                examples in the subsample used for evaluation.
+            asynchronous_checkpoints (bool, optional): If ``True``,
+                write checkpoints in a background thread while training
+                continues.
+            data_parallel_workers (int, optional): If larger than one,
+                split each minibatch into this number of shards, compute
+                the gradients for the shards in parallel, and apply
+                their average. Not possible with minibatch
+                normalisation.
+            data_parallel_reference_steps (int, optional): The number
+                of initial steps also computed without sharding to
+                measure the speed-up of data-parallel training.
         """
 
         if number_of_epochs is None:
@@ -677,6 +768,61 @@ class VariationalAutoencoder:
         if analyses_directory is None:
             analyses_directory = defaults["analyses"]["directory"]
 
+        input_pipeline = kwargs.get("input_pipeline")
+        if input_pipeline is None:
+            input_pipeline = defaults["models"]["input_pipeline"]
+
+        prefetch_size = kwargs.get("prefetch_size")
+        if prefetch_size is None:
+            prefetch_size = defaults["models"]["prefetch_size"]
+
+        producer_thread = kwargs.get("producer_thread")
+        if producer_thread is None:
+            producer_thread = defaults["models"]["producer_thread"]
+
+        evaluation_budget = kwargs.get("evaluation_budget")
+        if evaluation_budget is None:
+            evaluation_budget = defaults["models"]["evaluation_budget"]
+        if evaluation_budget not in EVALUATION_BUDGETS:
+            raise ValueError(
+                "Evaluation budget `{}` not found.".format(evaluation_budget))
+
+        evaluation_subsample_size = kwargs.get("evaluation_subsample_size")
+        if evaluation_subsample_size is None:
+            evaluation_subsample_size = defaults["models"][
+                "evaluation_subsample_size"]
+
+        asynchronous_checkpoints = kwargs.get("asynchronous_checkpoints")
+        if asynchronous_checkpoints is None:
+            asynchronous_checkpoints = defaults["models"][
+                "asynchronous_checkpoints"]
+
+        data_parallel_workers = kwargs.get("data_parallel_workers")
+        if data_parallel_workers is None:
+            data_parallel_workers = defaults["models"][
+                "data_parallel_workers"]
+        data_parallel_reference_steps = kwargs.get(
+            "data_parallel_reference_steps")
+        if data_parallel_reference_steps is None:
+            data_parallel_reference_steps = defaults["models"][
+                "data_parallel_reference_steps"]
+        if data_parallel_workers > 1 and input_pipeline:
+            raise ValueError(
+                "Data-parallel training cannot be used together with the "
+                "input pipeline."
+            )
+        if data_parallel_workers > 1 and evaluation_budget == "running":
+            raise ValueError(
+                "Data-parallel training cannot be used together with the "
+                "running evaluation budget."
+            )
+        if data_parallel_workers > 1 and self.minibatch_normalisation:
+            raise ValueError(
+                "Data-parallel training cannot be used together with "
+                "minibatch normalisation, since each shard would be "
+                "normalised separately."
+            )
+
         start_time = time()
 
         if run_id is None:
@@ -814,18 +960,24 @@ class VariationalAutoencoder:
         preparing_data_time_start = time()
 
         # Batch indices for batch correction
+        batch_indices_train = None
+        batch_indices_valid = None
         if self.batch_correction:
             batch_indices_train = batch_indices_for_subset(training_set)
             if validation_set:
                 batch_indices_valid = batch_indices_for_subset(validation_set)
 
         # Count sum for distributions
+        count_sum_parameter_train = None
+        count_sum_parameter_valid = None
         if self.use_count_sum_as_parameter:
             count_sum_parameter_train = training_set.count_sum
             if validation_set:
                 count_sum_parameter_valid = validation_set.count_sum
 
         # Normalised count sum as a feature to the decoder
+        count_sum_feature_train = None
+        count_sum_feature_valid = None
         if self.use_count_sum_as_feature:
             count_sum_feature_train = training_set.normalised_count_sum
             if validation_set:
@@ -836,7 +988,7 @@ class VariationalAutoencoder:
         if validation_set:
             n_examples_valid = validation_set.number_of_examples
 
-        # Preprocessing function at every epoch
+        # Noisy preprocessing function applied to every minibatch
         noisy_preprocess = training_set.noisy_preprocess
 
         # Input and output
@@ -860,14 +1012,77 @@ class VariationalAutoencoder:
                 if validation_set:
                     t_valid = validation_set.values
 
+        else:
+            # Deterministic noisy preprocessing is applied once, and the
+            # random part to each minibatch as it is drawn using a random
+            # stream seeded by the run and the epoch
+            x_train = t_train = training_set.noisy_values
+            if validation_set:
+                x_valid = t_valid = validation_set.noisy_values
+
         preparing_data_duration = time() - preparing_data_time_start
         print("Data prepared ({}).".format(format_duration(
             preparing_data_duration)))
         print()
 
-        # Display intervals during every epoch
+        # Hooks called at every step including printing of progress at
+        # intervals during every epoch
         steps_per_epoch = numpy.ceil(n_examples_train / minibatch_size)
-        output_at_step = numpy.round(numpy.linspace(0, steps_per_epoch, 11))
+        hooks = [ProgressPrinter(steps_per_epoch)]
+        hooks.extend(kwargs.get("hooks") or [])
+
+        # Tensors and examples used for evaluation after every epoch
+        minibatch_inputs = {"x": self.x, "t": self.t}
+        if self.batch_correction:
+            minibatch_inputs["batch_indices"] = self.batch_indices
+        if self.use_count_sum_as_parameter:
+            minibatch_inputs["count_sum_parameter"] = (
+                self.count_sum_parameter)
+        if self.use_count_sum_as_feature:
+            minibatch_inputs["count_sum_feature"] = self.count_sum_feature
+
+        evaluation_feed_dict = {
+            self.is_training: False,
+            self.use_deterministic_z: False,
+            self.warm_up_weight: 1.0,
+            self.number_of_iw_samples:
+                self.number_of_importance_samples["training"],
+            self.number_of_mc_samples:
+                self.number_of_monte_carlo_samples["training"]
+        }
+
+        training_evaluation_fetches = [
+            self.lower_bound,
+            self.kl_divergence,
+            self.reconstruction_error,
+            self.q_z_mean,
+            self.kl_divergence_neurons
+        ]
+        validation_evaluation_fetches = training_evaluation_fetches[:-1]
+
+        evaluation_indices_train = numpy.arange(n_examples_train)
+        if validation_set:
+            evaluation_indices_valid = numpy.arange(n_examples_valid)
+
+        if evaluation_budget == "running":
+            running_evaluation = RunningEvaluation(
+                training_evaluation_fetches)
+            hooks.append(running_evaluation)
+        elif evaluation_budget == "subsample":
+            evaluation_indices_train = subsample_indices(
+                n_examples_train, evaluation_subsample_size)
+
+        if evaluation_budget != "full" and validation_set:
+            evaluation_indices_valid = subsample_indices(
+                n_examples_valid, evaluation_subsample_size)
+
+        if data_parallel_workers > 1:
+            data_parallel_steps = DataParallelSteps(
+                self, data_parallel_workers,
+                number_of_reference_steps=data_parallel_reference_steps
+            )
+        else:
+            data_parallel_steps = None
 
         # Initialising lists for learning curves
         learning_curves = {
@@ -955,24 +1170,10 @@ class VariationalAutoencoder:
             print()
             training_time_start = time()
 
-            for epoch in range(epoch_start, number_of_epochs):
-
-                if noisy_preprocess:
-                    print("Noisily preprocess values.")
-                    noisy_time_start = time()
+            for hook in hooks:
+                hook.begin(self, session)
 
-                    x_train = noisy_preprocess(training_set.values)
-                    t_train = x_train
-
-                    if validation_set:
-                        x_valid = noisy_preprocess(
-                            validation_set.values)
-                        t_valid = x_valid
-
-                    noisy_duration = time() - noisy_time_start
-                    print("Values noisily preprocessed ({}).".format(
-                        format_duration(noisy_duration)))
-                    print()
+            for epoch in range(epoch_start, number_of_epochs):
 
                 epoch_time_start = time()
 
@@ -984,22 +1185,53 @@ class VariationalAutoencoder:
 
                 shuffled_indices = numpy.random.permutation(n_examples_train)
 
+                # Track steps locally instead of at every step
+                step = int(session.run(self.global_step))
+
+                for hook in hooks:
+                    hook.before_epoch(epoch)
+                minibatch_producer = None
+
+                if input_pipeline:
+                    self.input_pipeline.initialise(
+                        session,
+                        values=x_train,
+                        targets=t_train,
+                        indices=shuffled_indices,
+                        minibatch_size=minibatch_size,
+                        batch_indices=batch_indices_train,
+                        count_sum_feature=count_sum_feature_train,
+                        count_sum_parameter=count_sum_parameter_train,
+                        prefetch_size=prefetch_size,
+                        preprocess=noisy_preprocess,
+                        random_state=noise_random_state(
+                            self, epoch, "training", run_id=run_id)
+                    )
+                else:
+                    minibatches = generate_minibatches(
+                        values=x_train,
+                        targets=t_train,
+                        indices=shuffled_indices,
+                        minibatch_size=minibatch_size,
+                        sparse=self.sparse_input,
+                        batch_indices=batch_indices_train,
+                        count_sum_feature=count_sum_feature_train,
+                        count_sum_parameter=count_sum_parameter_train,
+                        preprocess=noisy_preprocess,
+                        random_state=noise_random_state(
+                            self, epoch, "training", run_id=run_id)
+                    )
+                    if producer_thread:
+                        minibatch_producer = MinibatchProducer(
+                            minibatches, queue_size=prefetch_size)
+                        minibatches = minibatch_producer
+
                 for i in range(0, n_examples_train, minibatch_size):
 
                     # Internal setup
                     step_time_start = time()
-                    step = session.run(self.global_step)
-
-                    # Prepare minibatch
-                    minibatch_indices = shuffled_indices[
-                        i:(i + minibatch_size)]
-
-                    x_batch = x_train[minibatch_indices].toarray()
-                    t_batch = t_train[minibatch_indices].toarray()
 
                     feed_dict_batch = {
-                        self.x: x_batch,
-                        self.t: t_batch,
                         self.is_training: True,
                         self.use_deterministic_z: False,
                         self.learning_rate: learning_rate,
@@ -1010,38 +1242,55 @@ class VariationalAutoencoder:
                             self.number_of_monte_carlo_samples["training"]
                     }
 
-                    if self.batch_correction:
-                        feed_dict_batch[self.batch_indices] = (
-                            batch_indices_train[minibatch_indices])
+                    # Prepare minibatch, unless the input pipeline does
+                    if not input_pipeline:
+
+                        minibatch = next(minibatches)
+
+                        feed_dict_batch[self.x] = minibatch["x"]
+                        feed_dict_batch[self.t] = minibatch["t"]
+
+                        if self.batch_correction:
+                            feed_dict_batch[self.batch_indices] = (
+                                minibatch["batch_indices"])
 
-                    if self.use_count_sum_as_parameter:
-                        feed_dict_batch[self.count_sum_parameter] = (
-                            count_sum_parameter_train[minibatch_indices])
+                        if self.use_count_sum_as_parameter:
+                            feed_dict_batch[self.count_sum_parameter] = (
+                                minibatch["count_sum_parameter"])
 
-                    if self.use_count_sum_as_feature:
-                        feed_dict_batch[self.count_sum_feature] = (
-                            count_sum_feature_train[minibatch_indices])
+                        if self.use_count_sum_as_feature:
+                            feed_dict_batch[self.count_sum_feature] = (
+                                minibatch["count_sum_feature"])
 
                     # Run the stochastic minibatch training operation
-                    _, minibatch_loss = session.run(
-                        [self.optimiser, self.lower_bound],
-                        feed_dict=feed_dict_batch
-                    )
+                    # together with tensors requested by hooks
+                    hook_fetches = [
+                        hook.before_step(step) or {} for hook in hooks]
+                    if data_parallel_steps:
+                        minibatch_loss, hook_results = (
+                            data_parallel_steps.run(
+                                session,
+                                feed_dict=feed_dict_batch,
+                                minibatch=minibatch,
+                                inputs=minibatch_inputs,
+                                fetches=hook_fetches
+                            )
+                        )
+                    else:
+                        _, minibatch_loss, hook_results = session.run(
+                            [self.optimiser, self.lower_bound, hook_fetches],
+                            feed_dict=feed_dict_batch
+                        )
+                    step += 1
 
                     # Compute step duration
                     step_duration = time() - step_time_start
 
-                    # Print evaluation and output summaries
-                    if (step + 1 - steps_per_epoch * epoch) in output_at_step:
-
-                        print("Step {:d} ({}): {:.5g}.".format(
-                            int(step + 1), format_duration(step_duration),
-                            minibatch_loss))
-
-                        if numpy.isnan(minibatch_loss):
-                            raise ArithmeticError(
-                                "Aborting. The ELBO for the last batch became "
-                                "indefinite.")
+                    for hook, results in zip(hooks, hook_results):
+                        hook.after_step(
+                            step, epoch, minibatch_loss, step_duration,
+                            results=results
+                        )
 
                 print()
 
@@ -1050,6 +1299,26 @@ class VariationalAutoencoder:
                 print("Epoch {} ({}):".format(
                     epoch + 1, format_duration(epoch_duration)))
 
+                for hook in hooks:
+                    hook.after_epoch(epoch, epoch_duration)
+
+                # Time spent waiting for minibatches from producer thread
+                if minibatch_producer:
+                    minibatch_producer.close()
+                    print("    Input stall time: {}.".format(
+                        format_duration(minibatch_producer.stall_duration)))
+
+                if (data_parallel_steps
+                        and not numpy.isnan(data_parallel_steps.speed_up)):
+                    print(
+                        "    Data-parallel speed-up:",
+                        "{:.2f} with {} workers.".format(
+                            data_parallel_steps.speed_up,
+                            data_parallel_steps.number_of_workers
+                        )
+                    )
+                    data_parallel_steps.reset()
+
                 # With warmup or not
                 if warm_up_weight < 1:
                     print("    Warm-up weight: {:.2g}".format(warm_up_weight))
@@ -1089,34 +1358,31 @@ class VariationalAutoencoder:
                 else:
                     kl_divergence_neurons = numpy.zeros(shape=self.latent_size)
 
-                for i in range(0, n_examples_train, minibatch_size):
-                    subset = slice(
-                        i, min(i + minibatch_size, n_examples_train))
-                    x_batch = x_train[subset].toarray()
-                    t_batch = t_train[subset].toarray()
-                    feed_dict_batch = {
-                        self.x: x_batch,
-                        self.t: t_batch,
-                        self.is_training: False,
-                        self.use_deterministic_z: False,
-                        self.warm_up_weight: 1.0,
-                        self.number_of_iw_samples:
-                            self.number_of_importance_samples["training"],
-                        self.number_of_mc_samples:
-                            self.number_of_monte_carlo_samples["training"]
-                    }
-
-                    if self.batch_correction:
-                        feed_dict_batch[self.batch_indices] = (
-                            batch_indices_train[subset])
-
-                    if self.use_count_sum_as_parameter:
-                        feed_dict_batch[self.count_sum_parameter] = (
-                            count_sum_parameter_train[subset])
+                if evaluation_budget == "running":
+                    training_evaluations = zip(
+                        split_indices(shuffled_indices, minibatch_size),
+                        running_evaluation.results
+                    )
+                else:
+                    training_evaluations = run_minibatches(
+                        session,
+                        training_evaluation_fetches,
+                        inputs=minibatch_inputs,
+                        values=x_train,
+                        targets=t_train,
+                        indices=evaluation_indices_train,
+                        minibatch_size=minibatch_size,
+                        sparse=self.sparse_input,
+                        feed_dict=evaluation_feed_dict,
+                        batch_indices=batch_indices_train,
+                        count_sum_feature=count_sum_feature_train,
+                        count_sum_parameter=count_sum_parameter_train,
+                        preprocess=noisy_preprocess,
+                        random_state=noise_random_state(
+                            self, epoch, "evaluation", run_id=run_id)
+                    )
 
-                    if self.use_count_sum_as_feature:
-                        feed_dict_batch[self.count_sum_feature] = (
-                            count_sum_feature_train[subset])
+                for subset, evaluation_results in training_evaluations:
 
                     (
                         lower_bound_i,
@@ -1124,16 +1390,7 @@ class VariationalAutoencoder:
                         reconstruction_error_i,
                         q_z_mean_i,
                         kl_divergence_neurons_i
-                    ) = session.run(
-                        [
-                            self.lower_bound,
-                            self.kl_divergence,
-                            self.reconstruction_error,
-                            self.q_z_mean,
-                            self.kl_divergence_neurons
-                        ],
-                        feed_dict=feed_dict_batch
-                    )
+                    ) = evaluation_results
 
                     lower_bound_train += lower_bound_i
                     kl_divergence_train += kl_divergence_i
@@ -1143,11 +1400,14 @@ class VariationalAutoencoder:
 
                     kl_divergence_neurons += kl_divergence_neurons_i
 
-                lower_bound_train /= n_examples_train / minibatch_size
-                kl_divergence_train /= n_examples_train / minibatch_size
-                reconstruction_error_train /= n_examples_train / minibatch_size
+                n_evaluated_train = evaluation_indices_train.size
 
-                kl_divergence_neurons /= n_examples_train / minibatch_size
+                lower_bound_train /= n_evaluated_train / minibatch_size
+                kl_divergence_train /= n_evaluated_train / minibatch_size
+                reconstruction_error_train /= (
+                    n_evaluated_train / minibatch_size)
+
+                kl_divergence_neurons /= n_evaluated_train / minibatch_size
 
                 if numpy.isnan(lower_bound_train):
                     raise ArithmeticError(
@@ -1248,49 +1508,32 @@ class VariationalAutoencoder:
                         dtype=numpy.float32
                     )
 
-                    for i in range(0, n_examples_valid, minibatch_size):
-                        subset = slice(
-                            i, min(i + minibatch_size, n_examples_valid))
-                        x_batch = x_valid[subset].toarray()
-                        t_batch = t_valid[subset].toarray()
-                        feed_dict_batch = {
-                            self.x: x_batch,
-                            self.t: t_batch,
-                            self.is_training: False,
-                            self.use_deterministic_z: False,
-                            self.warm_up_weight: 1.0,
-                            self.number_of_iw_samples:
-                                self.number_of_importance_samples["training"],
-                            self.number_of_mc_samples:
-                                self.number_of_monte_carlo_samples["training"]
-                        }
-
-                        if self.batch_correction:
-                            feed_dict_batch[self.batch_indices] = (
-                                batch_indices_valid[subset])
-
-                        if self.use_count_sum_as_parameter:
-                            feed_dict_batch[self.count_sum_parameter] = (
-                                count_sum_parameter_valid[subset])
+                    validation_evaluations = run_minibatches(
+                        session,
+                        validation_evaluation_fetches,
+                        inputs=minibatch_inputs,
+                        values=x_valid,
+                        targets=t_valid,
+                        indices=evaluation_indices_valid,
+                        minibatch_size=minibatch_size,
+                        sparse=self.sparse_input,
+                        feed_dict=evaluation_feed_dict,
+                        batch_indices=batch_indices_valid,
+                        count_sum_feature=count_sum_feature_valid,
+                        count_sum_parameter=count_sum_parameter_valid,
+                        preprocess=noisy_preprocess,
+                        random_state=noise_random_state(
+                            self, epoch, "evaluation", run_id=run_id)
+                    )
 
-                        if self.use_count_sum_as_feature:
-                            feed_dict_batch[self.count_sum_feature] = (
-                                count_sum_feature_valid[subset])
+                    for subset, evaluation_results in validation_evaluations:
 
                         (
                             lower_bound_i,
                             kl_divergence_i,
                             reconstruction_error_i,
                             q_z_mean_i
-                        ) = session.run(
-                            [
-                                self.lower_bound,
-                                self.kl_divergence,
-                                self.reconstruction_error,
-                                self.q_z_mean
-                            ],
-                            feed_dict=feed_dict_batch
-                        )
+                        ) = evaluation_results
 
                         lower_bound_valid += lower_bound_i
                         kl_divergence_valid += kl_divergence_i
@@ -1298,10 +1541,12 @@ class VariationalAutoencoder:
 
                         q_z_mean_valid[subset] = q_z_mean_i
 
-                    lower_bound_valid /= n_examples_valid / minibatch_size
-                    kl_divergence_valid /= n_examples_valid / minibatch_size
+                    n_evaluated_valid = evaluation_indices_valid.size
+
+                    lower_bound_valid /= n_evaluated_valid / minibatch_size
+                    kl_divergence_valid /= n_evaluated_valid / minibatch_size
                     reconstruction_error_valid /= (
-                        n_examples_valid / minibatch_size)
+                        n_evaluated_valid / minibatch_size)
 
                     if numpy.isnan(lower_bound_valid):
                         raise ArithmeticError(
@@ -1398,13 +1643,11 @@ class VariationalAutoencoder:
                             saving_time_start = time()
                             lower_bound_valid_early_stopping = (
                                 lower_bound_valid)
-                            current_checkpoint = tf.train.get_checkpoint_state(
-                                    log_directory)
-                            if current_checkpoint:
-                                copy_model_directory(
-                                    current_checkpoint,
-                                    early_stopping_log_directory
-                                )
+                            self.checkpoint_manager.wait()
+                            save_model_version(
+                                log_directory,
+                                early_stopping_log_directory
+                            )
                             saving_duration = time() - saving_time_start
                             print(
                                 "        "
@@ -1440,37 +1683,43 @@ class VariationalAutoencoder:
                         self.stopped_early = True
                         epochs_with_no_improvement = numpy.nan
 
-                # Saving model parameters (update checkpoint)
-                print("    Saving model parameters.")
+                # Saving model parameters (update checkpoint) and, if
+                # best yet, recording them as best model parameters
+                best_model_yet = (
+                    validation_set
+                    and lower_bound_valid > lower_bound_valid_maximum
+                )
+                if best_model_yet:
+                    print(
+                        "    Best validation lower_bound yet.",
+                        "Saving model parameters as best model parameters."
+                    )
+                    lower_bound_valid_maximum = lower_bound_valid
+                    saving_callback = functools.partial(
+                        save_model_version,
+                        log_directory,
+                        best_model_log_directory
+                    )
+                else:
+                    print("    Saving model parameters.")
+                    saving_callback = None
                 saving_time_start = time()
-                self.saver.save(
+                self.checkpoint_manager.save(
                     session,
                     checkpoint_file,
-                    global_step=epoch + 1
+                    global_step=epoch + 1,
+                    asynchronous=asynchronous_checkpoints,
+                    callback=saving_callback
                 )
                 saving_duration = time() - saving_time_start
-                print("    Model parameters saved ({}).".format(
-                    format_duration(saving_duration)))
-
-                # Saving best model parameters yet
-                if (validation_set
-                        and lower_bound_valid > lower_bound_valid_maximum):
+                if asynchronous_checkpoints:
                     print(
-                        "    Best validation lower_bound yet.",
-                        "Saving model parameters as best model parameters."
+                        "    Model parameters snapshotted ({});".format(
+                            format_duration(saving_duration)),
+                        "saving in background."
                     )
-                    saving_time_start = time()
-                    lower_bound_valid_maximum = lower_bound_valid
-                    current_checkpoint = (
-                        tf.train.get_checkpoint_state(log_directory))
-                    if current_checkpoint:
-                        copy_model_directory(
-                            current_checkpoint,
-                            best_model_log_directory
-                        )
-                    remove_old_checkpoints(best_model_log_directory)
-                    saving_duration = time() - saving_time_start
-                    print("    Best model parameters saved ({}).".format(
+                else:
+                    print("    Model parameters saved ({}).".format(
                         format_duration(saving_duration)))
 
                 print()
@@ -1514,12 +1763,19 @@ class VariationalAutoencoder:
                         else:
                             centroids = None
 
-                        if validation_set:
+                        # Latent values are only available for whole data
+                        # sets, when these are fully evaluated
+                        if (validation_set and evaluation_indices_valid.size
+                                == n_examples_valid):
                             intermediate_latent_values = q_z_mean_valid
                             intermediate_data_set = validation_set
-                        else:
+                        elif (evaluation_indices_train.size
+                                == n_examples_train):
                             intermediate_latent_values = q_z_mean_train
                             intermediate_data_set = training_set
+                        else:
+                            intermediate_latent_values = None
+                            intermediate_data_set = None
 
                         intermediate_analyser(
                             epoch=epoch,
@@ -1546,6 +1802,14 @@ class VariationalAutoencoder:
                         )
                         print()
 
+            for hook in hooks:
+                hook.end()
+
+            if data_parallel_steps:
+                data_parallel_steps.close()
+
+            self.checkpoint_manager.wait()
+
             training_duration = time() - training_time_start
 
             print("{} trained for {} epochs ({}).".format(
@@ -1599,7 +1863,8 @@ class VariationalAutoencoder:
             return 0
 
     def sample(self, sample_size=None, minibatch_size=None, run_id=None,
-               use_early_stopping_model=False, use_best_model=False):
+               use_early_stopping_model=False, use_best_model=False,
+               session=None, **kwargs):
         """Sample from trained model.
 
         Arguments:
@@ -1615,6 +1880,21 @@ class VariationalAutoencoder:
             use_best_model (bool, optional): If ``True``, use model
                 parameters, which resulted in the best performance on
                 validation set during training. Defaults to ``False``.
+            session (tf.Session, optional): Open session, in which the
+                model parameters have already been restored, for
+                example, by a model server. By default, a new session
+                is opened and the parameters are restored.
+            output_sink (str, optional): Where samples are written
+                while sampling: ``"memory"`` (in-memory arrays),
+                ``"npy"`` (memory-mapped NumPy files), or ``"hdf5"``
+                (chunked HDF5 files).
+            output_directory (str, optional): Directory for files
+                written by file-based output sinks. Defaults to a
+                subdirectory of the log directory of the model.
+            draw_counts (bool, optional): If ``True``, draw values from
+                the reconstruction distribution, which are integer
+                counts for count distributions, instead of using its
+                means.
 
         Returns:
             A data set of generated examples/cells as well as a
@@ -1627,6 +1907,14 @@ class VariationalAutoencoder:
         if minibatch_size is None:
             minibatch_size = defaults["models"]["minibatch_size"]
 
+        output_sink = kwargs.get("output_sink")
+        if output_sink is None:
+            output_sink = defaults["models"]["output_sink"]
+
+        draw_counts = kwargs.get("draw_counts")
+        if draw_counts is None:
+            draw_counts = defaults["models"]["draw_counts"]
+
         if run_id is None:
             run_id = defaults["models"]["run_id"]
         if run_id:
@@ -1654,34 +1942,38 @@ class VariationalAutoencoder:
             best_model=use_best_model
         )
 
-        checkpoint = tf.train.get_checkpoint_state(log_directory)
+        output_directory = kwargs.get("output_directory")
+        if output_directory is None:
+            output_directory = os.path.join(log_directory, "samples")
 
-        with tf.Session(graph=self.graph) as session:
+        if draw_counts:
+            x_version = "drawn"
+        else:
+            x_version = "reconstructed"
 
-            if checkpoint:
-                model_checkpoint_path = correct_model_checkpoint_path(
-                    checkpoint.model_checkpoint_path,
-                    log_directory
-                )
-                self.saver.restore(session, model_checkpoint_path)
-            else:
-                raise Exception(
-                    "Cannot evaluate {} when it has not been trained.".format(
-                        model_string)
-                )
+        x_samples_output = reconstruction_output(
+            self, self.p_x_given_z, draw_counts=draw_counts)
+
+        with restored_session(self, log_directory, model_string,
+                              session=session) as session:
 
             print("Sampling {} examples from {}.".format(
                 sample_size, model_string))
             sampling_time_start = time()
 
-            z_samples = numpy.empty(
+            z_samples = build_output_sink(
+                output_sink,
                 shape=(sample_size, self.latent_size),
-                dtype=numpy.float32
+                name="sample-latent-values",
+                directory=output_directory
             )
 
-            x_mean = numpy.empty(
+            x_samples = build_output_sink(
+                output_sink,
                 shape=(sample_size, self.feature_size),
-                dtype=numpy.float32
+                name="sample-{}-values".format(x_version),
+                directory=output_directory,
+                dtype=sampled_values_data_type(self, draw_counts)
             )
 
             for i in range(0, sample_size, minibatch_size):
@@ -1693,33 +1985,24 @@ class VariationalAutoencoder:
                 z_samples_i = session.run(
                     self.p_z_samples,
                     feed_dict={self.sample_size: minibatch_sample_size}
-                )
-                z_samples[indices] = z_samples_i
+                ).reshape(-1, self.latent_size)
+                z_samples.write(indices, z_samples_i)
 
                 feed_dict_batch = {
-                    self.z: z_samples[indices],
+                    self.z: z_samples_i,
                     self.is_training: False,
                     self.number_of_iw_samples: 1,
                     self.number_of_mc_samples: 1
                 }
 
-                # if self.batch_correction:
-                #     feed_dict_batch[self.batch_indices] = (
-                #         batch_indices_samples[indices])
-
-                # if self.use_count_sum_as_parameter:
-                #     feed_dict_batch[self.count_sum_parameter] = (
-                #         count_sum_parameter_samples[indices])
-
-                # if self.use_count_sum_as_feature:
-                #     feed_dict_batch[self.count_sum_feature] = (
-                #         count_sum_feature_samples[indices])
-
-                x_mean_i = session.run(
-                    self.p_x_mean,
+                x_samples_i = session.run(
+                    x_samples_output,
                     feed_dict=feed_dict_batch
                 )
-                x_mean[indices] = x_mean_i
+                x_samples.write(indices, x_samples_i)
+
+            z_samples.close()
+            x_samples.close()
 
             sampling_duration = time() - sampling_time_start
 
@@ -1732,16 +2015,14 @@ class VariationalAutoencoder:
             title = "Sampled data set"
             name = normalise_string(title)
             specifications = dict()
-            sample_names = numpy.array([
-                "sample {}".format(i + 1) for i in range(sample_size)])
-            feature_names = numpy.array([
-                "feature {}".format(i + 1) for i in range(self.feature_size)])
+            sample_names = numbered_names("sample", sample_size)
+            feature_names = numbered_names("feature", self.feature_size)
 
             sample_reconstruction_set = DataSet(
                 name,
                 title=title,
                 specifications=specifications,
-                values=x_mean,
+                values=x_samples.values,
                 preprocessed_values=None,
                 labels=None,
                 example_names=sample_names,
@@ -1751,19 +2032,19 @@ class VariationalAutoencoder:
                 example_filter=None,
                 preprocessing_methods=None,
                 kind="sample",
-                version="reconstructed"
+                version=x_version
             )
 
             sample_z_set = DataSet(
                 name,
                 title=title,
                 specifications=specifications,
-                values=z_samples,
+                values=z_samples.values,
                 preprocessed_values=None,
                 labels=None,
                 example_names=sample_names,
-                feature_names=numpy.array(["latent variable {}".format(
-                    i + 1) for i in range(self.latent_size)]),
+                feature_names=numbered_names(
+                    "latent variable", self.latent_size),
                 batch_indices=batch_indices_samples,
                 feature_selection=None,
                 example_filter=None,
@@ -1795,6 +2076,30 @@ class VariationalAutoencoder:
             use_best_model (bool, optional): If ``True``, use model
                 parameters, which resulted in the best performance on
                 validation set during training. Defaults to ``False``.
+            sample_chunk_size (int, optional): If given, keep the
+                minibatch size and evaluate the importance-weighted and
+                Monte Carlo samples for each minibatch in chunks of at
+                most this number of samples.
+            output_sink (str, optional): Where reconstructions and
+                latent means are written during evaluation:
+                ``"memory"`` (in-memory arrays), ``"npy"``
+                (memory-mapped NumPy files), or ``"hdf5"`` (chunked HDF5
+                files).
+            output_directory (str, optional): Directory for files
+                written by file-based output sinks. Defaults to a
+                subdirectory of the log directory of the model.
+            output_name (str, optional): Name used as prefix for files
+                written by file-based output sinks, which should differ
+                between evaluations of the same model whose outputs are
+                used at the same time. Defaults to the kind of the
+                evaluation set.
+            shared_minibatches (optional): Reader of minibatches shared
+                with evaluations of other model versions, as used by
+                `evaluate_ensemble`. Not used with noisy preprocessing.
+            use_inference_graph (bool, optional): If ``True``, evaluate
+                using the inference graph exported for the model
+                version (see `export_inference_graph`) instead of the
+                model graph.
 
         Returns:
             A data set of reconstructed examples/cells as well as a
@@ -1838,13 +2143,30 @@ class VariationalAutoencoder:
         if evaluation_subset_indices is None:
             evaluation_subset_indices = set()
 
+        sample_chunk_size = kwargs.get("sample_chunk_size")
+        if sample_chunk_size is None:
+            sample_chunk_size = defaults["models"]["sample_chunk_size"]
+
+        output_sink = kwargs.get("output_sink")
+        if output_sink is None:
+            output_sink = defaults["models"]["output_sink"]
+
+        shared_minibatches = kwargs.get("shared_minibatches")
+
+        use_inference_graph = kwargs.get("use_inference_graph")
+        if use_inference_graph is None:
+            use_inference_graph = defaults["models"]["use_inference_graph"]
+
         evaluation_set_transformed = False
 
-        minibatch_size /= (
-            self.number_of_importance_samples["evaluation"]
-            * self.number_of_monte_carlo_samples["evaluation"]
-        )
-        minibatch_size = int(numpy.ceil(minibatch_size))
+        # Unless samples are evaluated in chunks, all samples are
+        # evaluated at once, so fewer examples fit in each minibatch
+        if not sample_chunk_size:
+            minibatch_size /= (
+                self.number_of_importance_samples["evaluation"]
+                * self.number_of_monte_carlo_samples["evaluation"]
+            )
+            minibatch_size = int(numpy.ceil(minibatch_size))
 
         if self.batch_correction:
             batch_indices_eval = batch_indices_for_subset(evaluation_set)
@@ -1874,15 +2196,11 @@ class VariationalAutoencoder:
                 t_eval = evaluation_set.values
 
         else:
-            print("Noisily preprocess values.")
-            noisy_time_start = time()
-            x_eval = noisy_preprocess(evaluation_set.values)
-            t_eval = x_eval
+            # Random noisy preprocessing is applied to each minibatch, and
+            # these are only kept for the transformed data set
+            x_eval = evaluation_set.noisy_values
+            t_eval = None
             evaluation_set_transformed = True
-            noisy_duration = time() - noisy_time_start
-            print("Values noisily preprocessed ({}).".format(
-                format_duration(noisy_duration)))
-            print()
 
         # max_count = int(max(t_eval, axis = (0, 1)))
 
@@ -1894,13 +2212,33 @@ class VariationalAutoencoder:
 
         checkpoint = tf.train.get_checkpoint_state(log_directory)
 
+        output_directory = kwargs.get("output_directory")
+        if output_directory is None:
+            output_directory = os.path.join(log_directory, "outputs")
+
+        output_name = kwargs.get("output_name")
+        if output_name is None:
+            output_name = evaluation_set.kind
+
+        if use_inference_graph:
+            if sample_chunk_size:
+                raise ValueError(
+                    "Cannot evaluate samples in chunks using an inference "
+                    "graph, since its numbers of samples are fixed."
+                )
+            inference_graph = InferenceGraph.load(log_directory)
+            evaluation_session = inference_graph.session()
+        else:
+            inference_graph = None
+            evaluation_session = tf.Session(graph=self.graph)
+
         log_results = kwargs.get("log_results", True)
         if log_results:
             eval_summary_directory = os.path.join(log_directory, "evaluation")
             if os.path.exists(eval_summary_directory):
                 shutil.rmtree(eval_summary_directory)
 
-        with tf.Session(graph=self.graph) as session:
+        with evaluation_session as session:
 
             if log_results:
                 eval_summary_writer = tf.summary.FileWriter(
@@ -1911,9 +2249,17 @@ class VariationalAutoencoder:
                     checkpoint.model_checkpoint_path,
                     log_directory
                 )
-                self.saver.restore(session, model_checkpoint_path)
                 epoch = int(
                     os.path.split(model_checkpoint_path)[-1].split("-")[-1])
+                if inference_graph is None:
+                    self.saver.restore(session, model_checkpoint_path)
+                elif inference_graph.epoch != epoch:
+                    raise ValueError(
+                        "The inference graph was exported at epoch {}, but "
+                        "the {} has been trained for {} epochs. Export the "
+                        "inference graph again.".format(
+                            inference_graph.epoch, model_string, epoch)
+                    )
             else:
                 raise Exception(
                     "Cannot evaluate {} when it has not been trained.".format(
@@ -1937,23 +2283,27 @@ class VariationalAutoencoder:
                     kl_divergence_neurons = numpy.zeros(shape=self.latent_size)
 
             if "reconstructed" in output_versions:
-                p_x_mean_eval = numpy.empty(
+                p_x_mean_eval = build_output_sink(
+                    output_sink,
                     shape=(n_examples_eval, n_features_eval),
-                    dtype=numpy.float32
+                    name="{}-reconstructed-values".format(output_name),
+                    directory=output_directory
                 )
-                p_x_stddev_eval = scipy.sparse.lil_matrix(
+                p_x_stddev_eval = SparseSubsetBuffer(
                     (n_examples_eval, n_features_eval),
-                    dtype=numpy.float32
+                    evaluation_subset_indices
                 )
-                stddev_of_p_x_mean_eval = scipy.sparse.lil_matrix(
+                stddev_of_p_x_mean_eval = SparseSubsetBuffer(
                     (n_examples_eval, n_features_eval),
-                    dtype=numpy.float32
+                    evaluation_subset_indices
                 )
 
             if "latent" in output_versions:
-                q_z_mean_eval = numpy.empty(
+                q_z_mean_eval = build_output_sink(
+                    output_sink,
                     shape=(n_examples_eval, self.latent_size),
-                    dtype=numpy.float32
+                    name="{}-latent-values".format(output_name),
+                    directory=output_directory
                 )
 
             use_deterministic_z = kwargs.get("use_deterministic_z", False)
@@ -1966,6 +2316,54 @@ class VariationalAutoencoder:
                 number_of_mc_samples = self.number_of_monte_carlo_samples[
                     "evaluation"]
 
+            # Tensors evaluated for each minibatch together with how
+            # their results are combined when evaluating chunks of samples
+            evaluation_fetches = {
+                "lower_bound_estimates": (
+                    self.lower_bound_estimates, "log_mean_exp"),
+                "kl_divergence": (self.kl_divergence, "mean"),
+                "reconstruction_error": (self.reconstruction_error, "mean"),
+                "p_x_mean": (self.p_x_mean, "mean"),
+                "p_x_stddev": (self.p_x_stddev, ("stddev", "p_x_mean")),
+                "stddev_of_p_x_given_z_mean": (
+                    self.stddev_of_p_x_given_z_mean, ("stddev", "p_x_mean")),
+                "q_z_mean": (self.q_z_mean, "constant"),
+                "kl_divergence_neurons": (self.kl_divergence_neurons, "mean")
+            }
+
+            # Only tensors required for the requested outputs are run,
+            # and standard deviations of reconstructions only for
+            # minibatches with examples in the evaluation subset
+            required_fetch_names = [
+                "lower_bound_estimates", "kl_divergence",
+                "reconstruction_error"
+            ]
+            if log_results:
+                required_fetch_names.append("kl_divergence_neurons")
+            if "reconstructed" in output_versions:
+                required_fetch_names.append("p_x_mean")
+                subset_fetch_names = [
+                    "p_x_stddev", "stddev_of_p_x_given_z_mean"]
+            else:
+                subset_fetch_names = []
+            if "latent" in output_versions:
+                required_fetch_names.append("q_z_mean")
+
+            minibatch_fetches = plan_fetches(
+                evaluation_fetches, required_fetch_names)
+            subset_minibatch_fetches = plan_fetches(
+                evaluation_fetches, required_fetch_names + subset_fetch_names)
+
+            # Random stream for noisy preprocessing seeded by the run and
+            # the number of epochs trained, and noisy values kept for the
+            # transformed data set
+            noisy_random_state = noise_random_state(
+                self, epoch, "evaluation", run_id=run_id)
+            if noisy_preprocess and "transformed" in output_versions:
+                noisy_minibatches_eval = []
+            else:
+                noisy_minibatches_eval = None
+
             for i in range(0, n_examples_eval, minibatch_size):
 
                 indices = numpy.arange(
@@ -1974,9 +2372,34 @@ class VariationalAutoencoder:
                 subset_indices = numpy.array(list(
                     evaluation_subset_indices.intersection(indices)))
 
+                if shared_minibatches is not None and not noisy_preprocess:
+                    x_eval_i, t_eval_i = shared_minibatches.get(
+                        i,
+                        functools.partial(
+                            minibatch_values_and_targets,
+                            x_eval, t_eval, indices,
+                            sparse=self.sparse_input
+                        )
+                    )
+                else:
+                    x_eval_i = minibatch_values(
+                        x_eval, indices,
+                        sparse=self.sparse_input,
+                        preprocess=noisy_preprocess,
+                        random_state=noisy_random_state
+                    )
+
+                    if noisy_preprocess:
+                        t_eval_i = x_eval_i
+                        if noisy_minibatches_eval is not None:
+                            noisy_minibatches_eval.append(x_eval_i)
+                    else:
+                        t_eval_i = minibatch_values(
+                            t_eval, indices, sparse=self.sparse_input)
+
                 feed_dict_batch = {
-                    self.x: x_eval[indices].toarray(),
-                    self.t: t_eval[indices].toarray(),
+                    self.x: x_eval_i,
+                    self.t: t_eval_i,
                     self.is_training: False,
                     self.use_deterministic_z: use_deterministic_z,
                     self.warm_up_weight: 1.0,
@@ -1996,22 +2419,43 @@ class VariationalAutoencoder:
                     feed_dict_batch[self.count_sum_feature] = (
                         count_sum_feature_eval[indices])
 
-                (
-                    lower_bound_i,
-                    kl_divergence_i,
-                    reconstruction_error_i,
-                    p_x_mean_i, p_x_stddev_i, stddev_of_p_x_mean_i,
-                    q_z_mean_i, kl_divergence_neurons_i
-                ) = session.run(
-                    [
-                        self.lower_bound,
-                        self.kl_divergence,
-                        self.reconstruction_error, self.p_x_mean,
-                        self.p_x_stddev, self.stddev_of_p_x_given_z_mean,
-                        self.q_z_mean, self.kl_divergence_neurons
-                    ],
-                    feed_dict=feed_dict_batch
-                )
+                if subset_indices.size > 0:
+                    fetches_i = subset_minibatch_fetches
+                else:
+                    fetches_i = minibatch_fetches
+
+                if sample_chunk_size:
+                    results_i = run_in_sample_chunks(
+                        session,
+                        fetches_i,
+                        feed_dict=feed_dict_batch,
+                        sample_placeholders=(
+                            self.number_of_iw_samples,
+                            self.number_of_mc_samples
+                        ),
+                        number_of_iw_samples=number_of_iw_samples,
+                        number_of_mc_samples=number_of_mc_samples,
+                        chunk_size=sample_chunk_size
+                    )
+                else:
+                    results_i = session.run(
+                        {
+                            name: tensor for name, (tensor, __)
+                            in fetches_i.items()
+                        },
+                        feed_dict=feed_dict_batch
+                    )
+
+                lower_bound_i = numpy.mean(results_i["lower_bound_estimates"])
+                kl_divergence_i = results_i["kl_divergence"]
+                reconstruction_error_i = results_i["reconstruction_error"]
+                p_x_mean_i = results_i.get("p_x_mean")
+                p_x_stddev_i = results_i.get("p_x_stddev")
+                stddev_of_p_x_mean_i = results_i.get(
+                    "stddev_of_p_x_given_z_mean")
+                q_z_mean_i = results_i.get("q_z_mean")
+                kl_divergence_neurons_i = results_i.get(
+                    "kl_divergence_neurons")
 
                 lower_bound_eval += lower_bound_i
                 kl_divergence_eval += kl_divergence_i
@@ -2028,7 +2472,7 @@ class VariationalAutoencoder:
                     #           = E_z[p_x_given_z.mean]
                     #     \approx 1/(R*L) \sum^R_r w_r \sum^L_{l=1}
                     # p_x_given_z.mean
-                    p_x_mean_eval[indices] = p_x_mean_i
+                    p_x_mean_eval.write(indices, p_x_mean_i)
 
                     if subset_indices.size > 0:
 
@@ -2036,16 +2480,23 @@ class VariationalAutoencoder:
                         #     sqrt(V[x]) = sqrt(E[V[x|z]] + V[E[x|z]])
                         #     = E_z[p_x_given_z.var] + E_z[(p_x_given_z.mean
                         #       - E[x])^2]
-                        p_x_stddev_eval[subset_indices] = p_x_stddev_i[
-                            subset_indices - i]
+                        p_x_stddev_eval.write(
+                            subset_indices, p_x_stddev_i[subset_indices - i])
 
                         # Estimated standard deviation of Monte Carlo estimate
                         # E[x].
-                        stddev_of_p_x_mean_eval[subset_indices] = (
-                            stddev_of_p_x_mean_i[subset_indices - i])
+                        stddev_of_p_x_mean_eval.write(
+                            subset_indices,
+                            stddev_of_p_x_mean_i[subset_indices - i]
+                        )
 
                 if "latent" in output_versions:
-                    q_z_mean_eval[indices] = q_z_mean_i
+                    q_z_mean_eval.write(indices, q_z_mean_i)
+
+            if "reconstructed" in output_versions:
+                p_x_mean_eval.close()
+            if "latent" in output_versions:
+                q_z_mean_eval.close()
 
             lower_bound_eval /= n_examples_eval / minibatch_size
             kl_divergence_eval /= n_examples_eval / minibatch_size
@@ -2128,6 +2579,9 @@ class VariationalAutoencoder:
                 )
             )
 
+            if noisy_minibatches_eval is not None:
+                t_eval = stack_minibatch_values(noisy_minibatches_eval)
+
             # Data sets
 
             output_sets = [None] * len(output_versions)
@@ -2164,9 +2618,10 @@ class VariationalAutoencoder:
                     evaluation_set.name,
                     title=evaluation_set.title,
                     specifications=evaluation_set.specifications,
-                    values=p_x_mean_eval,
-                    total_standard_deviations=p_x_stddev_eval,
-                    explained_standard_deviations=stddev_of_p_x_mean_eval,
+                    values=p_x_mean_eval.values,
+                    total_standard_deviations=p_x_stddev_eval.to_sparse(),
+                    explained_standard_deviations=(
+                        stddev_of_p_x_mean_eval.to_sparse()),
                     preprocessed_values=None,
                     labels=evaluation_set.labels,
                     example_names=evaluation_set.example_names,
@@ -2188,7 +2643,7 @@ class VariationalAutoencoder:
                     evaluation_set.name,
                     title=evaluation_set.title,
                     specifications=evaluation_set.specifications,
-                    values=q_z_mean_eval,
+                    values=q_z_mean_eval.values,
                     preprocessed_values=None,
                     labels=evaluation_set.labels,
                     example_names=evaluation_set.example_names,
@@ -2232,6 +2687,8 @@ class VariationalAutoencoder:
             )
         elif self.inference_architecture == "LFM":
             encoder = self.x
+            if isinstance(encoder, tf.SparseTensor):
+                encoder = tf.sparse.to_dense(encoder, validate_indices=False)
         else:
             raise ValueError(
                 "The generative architecture can only be a neural network "
@@ -2559,11 +3016,26 @@ class VariationalAutoencoder:
 
     def _setup_loss_function(self):
 
+        # Use sparse targets for evaluating the reconstruction distribution
+        # sparsely, and dense targets otherwise
+        t = self.t
+        if self.sparse_reconstruction:
+            if not isinstance(t, tf.SparseTensor):
+                t = sparse_from_dense(t)
+        elif isinstance(t, tf.SparseTensor):
+            t = tf.sparse.to_dense(t, validate_indices=False)
+
         # Prepare replicated and reshaped arrays by replicating out
         # minibatches in tiles per sample into a shape of (R * L * B, D_x)
-        t_tiled = tf.tile(
-            self.t,
-            multiples=[self.number_of_iw_samples*self.number_of_mc_samples, 1])
+        if self.sparse_reconstruction:
+            t_tiled = tile_sparse_rows(
+                t,
+                multiples=self.number_of_iw_samples*self.number_of_mc_samples)
+        else:
+            t_tiled = tf.tile(
+                t,
+                multiples=[
+                    self.number_of_iw_samples*self.number_of_mc_samples, 1])
         # Reshape samples back to (R, L, B, D_z)
         z_reshaped = tf.reshape(
             self.z,
@@ -2578,14 +3050,21 @@ class VariationalAutoencoder:
         # Reconstruction error
         # 1. Evaluate all log(p(x|z)) (R * L * B, D_x) target values
         #    in the (R * L * B, D_x) probability distributions learned
+        #    (sparsely: log-probabilities of zero for all values corrected
+        #    using full log-probabilities for nonzero values only)
         # 2. Sum over all N_x features
         # 3. and reshape it back to (R, L, B)
-        p_x_given_z_log_prob = self.p_x_given_z.log_prob(t_tiled)
-        log_p_x_given_z = tf.reshape(
-            tf.reduce_sum(
+        if self.sparse_reconstruction:
+            p_x_given_z_log_prob_sum = sparse_log_prob(
+                self.p_x_given_z, t_tiled)
+        else:
+            p_x_given_z_log_prob = self.p_x_given_z.log_prob(t_tiled)
+            p_x_given_z_log_prob_sum = tf.reduce_sum(
                 p_x_given_z_log_prob,
                 axis=-1
-            ),
+            )
+        log_p_x_given_z = tf.reshape(
+            p_x_given_z_log_prob_sum,
             shape=[self.number_of_iw_samples, self.number_of_mc_samples, -1]
         )
 
@@ -2712,15 +3191,18 @@ class VariationalAutoencoder:
 
             self.p_x_stddev = tf.sqrt(self.p_x_variance)
 
-        # average over eq_samples, minibatch_size dimensions    -> shape: ()
         # log-mean-exp (to avoid over- and underflow) over iw_samples dimension
-        self.lower_bound = tf.reduce_mean(
+        # Shape: (R, L, B) --> (L, B)
+        self.lower_bound_estimates = tf.reshape(
             log_reduce_exp(
                 log_p_x_given_z - kl_divergence,
                 reduction_function=tf.reduce_mean,
                 axis=0
-            )
+            ),
+            shape=[self.number_of_mc_samples, -1]
         )
+        # average over eq_samples, minibatch_size dimensions    -> shape: ()
+        self.lower_bound = tf.reduce_mean(self.lower_bound_estimates)
         tf.add_to_collection("losses", self.lower_bound)
         self.lower_bound_weighted = tf.reduce_mean(
             log_reduce_exp(
@@ -2758,6 +3240,8 @@ class VariationalAutoencoder:
                 global_step=self.global_step
             )
 
+            return optimiser, gradients
+
         # Make sure that the updates of the moving_averages in minibatch_norm
         # layers are performed before the train_step
         update_ops = tf.get_collection(tf.GraphKeys.UPDATE_OPS)
@@ -2765,6 +3249,35 @@ class VariationalAutoencoder:
         if update_ops:
             updates = tf.group(*update_ops)
             with tf.control_dependencies([updates]):
-                _optimiser()
+                optimiser, gradients = _optimiser()
         else:
-            _optimiser()
+            optimiser, gradients = _optimiser()
+
+        # Gradients and their application for data-parallel training,
+        # where gradients are computed for shards of a minibatch and
+        # averaged before being applied using the same optimiser. The
+        # gradients are computed without depending on the updates of
+        # the moving averages in minibatch_norm layers.
+        self.gradients = [
+            tf.convert_to_tensor(gradient)
+            for gradient in tf.gradients(
+                -self.lower_bound_weighted,
+                [variable for _, variable in gradients]
+            )
+        ]
+        self.gradient_placeholders = [
+            tf.placeholder(
+                dtype=variable.dtype.base_dtype,
+                shape=variable.shape,
+                name="averaged_gradient"
+            )
+            for _, variable in gradients
+        ]
+        self.apply_averaged_gradients = optimiser.apply_gradients(
+            [
+                (tf.clip_by_value(placeholder, -1., 1.), variable)
+                for placeholder, (_, variable) in zip(
+                    self.gradient_placeholders, gradients)
+            ],
+            global_step=self.global_step
+        )
@@ -185,7 +185,10 @@ def extension(filename):
 
 
 def copy_file(url, path):
-    shutil.copyfile(url, path)
+    if os.path.isdir(url):
+        shutil.copytree(url, path)
+    else:
+        shutil.copyfile(url, path)
 
 
 def remove_empty_directories(source_directory):
@@ -0,0 +1,55 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import pickle
+
+import numpy
+import pytest
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("seaborn")
+pytest.importorskip("sklearn")
+
+from scvae.analyses.analyses import _data_set_for_plotting  # noqa: E402
+from scvae.data import DataSet  # noqa: E402
+
+
+def test_data_set_for_plotting_with_noisy_preprocessing_is_picklable(
+        tmp_path):
+
+    data_set = DataSet(
+        "test",
+        title="Test",
+        specifications={},
+        values=numpy.random.RandomState(60).poisson(2, size=(6, 4)),
+        labels=numpy.array(["A", "B", "A", "B", "A", "B"]),
+        example_names=numpy.array(["cell{}".format(i) for i in range(6)]),
+        feature_names=numpy.array(["gene{}".format(j) for j in range(4)]),
+        noisy_preprocessing_methods=["normalise", "binarise"],
+        directory=str(tmp_path)
+    )
+    assert data_set.noisy_preprocess is not None
+    assert data_set.noisy_values is not None
+
+    plotting_data_set = pickle.loads(
+        pickle.dumps(_data_set_for_plotting(data_set)))
+
+    assert plotting_data_set.values is None
+    assert plotting_data_set.noisy_values is None
+    numpy.testing.assert_array_equal(
+        plotting_data_set.labels, data_set.labels)
@@ -0,0 +1,139 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+import pytest
+
+pytest.importorskip("tensorflow.contrib")
+pytest.importorskip("tensorflow_probability")
+
+import tensorflow as tf  # noqa: E402
+
+from scvae.models import GaussianMixtureVariationalAutoencoder  # noqa: E402
+
+FEATURE_SIZE = 6
+LATENT_SIZE = 2
+NUMBER_OF_CLUSTERS = 3
+MINIBATCH_SIZE = 5
+
+OUTPUTS = [
+    "lower_bound", "kl_divergence_z", "reconstruction_error", "p_x_mean",
+    "kl_divergence_z_neurons"
+]
+
+
+def _build_model(batched_clusters, minibatch_normalisation, log_directory):
+    return GaussianMixtureVariationalAutoencoder(
+        feature_size=FEATURE_SIZE,
+        latent_size=LATENT_SIZE,
+        hidden_sizes=[4, 4],
+        reconstruction_distribution="poisson",
+        number_of_latent_clusters=NUMBER_OF_CLUSTERS,
+        minibatch_normalisation=minibatch_normalisation,
+        dropout_keep_probabilities=[],
+        batched_clusters=batched_clusters,
+        log_directory=log_directory
+    )
+
+
+def _evaluate_outputs(model, variable_values, x, z, is_training):
+
+    with model.graph.as_default():
+        variables = tf.global_variables()
+        with tf.Session(graph=model.graph) as session:
+
+            session.run(tf.global_variables_initializer())
+
+            if variable_values is None:
+                variable_values = {
+                    variable.op.name: session.run(variable)
+                    for variable in variables
+                }
+            else:
+                for variable in variables:
+                    variable.load(
+                        variable_values[variable.op.name], session)
+
+            feed_dict = {
+                model.x: x,
+                model.t: x,
+                model.is_training: is_training,
+                model.n_iw_samples: 1,
+                model.n_mc_samples: 1,
+                model.warm_up_weight: 1.0
+            }
+
+            # Latent values are fed, so the same values are used for
+            # both graphs
+            if model.batched_clusters:
+                feed_dict[model.z] = z.reshape(-1, LATENT_SIZE)
+            else:
+                for k in range(NUMBER_OF_CLUSTERS):
+                    feed_dict[model.z[k]] = z[k]
+
+            outputs = session.run(
+                {name: getattr(model, name) for name in OUTPUTS},
+                feed_dict=feed_dict
+            )
+
+    return outputs, variable_values
+
+
+@pytest.mark.parametrize("minibatch_normalisation", [False, True])
+@pytest.mark.parametrize("is_training", [False, True])
+def test_batched_clusters_match_clusters_in_turn(
+        minibatch_normalisation, is_training, tmp_path):
+
+    random_state = numpy.random.RandomState(60)
+    x = random_state.poisson(
+        2, size=(MINIBATCH_SIZE, FEATURE_SIZE)).astype(numpy.float32)
+    z = random_state.normal(
+        size=(NUMBER_OF_CLUSTERS, MINIBATCH_SIZE, LATENT_SIZE)
+    ).astype(numpy.float32)
+
+    model = _build_model(
+        batched_clusters=False,
+        minibatch_normalisation=minibatch_normalisation,
+        log_directory=str(tmp_path)
+    )
+    batched_model = _build_model(
+        batched_clusters=True,
+        minibatch_normalisation=minibatch_normalisation,
+        log_directory=str(tmp_path)
+    )
+
+    outputs, variable_values = _evaluate_outputs(
+        model, None, x, z, is_training)
+    batched_outputs, _ = _evaluate_outputs(
+        batched_model, variable_values, x, z, is_training)
+
+    for name in OUTPUTS:
+        numpy.testing.assert_allclose(
+            batched_outputs[name], outputs[name], rtol=1e-5, atol=1e-5,
+            err_msg=name
+        )
+
+
+def test_batched_clusters_reject_full_covariance(tmp_path):
+    with pytest.raises(NotImplementedError):
+        GaussianMixtureVariationalAutoencoder(
+            feature_size=FEATURE_SIZE,
+            latent_distribution="full-covariance gaussian mixture",
+            batched_clusters=True,
+            log_directory=str(tmp_path)
+        )
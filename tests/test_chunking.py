@@ -0,0 +1,129 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+import pytest
+import scipy.special
+
+pytest.importorskip("tensorflow.contrib")
+pytest.importorskip("tensorflow_probability")
+
+from scvae.models.chunking import (  # noqa: E402
+    run_in_sample_chunks, sample_chunks)
+
+NUMBER_OF_IW_SAMPLES = 5
+NUMBER_OF_MC_SAMPLES = 3
+MINIBATCH_SIZE = 4
+
+FETCHES = {
+    "mean": ("mean", "mean"),
+    "stddev": ("stddev", ("stddev", "mean")),
+    "log_likelihood": ("log_likelihood", "log_mean_exp"),
+    "constant": ("constant", "constant")
+}
+
+
+class _SampleSession:
+    """Session evaluating fetches for chunks of fixed samples.
+
+    Chunks are run in the order given by `sample_chunks`, so each run
+    evaluates the fetches on the next chunk of the samples.
+    """
+
+    def __init__(self, samples, chunk_size):
+        self.samples = samples
+        self.chunks = iter(sample_chunks(
+            NUMBER_OF_IW_SAMPLES, NUMBER_OF_MC_SAMPLES, chunk_size))
+
+    def run(self, fetches, feed_dict):
+
+        chunk = next(self.chunks)
+        assert feed_dict["iw"] == chunk.number_of_iw_samples
+        assert feed_dict["mc"] == chunk.number_of_mc_samples
+
+        samples = self.samples[
+            chunk.iw_start:chunk.iw_start + chunk.number_of_iw_samples,
+            chunk.mc_slice
+        ]
+        flat_samples = samples.reshape(-1, MINIBATCH_SIZE)
+
+        results = {
+            "mean": flat_samples.mean(axis=0),
+            "stddev": flat_samples.std(axis=0),
+            "log_likelihood": (
+                scipy.special.logsumexp(samples, axis=0)
+                - numpy.log(chunk.number_of_iw_samples)
+            ),
+            "constant": numpy.arange(MINIBATCH_SIZE)
+        }
+
+        return {name: results[tensor] for name, tensor in fetches.items()}
+
+
+def _run(samples, chunk_size):
+    return run_in_sample_chunks(
+        session=_SampleSession(samples, chunk_size),
+        fetches=FETCHES,
+        feed_dict={},
+        sample_placeholders=("iw", "mc"),
+        number_of_iw_samples=NUMBER_OF_IW_SAMPLES,
+        number_of_mc_samples=NUMBER_OF_MC_SAMPLES,
+        chunk_size=chunk_size
+    )
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 7])
+def test_chunked_results_match_unchunked_results(chunk_size):
+
+    samples = numpy.random.RandomState(60).normal(
+        scale=10, size=(
+            NUMBER_OF_IW_SAMPLES, NUMBER_OF_MC_SAMPLES, MINIBATCH_SIZE))
+    flat_samples = samples.reshape(-1, MINIBATCH_SIZE)
+
+    results = _run(
+        samples, chunk_size=NUMBER_OF_IW_SAMPLES * NUMBER_OF_MC_SAMPLES)
+    chunked_results = _run(samples, chunk_size=chunk_size)
+
+    numpy.testing.assert_allclose(results["mean"], flat_samples.mean(axis=0))
+    numpy.testing.assert_allclose(
+        results["stddev"], flat_samples.std(axis=0))
+    numpy.testing.assert_allclose(
+        results["log_likelihood"],
+        scipy.special.logsumexp(samples, axis=0)
+        - numpy.log(NUMBER_OF_IW_SAMPLES)
+    )
+
+    for name in FETCHES:
+        numpy.testing.assert_allclose(
+            chunked_results[name], results[name], rtol=1e-10, atol=1e-10,
+            err_msg=name
+        )
+
+
+def test_sample_chunks_cover_all_samples():
+    for chunk_size in range(1, 17):
+        covered = numpy.zeros(
+            (NUMBER_OF_IW_SAMPLES, NUMBER_OF_MC_SAMPLES), dtype=int)
+        for chunk in sample_chunks(
+                NUMBER_OF_IW_SAMPLES, NUMBER_OF_MC_SAMPLES, chunk_size):
+            assert chunk.number_of_samples <= chunk_size
+            covered[
+                chunk.iw_start:chunk.iw_start + chunk.number_of_iw_samples,
+                chunk.mc_slice
+            ] += 1
+        numpy.testing.assert_array_equal(covered, 1)
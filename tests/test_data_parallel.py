@@ -0,0 +1,154 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+import pytest
+
+pytest.importorskip("tensorflow.contrib")
+pytest.importorskip("tensorflow_probability")
+
+import tensorflow as tf  # noqa: E402
+
+from scvae.models import VariationalAutoencoder  # noqa: E402
+from scvae.models.parallel import DataParallelSteps  # noqa: E402
+
+FEATURE_SIZE = 6
+MINIBATCH_SIZE = 7
+
+
+def _build_model(minibatch_normalisation, log_directory):
+    return VariationalAutoencoder(
+        feature_size=FEATURE_SIZE,
+        latent_size=2,
+        hidden_sizes=[4],
+        reconstruction_distribution="poisson",
+        minibatch_normalisation=minibatch_normalisation,
+        log_directory=log_directory
+    )
+
+
+def _feed_dict(model):
+    # Latent values are deterministic, so the only difference between
+    # shards and the whole minibatch is the order of summation
+    return {
+        model.learning_rate: 1e-3,
+        model.is_training: True,
+        model.use_deterministic_z: True,
+        model.warm_up_weight: 1.0,
+        model.number_of_iw_samples: 1,
+        model.number_of_mc_samples: 1
+    }
+
+
+def _minibatch():
+    random_state = numpy.random.RandomState(60)
+    x = random_state.poisson(
+        2, size=(MINIBATCH_SIZE, FEATURE_SIZE)).astype(numpy.float32)
+    return {"x": x, "t": x}
+
+
+@pytest.mark.parametrize("number_of_workers", [1, 3])
+def test_averaged_gradients_match_minibatch_gradients(
+        number_of_workers, tmp_path):
+
+    model = _build_model(False, str(tmp_path))
+    minibatch = _minibatch()
+    inputs = {"x": model.x, "t": model.t}
+
+    with model.graph.as_default():
+        with tf.Session(graph=model.graph) as session:
+            session.run(tf.global_variables_initializer())
+
+            feed_dict = _feed_dict(model)
+            minibatch_feed_dict = dict(feed_dict)
+            for name, values in minibatch.items():
+                minibatch_feed_dict[inputs[name]] = values
+            gradients, lower_bound = session.run(
+                [model.gradients, model.lower_bound],
+                feed_dict=minibatch_feed_dict
+            )
+
+            data_parallel_steps = DataParallelSteps(
+                model, number_of_workers)
+            averaged_gradients, averaged_lower_bound, _ = (
+                data_parallel_steps.average_gradients(
+                    session, feed_dict, minibatch, inputs))
+            data_parallel_steps.close()
+
+    numpy.testing.assert_allclose(
+        averaged_lower_bound, lower_bound, rtol=1e-5, atol=1e-6)
+    for averaged_gradient, gradient in zip(averaged_gradients, gradients):
+        numpy.testing.assert_allclose(
+            averaged_gradient, gradient, rtol=1e-5, atol=1e-6)
+
+
+def test_data_parallel_steps_match_single_worker_step(tmp_path):
+
+    model = _build_model(False, str(tmp_path))
+    minibatch = _minibatch()
+    inputs = {"x": model.x, "t": model.t}
+
+    with model.graph.as_default():
+        variables = tf.global_variables()
+        with tf.Session(graph=model.graph) as session:
+            session.run(tf.global_variables_initializer())
+            initial_values = session.run(variables)
+
+            updated_values = []
+            for number_of_workers in [1, 3]:
+                for variable, value in zip(variables, initial_values):
+                    variable.load(value, session)
+                data_parallel_steps = DataParallelSteps(
+                    model, number_of_workers)
+                data_parallel_steps.run(
+                    session, _feed_dict(model), minibatch, inputs)
+                data_parallel_steps.close()
+                updated_values.append(
+                    session.run(tf.trainable_variables()))
+
+    for values, parallel_values in zip(*updated_values):
+        numpy.testing.assert_allclose(
+            parallel_values, values, rtol=1e-5, atol=1e-6)
+
+
+def test_data_parallel_steps_measure_speed_up_for_initial_steps(tmp_path):
+
+    model = _build_model(False, str(tmp_path))
+    minibatch = _minibatch()
+    inputs = {"x": model.x, "t": model.t}
+
+    with model.graph.as_default():
+        with tf.Session(graph=model.graph) as session:
+            session.run(tf.global_variables_initializer())
+            data_parallel_steps = DataParallelSteps(
+                model, 2, number_of_reference_steps=2)
+            for _ in range(2):
+                data_parallel_steps.run(
+                    session, _feed_dict(model), minibatch, inputs)
+            assert data_parallel_steps.speed_up > 0
+            data_parallel_steps.reset()
+            data_parallel_steps.run(
+                session, _feed_dict(model), minibatch, inputs)
+            assert numpy.isnan(data_parallel_steps.speed_up)
+            data_parallel_steps.close()
+
+
+def test_data_parallel_steps_reject_minibatch_normalisation(tmp_path):
+    model = _build_model(True, str(tmp_path))
+    with pytest.raises(ValueError):
+        DataParallelSteps(model, 2)
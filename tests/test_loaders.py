@@ -0,0 +1,225 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import gzip
+import tarfile
+
+import numpy
+import pytest
+
+loompy = pytest.importorskip("loompy")
+pytest.importorskip("tables")
+
+from scvae.data import loaders  # noqa: E402
+from scvae.defaults import defaults  # noqa: E402
+
+
+def _write_labels(path, rows):
+    path.write_text("".join("{}\t{}\n".format(*row) for row in rows))
+    return str(path)
+
+
+def test_load_labels_joins_labels_onto_example_names(tmp_path):
+
+    labels_path = _write_labels(tmp_path / "labels.tsv", [
+        ("cell", "label"),
+        ("c", "T"),
+        ("a", "B"),
+        ("a", "NK"),
+        ("x", "B")
+    ])
+    example_names = numpy.array(["a", "b", "c"])
+
+    labels = loaders._load_labels_from_delimiter_separeted_values(
+        labels_path, example_names=example_names, default_label="none")
+
+    numpy.testing.assert_array_equal(
+        labels, numpy.array(["NK", "none", "T"]))
+
+
+def test_load_labels_from_empty_labels_table(tmp_path):
+
+    labels_path = _write_labels(
+        tmp_path / "labels.tsv", [("cell", "label")])
+    example_names = numpy.array(["a", "b", "c"])
+
+    labels = loaders._load_labels_from_delimiter_separeted_values(
+        labels_path, example_names=example_names, default_label="none")
+
+    numpy.testing.assert_array_equal(
+        labels, numpy.array(["none", "none", "none"]))
+
+
+@pytest.mark.parametrize("number_of_workers", [1, 3])
+def test_load_tab_separated_matrix(number_of_workers, tmp_path):
+
+    values = numpy.random.RandomState(60).poisson(0.5, size=(20, 4))
+    example_names = ["gene{}".format(i) for i in range(values.shape[0])]
+    column_headers = ["cell{}".format(j) for j in range(values.shape[1])]
+
+    tsv_path = tmp_path / "matrix.tsv"
+    tsv_path.write_text(
+        "\t".join(column_headers) + "\n" + "".join(
+            "\t".join([name] + [str(value) for value in row]) + "\n"
+            for name, row in zip(example_names, values)
+        )
+    )
+
+    loaded_values, loaded_column_headers, row_indices = (
+        loaders._load_tab_separated_matrix(
+            str(tsv_path), chunk_size=64,
+            number_of_workers=number_of_workers)
+    )
+
+    numpy.testing.assert_array_equal(loaded_values.toarray(), values)
+    assert loaded_column_headers == column_headers
+    assert row_indices == [[name] for name in example_names]
+
+
+@pytest.mark.parametrize("number_of_workers", [1, 2])
+def test_load_tab_separated_matrix_with_blank_lines(
+        number_of_workers, tmp_path):
+
+    values = numpy.arange(12).reshape(4, 3)
+    blank_lines = " \n" + "\n" * 40
+
+    tsv_path = tmp_path / "matrix.tsv"
+    tsv_path.write_text(
+        "".join(
+            "\t".join(str(value) for value in row) + "\n" + blank_lines
+            for row in values
+        )
+    )
+
+    loaded_values, loaded_column_headers, row_indices = (
+        loaders._load_tab_separated_matrix(
+            str(tsv_path), chunk_size=16,
+            number_of_workers=number_of_workers)
+    )
+
+    numpy.testing.assert_array_equal(loaded_values.toarray(), values)
+    assert loaded_column_headers is None
+    assert row_indices is None
+
+
+def test_load_loom_data_set_in_chunks(monkeypatch, tmp_path):
+
+    values = numpy.random.RandomState(60).poisson(
+        0.5, size=(7, 5)).astype(numpy.float32)
+    example_names = numpy.array(["cell{}".format(i) for i in range(7)])
+    feature_names = numpy.array(["gene{}".format(j) for j in range(5)])
+    labels = numpy.array(["A", "B", "A", "C", "B", "A", "C"])
+
+    loom_path = str(tmp_path / "data_set.loom")
+    loompy.create(
+        loom_path,
+        values.T,
+        row_attrs={"Gene": feature_names},
+        col_attrs={"CellID": example_names, "ClusterName": labels}
+    )
+
+    monkeypatch.setitem(defaults["data"], "loom_chunk_size", 3)
+    data_dictionary = loaders._load_loom_data_set(
+        {"all": {"full": loom_path}})
+
+    numpy.testing.assert_array_equal(
+        data_dictionary["values"].toarray(), values)
+    numpy.testing.assert_array_equal(
+        data_dictionary["example names"], example_names)
+    numpy.testing.assert_array_equal(
+        data_dictionary["feature names"], feature_names)
+    numpy.testing.assert_array_equal(data_dictionary["labels"], labels)
+
+
+def _write_matrix_market(path, values, entries):
+    with gzip.open(str(path), mode="wt") as mtx_file:
+        mtx_file.write("%%MatrixMarket matrix coordinate integer general\n")
+        mtx_file.write("%metadata_json: {}\n")
+        mtx_file.write("{} {} {}\n".format(
+            values.shape[0], values.shape[1], len(entries)))
+        for row_index, column_index, value in entries:
+            mtx_file.write("{} {} {}\n".format(
+                row_index + 1, column_index + 1, value))
+
+
+def test_load_matrix_market_sums_duplicate_entries(tmp_path):
+
+    values = numpy.array([
+        [0, 3, 0],
+        [4, 0, 5]
+    ])
+    entries = [(1, 2, 5), (0, 1, 1), (1, 0, 4), (0, 1, 2)]
+
+    mtx_path = tmp_path / "matrix.mtx.gz"
+    _write_matrix_market(mtx_path, values, entries)
+
+    with gzip.open(str(mtx_path)) as mtx_file:
+        loaded_values = loaders._load_matrix_market_by_columns(
+            mtx_file, chunk_size=16, number_of_workers=2)
+
+    assert loaded_values.nnz == 3
+    assert loaded_values.has_canonical_format
+    numpy.testing.assert_array_equal(loaded_values.toarray(), values.T)
+
+
+@pytest.mark.parametrize("as_tarball", [False, True])
+def test_load_10x_cell_ranger_3_matrix_directory(as_tarball, tmp_path):
+
+    values = numpy.random.RandomState(60).poisson(0.5, size=(4, 3))
+    entries = [
+        (i, j, values[i, j])
+        for j in range(values.shape[1]) for i in range(values.shape[0])
+        if values[i, j] > 0
+    ]
+    feature_rows = [
+        "ENSG{}\tGENE{}\tGene Expression".format(i, i)
+        for i in range(values.shape[0])
+    ]
+    barcodes = ["CELL{}-1".format(j) for j in range(values.shape[1])]
+
+    matrix_directory = tmp_path / "filtered_feature_bc_matrix"
+    matrix_directory.mkdir()
+    _write_matrix_market(
+        matrix_directory / "matrix.mtx.gz", values, entries)
+    for filename, rows in [
+            ("features.tsv.gz", feature_rows),
+            ("barcodes.tsv.gz", barcodes)]:
+        with gzip.open(str(matrix_directory / filename), mode="wt") as f:
+            f.write("".join(row + "\n" for row in rows))
+
+    if as_tarball:
+        path = str(tmp_path / "matrix.tar.gz")
+        with tarfile.open(path, mode="w:gz") as tarball:
+            tarball.add(
+                str(matrix_directory), arcname=matrix_directory.name)
+    else:
+        path = str(matrix_directory)
+
+    data_dictionary = loaders._load_values_from_10x_data_set(path)
+
+    numpy.testing.assert_array_equal(
+        data_dictionary["values"].toarray(), values.T)
+    numpy.testing.assert_array_equal(
+        data_dictionary["example names"], numpy.array(barcodes))
+    numpy.testing.assert_array_equal(
+        data_dictionary["feature names"],
+        numpy.array([
+            "ENSG{}\tGENE{}".format(i, i) for i in range(values.shape[0])
+        ])
+    )
+    assert data_dictionary["genome name"] == "filtered_feature_bc_matrix"
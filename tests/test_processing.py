@@ -0,0 +1,132 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+import pytest
+
+pytest.importorskip("sklearn")
+
+from scvae.data import processing  # noqa: E402
+
+
+def test_split_noisy_preprocessing_methods():
+    deterministic_methods, random_methods = (
+        processing.split_noisy_preprocessing_methods(
+            ["normalise", "binarise"]))
+    assert deterministic_methods == ["normalise"]
+    assert random_methods == ["binarise"]
+
+
+def test_split_noisy_preprocessing_methods_without_random_methods():
+    deterministic_methods, random_methods = (
+        processing.split_noisy_preprocessing_methods(["log", "normalise"]))
+    assert deterministic_methods == ["log", "normalise"]
+    assert random_methods == []
+
+
+def test_split_noisy_preprocessing_methods_reject_normalising_minibatches():
+    with pytest.raises(ValueError):
+        processing.split_noisy_preprocessing_methods(
+            ["binarise", "normalise"])
+
+
+def test_random_preprocessing_of_minibatches_matches_all_values():
+
+    values = numpy.random.RandomState(60).uniform(size=(10, 4))
+    deterministic_methods, random_methods = (
+        processing.split_noisy_preprocessing_methods(
+            ["normalise", "binarise"]))
+    deterministic_preprocess = processing.build_preprocessor(
+        deterministic_methods)
+    random_preprocess = processing.build_preprocessor(
+        random_methods, noisy=True)
+
+    normalised_values = deterministic_preprocess(values)
+    noisy_values = random_preprocess(
+        normalised_values, random_state=numpy.random.RandomState(1))
+
+    random_state = numpy.random.RandomState(1)
+    noisy_minibatches = [
+        random_preprocess(
+            normalised_values[i:i + 3], random_state=random_state)
+        for i in range(0, 10, 3)
+    ]
+
+    numpy.testing.assert_array_equal(
+        numpy.concatenate(noisy_minibatches), noisy_values)
+
+
+def test_map_features_aggregates_values_of_mapped_features():
+
+    values = numpy.array([
+        [1, 2, 3, 4],
+        [0, 5, 0, 6]
+    ])
+    feature_ids = numpy.array([10, 11, 12, 13])
+    feature_mapping = {
+        "A": [10, 12],
+        "B": [11],
+        "C": [14]
+    }
+
+    mapped_values, feature_names = processing.map_features(
+        values, feature_ids, feature_mapping)
+
+    numpy.testing.assert_array_equal(
+        feature_names, numpy.array(["A", "B", "13"]))
+    numpy.testing.assert_array_equal(
+        mapped_values.toarray(),
+        numpy.array([
+            [4, 2, 4],
+            [0, 5, 6]
+        ])
+    )
+
+
+def test_map_features_keeps_string_feature_ids():
+
+    values = numpy.eye(3)
+    feature_ids = numpy.array(["ENSG1", "ENSG2", "ENSG3"])
+    feature_mapping = {"GENE": ["ENSG1", "ENSG3"]}
+
+    mapped_values, feature_names = processing.map_features(
+        values, feature_ids, feature_mapping)
+
+    assert feature_names.dtype.kind == "U"
+    numpy.testing.assert_array_equal(
+        feature_names, numpy.array(["GENE", "ENSG2"]))
+    numpy.testing.assert_array_equal(
+        mapped_values.toarray(),
+        numpy.array([
+            [1, 0],
+            [0, 1],
+            [1, 0]
+        ])
+    )
+
+
+def test_map_features_without_features():
+
+    values = numpy.zeros((3, 0))
+    feature_ids = numpy.array([], dtype="<U5")
+
+    mapped_values, feature_names = processing.map_features(
+        values, feature_ids, {})
+
+    assert mapped_values.shape == (3, 0)
+    assert feature_names.shape == (0,)
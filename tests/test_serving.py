@@ -0,0 +1,108 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import concurrent.futures
+import os
+
+import numpy
+import pytest
+
+pytest.importorskip("tensorflow.contrib")
+pytest.importorskip("tensorflow_probability")
+
+import tensorflow as tf  # noqa: E402
+
+from scvae.models import VariationalAutoencoder  # noqa: E402
+from scvae.models.serving import (  # noqa: E402
+    ModelServer, ServedModel, ServingClient)
+
+FEATURE_SIZE = 6
+LATENT_SIZE = 2
+
+
+def _build_trained_model(log_directory):
+
+    model = VariationalAutoencoder(
+        feature_size=FEATURE_SIZE,
+        latent_size=LATENT_SIZE,
+        hidden_sizes=[4],
+        reconstruction_distribution="poisson",
+        log_directory=log_directory
+    )
+
+    # Initial parameters are saved as a checkpoint in place of training
+    checkpoint_directory = model.log_directory()
+    os.makedirs(checkpoint_directory)
+    with model.graph.as_default():
+        with tf.Session(graph=model.graph) as session:
+            session.run(tf.global_variables_initializer())
+            model.saver.save(
+                session,
+                os.path.join(checkpoint_directory, "model.ckpt"),
+                global_step=1
+            )
+
+    return model
+
+
+def test_served_model_builds_reconstruction_outputs_up_front(tmp_path):
+
+    model = _build_trained_model(str(tmp_path))
+    served_model = ServedModel(model)
+
+    try:
+        assert len(model.reconstruction_outputs) == 1
+        served_model.sample(2)
+        assert len(model.reconstruction_outputs) == 1
+    finally:
+        served_model.close()
+
+
+def test_model_server_answers_client_requests(tmp_path):
+
+    model = _build_trained_model(str(tmp_path))
+    values = numpy.random.RandomState(60).poisson(
+        2, size=(5, FEATURE_SIZE)).astype(numpy.float32)
+
+    with ModelServer(
+            {"end_of_training": ServedModel(model)},
+            host="127.0.0.1", port=0) as server:
+        server.start()
+        client = ServingClient(server.address)
+
+        assert client.models()["model_versions"] == ["end_of_training"]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            embeddings = [
+                pool.submit(client.embed, values=values[i:i + 1])
+                for i in range(values.shape[0])
+            ]
+            samples = [pool.submit(client.sample, 3) for _ in range(2)]
+
+            latent_means = numpy.concatenate(
+                [embedding.result()["z"] for embedding in embeddings])
+            for sample in samples:
+                assert sample.result()["x"].shape == (3, FEATURE_SIZE)
+                assert sample.result()["z"].shape == (3, LATENT_SIZE)
+
+        whole_latent_means = client.embed(values=values)["z"]
+        numpy.testing.assert_allclose(
+            latent_means, whole_latent_means, rtol=1e-5, atol=1e-6)
+
+        with pytest.raises(ValueError):
+            client.evaluate([0])
@@ -0,0 +1,87 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+import pytest
+
+pytest.importorskip("tables")
+pytest.importorskip("tensorflow.contrib")
+pytest.importorskip("tensorflow_probability")
+pytest.importorskip("seaborn")
+pytest.importorskip("sklearn")
+
+from scvae.data import DataSet  # noqa: E402
+from scvae.models.sinks import OUTPUT_SINKS, build_output_sink  # noqa: E402
+
+ROW_KEYS = [
+    2,
+    slice(1, 4),
+    [1, 3],
+    [1, 1, 3],
+    [3, 0, -1],
+    numpy.array([0, 2]),
+    numpy.array([True, False, True, False, True]),
+    (numpy.array([4, 1]), 1),
+    (slice(None), 2)
+]
+
+
+@pytest.mark.parametrize("kind", OUTPUT_SINKS)
+def test_output_sink_values_in_data_set(kind, tmp_path):
+
+    values = numpy.random.RandomState(60).normal(
+        size=(5, 3)).astype(numpy.float32)
+
+    sink = build_output_sink(
+        kind, values.shape, name="values", directory=str(tmp_path))
+    sink.write(numpy.array([0, 1]), values[:2])
+    sink.write(numpy.array([2, 4, 3]), values[[2, 4, 3]])
+    sink.close()
+
+    data_set = DataSet(
+        "test",
+        title="Test",
+        specifications={},
+        values=sink.values,
+        example_names=numpy.array(["cell{}".format(i) for i in range(5)]),
+        feature_names=numpy.array(["gene{}".format(j) for j in range(3)]),
+        directory=str(tmp_path)
+    )
+
+    for key in ROW_KEYS:
+        numpy.testing.assert_array_equal(
+            data_set.values[key], values[key], err_msg=str(key))
+
+    numpy.testing.assert_array_equal(
+        data_set.values.reshape(-1), values.reshape(-1))
+    numpy.testing.assert_array_equal(data_set.values.copy(), values)
+    numpy.testing.assert_allclose(
+        data_set.count_sum, values.sum(axis=1).reshape(-1, 1), rtol=1e-6)
+
+    for reduction in ["sum", "mean", "std", "max", "min"]:
+        for axis in [None, 0, 1]:
+            numpy.testing.assert_allclose(
+                getattr(data_set.values, reduction)(axis=axis),
+                getattr(values, reduction)(axis=axis),
+                rtol=1e-5, atol=1e-6,
+                err_msg="{} over axis {}".format(reduction, axis)
+            )
+
+    # Files of finished sinks are closed, so they can be written again
+    build_output_sink(
+        kind, values.shape, name="values", directory=str(tmp_path)).close()
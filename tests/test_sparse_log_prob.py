@@ -0,0 +1,98 @@
+# ======================================================================== #
+#
+# Copyright (c) 2017 - 2020 scVAE authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# ======================================================================== #
+
+import numpy
+import pytest
+
+pytest.importorskip("tensorflow.contrib")
+pytest.importorskip("tensorflow_probability")
+
+import tensorflow as tf  # noqa: E402
+
+from scvae.distributions import (  # noqa: E402
+    DISTRIBUTIONS, SPARSE_LOG_PROB_DISTRIBUTIONS, sparse_log_prob)
+
+SHAPE = (4, 7)
+COUNT_SUM = 20.
+
+
+def _random_parameters(distribution_name, random_state):
+
+    theta = {}
+
+    for parameter, specification in DISTRIBUTIONS[distribution_name][
+            "parameters"].items():
+        p_min, p_max = specification["support"]
+        if numpy.isfinite(p_min) and numpy.isfinite(p_max):
+            # Keep away from the limits of the support
+            width = p_max - p_min
+            values = random_state.uniform(
+                p_min + 0.05 * width, p_min + 0.5 * width, size=SHAPE)
+        else:
+            values = random_state.normal(size=SHAPE)
+        theta[parameter] = tf.constant(values, dtype=tf.float32)
+
+    return theta
+
+
+def _random_values(distribution_name, random_state):
+
+    if distribution_name == "bernoulli":
+        values = random_state.binomial(1, 0.3, size=SHAPE)
+    else:
+        values = random_state.poisson(1, size=SHAPE)
+
+    # Ensure both rows without nonzero values and fully nonzero rows
+    values[0] = 0
+    values[-1] = numpy.maximum(values[-1], 1)
+
+    return values.astype(numpy.float32)
+
+
+@pytest.mark.parametrize("distribution_name", SPARSE_LOG_PROB_DISTRIBUTIONS)
+def test_sparse_log_prob_matches_dense_log_prob(distribution_name):
+
+    random_state = numpy.random.RandomState(60)
+
+    with tf.Graph().as_default():
+
+        theta = _random_parameters(distribution_name, random_state)
+        distribution_class = DISTRIBUTIONS[distribution_name]["class"]
+
+        if distribution_name == "constrained poisson":
+            distribution = distribution_class(theta, COUNT_SUM)
+        else:
+            distribution = distribution_class(theta)
+
+        values = _random_values(distribution_name, random_state)
+        indices = numpy.argwhere(values != 0)
+        sparse_values = tf.SparseTensor(
+            indices=indices.astype(numpy.int64),
+            values=values[values != 0],
+            dense_shape=numpy.array(SHAPE, dtype=numpy.int64)
+        )
+
+        dense_log_prob = tf.reduce_sum(distribution.log_prob(values), axis=-1)
+        sparse_log_prob_sum = sparse_log_prob(distribution, sparse_values)
+
+        with tf.Session() as session:
+            dense_log_prob, sparse_log_prob_sum = session.run(
+                [dense_log_prob, sparse_log_prob_sum])
+
+    numpy.testing.assert_allclose(
+        sparse_log_prob_sum, dense_log_prob, rtol=1e-5, atol=1e-4)